@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+审计日志基准测试
+写入大量命令/响应记录（分布在多台设备、数十天内），测量写入吞吐、压缩率，
+以及“某设备一个月内的全部开锁”查询耗时
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from lock_audit import KIND_COMMAND, AuditLog, AuditReader
+
+UNLOCK_FRAME = "HD2F0454049024910010000000000000000000006EDA1000000007EW"
+REPLY_FRAME = "HD2B0454049024910010000000000000000000006EDA1000000007EW"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='审计日志基准测试')
+    parser.add_argument('--records', type=int, default=2000000)
+    parser.add_argument('--devices', type=int, default=50000)
+    parser.add_argument('--days', type=int, default=60)
+    parser.add_argument('--segment-mb', type=float, default=1.0, help='活动段轮转大小（MB，压缩后）')
+    parser.add_argument('--directory', help='保留数据的目录（默认使用临时目录）')
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    macs = [f"86970107{i:07d}" for i in range(args.devices)]
+    directory = args.directory or tempfile.mkdtemp(prefix='audit-bench-')
+    base = time.time() - args.days * 86400
+    step = args.days * 86400 / args.records
+
+    log = AuditLog(directory, segment_size=int(args.segment_mb * 1024 * 1024))
+    start = time.perf_counter()
+    for i in range(0, args.records, 2):
+        mac = macs[rng.randrange(args.devices)]
+        ts = base + i * step
+        sn = int(ts)
+        log.record_command(mac, '0', sn, UNLOCK_FRAME, ts=ts)
+        log.record_response(mac, '0', sn, REPLY_FRAME, 'success', ts=ts + 0.3)
+    log.close()
+    write_elapsed = time.perf_counter() - start
+    size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+    reader = AuditReader(directory)
+    target = macs[0]
+    month_start = base + (args.days - 30) * 86400
+    start = time.perf_counter()
+    hits = sum(1 for _ in reader.query(target, month_start, None, KIND_COMMAND, '0'))
+    query_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    window = sum(1 for _ in reader.query(None, month_start, month_start + 3600))
+    window_elapsed = time.perf_counter() - start
+
+    print(json.dumps({
+        'records': reader.count(),
+        'write_per_s': round(args.records / write_elapsed),
+        'bytes_per_record': round(size / args.records, 1),
+        'segments': len(reader.segments),
+        'device_month_unlocks': hits,
+        'device_month_query_s': round(query_elapsed, 3),
+        'one_hour_all_devices': window,
+        'one_hour_query_s': round(window_elapsed, 3),
+        'directory': directory,
+    }, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+微批处理基准测试
+大量并发命令经 逐条发送 / 批量信封 两种方式发往替身服务器（每个HTTP请求有固定处理开销），
+对比吞吐、延迟和服务器收到的请求数；另测低负载下逐条串行的延迟，确认批处理不增加延迟
+"""
+
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from lock_batching import BatchingTransport
+from lock_endpoints import EndpointPool
+from lock_standin_server import start_standin
+from lock_transport import HttpTransport, create_session
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100.0 * len(ordered)))]
+
+
+def run(transport, total, concurrency, devices):
+    def one(i):
+        payload = {"type": "yfn03", "mac": f"86970107{i % devices:07d}", "cmd": "1", "sn": i,
+                   "info": "HD1F0000000000000000000000000000000000000000000000000000W"}
+        start = time.perf_counter()
+        try:
+            ok = transport.post(payload, timeout=10, idempotent=True).status_code == 200
+        except requests.RequestException:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    latencies = []
+    errors = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        for latency, ok in executor.map(one, range(total)):
+            latencies.append(latency)
+            errors += not ok
+    elapsed = time.perf_counter() - start
+    return {
+        'commands_per_s': round(total / elapsed),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'errors': errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='微批处理基准测试')
+    parser.add_argument('--commands', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=128)
+    parser.add_argument('--devices', type=int, default=2000)
+    parser.add_argument('--latency', type=float, default=0.005, help='替身每个HTTP请求的处理开销（秒）')
+    parser.add_argument('--max-batch', type=int, default=200)
+    args = parser.parse_args()
+
+    results = {}
+    for mode in ('single', 'batched'):
+        server = start_standin(latency=args.latency)
+        transport = HttpTransport(EndpointPool([server.url]), create_session(pool_maxsize=32))
+        if mode == 'batched':
+            transport = BatchingTransport(transport, max_batch=args.max_batch)
+        result = run(transport, args.commands, args.concurrency, args.devices)
+        result['server_requests'] = server.requests
+        before = server.requests
+        result['low_load'] = run(transport, 100, 1, args.devices)
+        result['low_load']['server_requests'] = server.requests - before
+        if mode == 'batched':
+            result['final_batch_size'] = transport.batch_size
+        transport.close()
+        server.shutdown()
+        server.server_close()
+        results[mode] = result
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多服务器选路基准测试
+启动三个注入不同延迟的本地替身服务器，对比 单一地址 / 轮询 / EWMA二选一 的尾延迟，
+并在运行中途停掉一个节点以验证故障切换
+"""
+
+import argparse
+import itertools
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from lock_endpoints import EndpointPool
+from lock_standin_server import start_standin
+from lock_transport import HttpTransport
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100.0 * len(ordered)))]
+
+
+class RoundRobinPool(EndpointPool):
+    """对照组：忽略统计，依次轮询"""
+
+    def __init__(self, urls):
+        super().__init__(urls)
+        self._cycle = itertools.cycle(self.endpoints)
+
+    def choose(self, exclude=()):
+        with self._lock:
+            for _ in range(len(self.endpoints)):
+                endpoint = next(self._cycle)
+                if endpoint not in exclude:
+                    break
+            endpoint.inflight += 1
+            return endpoint
+
+
+def run_strategy(name, pool, total, concurrency, outage=None):
+    transport = HttpTransport(pool, requests.Session())
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=concurrency)
+    transport.session.mount('http://', adapter)
+    latencies = []
+    errors = 0
+
+    def one(i):
+        if outage and i == total // 2:
+            outage.shutdown()
+            outage.server_close()
+        payload = {"type": "yfn03", "mac": "869701070802882", "cmd": "1", "sn": i,
+                   "info": "HD1F0000000000000000000000000000000000000000000000000000W"}
+        start = time.perf_counter()
+        try:
+            response = transport.post(payload, timeout=(0.5, 5), idempotent=True)
+            ok = response.status_code == 200
+        except requests.RequestException:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        for latency, ok in executor.map(one, range(total)):
+            latencies.append(latency)
+            errors += not ok
+    elapsed = time.perf_counter() - start
+    return {
+        'strategy': name,
+        'requests': total,
+        'errors': errors,
+        'throughput': round(total / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+        'max_ms': round(max(latencies) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='多服务器选路基准测试')
+    parser.add_argument('--requests', type=int, default=600)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--outage', action='store_true', help='中途停掉最快的节点')
+    args = parser.parse_args()
+
+    results = []
+    strategies = [
+        ('single', lambda urls: EndpointPool(urls[2:3])),
+        ('round_robin', RoundRobinPool),
+        ('ewma_p2c', lambda urls: EndpointPool(urls, seed=1)),
+    ]
+    for name, make_pool in strategies:
+        # 每个策略使用全新的服务器，避免相互影响
+        servers = [
+            start_standin(latency=0.02, jitter=0.01, seed=1),
+            start_standin(latency=0.06, jitter=0.02, seed=2),
+            start_standin(latency=0.03, jitter=0.01, slow_rate=0.1, slow_latency=0.8, seed=3),
+        ]
+        urls = [server.url for server in servers]
+        outage = servers[0] if args.outage and name != 'single' else None
+        results.append(run_strategy(name, make_pool(urls), args.requests, args.concurrency, outage))
+        for server in servers:
+            if server is not outage:
+                server.shutdown()
+                server.server_close()
+
+    print(f"{'strategy':12} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'errors':>7}")
+    for r in results:
+        print(f"{r['strategy']:12} {r['throughput']:8} {r['p50_ms']:8} {r['p95_ms']:8} {r['p99_ms']:8} {r['errors']:7}")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
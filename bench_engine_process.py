@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+引擎进程基准测试
+10k 台设备的批量状态查询期间测量界面帧时间：主线程模拟 60fps 渲染循环（每帧读取汇总、刷新日志文本），
+对比 命令核心在界面进程的线程中运行（与渲染争抢 GIL）和在独立引擎进程中运行两种模式。
+替身服务器在另一个进程中运行，两种模式条件相同
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from lock_core import LockCore
+from lock_engine_process import EngineProcess
+
+FRAME = 1 / 60.0
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100.0 * len(ordered)))]
+
+
+class FakeUi:
+    """与 LockControlApp.add_log / render_fleet_summary 相同的文本处理"""
+
+    def __init__(self):
+        self.log_text = ''
+        self.label = ''
+        self._lock = threading.Lock()
+
+    def add_log(self, message):
+        with self._lock:
+            self.log_text += f"[{time.strftime('%H:%M:%S')}] {message}\n"
+            lines = self.log_text.split('\n')
+            if len(lines) > 50:
+                self.log_text = '\n'.join(lines[-50:])
+
+    def render(self, summary):
+        self.label = (f"设备: {summary['total']}  在线: {summary['online']}  "
+                      f"已开锁: {summary['unlocked']}  低电量: {summary['low_battery']}")
+
+
+def render_loop(ui, summary, done):
+    """按 60fps 节拍渲染，返回每帧间隔"""
+    frames = []
+    last = time.perf_counter()
+    deadline = last + FRAME
+    while not done.is_set():
+        ui.render(summary())
+        pause = deadline - time.perf_counter()
+        if pause > 0:
+            time.sleep(pause)
+        now = time.perf_counter()
+        frames.append(now - last)
+        last = now
+        deadline = max(deadline + FRAME, now)
+    return frames
+
+
+def frame_stats(frames, elapsed):
+    return {
+        'bulk_seconds': round(elapsed, 2),
+        'frames': len(frames),
+        'frame_p50_ms': round(percentile(frames, 50) * 1000, 2),
+        'frame_p99_ms': round(percentile(frames, 99) * 1000, 2),
+        'frame_max_ms': round(max(frames) * 1000, 2),
+        'janky_frames': sum(1 for frame in frames if frame > 2 * FRAME),
+    }
+
+
+def run_thread_mode(url, macs, workers):
+    ui = FakeUi()
+    core = LockCore(url, log=ui.add_log)
+    done = threading.Event()
+    started = time.perf_counter()
+    worker = threading.Thread(target=lambda: (core.run_bulk(macs, 'status', workers=workers), done.set()))
+    worker.start()
+    frames = render_loop(ui, core.fleet.summary, done)
+    elapsed = time.perf_counter() - started
+    worker.join()
+    core.close()
+    return frame_stats(frames, elapsed)
+
+
+def run_process_mode(url, macs, workers):
+    ui = FakeUi()
+    engine = EngineProcess(url).start()
+    done = threading.Event()
+    started = time.perf_counter()
+    engine.bulk(macs, 'status', workers, on_progress=lambda count, total: ui.add_log(f"批量查询 {count}/{total}"),
+                on_done=lambda stats: done.set())
+    frames = render_loop(ui, engine.table.summary, done)
+    elapsed = time.perf_counter() - started
+    result = frame_stats(frames, elapsed)
+    result['devices_in_shared_table'] = engine.table.summary()['total']
+    engine.stop()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='引擎进程基准测试')
+    parser.add_argument('--devices', type=int, default=10000)
+    parser.add_argument('--workers', type=int, default=32)
+    parser.add_argument('--port', type=int, default=18090)
+    parser.add_argument('--latency', type=float, default=0.005)
+    args = parser.parse_args()
+
+    standin = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lock_standin_server.py')
+    server = subprocess.Popen([sys.executable, standin, '--port', str(args.port),
+                               '--latency', str(args.latency)], stdout=subprocess.PIPE, text=True)
+    url = server.stdout.readline().split(': ', 1)[1].strip()
+    macs = [f"86970107{i:07d}" for i in range(args.devices)]
+    try:
+        results = {
+            'thread': run_thread_mode(url, macs, args.workers),
+            'process': run_process_mode(url, macs, args.workers),
+        }
+    finally:
+        server.terminate()
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
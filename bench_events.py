@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+事件推送基准测试
+替身服务器上的设备随机变化，对比 事件推送 与 定时变更查询（轮询）两种方式：
+状态变化被客户端感知的延迟，以及期间发出的请求数；中途断开一次事件流以验证续传不丢事件
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+
+from lock_endpoints import EndpointPool
+from lock_events import EventDemux, EventSubscriber
+from lock_fleet import StatusStore
+from lock_standin_server import start_standin
+from lock_sync import StatusSync
+from lock_transport import HttpTransport, create_session
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100.0 * len(ordered)))] if ordered else 0.0
+
+
+def drive(server, macs, changes, rate, rng, changed_at):
+    """按固定速率改变设备状态，记录每次变化的时间"""
+    for i in range(changes):
+        mac = rng.choice(macs)
+        changed_at[mac] = time.perf_counter()
+        server.mutate(mac, battery=rng.randrange(20, 101))
+        time.sleep(1.0 / rate)
+
+
+def bench_push(server, macs, changes, rate):
+    rng = random.Random(3)
+    latencies = []
+    changed_at = {}
+    received = []
+    store = StatusStore()
+
+    def on_event(event):
+        mac = event.data.get('mac')
+        if event.event == 'status' and mac in changed_at:
+            latencies.append(time.perf_counter() - changed_at.pop(mac))
+        received.append(event.id)
+
+    demux = EventDemux(store)
+    demux.subscribe(None, on_event)
+    url = server.url.replace('mqttpost/', 'events/')
+    subscriber = EventSubscriber(url, demux.dispatch, min_backoff=0.05).start()
+    time.sleep(0.2)
+    requests_before = server.requests
+    first_id = server.event_id
+    half = changes // 2
+    drive(server, macs, half, rate, rng, changed_at)
+    # 断开一次：期间的变化应在重连后按续传位置补发
+    subscriber.stop()
+    last_id = subscriber.last_event_id
+    drive(server, macs, changes - half, rate, rng, changed_at)
+    subscriber = EventSubscriber(url, demux.dispatch, last_event_id=last_id, min_backoff=0.05).start()
+    time.sleep(0.5)
+    subscriber.stop()
+    return {
+        'events_received': len(received),
+        'missing': len(set(range(first_id + 1, server.event_id + 1)) - {int(i) for i in received}),
+        'latency_p50_ms': round(percentile(latencies[:half], 50) * 1000, 2),
+        'latency_p99_ms': round(percentile(latencies[:half], 99) * 1000, 2),
+        'post_requests': server.requests - requests_before,
+    }
+
+
+def bench_poll(server, macs, changes, rate, interval):
+    rng = random.Random(3)
+    latencies = []
+    changed_at = {}
+    store = StatusStore()
+    transport = HttpTransport(EndpointPool([server.url]), create_session())
+    sync = StatusSync(transport, store)
+    sync.sync_changes()
+
+    def on_update(status):
+        if status.mac in changed_at:
+            latencies.append(time.perf_counter() - changed_at.pop(status.mac))
+
+    store.subscribe(on_update)
+    stop = threading.Event()
+
+    def poll():
+        while not stop.wait(interval):
+            sync.sync_changes()
+
+    requests_before = server.requests
+    poller = threading.Thread(target=poll, daemon=True)
+    poller.start()
+    drive(server, macs, changes, rate, rng, changed_at)
+    time.sleep(interval)
+    stop.set()
+    poller.join()
+    return {
+        'interval_s': interval,
+        'latency_p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'latency_p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'post_requests': server.requests - requests_before,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='事件推送基准测试')
+    parser.add_argument('--devices', type=int, default=1000)
+    parser.add_argument('--changes', type=int, default=400)
+    parser.add_argument('--rate', type=float, default=100.0, help='每秒状态变化次数')
+    parser.add_argument('--poll-interval', type=float, default=1.0)
+    args = parser.parse_args()
+
+    server = start_standin()
+    macs = [f"86970107{i:07d}" for i in range(args.devices)]
+    for mac in macs:
+        server.mutate(mac, battery=100)
+    results = {
+        'push': bench_push(server, macs, args.changes, args.rate),
+        'poll': bench_poll(server, macs, args.changes, args.rate, args.poll_interval),
+    }
+    server.shutdown()
+    server.server_close()
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+对冲请求基准测试
+两个替身服务器各有少量慢请求，对比状态查询在 不对冲 / 对冲 两种模式下的尾延迟和额外负载
+"""
+
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from lock_endpoints import EndpointPool
+from lock_standin_server import start_standin
+from lock_transport import HedgingPolicy, HttpTransport, create_session
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100.0 * len(ordered)))]
+
+
+def run(name, hedging, total, concurrency, budget):
+    servers = [
+        start_standin(latency=0.02, jitter=0.01, slow_rate=0.03, slow_latency=2.0, seed=11),
+        start_standin(latency=0.02, jitter=0.01, slow_rate=0.03, slow_latency=2.0, seed=12),
+    ]
+    pool = EndpointPool([server.url for server in servers], seed=1)
+    policy = HedgingPolicy(budget_percent=budget) if hedging else None
+    transport = HttpTransport(pool, create_session(pool_maxsize=concurrency * 2), hedging=policy)
+
+    def one(i):
+        payload = {"type": "yfn03", "mac": "869701070802882", "cmd": "1", "sn": i,
+                   "info": "HD1F0000000000000000000000000000000000000000000000000000W"}
+        start = time.perf_counter()
+        try:
+            ok = transport.post(payload, timeout=10, idempotent=True).status_code == 200
+        except requests.RequestException:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    latencies = []
+    errors = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        for latency, ok in executor.map(one, range(total)):
+            latencies.append(latency)
+            errors += not ok
+    elapsed = time.perf_counter() - start
+    sent = sum(server.requests for server in servers)
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+    return {
+        'mode': name,
+        'requests': total,
+        'errors': errors,
+        'throughput': round(total / elapsed, 1),
+        'extra_load_pct': round((sent - total) * 100.0 / total, 2),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='对冲请求基准测试')
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--budget', type=float, default=5.0, help='对冲预算（百分比）')
+    args = parser.parse_args()
+
+    results = [
+        run('no_hedge', False, args.requests, args.concurrency, args.budget),
+        run('hedge', True, args.requests, args.concurrency, args.budget),
+    ]
+    print(f"{'mode':10} {'p50':>8} {'p95':>8} {'p99':>8} {'extra%':>7} {'errors':>7}")
+    for r in results:
+        print(f"{r['mode']:10} {r['p50_ms']:8} {r['p95_ms']:8} {r['p99_ms']:8} {r['extra_load_pct']:7} {r['errors']:7}")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+协议注册表基准测试
+对比 硬编码字面量 / 注册表预渲染帧 / 带参数模板（缓存命中、每次重新渲染）三种取帧方式的开销，
+以及按应答布局解析状态帧与手写切片解析的开销，并测量注册表加载（编译）时间
+"""
+
+import argparse
+import json
+import time
+
+from lock_fleet import status_from_frame
+from lock_protocol import DEFAULT_PATH, ProtocolRegistry
+
+LITERAL = "HD2F0454049024910010000000000000000000006EDA1000000007EW"
+STATUS_REPLY = "HD1F0064" + "0" * 48 + "W"
+
+# 带参数的演示型号：开锁时长写入数据段
+PARAM_SPEC = {
+    "models": {
+        "demo": {
+            "commands": {
+                "unlock": {"cmd": "0", "code": "2F", "data": "0454{seconds:02X}9024910010000000000000000006EDA1000000007E",
+                           "params": {"seconds": {"default": 5, "min": 1, "max": 255}}, "success": ["2B"]},
+            },
+            "replies": {"1F": {"name": "status", "fields": {"lock": [0, 2, "hex"], "battery": [2, 2, "hex"]}}},
+        }
+    }
+}
+
+
+def timed(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return round((time.perf_counter() - start) / iterations * 1e9, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='协议注册表基准测试')
+    parser.add_argument('--iterations', type=int, default=200000)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    registry = ProtocolRegistry.load(DEFAULT_PATH)
+    load_ms = (time.perf_counter() - start) * 1000
+    protocol = registry.get('yfn03')
+    assert protocol.frame('unlock') == LITERAL
+    demo = ProtocolRegistry(PARAM_SPEC).get('demo')
+    command = demo.command('unlock')
+
+    def literal_parse():
+        data = STATUS_REPLY[4:-1]
+        return int(data[0:2], 16), int(data[2:4], 16)
+
+    n = args.iterations
+    results = {
+        'registry_load_ms': round(load_ms, 3),
+        'frame_ns': {
+            'literal': timed(lambda: LITERAL, n),
+            'registry_static': timed(lambda: registry.get('yfn03').frame('unlock'), n),
+            'template_cached': timed(lambda: command.frame(seconds=5), n),
+            'template_render': timed(lambda: command._render({'seconds': 5}), n),
+        },
+        'decode_ns': {
+            'literal_slices': timed(literal_parse, n),
+            'reply_layout': timed(lambda: status_from_frame(protocol.parse(STATUS_REPLY), protocol), n),
+        },
+    }
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
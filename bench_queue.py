@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+离线命令队列基准测试
+测量 10万 条命令的入队（合并提交 vs 逐条提交）与重放吞吐
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from lock_queue import DELIVERED, CommandQueue
+
+UNLOCK_FRAME = "HD2F0454049024910010000000000000000000006EDA1000000007EW"
+
+
+def bench_enqueue(path, total, producers, devices):
+    queue = CommandQueue(path)
+    per_producer = total // producers
+
+    def produce(offset):
+        for i in range(per_producer):
+            n = offset * per_producer + i
+            queue.enqueue(f"8697010708{n % devices:05d}", "0", UNLOCK_FRAME, ttl=3600)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=produce, args=(p,)) for p in range(producers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    queue.flush()
+    elapsed = time.perf_counter() - start
+    return queue, elapsed
+
+
+def bench_naive_enqueue(path, total):
+    """对照组：每条命令单独提交一次事务"""
+    db = sqlite3.connect(path, isolation_level=None)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.execute("CREATE TABLE outbox (id INTEGER PRIMARY KEY, mac TEXT, cmd TEXT, info TEXT, created REAL, expires REAL)")
+    start = time.perf_counter()
+    for i in range(total):
+        now = time.time()
+        db.execute("INSERT INTO outbox (mac, cmd, info, created, expires) VALUES (?, ?, ?, ?, ?)",
+                   (f"8697010708{i:05d}", "0", UNLOCK_FRAME, now, now + 3600))
+    elapsed = time.perf_counter() - start
+    db.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='离线命令队列基准测试')
+    parser.add_argument('--commands', type=int, default=100000)
+    parser.add_argument('--devices', type=int, default=5000)
+    parser.add_argument('--producers', type=int, default=4)
+    parser.add_argument('--naive', type=int, default=10000, help='逐条提交对照组的命令数')
+    parser.add_argument('--send-latency', type=float, default=0.0, help='模拟每条命令的发送耗时（秒）')
+    args = parser.parse_args()
+
+    def send(command):
+        if args.send_latency:
+            time.sleep(args.send_latency)
+        return DELIVERED
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        naive = bench_naive_enqueue(os.path.join(tmp, 'naive.db'), args.naive)
+        results['naive_enqueue_per_s'] = round(args.naive / naive)
+
+        queue, elapsed = bench_enqueue(os.path.join(tmp, 'outbox.db'), args.commands, 1, args.devices)
+        results['enqueue_per_s_1_producer'] = round(args.commands / elapsed)
+        start = time.perf_counter()
+        stats = queue.drain(send, workers=1)
+        results['drain_per_s_1_worker'] = round(args.commands / (time.perf_counter() - start))
+        results['drain_stats'] = stats
+        queue.close()
+
+        queue, elapsed = bench_enqueue(os.path.join(tmp, 'outbox2.db'), args.commands,
+                                       args.producers, args.devices)
+        results[f'enqueue_per_s_{args.producers}_producers'] = round(args.commands / elapsed)
+        start = time.perf_counter()
+        queue.drain(send, workers=4)
+        results['drain_per_s_4_workers'] = round(args.commands / (time.perf_counter() - start))
+        results['left_after_drain'] = queue.pending_count()
+        queue.close()
+
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+定时任务基准测试
+10 万个任务：测量 添加（内存 / SQLite 持久化）、按模拟时钟推进的触发吞吐、重启加载耗时，
+以及调度线程实时触发时回调相对到期时间的延迟
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+
+from lock_scheduler import Job, Scheduler
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100.0 * len(ordered)))]
+
+
+def make_jobs(count, start, window, seed):
+    rng = random.Random(seed)
+    jobs = []
+    for i in range(count):
+        mac = f"86970107{i:07d}"
+        if i % 2:
+            jobs.append(Job(mac, 'status', {'every': window, 'start': start + rng.random() * window}))
+        else:
+            jobs.append(Job(mac, 'status', {'at': start + rng.random() * window}))
+    return jobs
+
+
+def main():
+    parser = argparse.ArgumentParser(description='定时任务基准测试')
+    parser.add_argument('--jobs', type=int, default=100000)
+    parser.add_argument('--window', type=float, default=3600.0, help='模拟时钟下任务到期时间的分布范围（秒）')
+    parser.add_argument('--steps', type=int, default=3600, help='模拟时钟推进的步数')
+    parser.add_argument('--live-seconds', type=float, default=3.0, help='实时触发测试中任务到期时间的分布范围')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    results = {'jobs': args.jobs}
+    start = time.time() + 10
+
+    # 添加：内存
+    scheduler = Scheduler()
+    jobs = make_jobs(args.jobs, start, args.window, args.seed)
+    t0 = time.perf_counter()
+    for job in jobs:
+        scheduler.add_many([job])
+    results['add_us_per_job_memory'] = round((time.perf_counter() - t0) / args.jobs * 1e6, 2)
+
+    # 触发：模拟时钟推进一个完整周期，每个任务恰好到期一次
+    fired = 0
+    t0 = time.perf_counter()
+    for step in range(1, args.steps + 1):
+        fired += len(scheduler.fire_due(start + args.window * step / args.steps))
+    elapsed = time.perf_counter() - t0
+    results['fire'] = {'fired': fired, 'firings_per_s': round(fired / elapsed),
+                       'remaining_jobs': len(scheduler.jobs)}
+
+    # 持久化：批量写入、推进一个周期、重启加载
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'schedule.db')
+        scheduler = Scheduler(path)
+        jobs = make_jobs(args.jobs, start, args.window, args.seed)
+        t0 = time.perf_counter()
+        scheduler.add_many(jobs)
+        results['add_us_per_job_sqlite_bulk'] = round((time.perf_counter() - t0) / args.jobs * 1e6, 2)
+        t0 = time.perf_counter()
+        fired = sum(len(scheduler.fire_due(start + args.window * step / args.steps))
+                    for step in range(1, args.steps + 1))
+        results['fire_sqlite_firings_per_s'] = round(fired / (time.perf_counter() - t0))
+        scheduler.stop()
+        t0 = time.perf_counter()
+        scheduler = Scheduler(path)
+        results['reload'] = {'ms': round((time.perf_counter() - t0) * 1000, 1), 'jobs': len(scheduler.jobs)}
+        scheduler.stop()
+
+    # 实时触发：调度线程回调的延迟
+    lateness = []
+    done = threading.Event()
+    total = min(args.jobs, 20000)
+
+    def on_fire(job, due):
+        lateness.append(time.time() - due)
+        if len(lateness) >= total:
+            done.set()
+
+    scheduler = Scheduler(on_fire=on_fire).start()
+    now = time.time() + 0.5
+    rng = random.Random(args.seed)
+    scheduler.add_many([Job(f"m{i}", 'status', {'at': now + rng.random() * args.live_seconds})
+                        for i in range(total)])
+    done.wait(args.live_seconds + 30)
+    scheduler.stop()
+    results['live'] = {
+        'fired': len(lateness),
+        'lateness_p50_ms': round(percentile(lateness, 50) * 1000, 2),
+        'lateness_p99_ms': round(percentile(lateness, 99) * 1000, 2),
+        'lateness_max_ms': round(max(lateness) * 1000, 2),
+    }
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分片路由基准测试
+每个替身服务器只有少量工作线程（--capacity）且每个请求有固定处理时间，单台服务器成为瓶颈；
+测量 1/2/4/8 个分片下批量命令（LockCore.run_bulk，每个分片一条发送流水线）的吞吐，
+以及虚拟节点下的负载均衡度和扩容时迁移的设备比例
+"""
+
+import argparse
+import json
+import time
+from collections import Counter
+
+import lock_core
+from lock_sharding import HashRing, ShardedTransport
+from lock_standin_server import start_standin
+
+
+def ring_stats(macs, shards, vnodes):
+    """负载最大分片/平均值，以及再加一个分片时改变归属的设备比例"""
+    nodes = [f"shard-{i}" for i in range(shards)]
+    ring = HashRing(nodes, vnodes)
+    before = {mac: ring.lookup(mac) for mac in macs}
+    load = Counter(before.values())
+    ring.add(f"shard-{shards}")
+    moved = sum(1 for mac in macs if ring.lookup(mac) != before[mac])
+    return {
+        'max_over_mean': round(max(load.values()) / (len(macs) / shards), 3),
+        'moved_on_add': round(moved / len(macs), 3),
+        'ideal_moved': round(1 / (shards + 1), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='分片路由基准测试')
+    parser.add_argument('--commands', type=int, default=800)
+    parser.add_argument('--devices', type=int, default=20000)
+    parser.add_argument('--latency', type=float, default=0.05, help='每个请求的处理时间（秒）')
+    parser.add_argument('--capacity', type=int, default=2, help='每台服务器同时处理的请求数')
+    parser.add_argument('--workers', type=int, default=8, help='每个分片的并发发送数')
+    parser.add_argument('--vnodes', type=int, default=160)
+    args = parser.parse_args()
+
+    macs = [f"86970107{i:07d}" for i in range(args.devices)]
+    targets = [macs[i % args.devices] for i in range(args.commands)]
+    results = []
+    baseline = None
+    for shards in (1, 2, 4, 8):
+        servers = [start_standin(latency=args.latency, capacity=args.capacity) for _ in range(shards)]
+        core = lock_core.LockCore(servers[0].url)
+        core.transport.close()
+        core.transport = ShardedTransport([server.url for server in servers], core.registry,
+                                          vnodes=args.vnodes, pool_maxsize=args.workers)
+        start = time.perf_counter()
+        outcomes = core.run_bulk(targets, 'status', workers=args.workers)
+        elapsed = time.perf_counter() - start
+        errors = sum(1 for outcome in outcomes if outcome.result not in (lock_core.SUCCESS, lock_core.COMPLETED))
+        throughput = args.commands / elapsed
+        baseline = baseline or throughput
+        result = {
+            'shards': shards,
+            'commands_per_s': round(throughput),
+            'speedup': round(throughput / baseline, 2),
+            'errors': errors,
+            'requests_per_server': [server.requests for server in servers],
+        }
+        result.update(ring_stats(macs, shards, args.vnodes))
+        results.append(result)
+        core.close()
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
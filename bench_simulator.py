@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+虚拟门锁群基准测试
+10 万台虚拟门锁：测量 每台设备的内存、经命令核心（LockCore.run_bulk）批量查询/开锁的吞吐和结果分布，
+并用同一种子、同一时钟重复一遍，确认逐台结果一致（可复现）
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+from collections import Counter
+
+import lock_core
+from lock_simulator import Simulator, SimulatorTransport
+
+
+def make_core(simulator):
+    core = lock_core.LockCore('sim://')
+    core.transport = core.sync.transport = SimulatorTransport(simulator)
+    return core
+
+
+def run(args, clock):
+    simulator = Simulator(seed=args.seed, clock=clock, offline_rate=args.offline_rate,
+                          jam_rate=args.jam_rate, malformed_rate=args.malformed_rate)
+    macs = simulator.populate(args.devices)
+    core = make_core(simulator)
+    report = {}
+    outcomes = []
+    for name in ('status', 'unlock', 'status'):
+        t0 = time.perf_counter()
+        results = core.run_bulk(macs, name, workers=args.workers)
+        elapsed = time.perf_counter() - t0
+        outcomes.append([result.result for result in results])
+        report.setdefault(name, []).append({
+            'commands_per_s': round(len(macs) / elapsed),
+            'results': dict(Counter(outcomes[-1])),
+        })
+    report['fleet'] = core.fleet.summary()
+    report['simulator'] = simulator.summary()
+    core.close()
+    return report, outcomes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='虚拟门锁群基准测试')
+    parser.add_argument('--devices', type=int, default=100000)
+    parser.add_argument('--workers', type=int, default=32)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--offline-rate', type=float, default=0.01)
+    parser.add_argument('--jam-rate', type=float, default=0.001)
+    parser.add_argument('--malformed-rate', type=float, default=0.001)
+    args = parser.parse_args()
+    results = {'devices': args.devices}
+
+    # 内存：状态数组 + MAC 字符串和索引
+    tracemalloc.start()
+    simulator = Simulator(seed=args.seed)
+    simulator.populate(args.devices)
+    total = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    results['bytes_per_device'] = round(total / args.devices, 1)
+    results['array_bytes_per_device'] = round(simulator.memory_bytes() / args.devices, 1)
+    del simulator
+
+    # 固定时钟：离线时间窗和自动上锁不随运行时长漂移，两次运行可逐台比较
+    now = time.time()
+    report, first = run(args, lambda: now)
+    results.update(report)
+    _, second = run(args, lambda: now)
+    results['deterministic'] = first == second
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
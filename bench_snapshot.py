@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+设备快照基准测试
+生成 5万 台设备的状态表，测量整体写入、增量写入、首屏可用时间（打开快照+汇总+界面状态）
+以及后台载入完整状态表的耗时
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from lock_fleet import STATE_LOCKED, STATE_UNLOCKED, DeviceRegistry, StatusStore
+from lock_snapshot import Snapshot, SnapshotWriter, load_into
+
+
+def build_fleet(devices, rng):
+    registry = DeviceRegistry()
+    store = StatusStore()
+    now = time.time()
+    for i in range(devices):
+        mac = f"86970107{i:07d}"
+        registry.add(mac, name=f"门锁{i}", model='yfn03')
+        store.update(mac, state=rng.choice((STATE_LOCKED, STATE_UNLOCKED)),
+                     battery=rng.randrange(101), online=rng.random() < 0.9,
+                     updated_at=now - rng.uniform(0, 3600))
+    return registry, store
+
+
+def main():
+    parser = argparse.ArgumentParser(description='设备快照基准测试')
+    parser.add_argument('--devices', type=int, default=50000)
+    parser.add_argument('--changes', type=int, default=500, help='增量写入时变更的设备数')
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    registry, store = build_fleet(args.devices, rng)
+    ui_state = {'mac': '869701070000001', 'log': '[12:00:00] 发送命令: 0\n' * 20}
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'fleet.snap')
+        writer = SnapshotWriter(path)
+        start = time.perf_counter()
+        writer.save(store, registry, ui_state)
+        results['full_write_s'] = round(time.perf_counter() - start, 4)
+        results['snapshot_bytes'] = os.path.getsize(path)
+
+        for i in rng.sample(range(args.devices), args.changes):
+            store.update(f"86970107{i:07d}", battery=rng.randrange(101))
+        start = time.perf_counter()
+        mode = writer.save(store, ui_state=ui_state)
+        results[f'incremental_write_{args.changes}_s'] = round(time.perf_counter() - start, 4)
+        results['incremental_mode'] = mode
+
+        # 首屏：打开快照、取汇总和界面状态、查询当前设备
+        start = time.perf_counter()
+        snapshot = Snapshot.open(path)
+        summary = snapshot.summary()
+        current = snapshot.get(snapshot.ui_state['mac'])
+        results['time_to_useful_screen_s'] = round(time.perf_counter() - start, 4)
+        results['summary'] = summary
+        results['summary_matches'] = summary == store.summary()
+        results['current_device_found'] = current is not None
+
+        start = time.perf_counter()
+        loaded = StatusStore()
+        load_into(loaded, snapshot)
+        snapshot.registry()
+        results['background_load_s'] = round(time.perf_counter() - start, 4)
+        results['loaded_devices'] = len(loaded)
+        snapshot.close()
+
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+状态同步基准测试
+替身服务器上有一批设备，每轮约 1% 的设备状态变化；对比三种刷新方式在稳态下的请求数和传输字节：
+    full         每台设备一次普通状态查询
+    conditional  每台设备一次带 etag 的条件查询
+    cursor       按游标的变更查询
+"""
+
+import argparse
+import json
+import random
+import time
+
+from lock_endpoints import EndpointPool
+from lock_fleet import StatusStore
+from lock_standin_server import start_standin
+from lock_sync import StatusSync
+from lock_transport import HttpTransport, create_session
+
+
+class WireCounter:
+    """统计请求和响应的字节数（含HTTP头，近似线上传输量）"""
+
+    def __init__(self, session):
+        self.requests = 0
+        self.bytes = 0
+        self.body_bytes = 0
+        session.hooks['response'].append(self.on_response)
+
+    def on_response(self, response, *args, **kwargs):
+        request = response.request
+        headers = sum(len(k) + len(v) + 4 for k, v in request.headers.items())
+        headers += sum(len(k) + len(v) + 4 for k, v in response.headers.items())
+        self.requests += 1
+        self.bytes += len(request.body or b'') + headers + len(response.content) + 60
+        self.body_bytes += len(response.content)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='状态同步基准测试')
+    parser.add_argument('--devices', type=int, default=2000)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--churn', type=float, default=0.01, help='每轮状态变化的设备比例')
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+
+    rng = random.Random(5)
+    server = start_standin()
+    macs = [f"86970107{i:07d}" for i in range(args.devices)]
+    for mac in macs:
+        server.mutate(mac, battery=rng.randrange(101))
+
+    results = {}
+    for mode in ('full', 'conditional', 'cursor'):
+        session = create_session(pool_maxsize=args.workers * 2)
+        counter = WireCounter(session)
+        transport = HttpTransport(EndpointPool([server.url]), session)
+        sync = StatusSync(transport, StatusStore())
+        # 首次同步（建立 etag/游标），不计入稳态
+        if mode == 'cursor':
+            sync.sync_changes()
+        else:
+            sync.refresh(macs, workers=args.workers)
+        counter.requests = counter.bytes = counter.body_bytes = 0
+        start = time.perf_counter()
+        changed = 0
+        for _ in range(args.rounds):
+            for mac in rng.sample(macs, max(1, int(args.devices * args.churn))):
+                server.mutate(mac, battery=rng.randrange(101))
+            if mode == 'cursor':
+                changed += sync.sync_changes()
+            else:
+                if mode == 'full':
+                    sync.etags.clear()
+                changed += sync.refresh(macs, workers=args.workers)['changed']
+        elapsed = time.perf_counter() - start
+        results[mode] = {
+            'requests_per_round': round(counter.requests / args.rounds, 1),
+            'bytes_per_round': round(counter.bytes / args.rounds),
+            'response_body_bytes_per_round': round(counter.body_bytes / args.rounds),
+            'changed_per_round': round(changed / args.rounds, 1),
+            'seconds_per_round': round(elapsed / args.rounds, 3),
+        }
+    server.shutdown()
+    server.server_close()
+    full = results['full']['bytes_per_round']
+    for mode in ('conditional', 'cursor'):
+        results[mode]['bandwidth_reduction'] = round(full / max(results[mode]['bytes_per_round'], 1), 1)
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
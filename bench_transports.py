@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+传输层基准测试
+同样的命令分别经 HTTP（本地 mqttpost 替身）和 MQTT 直连（本地替身 broker）发送，
+对比并发闭环下的吞吐和延迟分位数
+"""
+
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from lock_endpoints import EndpointPool
+from lock_mqtt import MqttTransport
+from lock_standin_broker import start_broker
+from lock_standin_server import start_standin
+from lock_transport import HttpTransport, create_session
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100.0 * len(ordered)))]
+
+
+def run(name, transport, total, concurrency, devices):
+    def one(i):
+        cmd = "0" if i % 10 == 0 else "1"
+        payload = {"type": "yfn03", "mac": f"86970107{i % devices:07d}", "cmd": cmd, "sn": i,
+                   "info": "HD1F0000000000000000000000000000000000000000000000000000W"}
+        start = time.perf_counter()
+        try:
+            ok = transport.post(payload, timeout=10, idempotent=(cmd == "1")).status_code == 200
+        except requests.RequestException:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    # 预热：建立连接
+    for i in range(min(concurrency, total)):
+        one(i)
+    latencies = []
+    errors = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        for latency, ok in executor.map(one, range(total)):
+            latencies.append(latency)
+            errors += not ok
+    elapsed = time.perf_counter() - start
+    return {
+        'transport': name,
+        'commands': total,
+        'errors': errors,
+        'commands_per_s': round(total / elapsed),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='HTTP 与 MQTT 直连传输对比')
+    parser.add_argument('--commands', type=int, default=10000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--devices', type=int, default=1000)
+    parser.add_argument('--latency', type=float, default=0.0, help='替身的设备应答延迟（秒）')
+    args = parser.parse_args()
+
+    server = start_standin(latency=args.latency)
+    http = HttpTransport(EndpointPool([server.url]), create_session(pool_maxsize=args.concurrency))
+    broker = start_broker(latency=args.latency)
+    mqtt = MqttTransport(broker.url)
+    results = [
+        run('http', http, args.commands, args.concurrency, args.devices),
+        run('mqtt', mqtt, args.commands, args.concurrency, args.devices),
+    ]
+    for transport in (http, mqtt):
+        transport.close()
+    for stub in (server, broker):
+        stub.shutdown()
+        stub.server_close()
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+界面帧时间回归测试
+在无头窗口（SDL offscreen；不支持时可用 xvfb-run 运行）中启动真正的 LockControlApp，
+经 kivy 的输入录制器（kivy.input.recorder，即 kivy.modules.recorder 使用的回放器）回放一段输入，
+同时按计划注入应答突发（批量状态应答写入状态表、连串结果弹窗）和日志风暴（事件线程连续 add_log）。
+
+每帧在 Window.on_flip 时打点，报告帧时间分位数、掉帧数，以及主线程卡顿：
+卡顿看门狗线程发现超过 --stall-ms 没有出帧时，抓取主线程当时的调用位置，按位置汇总。
+设置 --budget-p99-ms / --max-dropped-ratio 时超出预算退出码为 1，可作为界面改动的门禁：
+
+    python bench_ui_frametime.py --output frames.json --budget-p99-ms 34
+    python bench_ui_frametime.py --record session.rec     # 在可见窗口中录制一段真实操作
+    python bench_ui_frametime.py --session session.rec     # 回放录制的操作
+
+不指定 --session 时按界面布局生成一段点击 开锁/查询状态/清除日志 的输入。
+命令发往子进程中的本地替身服务器（lock_standin_server.py），不访问线上服务器
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from collections import Counter
+
+import lock_events
+
+FRAME = 1 / 60.0
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100.0 * len(ordered)))]
+
+
+def write_session(path, taps):
+    """按录制器的文件格式写入点击序列；taps 为 [(时间, sx, sy), ...]，坐标为窗口归一化坐标"""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('#RECORDER1.0\n')
+        for uid, (at, sx, sy) in enumerate(taps, 1):
+            args = {'is_touch': True, 'sx': sx, 'sy': sy, 'profile': ['pos']}
+            f.write('%r\n' % ((at, 'begin', uid, args),))
+            f.write('%r\n' % ((at + 0.08, 'end', uid, args),))
+
+
+class FrameMonitor:
+    """Window.on_flip 打点 + 主线程卡顿看门狗"""
+
+    def __init__(self, stall_threshold):
+        self.stall_threshold = stall_threshold
+        self.frames = []
+        self.stalls = []
+        self.stall_sites = Counter()
+        self.last_flip = None
+        self._main_ident = threading.main_thread().ident
+        self._stop = threading.Event()
+        self._stalled_since = None
+
+    def on_flip(self, *args):
+        now = time.perf_counter()
+        if self.last_flip is not None:
+            self.frames.append(now - self.last_flip)
+            if now - self.last_flip > self.stall_threshold:
+                self.stalls.append(now - self.last_flip)
+        self.last_flip = now
+
+    def start(self):
+        threading.Thread(target=self._watch, name='stall-watchdog', daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _watch(self):
+        while not self._stop.wait(0.005):
+            last = self.last_flip
+            if last is None or time.perf_counter() - last < self.stall_threshold:
+                continue
+            if self._stalled_since == last:
+                # 同一次卡顿只记录一次位置
+                continue
+            self._stalled_since = last
+            frame = sys._current_frames().get(self._main_ident)
+            if frame is None:
+                continue
+            stack = traceback.extract_stack(frame)
+            # 取最内层的项目代码位置；全在 Kivy/标准库中时取最内层
+            site = next((s for s in reversed(stack) if os.path.dirname(os.path.abspath(s.filename)) == HERE),
+                        stack[-1])
+            self.stall_sites[f"{os.path.basename(site.filename)}:{site.lineno} {site.name}"] += 1
+
+    def report(self):
+        frames = self.frames
+        if not frames:
+            return {'frames': 0}
+        dropped = sum(max(0, round(frame / FRAME) - 1) for frame in frames)
+        frame_ms = {f"p{q}": round(percentile(frames, q) * 1000, 2) for q in (50, 90, 95, 99)}
+        frame_ms['max'] = round(max(frames) * 1000, 2)
+        return {
+            'frames': len(frames),
+            'frame_ms': frame_ms,
+            'dropped_frames': dropped,
+            'dropped_ratio': round(dropped / (len(frames) + dropped), 4),
+            'janky_frames': sum(1 for frame in frames if frame > 2 * FRAME),
+            'stalls': {
+                'count': len(self.stalls),
+                'total_ms': round(sum(self.stalls) * 1000, 1),
+                'p50_ms': round(percentile(self.stalls, 50) * 1000, 1) if self.stalls else None,
+                'max_ms': round(max(self.stalls) * 1000, 1) if self.stalls else None,
+                'sites': dict(self.stall_sites.most_common(10)),
+            },
+        }
+
+
+def injections(args):
+    """注入计划：[(时间, 类型)]，与点击交错"""
+    plan = []
+    for i in range(args.bursts):
+        plan.append((args.start + 1.0 + i * args.interval, 'burst'))
+    for i in range(args.log_storms):
+        plan.append((args.start + 1.5 + i * args.interval, 'log_storm'))
+    return sorted(plan)
+
+
+def run_app(args):
+    # Kivy 在导入时读取这些环境变量
+    os.environ.setdefault('KIVY_NO_ARGS', '1')
+    os.environ.setdefault('KIVY_NO_CONSOLELOG', '1')
+    if not args.record:
+        os.environ.setdefault('SDL_VIDEODRIVER', 'offscreen')
+    from kivy.clock import Clock
+    from kivy.core.window import Window
+    from kivy.input.recorder import Recorder
+    from kivy.uix.button import Button
+
+    import lock_core
+    from lock_standin_server import status_frame
+    from main import LockControlApp
+
+    data_dir = tempfile.mkdtemp(prefix='ui-frametime-')
+    monitor = FrameMonitor(args.stall_ms / 1000.0)
+    result = {}
+
+    class HarnessApp(LockControlApp):
+        # 快照、离线队列等写到临时目录，不碰真实的用户数据
+        @property
+        def user_data_dir(self):
+            return data_dir
+
+        def on_start(self):
+            super().on_start()
+            if args.record:
+                self.recorder = Recorder(window=Window, filename=args.record, record=True)
+                return
+            Clock.schedule_once(self.begin, args.start)
+
+        def on_stop(self):
+            if args.record:
+                self.recorder.record = False
+            super().on_stop()
+
+        def find_button(self, prefix):
+            return next(w for w in self.root.walk() if isinstance(w, Button) and prefix in w.text)
+
+        def begin(self, dt):
+            session = args.session
+            if session is None:
+                session = os.path.join(data_dir, 'session.rec')
+                write_session(session, self.synthetic_taps())
+            Window.bind(on_flip=monitor.on_flip)
+            monitor.start()
+            self.started = time.perf_counter()
+            for at, kind in injections(args):
+                Clock.schedule_once(lambda dt, kind=kind: self.inject(kind), at - args.start)
+            self.player = Recorder(window=Window, filename=session)
+            self.player.bind(on_stop=lambda *_: Clock.schedule_once(self.finish, args.settle))
+            self.player.play = True
+            # 回放卡住时兜底
+            Clock.schedule_once(self.finish, args.max_seconds)
+
+        def synthetic_taps(self):
+            """按当前布局生成点击：开锁、查询状态交替，每 5 次清一次日志"""
+            targets = [self.find_button(name) for name in ('开锁', '查询状态', '清除日志')]
+            taps = []
+            for i in range(args.taps):
+                button = targets[2] if i % 5 == 4 else targets[i % 2]
+                x, y = button.to_window(*button.center)
+                taps.append((0.5 + i * args.tap_interval, x / Window.width, y / Window.height))
+            return taps
+
+        def inject(self, kind):
+            if kind == 'burst':
+                threading.Thread(target=self.response_burst, daemon=True).start()
+            else:
+                threading.Thread(target=self.log_storm, daemon=True).start()
+
+        def response_burst(self):
+            """一批状态应答写入状态表（触发汇总刷新），并连续显示几条结果"""
+            for i in range(args.burst_size):
+                frame = status_frame(i % 3 == 0, 10 + i % 90)
+                self.core.record_status(f"86970107{i:07d}", lock_core.parse_lock_command(frame))
+            for result in (lock_core.SUCCESS, lock_core.COMPLETED, lock_core.TIMEOUT):
+                outcome = lock_core.CommandResult(self.mac_input.text.strip(), '1')
+                outcome.result = result
+                Clock.schedule_once(lambda dt, outcome=outcome: self.show_result(outcome), 0)
+
+        def log_storm(self):
+            """与事件线程推送日志相同的方式：每条 add_log 经 Clock.schedule_once 回到主线程"""
+            for i in range(args.storm_size):
+                message = f"设备事件: 状态变化 #{i}"
+                Clock.schedule_once(lambda dt, message=message: self.add_log(message), 0)
+
+        def finish(self, dt):
+            if result:
+                return
+            monitor.stop()
+            Window.unbind(on_flip=monitor.on_flip)
+            result.update(monitor.report())
+            result['seconds'] = round(time.perf_counter() - self.started, 2)
+            self.stop()
+
+    HarnessApp().run()
+    return result
+
+
+def check_budget(report, args):
+    failures = []
+    if args.budget_p99_ms is not None and report.get('frame_ms', {}).get('p99', 0) > args.budget_p99_ms:
+        failures.append(f"帧时间 p99 {report['frame_ms']['p99']} ms 超过预算 {args.budget_p99_ms} ms")
+    if args.max_dropped_ratio is not None and report.get('dropped_ratio', 0) > args.max_dropped_ratio:
+        failures.append(f"掉帧比例 {report['dropped_ratio']} 超过预算 {args.max_dropped_ratio}")
+    if args.max_stall_ms is not None and (report.get('stalls', {}).get('max_ms') or 0) > args.max_stall_ms:
+        failures.append(f"最长卡顿 {report['stalls']['max_ms']} ms 超过预算 {args.max_stall_ms} ms")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='界面帧时间回归测试')
+    parser.add_argument('--session', help='回放的录制文件（默认按布局生成点击）')
+    parser.add_argument('--record', help='录制模式：在可见窗口中操作，关闭窗口时保存到该文件')
+    parser.add_argument('--taps', type=int, default=20, help='生成的点击次数')
+    parser.add_argument('--tap-interval', type=float, default=0.5)
+    parser.add_argument('--bursts', type=int, default=3, help='应答突发次数')
+    parser.add_argument('--burst-size', type=int, default=2000, help='每次突发的状态应答数')
+    parser.add_argument('--log-storms', type=int, default=3, help='日志风暴次数')
+    parser.add_argument('--storm-size', type=int, default=500, help='每次风暴的日志条数')
+    parser.add_argument('--interval', type=float, default=3.0, help='相邻两次注入的间隔（秒）')
+    parser.add_argument('--start', type=float, default=2.0, help='启动后等待多久开始回放（秒）')
+    parser.add_argument('--settle', type=float, default=2.0, help='回放结束后继续测量的时间（秒）')
+    parser.add_argument('--max-seconds', type=float, default=120.0)
+    parser.add_argument('--stall-ms', type=float, default=50.0, help='超过该时间没有出帧记为卡顿')
+    parser.add_argument('--server', help='已有服务器地址；不指定时在子进程启动替身服务器')
+    parser.add_argument('--port', type=int, default=18096)
+    parser.add_argument('--latency', type=float, default=0.02, help='替身服务器延迟（秒）')
+    parser.add_argument('--budget-p99-ms', type=float)
+    parser.add_argument('--max-dropped-ratio', type=float)
+    parser.add_argument('--max-stall-ms', type=float)
+    parser.add_argument('--output', help='写入 JSON 文件（默认打印）')
+    args = parser.parse_args()
+
+    server = None
+    url = args.server
+    if url is None:
+        server = subprocess.Popen([sys.executable, os.path.join(HERE, 'lock_standin_server.py'),
+                                   '--port', str(args.port), '--latency', str(args.latency)],
+                                  stdout=subprocess.PIPE, text=True)
+        url = server.stdout.readline().split(': ', 1)[1].strip()
+    # 界面进程的命令、状态同步和事件流都发往该服务器
+    os.environ['LOCK_EVENTS_URL'] = lock_events.events_url(url)
+    os.environ['LOCK_SERVER_URLS'] = url
+    try:
+        report = run_app(args)
+    finally:
+        if server is not None:
+            server.terminate()
+    if args.record:
+        print(f"已录制: {args.record}")
+        return
+    report['session'] = args.session or 'synthetic'
+    report['injections'] = {'bursts': args.bursts, 'burst_size': args.burst_size,
+                            'log_storms': args.log_storms, 'storm_size': args.storm_size}
+    failures = check_budget(report, args)
+    report['budget_failures'] = failures
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    print(text)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -23,6 +23,8 @@ from kivy.core.text import LabelBase
 from kivy.resources import resource_add_path
 import os
 
+import lock_probe
+
 # 注册中文字体
 try:
     # 尝试注册系统中文字体
@@ -341,9 +343,8 @@ class LockControlApp(App):
                 self.update_status("测试连接中...", (1, 1, 0, 1))
                 self.simulate_progress()
                 
-                # 模拟连接测试
-                time.sleep(1)
-                response = simulate_network_request(self.server_url, {"test": True})
+                # 健康探测：仅发送HEAD请求，不会触发门锁动作
+                response = lock_probe.probe(self.server_url, samples=5).as_response()
                 
                 Clock.schedule_once(
                     lambda dt: self.connection_test_complete(response), 0
@@ -358,6 +359,8 @@ class LockControlApp(App):
     
     def connection_test_complete(self, response):
         """连接测试完成"""
+        for line in response.get("message", "").split("\n"):
+            self.add_log(line)
         if response.get("status") == "success":
             self.is_connected = True
             self.update_status("连接成功", (0, 1, 0, 1))
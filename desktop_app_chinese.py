@@ -24,6 +24,8 @@ from kivy.config import Config
 import os
 import platform
 
+import lock_probe
+
 # 设置窗口大小
 Config.set('graphics', 'width', '800')
 Config.set('graphics', 'height', '600')
@@ -370,9 +372,8 @@ class ChineseLockControlApp(App):
                 self.update_status("Testing connection...", (1, 1, 0, 1))
                 self.simulate_progress()
                 
-                # 模拟连接测试
-                time.sleep(1)
-                response = simulate_network_request(self.server_url, {"test": True})
+                # 健康探测：仅发送HEAD请求，不会触发门锁动作
+                response = lock_probe.probe(self.server_url, samples=5).as_response()
                 
                 Clock.schedule_once(
                     lambda dt: self.connection_test_complete(response), 0
@@ -387,6 +388,8 @@ class ChineseLockControlApp(App):
     
     def connection_test_complete(self, response):
         """连接测试完成"""
+        for line in response.get("message", "").split("\n"):
+            self.add_log(line)
         if response.get("status") == "success":
             self.is_connected = True
             self.update_status("Connection OK", (0, 1, 0, 1))
@@ -21,6 +21,8 @@ from kivy.uix.gridlayout import GridLayout
 from kivy.uix.scrollview import ScrollView
 from kivy.config import Config
 
+import lock_probe
+
 # Set window size
 Config.set('graphics', 'width', '800')
 Config.set('graphics', 'height', '600')
@@ -323,9 +325,8 @@ class SmartLockControlApp(App):
                 self.update_status("Testing connection...", (1, 1, 0, 1))
                 self.simulate_progress()
                 
-                # Simulate connection test
-                time.sleep(1)
-                response = simulate_network_request(self.server_url, {"test": True})
+                # Health probe: HEAD requests only, no lock-side effects
+                response = lock_probe.probe(self.server_url, samples=5).as_response()
                 
                 Clock.schedule_once(
                     lambda dt: self.connection_test_complete(response), 0
@@ -340,6 +341,8 @@ class SmartLockControlApp(App):
     
     def connection_test_complete(self, response):
         """Connection test completion"""
+        for line in response.get("message", "").split("\n"):
+            self.add_log(line)
         if response.get("status") == "success":
             self.is_connected = True
             self.update_status("Connection OK", (0, 1, 0, 1))
@@ -0,0 +1,507 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+命令审计日志
+按时间追加写入每条命令及 msg_info 响应帧：记录为带长度前缀的二进制格式，按块用zlib压缩；
+活动段写满后轮转，并在后台整理为按 (MAC, 时间) 排序的封存段，附带稀疏块索引。
+读取端通过 mmap 只解压命中的块，“某设备上个月的全部开锁”只需触及很少的数据；
+命令行可流式导出为 CSV 或 JSON Lines
+
+目录结构：
+    seg-00000001.log / .lidx   活动段（按到达顺序）及其块索引
+    seg-00000001.mac / .midx   封存段（按MAC、时间排序）及其稀疏索引
+"""
+
+import argparse
+import csv
+import datetime
+import heapq
+import json
+import mmap
+import operator
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+
+BLOCK_MAGIC = b'LAB1'
+BLOCK_HEADER = struct.Struct('<4sIIIqq')        # magic, 压缩长度, 原始长度, 记录数, 最小时间, 最大时间
+LOG_INDEX = struct.Struct('<QIIIqq')            # 偏移, 压缩长度, 原始长度, 记录数, 最小时间, 最大时间
+MAC_INDEX = struct.Struct('<QIIIqq16s16s')      # 同上 + 块内首个/最后一个MAC键
+RECORD_LEN = struct.Struct('<I')
+RECORD_HEAD = struct.Struct('<qqB')             # 时间(微秒), sn, 类型
+
+KIND_COMMAND = 0
+KIND_RESPONSE = 1
+KIND_NAMES = {KIND_COMMAND: 'command', KIND_RESPONSE: 'response'}
+
+# 封存时每个临时有序段的大小（未压缩字节）及归并时每段的读缓冲
+SEAL_RUN_SIZE = 1024 * 1024
+SEAL_RUN_BUFFER = 16 * 1024
+
+# 字段长度前缀：MAC/命令/结果 1 字节，响应帧 2 字节；超长部分截断
+FIELD_MAX = 0xFF
+FRAME_MAX = 0xFFFF
+
+FIELDS = ('time', 'kind', 'mac', 'cmd', 'sn', 'result', 'frame')
+
+
+def _mac_key(mac):
+    """MAC的定长排序键（16字节）；超长MAC按前缀比较，记录级过滤保证结果准确"""
+    return mac[:16].ljust(16, b'\0')
+
+
+def encode_record(ts_us, sn, kind, mac, cmd, result, frame):
+    """编码一条记录（不含长度前缀），字符串字段均为bytes；超出长度前缀范围的字段截断"""
+    mac, cmd, result, frame = mac[:FIELD_MAX], cmd[:FIELD_MAX], result[:FIELD_MAX], frame[:FRAME_MAX]
+    return b''.join((
+        RECORD_HEAD.pack(ts_us, sn, kind),
+        bytes((len(mac),)), mac,
+        bytes((len(cmd),)), cmd,
+        bytes((len(result),)), result,
+        struct.pack('<H', len(frame)), frame,
+    ))
+
+
+def decode_records(raw):
+    """解码块内全部记录，逐条产出 (ts_us, sn, kind, mac, cmd, result, frame)"""
+    pos = 0
+    end = len(raw)
+    unpack_head = RECORD_HEAD.unpack_from
+    while pos < end:
+        (length,) = RECORD_LEN.unpack_from(raw, pos)
+        start = pos + 4
+        pos = start + length
+        ts_us, sn, kind = unpack_head(raw, start)
+        p = start + RECORD_HEAD.size
+        n = raw[p]
+        mac = raw[p + 1:p + 1 + n]
+        p += 1 + n
+        n = raw[p]
+        cmd = raw[p + 1:p + 1 + n]
+        p += 1 + n
+        n = raw[p]
+        result = raw[p + 1:p + 1 + n]
+        p += 1 + n
+        (n,) = struct.unpack_from('<H', raw, p)
+        frame = raw[p + 2:p + 2 + n]
+        yield ts_us, sn, kind, mac, cmd, result, frame
+
+
+def _write_block(f, records, level):
+    """把已编码记录写成一个压缩块，返回索引所需信息"""
+    raw = b''.join(RECORD_LEN.pack(len(body)) + body for _, _, body in records)
+    compressed = zlib.compress(raw, level)
+    min_ts = min(ts for ts, _, _ in records)
+    max_ts = max(ts for ts, _, _ in records)
+    offset = f.tell()
+    f.write(BLOCK_HEADER.pack(BLOCK_MAGIC, len(compressed), len(raw), len(records), min_ts, max_ts))
+    f.write(compressed)
+    return offset, len(compressed), len(raw), len(records), min_ts, max_ts
+
+
+def _scan_blocks(path):
+    """扫描段文件的块头，返回有效块索引和有效长度（用于崩溃后恢复）"""
+    entries = []
+    valid = 0
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        while valid + BLOCK_HEADER.size <= size:
+            f.seek(valid)
+            header = f.read(BLOCK_HEADER.size)
+            magic, comp_len, raw_len, count, min_ts, max_ts = BLOCK_HEADER.unpack(header)
+            if magic != BLOCK_MAGIC or valid + BLOCK_HEADER.size + comp_len > size:
+                break
+            entries.append((valid, comp_len, raw_len, count, min_ts, max_ts))
+            valid += BLOCK_HEADER.size + comp_len
+    return entries, valid
+
+
+class AuditLog:
+    """审计日志写入端（线程安全）"""
+
+    def __init__(self, directory, block_size=64 * 1024, segment_size=8 * 1024 * 1024,
+                 flush_interval=1.0, level=6):
+        self.directory = directory
+        self.block_size = block_size
+        self.segment_size = segment_size
+        self.flush_interval = flush_interval
+        self.level = level
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._records = []
+        self._buffered = 0
+        self._first_buffered = 0.0
+        self._closed = False
+        self._sealers = []
+
+        logs = sorted(name for name in os.listdir(directory) if name.endswith('.log'))
+        for name in logs[:-1]:
+            # 上次未来得及封存的段
+            self._seal_async(os.path.join(directory, name))
+        if logs:
+            self._seq = int(logs[-1][4:12])
+            self._open_segment(recover=True)
+        else:
+            self._seq = self._max_sealed_seq() + 1
+            self._open_segment()
+        self._flusher = threading.Thread(target=self._flush_loop, name='audit-flusher', daemon=True)
+        self._flusher.start()
+
+    def _max_sealed_seq(self):
+        seqs = [int(name[4:12]) for name in os.listdir(self.directory) if name.endswith('.midx')]
+        return max(seqs) if seqs else 0
+
+    def _segment_path(self, ext, seq=None):
+        return os.path.join(self.directory, f"seg-{seq or self._seq:08d}.{ext}")
+
+    def _open_segment(self, recover=False):
+        path = self._segment_path('log')
+        if recover and os.path.exists(path):
+            # 截掉崩溃时写了一半的块，并重建块索引
+            entries, valid = _scan_blocks(path)
+            with open(path, 'r+b') as f:
+                f.truncate(valid)
+            with open(self._segment_path('lidx'), 'wb') as f:
+                for entry in entries:
+                    f.write(LOG_INDEX.pack(*entry))
+        self._segment = open(path, 'ab')
+        self._index = open(self._segment_path('lidx'), 'ab')
+
+    # ---- 写入 ----
+
+    def append(self, kind, mac, cmd, sn, frame='', result='', ts=None):
+        """追加一条记录；ts为秒级时间戳，默认当前时间"""
+        ts_us = int((ts if ts is not None else time.time()) * 1000000)
+        body = encode_record(ts_us, int(sn or 0), kind, str(mac).encode(), str(cmd).encode(),
+                             str(result).encode(), str(frame).encode())
+        with self._lock:
+            if self._closed:
+                return
+            if not self._records:
+                self._first_buffered = time.monotonic()
+            self._records.append((ts_us, mac, body))
+            self._buffered += len(body) + 4
+            if self._buffered >= self.block_size:
+                self._flush_locked()
+
+    def record_command(self, mac, cmd, sn, frame, ts=None):
+        self.append(KIND_COMMAND, mac, cmd, sn, frame, '', ts)
+
+    def record_response(self, mac, cmd, sn, frame, result, ts=None):
+        self.append(KIND_RESPONSE, mac, cmd, sn, frame, result, ts)
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._records:
+            return
+        entry = _write_block(self._segment, self._records, self.level)
+        self._segment.flush()
+        self._index.write(LOG_INDEX.pack(*entry))
+        self._index.flush()
+        self._records = []
+        self._buffered = 0
+        if self._segment.tell() >= self.segment_size:
+            self._rotate_locked()
+
+    def _rotate_locked(self):
+        self._segment.close()
+        self._index.close()
+        finished = self._segment_path('log')
+        self._seq += 1
+        self._open_segment()
+        self._seal_async(finished)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval / 2)
+            with self._lock:
+                if self._closed:
+                    return
+                if self._records and time.monotonic() - self._first_buffered >= self.flush_interval:
+                    self._flush_locked()
+
+    # ---- 封存 ----
+
+    def _seal_async(self, path):
+        thread = threading.Thread(target=seal_segment, args=(path, self.block_size, self.level),
+                                  name='audit-sealer', daemon=True)
+        thread.start()
+        self._sealers.append(thread)
+
+    def close(self, wait_seal=True):
+        with self._lock:
+            self._flush_locked()
+            self._closed = True
+            self._segment.close()
+            self._index.close()
+        if wait_seal:
+            for thread in self._sealers:
+                thread.join()
+
+
+def _segment_records(path):
+    """按写入顺序逐条产出活动段中的 (mac, ts_us, body)"""
+    entries, _ = _scan_blocks(path)
+    with open(path, 'rb') as f:
+        for offset, comp_len, _, _, _, _ in entries:
+            f.seek(offset + BLOCK_HEADER.size)
+            raw = zlib.decompress(f.read(comp_len))
+            pos = 0
+            while pos < len(raw):
+                (length,) = RECORD_LEN.unpack_from(raw, pos)
+                body = raw[pos + 4:pos + 4 + length]
+                pos += 4 + length
+                yield _record_key(body) + (body,)
+
+
+def _record_key(body):
+    """记录体 -> (mac, ts_us)"""
+    n = body[RECORD_HEAD.size]
+    return body[RECORD_HEAD.size + 1:RECORD_HEAD.size + 1 + n], RECORD_HEAD.unpack_from(body)[0]
+
+
+_SEAL_ORDER = operator.itemgetter(0, 1)
+
+
+def _write_run(path, records):
+    with open(path, 'wb') as f:
+        for _, _, body in records:
+            f.write(RECORD_LEN.pack(len(body)))
+            f.write(body)
+
+
+def _read_run(path):
+    with open(path, 'rb', buffering=SEAL_RUN_BUFFER) as f:
+        while True:
+            head = f.read(RECORD_LEN.size)
+            if not head:
+                return
+            body = f.read(RECORD_LEN.unpack(head)[0])
+            yield _record_key(body) + (body,)
+
+
+def seal_segment(path, block_size=64 * 1024, level=6, run_size=None):
+    """把活动段整理为按 (MAC, 时间) 排序的封存段，完成后删除原文件
+
+    外部排序：每攒够 run_size 字节（未压缩）的记录排序后写成一个临时有序段，最后多路归并，
+    内存占用与段大小无关（默认约几MB）；整段不超过 run_size 时直接在内存中排序"""
+    run_size = run_size or SEAL_RUN_SIZE
+    base = path[:-len('.log')]
+    runs = []
+    try:
+        chunk = []
+        size = 0
+        for record in _segment_records(path):
+            chunk.append(record)
+            size += len(record[2]) + 4
+            if size >= run_size:
+                chunk.sort(key=_SEAL_ORDER)
+                runs.append(f"{base}.run{len(runs):04d}.tmp")
+                _write_run(runs[-1], chunk)
+                chunk = []
+                size = 0
+        chunk.sort(key=_SEAL_ORDER)
+        if runs:
+            if chunk:
+                runs.append(f"{base}.run{len(runs):04d}.tmp")
+                _write_run(runs[-1], chunk)
+                chunk = []
+            # 各有序段按写入顺序排列，merge 对相同键保持先后，与整段稳定排序结果一致
+            records = heapq.merge(*(_read_run(run) for run in runs), key=_SEAL_ORDER)
+        else:
+            records = chunk
+        _write_sealed(base, records, block_size, level)
+    finally:
+        for run in runs:
+            try:
+                os.remove(run)
+            except FileNotFoundError:
+                pass
+    for ext in ('.log', '.lidx'):
+        try:
+            os.remove(base + ext)
+        except FileNotFoundError:
+            pass
+
+
+def _write_sealed(base, records, block_size, level):
+    with open(base + '.mac.tmp', 'wb') as data, open(base + '.midx.tmp', 'wb') as index:
+        block = []
+        size = 0
+        for mac, ts_us, body in records:
+            block.append((ts_us, mac, body))
+            size += len(body) + 4
+            if size >= block_size:
+                _write_sealed_block(data, index, block, level)
+                block = []
+                size = 0
+        if block:
+            _write_sealed_block(data, index, block, level)
+        data.flush()
+        os.fsync(data.fileno())
+        index.flush()
+        os.fsync(index.fileno())
+    os.replace(base + '.mac.tmp', base + '.mac')
+    os.replace(base + '.midx.tmp', base + '.midx')
+
+
+def _write_sealed_block(data, index, block, level):
+    entry = _write_block(data, block, level)
+    index.write(MAC_INDEX.pack(*entry, _mac_key(block[0][1]), _mac_key(block[-1][1])))
+
+
+class AuditReader:
+    """审计日志读取端：mmap段文件，按稀疏索引只解压命中的块"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.segments = []
+        names = set(os.listdir(directory))
+        seqs = sorted({name[4:12] for name in names if name.startswith('seg-')})
+        for seq in seqs:
+            base = os.path.join(directory, f"seg-{seq}")
+            if f"seg-{seq}.midx" in names and f"seg-{seq}.mac" in names:
+                self.segments.append(('mac', base + '.mac', self._load(base + '.midx', MAC_INDEX)))
+            elif f"seg-{seq}.log" in names:
+                entries, _ = _scan_blocks(base + '.log')
+                self.segments.append(('log', base + '.log', entries))
+
+    @staticmethod
+    def _load(path, layout):
+        with open(path, 'rb') as f:
+            data = f.read()
+        usable = len(data) - len(data) % layout.size
+        return [layout.unpack_from(data, pos) for pos in range(0, usable, layout.size)]
+
+    def count(self):
+        return sum(entry[3] for _, _, entries in self.segments for entry in entries)
+
+    def query(self, mac=None, start=None, end=None, kind=None, cmd=None):
+        """流式查询；start/end为秒级时间戳（end不含），逐条产出 dict"""
+        mac_b = mac.encode()[:FIELD_MAX] if mac else None
+        key = _mac_key(mac_b) if mac_b else None
+        start_us = int(start * 1000000) if start is not None else -(1 << 62)
+        end_us = int(end * 1000000) if end is not None else 1 << 62
+        cmd_b = str(cmd).encode()[:FIELD_MAX] if cmd is not None else None
+        for layout, path, entries in self.segments:
+            if not entries:
+                continue
+            if max(e[5] for e in entries) < start_us or min(e[4] for e in entries) >= end_us:
+                continue
+            with open(path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    continue
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                try:
+                    for entry in self._candidate_blocks(layout, entries, key, start_us, end_us):
+                        offset, comp_len = entry[0], entry[1]
+                        body_start = offset + BLOCK_HEADER.size
+                        raw = zlib.decompress(mm[body_start:body_start + comp_len])
+                        for ts_us, sn, rec_kind, rec_mac, rec_cmd, result, frame in decode_records(raw):
+                            if mac_b is not None and rec_mac != mac_b:
+                                continue
+                            if not start_us <= ts_us < end_us:
+                                continue
+                            if kind is not None and rec_kind != kind:
+                                continue
+                            if cmd_b is not None and rec_cmd != cmd_b:
+                                continue
+                            yield {
+                                'time': ts_us / 1000000.0,
+                                'kind': KIND_NAMES.get(rec_kind, str(rec_kind)),
+                                # 截断可能切在多字节字符中间
+                                'mac': rec_mac.decode(errors='replace'),
+                                'cmd': rec_cmd.decode(errors='replace'),
+                                'sn': sn,
+                                'result': result.decode(errors='replace'),
+                                'frame': frame.decode(errors='replace'),
+                            }
+                finally:
+                    mm.close()
+
+    @staticmethod
+    def _candidate_blocks(layout, entries, key, start_us, end_us):
+        if layout == 'mac' and key is not None:
+            # 封存段按MAC排序：二分定位第一个可能包含该MAC的块
+            lo, hi = 0, len(entries)
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if entries[mid][7] < key:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            for entry in entries[lo:]:
+                if entry[6] > key:
+                    break
+                if entry[5] >= start_us and entry[4] < end_us:
+                    yield entry
+            return
+        for entry in entries:
+            if entry[5] >= start_us and entry[4] < end_us:
+                yield entry
+
+
+def _parse_time(text):
+    if text is None:
+        return None
+    try:
+        return float(text)
+    except ValueError:
+        return datetime.datetime.fromisoformat(text).timestamp()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='门锁审计日志工具')
+    sub = parser.add_subparsers(dest='command', required=True)
+    export = sub.add_parser('export', help='流式导出为CSV或JSON Lines')
+    export.add_argument('directory')
+    export.add_argument('--mac')
+    export.add_argument('--since', help='起始时间（ISO日期或时间戳）')
+    export.add_argument('--until', help='截止时间（不含）')
+    export.add_argument('--kind', choices=('command', 'response'))
+    export.add_argument('--cmd', help='命令类型，如 0（开锁）、1（查询）')
+    export.add_argument('--format', choices=('csv', 'jsonl'), default='jsonl')
+    export.add_argument('--output', help='输出文件，默认标准输出')
+    stats = sub.add_parser('stats', help='显示段数和记录数')
+    stats.add_argument('directory')
+    seal = sub.add_parser('seal', help='立即封存所有活动段')
+    seal.add_argument('directory')
+    args = parser.parse_args(argv)
+
+    if args.command == 'stats':
+        reader = AuditReader(args.directory)
+        sealed = sum(1 for layout, _, _ in reader.segments if layout == 'mac')
+        print(f"段: {len(reader.segments)}（封存 {sealed}）, 记录: {reader.count()}")
+        return
+    if args.command == 'seal':
+        for name in sorted(os.listdir(args.directory)):
+            if name.endswith('.log'):
+                seal_segment(os.path.join(args.directory, name))
+        return
+
+    kind = {'command': KIND_COMMAND, 'response': KIND_RESPONSE}.get(args.kind)
+    rows = AuditReader(args.directory).query(args.mac, _parse_time(args.since),
+                                             _parse_time(args.until), kind, args.cmd)
+    out = open(args.output, 'w', encoding='utf-8', newline='') if args.output else sys.stdout
+    try:
+        if args.format == 'csv':
+            writer = csv.DictWriter(out, fieldnames=FIELDS)
+            writer.writeheader()
+            for row in rows:
+                writer.writerow(row)
+        else:
+            for row in rows:
+                out.write(json.dumps(row, ensure_ascii=False) + '\n')
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == '__main__':
+    main()
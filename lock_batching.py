@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+命令微批处理
+BatchingTransport 包装任一 Transport：短时间窗口内到达的命令打包成一个数组信封
+    {"type": "yfn03", "cmd": "batch", "items": [命令, ...]}
+服务器按顺序返回 {"code": 0, "results": [{"mac", "sn", "code", "data"}, ...]}，再按 (mac, sn) 分发给各调用方。
+
+窗口和批大小随负载自适应：到达间隔大于窗口上限时不等待直接发送（低负载不增加延迟）；
+批次填满且延迟正常时批大小翻倍，信封延迟超过目标时减半。
+服务器明确不支持批量信封（400/404/405，或成功应答中没有 results）时自动退回逐条发送；
+502/503 等暂时性故障不改变判断，只把本批中的幂等命令逐条重发。在确认支持之前，
+开锁等非幂等命令不放进信封，以免服务器不认识信封时无法判断其是否已执行。
+命令带 Deadline（lock_deadline）时，排队中已过截止时间或已取消的命令在装批前剔除，不会发出
+"""
+
+import json
+import os
+import threading
+import time
+
+import requests
+
+import lock_deadline
+import lock_metrics
+from lock_transport import Transport, TransportResponse, status_for_code
+
+# 无标签计数，预先绑定子计数，累加时不再查标签
+BATCHES_TOTAL = lock_metrics.REGISTRY.counter(
+    'lock_batch_envelopes_total', '发出的批量信封数', ()).labels()
+BATCH_ITEMS_TOTAL = lock_metrics.REGISTRY.counter(
+    'lock_batch_items_total', '经批量信封发送的命令数', ()).labels()
+
+# 批量端点返回这些状态码时确认服务器不支持批量信封（信封未被执行）
+UNSUPPORTED_STATUS = (400, 404, 405)
+
+
+def _total(timeout):
+    return sum(timeout) if isinstance(timeout, tuple) else timeout
+
+
+class _Item:
+    __slots__ = ('payload', 'timeout', 'idempotent', 'deadline', 'key', 'done', 'response', 'error')
+
+    def __init__(self, payload, timeout, idempotent, deadline=None):
+        self.payload = payload
+        self.timeout = timeout
+        self.idempotent = idempotent
+        self.deadline = deadline
+        self.key = (payload.get('mac'), payload.get('sn'))
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+
+    def abort(self):
+        """取消：立即唤醒等待的调用方；仍在队列中的命令不再发出"""
+        self.error = lock_deadline.Cancelled(self.deadline.reason or "命令已取消")
+        self.done.set()
+
+    def expire(self):
+        """排队期间已取消或已过截止时间时结束该命令，返回 True"""
+        if self.done.is_set():
+            return True
+        if self.deadline is None or not self.deadline.done:
+            return False
+        try:
+            self.deadline.check()
+        except requests.exceptions.RequestException as e:
+            self.error = e
+        self.done.set()
+        return True
+
+
+class BatchingTransport(Transport):
+    """把并发命令合并成批量信封发送的传输包装"""
+
+    name = 'batching'
+
+    def __init__(self, transport, max_batch=200, min_batch=4, max_wait=0.005,
+                 latency_target=0.5, device_type='yfn03'):
+        self.transport = transport
+        self.max_batch = max_batch
+        self.min_batch = min_batch
+        self.max_wait = max_wait
+        self.latency_target = latency_target
+        self.device_type = device_type
+        self.batch_size = min_batch
+        self.supported = None                   # None=未知, True/False=已探明
+        self.interval = max_wait * 10           # 命令到达间隔的EWMA
+        self._last_arrival = time.perf_counter()
+        self._queue = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='lock-batcher', daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def wrap_from_env(cls, transport):
+        """LOCK_BATCH=最大批大小（如 200）时启用批处理，未设置时原样返回"""
+        size = int(os.environ.get('LOCK_BATCH', '0') or 0)
+        return cls(transport, max_batch=size) if size > 1 else transport
+
+    def post(self, payload, timeout=10, idempotent=False):
+        if self.supported is False or self._closed:
+            return self.transport.post(payload, timeout=timeout, idempotent=idempotent)
+        deadline = lock_deadline.current()
+        wait = _total(timeout)
+        if deadline is not None:
+            deadline.check()
+            wait = deadline.clamp(wait)
+        item = _Item(payload, timeout, idempotent, deadline)
+        with self._cond:
+            now = time.perf_counter()
+            self.interval += 0.2 * ((now - self._last_arrival) - self.interval)
+            self._last_arrival = now
+            self._queue.append(item)
+            self._cond.notify()
+        with lock_deadline.watch(deadline, item.abort):
+            finished = item.done.wait(wait + self.max_wait)
+        if not finished:
+            raise requests.exceptions.ReadTimeout(f"批量命令 {item.key} 超时")
+        if item.error is not None:
+            raise item.error
+        return item.response
+
+    def queue_depth(self):
+        """等待装入批量信封的命令数"""
+        with self._cond:
+            return len(self._queue)
+
+    def _window(self):
+        """本批最多再等待多久：预计窗口内到不了第二条命令时不等待"""
+        if self.interval * 2 >= self.max_wait:
+            return 0.0
+        return self.max_wait
+
+    def _take_batch(self):
+        """取出一批 (mac, sn) 互不相同的命令"""
+        batch, keys, rest = [], set(), []
+        for item in self._queue:
+            if item.expire():
+                continue
+            if len(batch) < self.batch_size and item.key not in keys:
+                keys.add(item.key)
+                batch.append(item)
+            else:
+                rest.append(item)
+        self._queue = rest
+        return batch
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if self._closed and not self._queue:
+                    return
+                deadline = time.perf_counter() + self._window()
+                while len(self._queue) < self.batch_size and not self._closed:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._take_batch()
+            if self.supported is None:
+                self._send_singles([item for item in batch if not item.idempotent])
+                batch = [item for item in batch if item.idempotent]
+            if not batch:
+                continue
+            if len(batch) == 1 or self.supported is False:
+                self._send_singles(batch)
+            else:
+                threading.Thread(target=self._send_batch, args=(batch,), daemon=True).start()
+
+    def _send_singles(self, items):
+        for item in items:
+            threading.Thread(target=self._send_single, args=(item,), daemon=True).start()
+
+    def _send_single(self, item):
+        try:
+            with lock_deadline.activate(item.deadline):
+                item.response = self.transport.post(item.payload, timeout=item.timeout, idempotent=item.idempotent)
+        except Exception as e:
+            item.error = e
+        item.done.set()
+
+    def _send_batch(self, batch):
+        envelope = {"type": self.device_type, "cmd": "batch", "items": [item.payload for item in batch]}
+        # 信封中的命令全部被取消后中止信封请求
+        envelope_deadline = lock_deadline.Deadline()
+
+        def abandon():
+            if all(item.done.is_set() for item in batch):
+                envelope_deadline.cancel("信封中的命令均已取消")
+
+        deadlines = {item.deadline for item in batch if item.deadline is not None}
+        for deadline in deadlines:
+            deadline.register(abandon)
+        start = time.perf_counter()
+        try:
+            with envelope_deadline.activate():
+                response = self.transport.post(envelope, timeout=max((item.timeout for item in batch), key=_total),
+                                               idempotent=all(item.idempotent for item in batch))
+            body = response.json() if response.status_code == 200 else {}
+        except (requests.exceptions.RequestException, ValueError) as e:
+            for item in batch:
+                item.error = e
+                item.done.set()
+            return
+        finally:
+            for deadline in deadlines:
+                deadline.unregister(abandon)
+        elapsed = time.perf_counter() - start
+        status = response.status_code
+        results = body.get('results')
+        if status in UNSUPPORTED_STATUS or (status == 200 and 'results' not in body):
+            # 服务器明确不认识批量信封（信封未被执行）：此后逐条发送，本批也逐条重发
+            self.supported = False
+            self._send_singles(batch)
+            return
+        if not isinstance(results, list):
+            # 暂时性故障（如502/503）或应答不完整：不改变支持判断。幂等命令逐条重发；
+            # 非幂等命令可能已执行，不重发，如实返回信封的结果
+            self._send_singles([item for item in batch if item.idempotent])
+            for item in batch:
+                if item.idempotent:
+                    continue
+                if status != 200:
+                    item.response = TransportResponse(status, response.content, getattr(response, 'endpoint', None))
+                else:
+                    item.error = requests.exceptions.RequestException("批量应答格式错误")
+                item.done.set()
+            return
+        self.supported = True
+        BATCHES_TOTAL.inc()
+        BATCH_ITEMS_TOTAL.inc(len(batch))
+        self._adapt(len(batch), elapsed)
+        by_key = {(r.get('mac'), r.get('sn')): r for r in results}
+        endpoint = getattr(response, 'endpoint', None)
+        for item in batch:
+            result = by_key.get(item.key)
+            if result is None:
+                item.error = requests.exceptions.ConnectionError(f"批量应答中缺少 {item.key}")
+            else:
+                code = result.get('code') or 0
+                content = json.dumps({'code': code, 'data': result.get('data', [])},
+                                     ensure_ascii=False).encode('utf-8')
+                item.response = TransportResponse(status_for_code(code), content, endpoint)
+            item.done.set()
+
+    def _adapt(self, size, elapsed):
+        if elapsed > self.latency_target:
+            self.batch_size = max(self.min_batch, self.batch_size // 2)
+        elif size >= self.batch_size:
+            self.batch_size = min(self.max_batch, self.batch_size * 2)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout=2)
+        self.transport.close()
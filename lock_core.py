@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+命令核心
+不依赖 Kivy 的命令流水线：构造请求体、经传输发送、解析应答帧、判定结果，并维护设备清单、状态表、
+离线命令队列、审计日志和定时任务。桌面/手机界面（main.py）、后台服务（lockd.py）
+和命令行（lockctl.py）共用这一套逻辑；界面只负责把 CommandResult 显示出来
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import lock_audit
+import lock_batching
+import lock_deadline
+import lock_endpoints
+import lock_fleet
+import lock_metrics
+import lock_probe
+import lock_protocol
+import lock_queue
+import lock_scheduler
+import lock_sharding
+import lock_sync
+import lock_tracing
+import lock_transport
+
+DEFAULT_SERVER_URL = "https://svr.yefiot.com/yefiot/v1/mqttpost/"
+
+# CommandResult.result 的取值（与 lock_commands_total 的 result 标签一致）
+SUCCESS = 'success'          # 应答码表示命令执行成功
+COMPLETED = 'completed'      # 有应答帧，但不是该命令的成功码
+BAD_FORMAT = 'bad_format'    # 应答中的帧无法解析
+NO_DATA = 'no_data'          # 应答中没有数据
+HTTP_ERROR = 'http_error'
+QUEUED = 'queued'            # 请求未发出，已加入离线队列
+TIMEOUT = 'timeout'
+CANCELLED = 'cancelled'      # 被取消（Deadline.cancel），在途请求已中止
+EXPIRED = 'expired'          # 已过截止时间，命令未发出
+ERROR = 'error'
+
+
+def parse_lock_command(hex_string):
+    """解析门锁指令"""
+    if not hex_string.startswith('HD'):
+        return None
+
+    return {
+        'header': hex_string[:2],
+        'command': hex_string[2:4],
+        'data': hex_string[4:-1],
+        'checksum': hex_string[-1]
+    }
+
+
+class CommandResult:
+    """一条命令的执行结果"""
+
+    __slots__ = ('mac', 'cmd', 'sn', 'result', 'http_status', 'msg_info', 'parsed', 'response_data',
+                 'error', 'elapsed', 'ttl')
+
+    def __init__(self, mac, cmd):
+        self.mac = mac
+        self.cmd = cmd
+        self.sn = None
+        self.result = ERROR
+        self.http_status = ''
+        self.msg_info = ''
+        self.parsed = None
+        self.response_data = None
+        self.error = None
+        self.elapsed = 0.0
+        self.ttl = None
+
+    @property
+    def ok(self):
+        return self.result in (SUCCESS, COMPLETED)
+
+    @classmethod
+    def from_dict(cls, data):
+        """to_dict 的逆过程（如来自引擎进程的结果），只恢复界面用到的字段"""
+        outcome = cls(data.get('mac'), data.get('cmd'))
+        outcome.sn = data.get('sn')
+        outcome.result = data.get('result', ERROR)
+        outcome.http_status = data.get('http_status', '')
+        outcome.msg_info = data.get('msg_info', '')
+        outcome.error = data.get('error')
+        outcome.elapsed = data.get('elapsed_ms', 0) / 1000.0
+        return outcome
+
+    def to_dict(self):
+        result = {'mac': self.mac, 'cmd': self.cmd, 'sn': self.sn, 'result': self.result,
+                  'http_status': self.http_status, 'msg_info': self.msg_info,
+                  'elapsed_ms': round(self.elapsed * 1000, 2)}
+        if self.error:
+            result['error'] = self.error
+        return result
+
+
+class LockCore:
+    """命令流水线和它依赖的全部状态"""
+
+    def __init__(self, server_url=DEFAULT_SERVER_URL, timeout=10, log=None):
+        self.server_url = server_url
+        # 请求超时 (连接, 读取)，连接测试后按探测结果调整
+        self.timeout = timeout
+        self.log = log or (lambda message: None)
+        # 复用连接并为DNS/TCP/TLS阶段打点
+        self.session = lock_transport.create_session()
+        # 设备清单与状态表
+        self.registry = lock_fleet.DeviceRegistry()
+        self.fleet = lock_fleet.StatusStore()
+        self.registry_changed = False
+        # 各型号的命令帧与应答布局（protocols.json），按设备清单中的 model 选择
+        self.protocols = lock_protocol.default_registry()
+        # 多个等价服务器（LOCK_SERVER_URLS）按延迟选路并自动故障切换，状态查询启用对冲请求；
+        # LOCK_TRANSPORT=mqtt 时改为经 MQTT broker 直连发送；LOCK_SHARDS 按设备归属分片发往区域服务器
+        # （设备清单中的 endpoint 优先）；LOCK_BATCH 开启批量信封，分片时每个分片各自装批
+        self.endpoints = lock_endpoints.EndpointPool.from_env(server_url)
+        hedging = lock_transport.HedgingPolicy.from_env()
+        transport = lock_transport.transport_from_env(self.endpoints, self.session, hedging=hedging)
+        sharded = lock_sharding.ShardedTransport.wrap_from_env(
+            transport, self.registry, hedging=hedging, wrap=lock_batching.BatchingTransport.wrap_from_env)
+        self.transport = sharded if sharded is not transport else lock_batching.BatchingTransport.wrap_from_env(transport)
+        # 条件查询/变更查询，只拉取有变化的设备
+        self.sync = lock_sync.StatusSync(self.transport, self.fleet, timeout=timeout,
+                                         protocol_for=self.protocol_for)
+        # 离线命令队列、审计日志和定时任务，在 open 中打开
+        self.outbox = None
+        self.replayer = None
+        self.audit = None
+        self.scheduler = None
+        self.on_scheduled = None
+
+    def open(self, data_dir, on_drained=None, on_scheduled=None):
+        """打开数据目录下的审计日志、离线命令队列和定时任务，返回离线队列中待发送的命令数"""
+        os.makedirs(data_dir, exist_ok=True)
+        self.audit = lock_audit.AuditLog(os.path.join(data_dir, 'audit'))
+        self.outbox = lock_queue.CommandQueue(os.path.join(data_dir, 'outbox.db'))
+        self.replayer = lock_queue.Replayer(
+            self.outbox, self.send_queued, self.network_online, on_drained=on_drained).start()
+        pending = self.outbox.pending_count()
+        if pending:
+            self.replayer.kick()
+        # 定时任务（python lock_scheduler.py --db <数据目录>/schedule.db add ...），到期命令经离线队列发送
+        self.on_scheduled = on_scheduled
+        self.scheduler = lock_scheduler.Scheduler(
+            os.path.join(data_dir, 'schedule.db'), on_fire=self.run_scheduled).start()
+        return pending
+
+    def close(self):
+        if self.scheduler:
+            self.scheduler.stop()
+        if self.replayer:
+            self.replayer.stop()
+        if self.outbox:
+            self.outbox.close()
+        if self.audit:
+            self.audit.close(wait_seal=False)
+        self.transport.close()
+
+    def set_timeout(self, timeout):
+        self.timeout = timeout
+        self.sync.timeout = timeout
+
+    def protocol_for(self, mac):
+        """设备型号对应的协议；未登记型号的设备使用默认型号"""
+        return self.protocols.get(self.registry.get(mac).get('model'))
+
+    # ---- 发送 ----
+
+    def command(self, mac, name, **kwargs):
+        """按协议中的命令名（unlock/status）发送"""
+        command = self.protocol_for(mac).command(name)
+        return self.execute(mac, command.cmd, command.frame(), **kwargs)
+
+    def execute(self, mac, cmd_type, info_data, enqueued_at=None, trace=lock_tracing.NULL_TRACE,
+                on_progress=None, deadline=None):
+        """发送门锁命令并判定结果；on_progress(百分比) 用于界面进度条，在发送线程上调用。
+        deadline（lock_deadline.Deadline）为截止时间和取消句柄：到期或取消的命令不再发出，
+        请求超时收紧到剩余时间以内，取消时中止在途请求"""
+        started = time.perf_counter()
+        if enqueued_at is not None:
+            lock_metrics.QUEUE_WAIT.observe(started - enqueued_at)
+            trace.add_span('thread_start', trace.start_ns)
+        trace.activate()
+        progress = on_progress or (lambda value: None)
+        outcome = CommandResult(mac, cmd_type)
+        payload = None
+        try:
+            if deadline is not None:
+                # 排队等待线程期间已到期或被取消的命令直接丢弃
+                deadline.check()
+            progress(30)
+            protocol = self.protocol_for(mac)
+            payload = {
+                "type": protocol.type,
+                "mac": mac,
+                "cmd": cmd_type,
+                "sn": int(time.time()),
+                "info": info_data
+            }
+            outcome.sn = payload['sn']
+
+            trace.tags.update(sn=payload['sn'], mac=payload['mac'])
+            if self.audit:
+                self._audit(self.audit.record_command, payload['mac'], cmd_type, payload['sn'], info_data)
+
+            self.log(f"发送命令: {cmd_type}, MAC: {payload['mac']}")
+            progress(60)
+
+            network_started = time.perf_counter()
+            lock_metrics.REQUESTS_IN_FLIGHT.inc()
+            try:
+                with trace.span('http_post'), lock_deadline.activate(deadline):
+                    response = self.transport.post(
+                        payload,
+                        timeout=self.timeout if deadline is None else deadline.clamp(self.timeout),
+                        idempotent=protocol.is_idempotent(cmd_type)
+                    )
+            finally:
+                lock_metrics.REQUESTS_IN_FLIGHT.dec()
+                lock_metrics.NETWORK.observe(time.perf_counter() - network_started)
+            outcome.http_status = str(response.status_code)
+            progress(90)
+
+            if response.status_code == 200:
+                parse_started = time.perf_counter()
+                with trace.span('json_decode'):
+                    response_data = response.json()
+                outcome.response_data = response_data
+                parsed = None
+                if 'data' in response_data and response_data['data']:
+                    outcome.msg_info = response_data['data'][0].get('msg_info', '')
+                    with trace.span('parse_lock_command'):
+                        parsed = protocol.parse(outcome.msg_info)
+                    self.record_status(mac, parsed, response_data['data'][0].get('etag'))
+                outcome.parsed = parsed
+                lock_metrics.PARSE.observe(time.perf_counter() - parse_started)
+                self.log(f"响应成功: {response_data}")
+
+                if self.replayer:
+                    # 命令成功说明网络可用，顺便重放离线队列
+                    self.replayer.kick()
+
+                if 'data' in response_data and response_data['data']:
+                    if parsed:
+                        self.log(f"指令解析: 命令码={parsed['command']}, 数据={parsed['data']}")
+                        # 根据响应判断操作结果
+                        if protocol.is_success(cmd_type, parsed['command']):
+                            outcome.result = SUCCESS
+                        else:
+                            outcome.result = COMPLETED
+                    else:
+                        outcome.result = BAD_FORMAT
+                else:
+                    outcome.result = NO_DATA
+            else:
+                outcome.result = HTTP_ERROR
+                self.log(f"请求失败: HTTP {response.status_code}")
+
+        except lock_deadline.Cancelled as e:
+            outcome.result = CANCELLED
+            outcome.error = str(e)
+            self.log(f"命令已取消: {cmd_type}, MAC: {mac}")
+        except lock_deadline.DeadlineExceeded as e:
+            outcome.result = EXPIRED
+            outcome.error = str(e)
+            self.log(f"命令已过截止时间，未发出: {cmd_type}, MAC: {mac}")
+        except requests.exceptions.Timeout:
+            # 先于 ConnectionError：ConnectTimeout 同时是两者的子类，应报告为超时
+            outcome.result = TIMEOUT
+            outcome.error = "请求超时"
+            self.log("请求超时")
+        except requests.exceptions.ConnectionError as e:
+            if self.outbox is not None and lock_transport.request_not_sent(e):
+                # 请求未发出：加入离线队列，恢复连接后在有效期内重放（不超过命令的截止时间）
+                outcome.result = QUEUED
+                outcome.ttl = lock_queue.DEFAULT_TTL.get(cmd_type, 300.0)
+                if deadline is not None and deadline.remaining() is not None:
+                    outcome.ttl = min(outcome.ttl, deadline.remaining())
+                self.outbox.enqueue(mac, cmd_type, info_data, ttl=outcome.ttl)
+                self.log(f"网络不可用，命令已加入离线队列（{outcome.ttl:.0f}秒内有效）")
+            else:
+                outcome.error = str(e)
+                self.log(f"错误: {str(e)}")
+        except Exception as e:
+            outcome.error = str(e)
+            self.log(f"错误: {str(e)}")
+        finally:
+            outcome.elapsed = time.perf_counter() - started
+            lock_metrics.COMMANDS_TOTAL.inc(cmd_type, outcome.result, outcome.http_status)
+            if self.audit and payload:
+                self._audit(self.audit.record_response, payload['mac'], cmd_type, payload['sn'],
+                            outcome.msg_info, outcome.result)
+            trace.tags['result'] = outcome.result
+            trace.finish()
+        return outcome
+
+    def run_bulk(self, macs, name, workers=32, on_result=None, deadline=None):
+        """对一组设备并发执行同一命令，返回与 macs 同序的 CommandResult 列表；
+        on_result(result) 在每条命令完成时调用（可用于流式输出）。
+
+        按设备分片时每个分片各开一个 workers 路的线程池，慢分片不占用其他分片的并发。
+
+        deadline 是整个任务的截止时间和取消句柄：deadline.cancel() 中止全部在途请求，
+        尚未发出的命令立即以 cancelled 结束；调用线程被中断（如 Ctrl-C）时同样取消整个任务"""
+        results = [None] * len(macs)
+        if deadline is None:
+            deadline = lock_deadline.Deadline()
+
+        def one(index):
+            results[index] = self.command(macs[index], name, deadline=deadline)
+            if on_result:
+                on_result(results[index])
+
+        groups = self.partition_indexes(macs)
+        executors = [ThreadPoolExecutor(max_workers=min(workers, len(indexes)), thread_name_prefix='bulk')
+                     for indexes in groups]
+        try:
+            futures = [executor.submit(one, index) for executor, indexes in zip(executors, groups)
+                       for index in indexes]
+            for future in futures:
+                future.result()
+        except BaseException:
+            deadline.cancel("批量任务已中断")
+            raise
+        finally:
+            for executor in executors:
+                executor.shutdown()
+        return results
+
+    def partition_indexes(self, macs):
+        """按传输分区（分片）对 macs 的下标分组，返回下标列表的列表；未分片时只有一组"""
+        groups = {}
+        for index, mac in enumerate(macs):
+            groups.setdefault(self.transport.partition_of(mac), []).append(index)
+        return list(groups.values())
+
+    def queue_depths(self):
+        """各命令队列中等待的条数：离线队列、批量信封、定时任务"""
+        depths = {}
+        if self.outbox is not None:
+            depths['outbox'] = self.outbox.pending_count()
+        batching = [transport for transport in self.transport.partitions().values()
+                    if isinstance(transport, lock_batching.BatchingTransport)]
+        if batching:
+            depths['batch'] = sum(transport.queue_depth() for transport in batching)
+        if self.scheduler is not None:
+            depths['scheduled_jobs'] = len(self.scheduler.jobs)
+        return depths
+
+    def record_status(self, mac, parsed, etag=None):
+        """根据应答帧更新设备状态表"""
+        fields = lock_fleet.status_from_frame(parsed, self.protocol_for(mac))
+        if not fields:
+            return
+        if etag is not None:
+            self.sync.etags[mac] = etag
+        if mac not in self.registry:
+            self.registry.add(mac)
+            self.registry_changed = True
+        self.fleet.update(mac, **fields)
+
+    # ---- 离线队列与定时任务 ----
+
+    def network_online(self):
+        """快速探测任一服务器是否可达"""
+        for url in self.endpoints.urls:
+            try:
+                lock_probe.probe_once(url, timeout=3)
+                return True
+            except OSError:
+                continue
+        return False
+
+    def send_queued(self, command):
+        """重放离线队列中的一条命令"""
+        protocol = self.protocol_for(command.mac)
+        payload = command.payload(device_type=protocol.type)
+        status = lock_queue.DELIVERED
+        msg_info = ''
+        if self.audit:
+            self._audit(self.audit.record_command, command.mac, command.cmd, payload['sn'], command.info)
+        # 重放（含重试）不超过命令的有效期
+        deadline = lock_deadline.Deadline(command.expires - time.time())
+        lock_metrics.REQUESTS_IN_FLIGHT.inc()
+        try:
+            with deadline.activate():
+                response = self.transport.post(
+                    payload,
+                    timeout=deadline.clamp(self.timeout),
+                    idempotent=protocol.is_idempotent(command.cmd)
+                )
+            if response.status_code >= 500:
+                status = lock_queue.RETRY
+            elif response.status_code != 200:
+                status = lock_queue.REJECTED
+            else:
+                data = response.json().get('data') or [{}]
+                msg_info = data[0].get('msg_info', '')
+        except lock_deadline.DeadlineExceeded:
+            status = 'expired'
+        except requests.exceptions.RequestException as e:
+            # 开锁命令若可能已发出则不再重试，保证至多执行一次
+            if protocol.is_idempotent(command.cmd) or lock_transport.request_not_sent(e):
+                status = lock_queue.RETRY
+            else:
+                status = lock_queue.REJECTED
+        finally:
+            lock_metrics.REQUESTS_IN_FLIGHT.dec()
+        if self.audit:
+            self._audit(self.audit.record_response, command.mac, command.cmd, payload['sn'], msg_info,
+                        f"replay_{status}")
+        return status
+
+    def _audit(self, record, *args):
+        """写审计日志；审计失败只记日志，不影响命令本身"""
+        try:
+            record(*args)
+        except Exception as e:
+            self.log(f"审计日志写入失败: {e}")
+
+    def run_scheduled(self, job, due):
+        """定时任务到期：在调度线程上把命令放入离线队列，由重放线程发送（开锁过期不补发）"""
+        for mac in job.macs:
+            command = self.protocol_for(mac).command(job.command)
+            self.outbox.enqueue(mac, command.cmd, command.frame())
+        self.replayer.kick()
+        if self.on_scheduled:
+            self.on_scheduled(job, due)
+
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+命令截止时间与取消
+Deadline 同时是一条命令（或一整个批量任务）的截止时间和取消句柄，由发起方（界面、lockd、lockctl）
+创建并一路传到传输层：
+    发送前      已取消或已过截止时间的命令直接丢弃，不再发出（结果为 cancelled / expired）
+    重试之间    每次换节点重试前检查，超时时间按剩余时间收紧
+    排队中      批量信封队列中过期的命令在装批前剔除；离线队列按命令有效期设定截止时间
+    在途        cancel() 立即中止已登记的在途请求（AbortScope 断开套接字、唤醒等待应答的线程）
+传输层经线程局部的 current() 取得当前命令的 Deadline，Transport.post 的签名不变：
+
+    deadline = lock_deadline.Deadline(15)
+    core.command(mac, 'unlock', deadline=deadline)   # 其他线程中 deadline.cancel() 可随时中止
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+_local = threading.local()
+
+
+class Cancelled(requests.exceptions.RequestException):
+    """命令已被取消（不是连接错误，不会进入离线队列）"""
+
+
+class DeadlineExceeded(requests.exceptions.Timeout):
+    """已过截止时间，命令（或下一次重试）没有发出"""
+
+
+class Deadline:
+    """截止时间 + 取消句柄；timeout=None 表示只用于取消、不限时间。可在多个线程间共享"""
+
+    def __init__(self, timeout=None):
+        self.expires_at = None if timeout is None else time.monotonic() + timeout
+        self.cancelled = False
+        self.reason = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def remaining(self):
+        """剩余秒数（不小于0）；不限时间时返回 None"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self):
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    @property
+    def done(self):
+        return self.cancelled or self.expired
+
+    def check(self):
+        """已取消时抛出 Cancelled，已过截止时间时抛出 DeadlineExceeded"""
+        if self.cancelled:
+            raise Cancelled(self.reason or "命令已取消")
+        if self.expired:
+            raise DeadlineExceeded("已过截止时间，命令未发出")
+
+    def clamp(self, timeout):
+        """把请求超时（秒数或 (连接, 读取)）收紧到剩余时间以内；已没有剩余时间时抛出 DeadlineExceeded
+        （check 之后才到期时，不把 0 作为超时交给 requests —— 那会被当作参数错误）"""
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        if remaining <= 0:
+            raise DeadlineExceeded("已过截止时间，命令未发出")
+        if isinstance(timeout, tuple):
+            return tuple(min(part, remaining) for part in timeout)
+        return min(timeout, remaining)
+
+    def cancel(self, reason=None):
+        """取消：之后的发送直接丢弃，已登记的在途请求立即中止"""
+        with self._lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            self.reason = reason
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def register(self, callback):
+        """登记取消时调用的回调（如 AbortScope.abort）；已取消时立即调用"""
+        with self._lock:
+            if not self.cancelled:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def unregister(self, callback):
+        with self._lock:
+            try:
+                self._callbacks.remove(callback)
+            except ValueError:
+                pass
+
+    @contextmanager
+    def watch(self, callback):
+        """范围内取消时调用 callback"""
+        self.register(callback)
+        try:
+            yield self
+        finally:
+            self.unregister(callback)
+
+    @contextmanager
+    def activate(self):
+        """设为当前线程的 Deadline，供传输层读取"""
+        previous = getattr(_local, 'deadline', None)
+        _local.deadline = self
+        try:
+            yield self
+        finally:
+            _local.deadline = previous
+
+    def __repr__(self):
+        remaining = self.remaining()
+        state = 'cancelled' if self.cancelled else ('unbounded' if remaining is None else f"{remaining:.3f}s")
+        return f"Deadline({state})"
+
+
+def current():
+    """当前线程正在执行的命令的 Deadline，没有时返回 None"""
+    return getattr(_local, 'deadline', None)
+
+
+@contextmanager
+def activate(deadline):
+    """deadline 为 None 时什么也不做"""
+    if deadline is None:
+        yield None
+    else:
+        with deadline.activate():
+            yield deadline
+
+
+@contextmanager
+def watch(deadline, callback):
+    """deadline 为 None 时什么也不做"""
+    if deadline is None:
+        yield None
+    else:
+        with deadline.watch(callback):
+            yield deadline
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多服务器选路
+对一组等价的 mqttpost 地址持续跟踪 EWMA 延迟和错误率，
+用“二选一”（power-of-two-choices）挑选更快的健康节点，连续失败时摘除并在冷却后自动恢复
+"""
+
+import os
+import random
+import threading
+import time
+
+
+def split_urls(text):
+    """逗号/空白分隔的地址列表"""
+    return [url.strip() for url in text.replace('\n', ',').split(',') if url.strip()]
+
+
+class Endpoint:
+    """单个服务器地址及其统计"""
+
+    def __init__(self, url, initial_latency=0.1):
+        self.url = url
+        self.latency = initial_latency
+        self.error_rate = 0.0
+        self.inflight = 0
+        self.failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.last_used = 0.0
+        self.requests = 0
+
+    def healthy(self, now):
+        return self.ejected_until <= now
+
+    def score(self):
+        """越小越好：延迟 ×（在途数+1），再按错误率放大"""
+        return self.latency * (self.inflight + 1) / max(0.05, 1.0 - self.error_rate)
+
+    def to_dict(self, now=None):
+        now = now or time.monotonic()
+        return {
+            'url': self.url,
+            'latency_ms': round(self.latency * 1000, 1),
+            'error_rate': round(self.error_rate, 3),
+            'inflight': self.inflight,
+            'healthy': self.healthy(now),
+            'requests': self.requests,
+        }
+
+
+class EndpointPool:
+    """等价服务器池"""
+
+    def __init__(self, urls, alpha=0.3, max_failures=3, cooldown=5.0, max_cooldown=60.0,
+                 refresh_interval=10.0, seed=None):
+        if not urls:
+            raise ValueError("至少需要一个服务器地址")
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.alpha = alpha
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.refresh_interval = refresh_interval
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, default_url):
+        """LOCK_SERVER_URLS 为逗号分隔的等价地址；未设置时只使用 default_url"""
+        urls = split_urls(os.environ.get('LOCK_SERVER_URLS', '')) or [default_url]
+        return cls(urls)
+
+    @property
+    def urls(self):
+        return [endpoint.url for endpoint in self.endpoints]
+
+    def choose(self, exclude=()):
+        """挑选一个节点并计为在途；用完必须调用 record()"""
+        now = time.monotonic()
+        with self._lock:
+            candidates = [e for e in self.endpoints if e not in exclude] or list(self.endpoints)
+            healthy = [e for e in candidates if e.healthy(now)]
+            if not healthy:
+                # 全部摘除时放行最早恢复的节点，避免完全不可用
+                chosen = min(candidates, key=lambda e: e.ejected_until)
+            else:
+                # 长时间未使用的节点放行一次，刷新其延迟统计（也用于摘除后的恢复）
+                stale = [e for e in healthy if now - e.last_used > self.refresh_interval]
+                if stale:
+                    chosen = stale[0]
+                elif len(healthy) == 1:
+                    chosen = healthy[0]
+                else:
+                    a, b = self.random.sample(healthy, 2)
+                    chosen = a if a.score() <= b.score() else b
+            chosen.inflight += 1
+            chosen.last_used = now
+            chosen.requests += 1
+            return chosen
+
+    def record(self, endpoint, latency, ok):
+        """记录一次请求结果（latency为秒）"""
+        now = time.monotonic()
+        with self._lock:
+            endpoint.inflight = max(0, endpoint.inflight - 1)
+            endpoint.error_rate += self.alpha * ((0.0 if ok else 1.0) - endpoint.error_rate)
+            if ok:
+                endpoint.latency += self.alpha * (latency - endpoint.latency)
+                endpoint.failures = 0
+                endpoint.ejections = 0
+                endpoint.ejected_until = 0.0
+            else:
+                # 失败按实际耗时计入延迟，超时节点因此自然变“慢”
+                endpoint.latency += self.alpha * (max(latency, endpoint.latency) - endpoint.latency)
+                endpoint.failures += 1
+                if endpoint.failures >= self.max_failures:
+                    endpoint.ejections += 1
+                    backoff = min(self.max_cooldown, self.cooldown * 2 ** (endpoint.ejections - 1))
+                    endpoint.ejected_until = now + backoff
+                    endpoint.failures = 0
+
+    def release(self, endpoint, latency):
+        """主动放弃的请求（如对冲中落后的一方）：只释放在途计数，耗时仅在更慢时计入"""
+        with self._lock:
+            endpoint.inflight = max(0, endpoint.inflight - 1)
+            if latency > endpoint.latency:
+                endpoint.latency += self.alpha * (latency - endpoint.latency)
+
+    def seed_from_probe(self, report):
+        """用健康探测结果初始化/校正节点延迟"""
+        with self._lock:
+            for endpoint in self.endpoints:
+                if endpoint.url != report.url:
+                    continue
+                if report.ok:
+                    endpoint.latency = report.stats('total')['median']
+                    endpoint.error_rate = report.loss
+                else:
+                    endpoint.error_rate = 1.0
+                    endpoint.ejected_until = time.monotonic() + self.cooldown
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self._lock:
+            return [endpoint.to_dict(now) for endpoint in self.endpoints]
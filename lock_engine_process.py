@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+独立进程的命令引擎（桌面）
+命令核心（lock_core）在子进程中运行，网络、JSON 解析和日志不再与 Kivy 渲染循环争抢 GIL。
+两个进程之间：
+    消息通道  multiprocessing.connection（Unix 套接字/命名管道，带认证），消息为短元组
+    状态表    shared_memory 中的定长记录，引擎进程是唯一写入者，每条记录带序号（seqlock），
+              界面进程无锁读取；表头维护汇总计数，界面读汇总是 O(1)
+界面进程只发请求、读状态表和接收结果；请求可带截止时间（秒，从引擎收到时算起），
+并可随时按请求号取消（('cancel', 请求号)），取消会中止引擎进程中的在途请求。子进程以独立的解释器启动（不经 multiprocessing 的 spawn），
+不会重新导入 main.py 和 Kivy
+
+    LOCK_ENGINE=process    main.py 改用引擎进程
+"""
+
+import argparse
+import os
+import secrets
+import struct
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+from multiprocessing.connection import Client, Listener
+
+from lock_fleet import BATTERY_UNKNOWN, LOW_BATTERY, STATE_UNLOCKED, DeviceStatus
+
+DEFAULT_CAPACITY = 65536
+PROGRESS_INTERVAL = 0.1
+
+# 表头：seq, capacity, count, total, online, unlocked, low_battery
+HEADER = struct.Struct('<7I4x')
+# 记录：seq, mac, state, battery, online, version, updated_at
+RECORD = struct.Struct('<I24sBBBxId')
+SEQ = struct.Struct('<I')
+HEADER_BODY = struct.Struct('<6I4x')
+RECORD_BODY = struct.Struct('<24sBBBxId')
+
+
+def enabled():
+    return os.environ.get('LOCK_ENGINE', '').strip().lower() == 'process'
+
+
+class StatusTable:
+    """共享内存中的设备状态表；写入只在引擎进程，读取可在任意进程"""
+
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner
+        self.buf = shm.buf
+        self.capacity = HEADER.unpack_from(self.buf, 0)[1]
+        self._slots = {}
+        self._indexed = 0
+        self._header = [0, self.capacity, 0, 0, 0, 0, 0]
+        self._write_lock = threading.Lock()
+
+    @classmethod
+    def create(cls, capacity=DEFAULT_CAPACITY):
+        shm = shared_memory.SharedMemory(create=True, size=HEADER.size + RECORD.size * capacity)
+        HEADER.pack_into(shm.buf, 0, 0, capacity, 0, 0, 0, 0, 0)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        shm = shared_memory.SharedMemory(name=name)
+        # 表由界面进程创建和回收；不让本进程的资源跟踪器在退出时删除它
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return cls(shm, owner=False)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def _offset(self, slot):
+        return HEADER.size + slot * RECORD.size
+
+    # ---- 写入（引擎进程） ----
+
+    def write(self, status):
+        """写入一台设备的状态，并按新旧值之差更新表头汇总（可在引擎进程的任意线程调用）"""
+        with self._write_lock:
+            header = self._header
+            slot = self._slots.get(status.mac)
+            if slot is None:
+                if header[2] >= self.capacity:
+                    return False
+                slot = self._slots[status.mac] = header[2]
+                header[2] += 1
+                header[3] += 1
+                old = None
+            else:
+                old = RECORD.unpack_from(self.buf, self._offset(slot))
+            body = (status.mac.encode('utf-8')[:24], status.state, min(status.battery, 255),
+                    bool(status.online), status.version, status.updated_at)
+            if old:
+                header[4] -= old[4]
+                header[5] -= old[2] == STATE_UNLOCKED
+                header[6] -= old[3] < LOW_BATTERY
+            header[4] += body[3]
+            header[5] += body[1] == STATE_UNLOCKED
+            header[6] += body[2] < LOW_BATTERY
+            offset = self._offset(slot)
+            self._publish(offset, old[0] if old else 0, RECORD_BODY, body)
+            self._publish(0, header[0], HEADER_BODY, header[1:])
+            header[0] += 2
+            return True
+
+    def _publish(self, offset, seq, body_struct, body):
+        """seqlock 写入：序号置为奇数 -> 写内容 -> 序号置为下一个偶数"""
+        SEQ.pack_into(self.buf, offset, seq + 1)
+        body_struct.pack_into(self.buf, offset + SEQ.size, *body)
+        SEQ.pack_into(self.buf, offset, seq + 2)
+
+    # ---- 读取（任意进程） ----
+
+    def _read(self, struct_, offset):
+        while True:
+            values = struct_.unpack_from(self.buf, offset)
+            if values[0] & 1 == 0 and SEQ.unpack_from(self.buf, offset)[0] == values[0]:
+                return values
+            time.sleep(0)
+
+    def summary(self):
+        _, _, _, total, online, unlocked, low_battery = self._read(HEADER, 0)
+        return {'total': total, 'online': online, 'unlocked': unlocked, 'low_battery': low_battery}
+
+    def get(self, mac):
+        """读取一台设备；只在遇到未见过的设备时增量扫描新追加的记录"""
+        slot = self._slots.get(mac)
+        if slot is None:
+            count = self._read(HEADER, 0)[2]
+            for index in range(self._indexed, count):
+                key = RECORD.unpack_from(self.buf, self._offset(index))[1].rstrip(b'\0').decode('utf-8')
+                self._slots[key] = index
+            self._indexed = count
+            slot = self._slots.get(mac)
+        if slot is None:
+            return None
+        _, _, state, battery, online, version, updated_at = self._read(RECORD, self._offset(slot))
+        return DeviceStatus(mac, state, BATTERY_UNKNOWN if battery == BATTERY_UNKNOWN else battery,
+                            bool(online), version, updated_at)
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class EngineProcess:
+    """界面进程中的引擎代理；回调在接收线程上调用，界面需自行切回主线程"""
+
+    def __init__(self, server_url, data_dir=None, capacity=DEFAULT_CAPACITY, on_log=None):
+        self.server_url = server_url
+        self.data_dir = data_dir
+        self.capacity = capacity
+        self.on_log = on_log
+        self.table = None
+        self.process = None
+        self.conn = None
+        self._pending = {}
+        self._ids = 0
+        self._send_lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def start(self, timeout=30):
+        self.table = StatusTable.create(self.capacity)
+        authkey = secrets.token_bytes(16)
+        listener = Listener(authkey=authkey)
+        env = dict(os.environ, LOCK_ENGINE_AUTHKEY=authkey.hex())
+        command = [sys.executable, os.path.abspath(__file__), '--connect', str(listener.address),
+                   '--shm', self.table.name, '--server', self.server_url]
+        if self.data_dir:
+            command += ['--data-dir', self.data_dir]
+        self.process = subprocess.Popen(command, env=env)
+        # accept 没有超时参数，子进程启动失败时关闭监听让 accept 返回
+        watchdog = threading.Timer(timeout, listener.close)
+        watchdog.start()
+        try:
+            self.conn = listener.accept()
+        finally:
+            watchdog.cancel()
+            listener.close()
+        threading.Thread(target=self._receive, name='engine-receiver', daemon=True).start()
+        return self
+
+    def _send(self, message):
+        with self._send_lock:
+            self.conn.send(message)
+
+    def _request(self, kind, callbacks, *args):
+        with self._send_lock:
+            self._ids += 1
+            request_id = self._ids
+            self._pending[request_id] = callbacks
+            self.conn.send((kind, request_id) + args)
+        return request_id
+
+    def command(self, mac, name, on_result, timeout=None):
+        """on_result(结果dict，同 CommandResult.to_dict)；timeout 为截止时间（秒），返回请求号"""
+        return self._request('command', (on_result,), mac, name, timeout)
+
+    def bulk(self, macs, name, workers=32, on_progress=None, on_done=None, timeout=None):
+        """on_progress(已完成, 总数)；on_done(各结果的计数)。逐条结果留在引擎进程，只回传进度"""
+        return self._request('bulk', (on_done, on_progress), list(macs), name, workers, timeout)
+
+    def verify(self, mac, on_result, timeout=None):
+        """开锁并确认；on_result(结果dict，同 VerifiedUnlock.to_dict)"""
+        return self._request('verify', (on_result,), mac, timeout)
+
+    def cancel(self, request_id):
+        """取消命令或整个批量任务；结果仍经原回调返回（cancelled）"""
+        try:
+            self._send(('cancel', request_id))
+        except OSError:
+            pass
+
+    def _receive(self):
+        while not self._stopped.is_set():
+            try:
+                message = self.conn.recv()
+            except (EOFError, OSError):
+                break
+            kind = message[0]
+            if kind == 'log':
+                if self.on_log:
+                    self.on_log(message[1])
+            elif kind == 'progress':
+                callbacks = self._pending.get(message[1])
+                if callbacks and callbacks[1]:
+                    callbacks[1](message[2], message[3])
+            elif kind in ('result', 'bulk_done'):
+                callbacks = self._pending.pop(message[1], None)
+                if callbacks and callbacks[0]:
+                    callbacks[0](message[2])
+            elif kind == 'stopped':
+                break
+        self._stopped.set()
+
+    def stop(self, ui_state=None, timeout=10):
+        """通知引擎保存快照（附带界面状态）并退出"""
+        if self.process is None:
+            return
+        if self.conn is None:
+            # 启动未完成（子进程没有连上来）：直接结束
+            self.process.kill()
+            self.process.wait()
+            self.table.close()
+            self.process = None
+            return
+        try:
+            self._send(('stop', ui_state))
+        except OSError:
+            pass
+        self._stopped.wait(timeout)
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        self.conn.close()
+        self.table.close()
+        self.process = None
+
+
+def serve(conn, table, server_url, data_dir, workers=32):
+    """引擎进程主循环"""
+    import lock_core
+    import lock_deadline
+    import lock_snapshot
+    import lock_verify
+
+    send_lock = threading.Lock()
+
+    def send(message):
+        with send_lock:
+            conn.send(message)
+
+    def send_log(message):
+        # 退出过程中界面可能已断开，日志发不出去时丢弃
+        try:
+            send(('log', message))
+        except OSError:
+            pass
+
+    core = lock_core.LockCore(server_url)
+    core.fleet.subscribe(table.write)
+    writer = None
+    if data_dir:
+        core.open(data_dir)
+        path = os.path.join(data_dir, 'fleet.snap')
+        snapshot = lock_snapshot.Snapshot.open(path)
+        if snapshot is not None:
+            try:
+                lock_snapshot.load_into(core.fleet, snapshot)
+                for mac, info in snapshot.registry().items():
+                    core.registry.add(mac, **info)
+            finally:
+                snapshot.close()
+            for _, status in core.fleet.items_snapshot():
+                table.write(status)
+        writer = lock_snapshot.SnapshotWriter(path, log=send_log)
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='engine')
+    # 未完成请求的取消句柄，收到请求时创建（等待线程池的时间计入截止时间）
+    deadlines = {}
+
+    def run_command(request_id, mac, name):
+        try:
+            result = core.command(mac, name, deadline=deadlines.get(request_id))
+            send(('log', f"{name} {mac}: {result.result} {result.msg_info}"))
+            send(('result', request_id, result.to_dict()))
+        except Exception as e:
+            send(('result', request_id, {'mac': mac, 'result': lock_core.ERROR, 'error': str(e)}))
+        finally:
+            deadlines.pop(request_id, None)
+
+    verifier = lock_verify.UnlockVerifier(core)
+
+    def run_verify(request_id, mac):
+        try:
+            outcome = verifier.verify(mac, deadline=deadlines.get(request_id))
+            send(('log', f"unlock {mac}: {outcome.result} ({outcome.polls} 次查询)"))
+            send(('result', request_id, outcome.to_dict()))
+        except Exception as e:
+            send(('result', request_id, {'mac': mac, 'result': lock_core.ERROR, 'error': str(e)}))
+        finally:
+            deadlines.pop(request_id, None)
+
+    def run_bulk(request_id, macs, name, bulk_workers):
+        done = [0, time.monotonic()]
+        lock = threading.Lock()
+
+        def on_result(result):
+            with lock:
+                done[0] += 1
+                now = time.monotonic()
+                if now - done[1] < PROGRESS_INTERVAL:
+                    return
+                done[1] = now
+                count = done[0]
+            send(('progress', request_id, count, len(macs)))
+
+        try:
+            results = core.run_bulk(macs, name, workers=bulk_workers, on_result=on_result,
+                                    deadline=deadlines.get(request_id))
+        except Exception as e:
+            # 如未知命令：整批记为错误，界面的完成回调照常触发
+            send(('log', f"批量 {name} 失败: {e}"))
+            send(('bulk_done', request_id, {lock_core.ERROR: len(macs)}))
+            return
+        finally:
+            deadlines.pop(request_id, None)
+        send(('bulk_done', request_id, dict(Counter(result.result for result in results))))
+
+    ui_state = None
+    try:
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                break
+            kind = message[0]
+            if kind in ('command', 'verify', 'bulk'):
+                deadlines[message[1]] = lock_deadline.Deadline(message[-1])
+            if kind == 'command':
+                executor.submit(run_command, *message[1:-1])
+            elif kind == 'verify':
+                executor.submit(run_verify, *message[1:-1])
+            elif kind == 'bulk':
+                threading.Thread(target=run_bulk, args=message[1:-1], name='engine-bulk', daemon=True).start()
+            elif kind == 'cancel':
+                deadline = deadlines.get(message[1])
+                if deadline is not None:
+                    deadline.cancel("界面已取消")
+            elif kind == 'stop':
+                ui_state = message[1]
+                break
+    finally:
+        for deadline in list(deadlines.values()):
+            deadline.cancel("引擎进程退出")
+        executor.shutdown(wait=False)
+        if writer is not None:
+            try:
+                writer.save(core.fleet, core.registry if core.registry_changed else None, ui_state)
+            except Exception as e:
+                # 快照写不出不影响关闭离线队列和审计日志
+                send_log(f"保存快照失败: {e}")
+        core.close()
+        try:
+            send(('stopped',))
+        except OSError:
+            pass
+        table.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='命令引擎子进程（由 EngineProcess 启动）')
+    parser.add_argument('--connect', required=True)
+    parser.add_argument('--shm', required=True)
+    parser.add_argument('--server', required=True)
+    parser.add_argument('--data-dir')
+    args = parser.parse_args()
+    conn = Client(args.connect, authkey=bytes.fromhex(os.environ['LOCK_ENGINE_AUTHKEY']))
+    serve(conn, StatusTable.attach(args.shm), args.server, args.data_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+设备事件订阅（SSE）
+与 mqttpost 同一服务器的 /events/ 接口以 text/event-stream 推送门锁事件，取代轮询：
+    status       状态变化（data: mac, msg_info, etag）
+    ack          命令已执行（data: mac, sn, msg_info）
+    battery_low  电量低（data: mac, battery）
+    reset        续传位置已不在服务器保留范围内，客户端需做一次全量同步
+断线后携带 Last-Event-ID 重连，从上次位置继续；服务器不提供该接口（404/405）时停止订阅，调用方继续使用轮询
+"""
+
+import http.client
+import json
+import os
+import random
+import ssl
+import threading
+from urllib.parse import urljoin, urlsplit
+
+import lock_metrics
+from lock_fleet import status_from_frame
+from lock_protocol import default_registry
+
+EVENTS_TOTAL = lock_metrics.REGISTRY.counter(
+    'lock_events_total', '收到的设备事件', ('event',))
+RECONNECTS_TOTAL = lock_metrics.REGISTRY.counter(
+    'lock_event_reconnects_total', '事件流重连次数', ())
+EVENT_ERRORS_TOTAL = lock_metrics.REGISTRY.counter(
+    'lock_event_errors_total', '处理失败（已跳过）的设备事件', ('event',))
+
+
+def events_url(server_url):
+    """由 mqttpost 地址推出事件流地址，可用 LOCK_EVENTS_URL 覆盖"""
+    return os.environ.get('LOCK_EVENTS_URL') or urljoin(server_url, '../events/')
+
+
+class Event:
+    __slots__ = ('id', 'event', 'data')
+
+    def __init__(self, id, event, data):
+        self.id = id
+        self.event = event
+        self.data = data
+
+
+class EventSubscriber:
+    """后台线程维持事件流连接，断线按指数退避重连并从 last_event_id 续传"""
+
+    def __init__(self, url, on_event, last_event_id=None, read_timeout=45.0,
+                 min_backoff=0.5, max_backoff=30.0, on_unsupported=None, on_state=None, log=None):
+        self.url = url
+        self.on_event = on_event
+        self.log = log or (lambda message: None)
+        self.last_event_id = last_event_id
+        self.read_timeout = read_timeout
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.on_unsupported = on_unsupported
+        self.on_state = on_state
+        self.connected = False
+        self._stopped = threading.Event()
+        self._sock = None
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='lock-events', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        sock = self._sock
+        if sock is not None:
+            # 打断阻塞中的读取（服务器应答 Connection: close 时 connection.sock 已被置空，要用请求时的套接字）
+            try:
+                sock.shutdown(2)
+            except OSError:
+                pass
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+
+    def _set_connected(self, connected):
+        if connected != self.connected:
+            self.connected = connected
+            if self.on_state:
+                self.on_state(connected)
+
+    def _run(self):
+        backoff = self.min_backoff
+        while not self._stopped.is_set():
+            try:
+                status = self._stream()
+                if status in (404, 405, 501):
+                    if self.on_unsupported:
+                        self.on_unsupported(status)
+                    return
+                if status == 200:
+                    # 连接建立过，说明服务器可用，退避从头开始
+                    backoff = self.min_backoff
+            except (OSError, http.client.HTTPException, UnicodeDecodeError):
+                # 连接中断或流中出现非 UTF-8 数据：重连续传
+                pass
+            self._set_connected(False)
+            if self._stopped.is_set():
+                return
+            RECONNECTS_TOTAL.inc()
+            self._stopped.wait(backoff * random.uniform(0.5, 1.0))
+            backoff = min(backoff * 2, self.max_backoff)
+
+    def _stream(self):
+        parts = urlsplit(self.url)
+        if parts.scheme == 'https':
+            connection = http.client.HTTPSConnection(parts.hostname, parts.port or 443, timeout=self.read_timeout,
+                                                     context=ssl.create_default_context())
+        else:
+            connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=self.read_timeout)
+        headers = {'Accept': 'text/event-stream', 'Cache-Control': 'no-cache'}
+        if self.last_event_id is not None:
+            headers['Last-Event-ID'] = str(self.last_event_id)
+        try:
+            connection.request('GET', parts.path + ('?' + parts.query if parts.query else ''), headers=headers)
+            self._sock = connection.sock
+            if self._stopped.is_set():
+                return 0
+            response = connection.getresponse()
+            if response.status != 200:
+                return response.status
+            self._set_connected(True)
+            self._read_events(response)
+            return 200
+        finally:
+            self._sock = None
+            connection.close()
+
+    def _read_events(self, response):
+        event_id, event_type, data = None, 'message', []
+        while not self._stopped.is_set():
+            line = response.readline()
+            if not line:
+                return
+            line = line.decode('utf-8').rstrip('\r\n')
+            if not line:
+                # 空行：一个事件结束
+                if data:
+                    self._dispatch(event_id, event_type, '\n'.join(data))
+                event_id, event_type, data = None, 'message', []
+                continue
+            if line.startswith(':'):
+                continue                    # 心跳注释
+            field, _, value = line.partition(':')
+            value = value[1:] if value.startswith(' ') else value
+            if field == 'id':
+                event_id = value
+            elif field == 'event':
+                event_type = value
+            elif field == 'data':
+                data.append(value)
+            elif field == 'retry' and value.isdigit():
+                self.min_backoff = int(value) / 1000.0
+
+    def _dispatch(self, event_id, event_type, raw):
+        try:
+            payload = json.loads(raw)
+        except ValueError:
+            payload = {'raw': raw}
+        EVENTS_TOTAL.inc(event_type)
+        try:
+            self.on_event(Event(event_id, event_type, payload))
+        except Exception as e:
+            # 格式意外的事件跳过并记录，不能让订阅线程退出、之后的推送全部中断
+            EVENT_ERRORS_TOTAL.inc(event_type)
+            self.log(f"事件 {event_type}#{event_id} 处理失败，已跳过: {type(e).__name__}: {e}")
+        # 回调完成（或确定无法处理）后才推进续传位置，崩溃重连时不会漏掉未处理的事件
+        if event_id is not None:
+            self.last_event_id = event_id
+
+
+class EventDemux:
+    """按MAC分发事件：写入 StatusStore / etag，并通知订阅了该设备的界面回调"""
+
+    def __init__(self, store, sync=None, on_reset=None):
+        self.store = store
+        self.sync = sync
+        self.on_reset = on_reset
+        self._listeners = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, mac, callback):
+        """callback(event)；mac 为 None 时接收所有设备的事件"""
+        with self._lock:
+            self._listeners.setdefault(mac, []).append(callback)
+
+    def unsubscribe(self, mac, callback):
+        with self._lock:
+            callbacks = self._listeners.get(mac, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+
+    def dispatch(self, event):
+        if event.event == 'reset':
+            if self.on_reset:
+                self.on_reset()
+            return
+        if not isinstance(event.data, dict):
+            return
+        mac = event.data.get('mac')
+        if not mac:
+            return
+        if event.event in ('status', 'ack'):
+            if self.sync is not None:
+                fields = self.sync.status_fields(mac, event.data.get('msg_info', ''))
+            else:
+                protocol = default_registry().default
+                fields = status_from_frame(protocol.parse(event.data.get('msg_info', '')), protocol)
+            if fields:
+                self.store.update(mac, **fields)
+            if self.sync is not None and event.data.get('etag') is not None:
+                self.sync.etags[mac] = event.data['etag']
+        elif event.event == 'battery_low' and event.data.get('battery') is not None:
+            self.store.update(mac, battery=int(event.data['battery']))
+        with self._lock:
+            callbacks = self._listeners.get(mac, []) + self._listeners.get(None, [])
+        for callback in callbacks:
+            callback(event)
+
+
+def load_offset(path):
+    """读取保存的续传位置"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def save_offset(path, event_id):
+    if event_id is None:
+        return
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(str(event_id))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+设备清单与状态表
+DeviceRegistry 记录设备的名称、型号、所属服务器等静态信息；
+StatusStore 保存每台设备最近一次的状态，并记录自上次快照以来的变更，供增量快照使用
+"""
+
+import threading
+import time
+
+# 门锁状态码
+STATE_UNKNOWN = 0
+STATE_LOCKED = 1
+STATE_UNLOCKED = 2
+STATE_NAMES = {STATE_UNKNOWN: '未知', STATE_LOCKED: '已上锁', STATE_UNLOCKED: '已开锁'}
+
+BATTERY_UNKNOWN = 255
+LOW_BATTERY = 20
+
+
+class DeviceStatus:
+    """单台设备的状态"""
+
+    __slots__ = ('mac', 'state', 'battery', 'online', 'version', 'updated_at')
+
+    def __init__(self, mac, state=STATE_UNKNOWN, battery=BATTERY_UNKNOWN, online=False,
+                 version=0, updated_at=0.0):
+        self.mac = mac
+        self.state = state
+        self.battery = battery
+        self.online = online
+        self.version = version
+        self.updated_at = updated_at
+
+    def copy(self):
+        return DeviceStatus(self.mac, self.state, self.battery, self.online, self.version, self.updated_at)
+
+    def to_dict(self):
+        return {
+            'mac': self.mac,
+            'state': STATE_NAMES.get(self.state, str(self.state)),
+            'battery': None if self.battery == BATTERY_UNKNOWN else self.battery,
+            'online': self.online,
+            'version': self.version,
+            'updated_at': self.updated_at,
+        }
+
+
+def status_from_frame(parsed, protocol=None):
+    """从 parse_lock_command 的结果中提取状态字段；无法识别时返回空dict
+
+    状态应答(1F)：数据前两位为锁状态(00上锁/01开锁)，随后两位为电量百分比(十六进制)；
+    开锁应答(2B)表示锁已打开。给出 protocol（lock_protocol.Protocol）时按其登记的应答布局解析
+    """
+    if not parsed:
+        return {}
+    if protocol is not None:
+        reply = protocol.replies.get(parsed['command'])
+        if reply is None:
+            return {}
+        if reply.name == 'unlock_ok':
+            return {'state': STATE_UNLOCKED, 'online': True}
+        fields = reply.decode(parsed['data'])
+        if 'lock' not in fields:
+            return {}
+        lock_byte = fields['lock']
+        battery = fields.get('battery')
+    else:
+        if parsed['command'] == '2B':
+            return {'state': STATE_UNLOCKED, 'online': True}
+        if parsed['command'] != '1F' or len(parsed['data']) < 4:
+            return {}
+        try:
+            lock_byte = int(parsed['data'][0:2], 16)
+            battery = int(parsed['data'][2:4], 16)
+        except ValueError:
+            return {}
+    result = {'state': STATE_UNLOCKED if lock_byte else STATE_LOCKED, 'online': True}
+    if battery is not None:
+        result['battery'] = min(battery, 100)
+    return result
+
+
+class DeviceRegistry:
+    """设备清单：mac -> {name, model, endpoint, group}"""
+
+    def __init__(self, devices=None):
+        self.devices = dict(devices or {})
+        self._lock = threading.Lock()
+
+    def add(self, mac, **info):
+        with self._lock:
+            self.devices.setdefault(mac, {}).update(info)
+
+    def remove(self, mac):
+        with self._lock:
+            self.devices.pop(mac, None)
+
+    def get(self, mac):
+        return self.devices.get(mac, {})
+
+    def __contains__(self, mac):
+        return mac in self.devices
+
+    def __len__(self):
+        return len(self.devices)
+
+    def macs(self):
+        return list(self.devices)
+
+    def to_dict(self):
+        with self._lock:
+            return {mac: dict(info) for mac, info in self.devices.items()}
+
+
+class StatusStore:
+    """设备状态表（线程安全），更新时通知监听者并记录脏数据"""
+
+    def __init__(self):
+        self.statuses = {}
+        self.dirty = set()
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.statuses)
+
+    def get(self, mac):
+        return self.statuses.get(mac)
+
+    def subscribe(self, callback):
+        """callback(status) 在更新它的线程中调用，UI需自行切回主线程"""
+        self._listeners.append(callback)
+
+    def update(self, mac, version=None, updated_at=None, **fields):
+        """更新设备状态；version未给出时自动递增"""
+        with self._lock:
+            status = self.statuses.get(mac)
+            if status is None:
+                status = self.statuses[mac] = DeviceStatus(mac)
+            for name, value in fields.items():
+                setattr(status, name, value)
+            status.version = version if version is not None else status.version + 1
+            status.updated_at = updated_at if updated_at is not None else time.time()
+            self.dirty.add(mac)
+        for callback in self._listeners:
+            callback(status)
+        return status
+
+    def load(self, statuses):
+        """批量载入（来自快照），不标记为脏、不通知监听者；已有的较新状态不会被覆盖"""
+        with self._lock:
+            for status in statuses:
+                self.statuses.setdefault(status.mac, status)
+
+    def items_snapshot(self):
+        """在锁内复制全部状态，返回 [(mac, DeviceStatus副本)]；遍历期间其他线程可继续更新"""
+        with self._lock:
+            return [(mac, status.copy()) for mac, status in self.statuses.items()]
+
+    def take_dirty(self):
+        """取出并清空自上次快照以来变更的设备"""
+        with self._lock:
+            dirty = [self.statuses[mac].copy() for mac in self.dirty if mac in self.statuses]
+            self.dirty = set()
+        return dirty
+
+    def stale(self, max_age, now=None):
+        """超过 max_age 秒未更新的设备"""
+        now = now or time.time()
+        with self._lock:
+            return [s.mac for s in self.statuses.values() if now - s.updated_at > max_age]
+
+    def summary(self):
+        """仪表盘汇总：总数、在线、已开锁、低电量"""
+        total = online = unlocked = low_battery = 0
+        with self._lock:
+            for status in self.statuses.values():
+                total += 1
+                online += status.online
+                unlocked += status.state == STATE_UNLOCKED
+                low_battery += status.battery < LOW_BATTERY
+        return {'total': total, 'online': online, 'unlocked': unlocked, 'low_battery': low_battery}
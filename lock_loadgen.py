@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+端到端压测
+经命令核心（LockCore.command，即无界面的 send_lock_command）向服务器发送命令，默认在子进程中启动
+本地替身服务器（lock_standin_server.py），客户端的 CPU 和内存不受服务端影响。两种负载模型：
+    closed  N 个并发，每个收到应答后立即发下一条；测"某并发下能撑住多少吞吐"
+    open    按固定速率（或 --poisson 泊松到达）发送，与应答快慢无关；延迟从计划发送时刻算起，
+            排队时间计入延迟（不会因客户端跟不上而低估尾延迟）
+--concurrency / --rate 可给多个值逐档扫描，每档输出吞吐、延迟分位数、结果分布、错误率、
+客户端 CPU 和内存，整体为一个 JSON，便于各次运行之间对比：
+
+    python lock_loadgen.py closed --concurrency 1,8,32 --duration 10
+    python lock_loadgen.py open --rate 200,500,1000 --mix unlock=1,status=9 --output run.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import lock_core
+import lock_profiler
+
+# 计入"错误"的结果：COMPLETED 是设备应答了非成功码，属于业务结果而不是错误
+OK_RESULTS = (lock_core.SUCCESS, lock_core.COMPLETED)
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100.0 * len(ordered)))]
+
+
+def parse_list(text, cast):
+    return [cast(value) for value in text.split(',') if value.strip()]
+
+
+def parse_mix(text):
+    """'unlock=1,status=9' -> [('unlock', 0.1), ('status', 1.0)]（累计比例）"""
+    weights = []
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        weights.append((name.strip(), float(weight or 1)))
+    total = sum(weight for _, weight in weights)
+    cumulative = 0.0
+    mix = []
+    for name, weight in weights:
+        cumulative += weight / total
+        mix.append((name, cumulative))
+    return mix
+
+
+class Workload:
+    """命令序列：设备轮转，命令按比例由固定种子抽取，各次运行相同"""
+
+    def __init__(self, mix, devices, seed=1):
+        self.mix = mix
+        self.macs = [f"86970107{i:07d}" for i in range(devices)]
+        self.rng = random.Random(seed)
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def next(self):
+        with self._lock:
+            index = self.count
+            self.count += 1
+            draw = self.rng.random()
+        name = next((name for name, edge in self.mix if draw < edge), self.mix[-1][0])
+        return self.macs[index % len(self.macs)], name
+
+
+class Recorder:
+    """一档负载的延迟和结果"""
+
+    def __init__(self):
+        self.latencies = []
+        self.results = Counter()
+        self.by_command = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, latency, result):
+        with self._lock:
+            self.latencies.append(latency)
+            self.results[result] += 1
+            self.by_command.setdefault(name, []).append(latency)
+
+
+def send(core, workload, recorder, intended=None):
+    mac, name = workload.next()
+    started = time.perf_counter() if intended is None else intended
+    try:
+        result = core.command(mac, name).result
+    except Exception:
+        result = lock_core.ERROR
+    recorder.add(name, time.perf_counter() - started, result)
+
+
+def run_closed(core, workload, concurrency, duration):
+    recorder = Recorder()
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        while time.perf_counter() < deadline:
+            send(core, workload, recorder)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return recorder, {}
+
+
+def run_open(core, workload, rate, duration, max_inflight, poisson=False, seed=1):
+    """按计划时刻提交；在途达到 max_inflight 时新请求在线程池中排队，排队时间计入延迟"""
+    recorder = Recorder()
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    deadline = start + duration
+    intended = start
+    scheduled = 0
+    max_lag = 0.0
+    with ThreadPoolExecutor(max_workers=max_inflight, thread_name_prefix='loadgen') as executor:
+        while intended < deadline:
+            now = time.perf_counter()
+            if intended > now:
+                time.sleep(intended - now)
+            else:
+                max_lag = max(max_lag, now - intended)
+            executor.submit(send, core, workload, recorder, intended)
+            scheduled += 1
+            intended += rng.expovariate(rate) if poisson else 1.0 / rate
+    return recorder, {'scheduled': scheduled, 'max_dispatch_lag_ms': round(max_lag * 1000, 2)}
+
+
+def latency_summary(latencies):
+    if not latencies:
+        return {}
+    summary = {f"p{q}_ms".replace('.', '_'): round(percentile(latencies, q) * 1000, 2) for q in (50, 90, 99, 99.9)}
+    summary['mean_ms'] = round(sum(latencies) / len(latencies) * 1000, 2)
+    summary['max_ms'] = round(max(latencies) * 1000, 2)
+    return summary
+
+
+def run_step(core, args, model, level):
+    """一档：预热后运行 duration 秒，附带客户端 CPU 和内存"""
+    workload = Workload(args.mix, args.devices, args.seed)
+    if args.warmup:
+        if model == 'closed':
+            run_closed(core, workload, level, args.warmup)
+        else:
+            run_open(core, workload, level, args.warmup, args.max_inflight, args.poisson, args.seed)
+    if args.tracemalloc:
+        tracemalloc.start()
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    wall = time.perf_counter()
+    if model == 'closed':
+        recorder, extra = run_closed(core, workload, level, args.duration)
+    else:
+        recorder, extra = run_open(core, workload, level, args.duration, args.max_inflight,
+                                   args.poisson, args.seed)
+    wall = time.perf_counter() - wall
+    after = resource.getrusage(resource.RUSAGE_SELF)
+    cpu = (after.ru_utime - usage.ru_utime) + (after.ru_stime - usage.ru_stime)
+    completed = len(recorder.latencies)
+    errors = sum(count for result, count in recorder.results.items() if result not in OK_RESULTS)
+    step = {
+        'model': model,
+        'concurrency' if model == 'closed' else 'rate': level,
+        'duration_s': round(wall, 3),
+        'completed': completed,
+        'throughput_per_s': round(completed / wall, 1),
+        'error_rate': round(errors / completed, 5) if completed else None,
+        'results': dict(recorder.results),
+        'latency': latency_summary(recorder.latencies),
+        'latency_by_command': {name: latency_summary(values) for name, values in recorder.by_command.items()},
+        'client': {
+            'cpu_s': round(cpu, 3),
+            'cpu_percent': round(cpu / wall * 100, 1),
+            'cpu_us_per_command': round(cpu / completed * 1e6, 1) if completed else None,
+            # Linux 上 ru_maxrss 单位为 KB
+            'max_rss_mb': round(after.ru_maxrss / 1024, 1),
+        },
+    }
+    if args.tracemalloc:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        step['client']['traced_peak_mb'] = round(peak / 2 ** 20, 2)
+    step.update(extra)
+    return step
+
+
+def start_server(args):
+    """子进程启动替身服务器，返回 (进程, 接口地址)"""
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lock_standin_server.py'),
+               '--port', str(args.port),
+               '--latency', str(args.latency), '--jitter', str(args.jitter),
+               '--error-rate', str(args.error_rate), '--seed', str(args.seed)]
+    server = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    return server, server.stdout.readline().split(': ', 1)[1].strip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='端到端压测')
+    parser.add_argument('model', choices=('closed', 'open'))
+    parser.add_argument('--concurrency', default='1,8,32', help='closed：逗号分隔的并发档位')
+    parser.add_argument('--rate', default='100,500,1000', help='open：逗号分隔的速率档位（条/秒）')
+    parser.add_argument('--max-inflight', type=int, default=256, help='open：在途请求上限')
+    parser.add_argument('--poisson', action='store_true', help='open：泊松到达（默认等间隔）')
+    parser.add_argument('--duration', type=float, default=10.0, help='每档持续时间（秒）')
+    parser.add_argument('--warmup', type=float, default=1.0, help='每档预热时间（秒），不计入结果')
+    parser.add_argument('--mix', default='unlock=1', help='命令比例，如 unlock=1,status=9')
+    parser.add_argument('--devices', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--server', help='已有服务器地址；不指定时在子进程启动替身服务器')
+    parser.add_argument('--port', type=int, default=18095, help='替身服务器端口')
+    parser.add_argument('--latency', type=float, default=0.005, help='替身服务器基础延迟（秒）')
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--timeout', type=float, default=10)
+    parser.add_argument('--tracemalloc', action='store_true', help='统计 Python 堆内存峰值（明显拖慢客户端）')
+    parser.add_argument('--output', help='写入 JSON 文件（默认打印）')
+    args = parser.parse_args()
+    mix_text = args.mix
+    args.mix = parse_mix(args.mix)
+    levels = parse_list(args.concurrency, int) if args.model == 'closed' else parse_list(args.rate, float)
+
+    server = None
+    url = args.server
+    if url is None:
+        server, url = start_server(args)
+    core = lock_core.LockCore(url, timeout=args.timeout)
+    # LOCK_PROFILE=sample/alloc 时在整个压测期间剖析客户端
+    profile = lock_profiler.start_from_env(log=lambda message: print(message, file=sys.stderr))
+    try:
+        steps = [run_step(core, args, args.model, level) for level in levels]
+    finally:
+        profiles = profile.stop() if profile else []
+        core.close()
+        if server is not None:
+            server.terminate()
+    report = {
+        'model': args.model,
+        'mix': mix_text,
+        'devices': args.devices,
+        'seed': args.seed,
+        'server': url if args.server else {'standin_latency': args.latency, 'jitter': args.jitter,
+                                           'error_rate': args.error_rate},
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'steps': steps,
+    }
+    if profiles:
+        report['profiles'] = profiles
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,510 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+门锁命令指标采集
+提供计数器、HDR风格延迟直方图，以及本地Prometheus文本/JSON抓取端点
+"""
+
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 直方图精度：每个2的幂区间再细分为 2**SUB_BITS 个线性子桶（相对误差约6%）
+SUB_BITS = 4
+SUB_COUNT = 1 << SUB_BITS
+LINEAR_LIMIT = SUB_COUNT * 2
+# 预分配的桶数：覆盖 2**63 微秒以内的全部取值，记录时不必检查长度
+BUCKET_COUNT = SUB_COUNT * 64
+
+# 导出到Prometheus时使用的固定桶边界（秒）
+PROMETHEUS_BOUNDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                     0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def bucket_index(value_us):
+    """微秒值 -> 桶序号"""
+    if value_us < LINEAR_LIMIT:
+        return value_us if value_us > 0 else 0
+    shift = value_us.bit_length() - SUB_BITS - 1
+    return (shift + 1) * SUB_COUNT + (value_us >> shift) - SUB_COUNT
+
+
+def bucket_bounds(index):
+    """桶序号 -> (下界, 上界) 微秒，上界不含"""
+    if index < LINEAR_LIMIT:
+        return index, index + 1
+    shift = index // SUB_COUNT - 1
+    low = (index - shift * SUB_COUNT) << shift
+    return low, low + (1 << shift)
+
+
+class _ThreadShards:
+    """每线程一份的累加分片：记录时只写本线程的分片、不加锁；读取时在锁内复制并合并。
+    线程退出后其分片并入 retired，每请求一线程的HTTP服务下分片数也不会持续增长"""
+
+    def __init__(self, factory, merge):
+        self.factory = factory
+        self.merge = merge
+        self.local = threading.local()
+        self._lock = threading.Lock()
+        self._live = []
+        self.retired = factory()
+
+    def create(self):
+        """当前线程第一次记录时调用"""
+        shard = self.factory()
+        with self._lock:
+            self._fold()
+            self._live.append((threading.current_thread(), shard))
+        self.local.shard = shard
+        return shard
+
+    def _fold(self):
+        live = []
+        for thread, shard in self._live:
+            if thread.is_alive():
+                live.append((thread, shard))
+            else:
+                self.merge(self.retired, shard)
+        self._live = live
+
+    def collect(self, copy):
+        """返回各分片的副本（第一项为已退出线程的合并结果）"""
+        with self._lock:
+            self._fold()
+            return [copy(self.retired)] + [copy(shard) for _, shard in self._live]
+
+
+class _HistogramShard:
+    __slots__ = ('counts', 'total_us', 'max_us')
+
+    def __init__(self):
+        self.counts = [0] * BUCKET_COUNT
+        self.total_us = 0
+        self.max_us = 0
+
+    def merge(self, other):
+        counts = self.counts
+        for index, n in enumerate(other.counts):
+            if n:
+                counts[index] += n
+        self.total_us += other.total_us
+        self.max_us = max(self.max_us, other.max_us)
+
+    def copy(self):
+        # list() 复制在GIL下是原子的；与 total_us 之间可能差正在进行的一次记录
+        shard = _HistogramShard.__new__(_HistogramShard)
+        shard.counts = list(self.counts)
+        shard.total_us = self.total_us
+        shard.max_us = self.max_us
+        return shard
+
+
+class Histogram:
+    """HDR风格对数-线性直方图，单位为微秒，记录开销为常数；每线程分片记录，读取时合并。
+    记录路径不加锁、不查标签，observe 与 observe_us 各自内联桶序号计算（省掉一次函数调用）"""
+
+    def __init__(self):
+        self._shards = _ThreadShards(_HistogramShard, _HistogramShard.merge)
+        self._local = self._shards.local
+
+    def observe(self, seconds):
+        """记录一次耗时（秒）；负值抛出 ValueError"""
+        value_us = int(seconds * 1000000)
+        if value_us < LINEAR_LIMIT:
+            if value_us < 0:
+                raise ValueError(f"耗时不能为负: {seconds}")
+            index = value_us
+        else:
+            shift = value_us.bit_length() - SUB_BITS - 1
+            index = (shift + 1) * SUB_COUNT + (value_us >> shift) - SUB_COUNT
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._shards.create()
+        shard.counts[index] += 1
+        shard.total_us += value_us
+        if value_us > shard.max_us:
+            shard.max_us = value_us
+
+    def observe_us(self, value_us):
+        """记录一次耗时（整数微秒）；负值抛出 ValueError"""
+        if value_us < LINEAR_LIMIT:
+            if value_us < 0:
+                raise ValueError(f"耗时不能为负: {value_us}us")
+            index = value_us
+        else:
+            shift = value_us.bit_length() - SUB_BITS - 1
+            index = (shift + 1) * SUB_COUNT + (value_us >> shift) - SUB_COUNT
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._shards.create()
+        shard.counts[index] += 1
+        shard.total_us += value_us
+        if value_us > shard.max_us:
+            shard.max_us = value_us
+
+    @property
+    def count(self):
+        """已记录次数（不复制各分片的桶）"""
+        return sum(sum(shard.counts) for shard in self._shards.collect(lambda shard: shard))
+
+    def snapshot(self):
+        """返回 (counts副本, count, total_us, max_us)"""
+        merged = _HistogramShard()
+        for shard in self._shards.collect(_HistogramShard.copy):
+            merged.merge(shard)
+        return merged.counts, sum(merged.counts), merged.total_us, merged.max_us
+
+    def percentile(self, q, snapshot=None):
+        """估算分位数（q取0~100），返回秒"""
+        counts, count, _, max_us = snapshot or self.snapshot()
+        if not count:
+            return 0.0
+        target = max(1, int(count * q / 100.0 + 0.5))
+        seen = 0
+        for index, n in enumerate(counts):
+            if not n:
+                continue
+            seen += n
+            if seen >= target:
+                low, high = bucket_bounds(index)
+                # 取桶中点，且不超过实际最大值
+                return min((low + high - 1) / 2.0, max_us) / 1000000.0
+        return max_us / 1000000.0
+
+    def cumulative(self, bounds=PROMETHEUS_BOUNDS, snapshot=None):
+        """按固定边界（秒）计算累计计数，用于Prometheus导出"""
+        counts, count, _, _ = snapshot or self.snapshot()
+        result = []
+        index = 0
+        seen = 0
+        for bound in bounds:
+            limit_us = bound * 1000000
+            while index < len(counts) and bucket_bounds(index)[1] <= limit_us:
+                seen += counts[index]
+                index += 1
+            result.append((bound, seen))
+        result.append((float('inf'), count))
+        return result
+
+    def summary(self):
+        """JSON友好的统计摘要"""
+        snap = self.snapshot()
+        _, count, total_us, max_us = snap
+        return {
+            'count': count,
+            'sum': total_us / 1000000.0,
+            'max': max_us / 1000000.0,
+            'p50': self.percentile(50, snap),
+            'p90': self.percentile(90, snap),
+            'p95': self.percentile(95, snap),
+            'p99': self.percentile(99, snap),
+        }
+
+
+def _new_cell():
+    return [0]
+
+
+def _merge_cell(into, cell):
+    into[0] += cell[0]
+
+
+class _CounterChild:
+    """某一组标签值的计数；每线程一个单元格累加，读取时合并"""
+
+    def __init__(self):
+        self._shards = _ThreadShards(_new_cell, _merge_cell)
+        self._local = self._shards.local
+
+    def inc(self, amount=1):
+        """累加；负值抛出 ValueError（计数器只增不减）"""
+        if amount < 0:
+            raise ValueError(f"计数器不能减少: {amount}")
+        try:
+            cell = self._local.shard
+        except AttributeError:
+            cell = self._shards.create()
+        cell[0] += amount
+
+    @property
+    def value(self):
+        return sum(cell[0] for cell in self._shards.collect(lambda cell: cell))
+
+
+class Counter:
+    """带标签的计数器；按标签值划分子计数，热路径可用 labels() 预先绑定"""
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self.children = {}
+
+    def labels(self, *labels):
+        """取得（必要时创建）对应标签的子计数；热路径中可缓存返回值"""
+        child = self.children.get(labels)
+        if child is None:
+            with self._lock:
+                child = self.children.setdefault(labels, _CounterChild())
+        return child
+
+    def inc(self, *labels, amount=1):
+        """按标签值（与labelnames顺序一致）累加"""
+        child = self.children.get(labels)
+        if child is None:
+            child = self.labels(*labels)
+        child.inc(amount)
+
+    @property
+    def values(self):
+        """合并后的 {标签值: 计数}"""
+        return {labels: child.value for labels, child in list(self.children.items())}
+
+    def get(self, *labels):
+        return self.values.get(labels, 0)
+
+    def render(self, lines):
+        lines.append(f"# HELP {self.name} {self.help_text}")
+        lines.append(f"# TYPE {self.name} counter")
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+
+    def to_dict(self):
+        return [dict(zip(self.labelnames, labels), value=value)
+                for labels, value in sorted(self.values.items())]
+
+
+class Gauge:
+    """带标签的瞬时值"""
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self.values = {}
+
+    def set(self, value, *labels):
+        with self._lock:
+            self.values[labels] = value
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0) - amount
+
+    def get(self, *labels):
+        return self.values.get(labels, 0)
+
+    def render(self, lines):
+        lines.append(f"# HELP {self.name} {self.help_text}")
+        lines.append(f"# TYPE {self.name} gauge")
+        for labels, value in self._items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+
+    def _items(self):
+        with self._lock:
+            return sorted(self.values.items())
+
+    def to_dict(self):
+        return [dict(zip(self.labelnames, labels), value=value) for labels, value in self._items()]
+
+
+class LabeledHistogram:
+    """按标签划分的一组直方图"""
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self.children = {}
+
+    def labels(self, *labels):
+        """取得（必要时创建）对应标签的直方图；热路径中可缓存返回值"""
+        child = self.children.get(labels)
+        if child is None:
+            with self._lock:
+                child = self.children.setdefault(labels, Histogram())
+        return child
+
+    def observe(self, seconds, *labels):
+        self.labels(*labels).observe(seconds)
+
+    def render(self, lines):
+        lines.append(f"# HELP {self.name} {self.help_text}")
+        lines.append(f"# TYPE {self.name} histogram")
+        for labels, child in sorted(self.children.items()):
+            snap = child.snapshot()
+            for bound, seen in child.cumulative(snapshot=snap):
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                label_text = _format_labels(self.labelnames + ('le',), labels + (le,))
+                lines.append(f"{self.name}_bucket{label_text} {seen}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {snap[2] / 1000000.0}")
+            lines.append(f"{self.name}_count{label_text} {snap[1]}")
+
+    def to_dict(self):
+        return [dict(zip(self.labelnames, labels), **child.summary())
+                for labels, child in sorted(self.children.items())]
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self):
+        self.metrics = {}
+
+    def _register(self, metric):
+        existing = self.metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name, help_text, labelnames=()):
+        return self._register(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=()):
+        return self._register(LabeledHistogram(name, help_text, labelnames))
+
+    def render_prometheus(self):
+        """Prometheus文本格式"""
+        lines = []
+        for name in sorted(self.metrics):
+            self.metrics[name].render(lines)
+        return '\n'.join(lines) + '\n'
+
+    def to_dict(self):
+        return {name: metric.to_dict() for name, metric in sorted(self.metrics.items())}
+
+    def dump_json(self, path=None):
+        """导出JSON；给定path时写入文件"""
+        text = json.dumps(self.to_dict(), ensure_ascii=False, indent=2)
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(text)
+        return text
+
+
+# 默认注册表及命令链路使用的指标
+REGISTRY = MetricsRegistry()
+COMMANDS_TOTAL = REGISTRY.counter(
+    'lock_commands_total', '门锁命令数（按命令、结果、HTTP状态）',
+    ('cmd', 'result', 'http_status'))
+COMMAND_STAGE_SECONDS = REGISTRY.histogram(
+    'lock_command_stage_seconds', '命令各阶段耗时（排队、网络、解析）', ('stage',))
+
+REQUESTS_IN_FLIGHT = REGISTRY.gauge('lock_requests_in_flight', '已发出、尚未收到应答的命令请求数')
+
+QUEUE_WAIT = COMMAND_STAGE_SECONDS.labels('queue_wait')
+NETWORK = COMMAND_STAGE_SECONDS.labels('network')
+PARSE = COMMAND_STAGE_SECONDS.labels('parse')
+
+
+# 附加抓取路由：路径 -> (生成函数, Content-Type)
+EXTRA_ROUTES = {}
+
+
+def register_route(path, producer, content_type='application/json; charset=utf-8'):
+    """在抓取端点上挂载额外路由（如追踪导出）"""
+    EXTRA_ROUTES[path] = (producer, content_type)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        path = self.path.split('?', 1)[0]
+        if path in EXTRA_ROUTES:
+            producer, content_type = EXTRA_ROUTES[path]
+            body = producer().encode('utf-8')
+        elif path == '/metrics':
+            body = self.registry.render_prometheus().encode('utf-8')
+            content_type = 'text/plain; version=0.0.4; charset=utf-8'
+        elif path == '/metrics.json':
+            body = self.registry.dump_json().encode('utf-8')
+            content_type = 'application/json; charset=utf-8'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # 抓取请求频繁，不输出访问日志
+        pass
+
+
+def start_metrics_server(port=9464, host='127.0.0.1', registry=REGISTRY):
+    """在后台线程启动抓取端点：/metrics（Prometheus）与 /metrics.json"""
+    handler = type('MetricsHandler', (_MetricsHandler,), {'registry': registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def start_from_env(registry=REGISTRY):
+    """设置了环境变量 LOCK_METRICS_PORT 时启动抓取端点"""
+    port = os.environ.get('LOCK_METRICS_PORT')
+    if not port:
+        return None
+    host = os.environ.get('LOCK_METRICS_HOST', '127.0.0.1')
+    return start_metrics_server(int(port), host, registry)
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+
+    # 简单自测：测量单次记录开销
+    hist = Histogram()
+    n = 200000
+    start = time.perf_counter()
+    for i in range(n):
+        hist.observe(i % 50000 / 1000000.0)
+    cost = (time.perf_counter() - start) / n
+    print(f"直方图记录开销: {cost * 1e9:.0f} ns/次")
+    start = time.perf_counter()
+    for i in range(n):
+        COMMANDS_TOTAL.inc('1', 'success', '200')
+    cost = (time.perf_counter() - start) / n
+    print(f"计数器累加开销（按标签）: {cost * 1e9:.0f} ns/次")
+    child = COMMANDS_TOTAL.labels('1', 'success', '200')
+    start = time.perf_counter()
+    for i in range(n):
+        child.inc()
+    cost = (time.perf_counter() - start) / n
+    print(f"计数器累加开销（预绑定）: {cost * 1e9:.0f} ns/次")
+    if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        start_metrics_server()
+        print("抓取端点: http://127.0.0.1:9464/metrics")
+        while True:
+            time.sleep(3600)
@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+热点路径微基准
+每个热点（group）下并列若干实现（variant）：current 为现行代码，其余为候选实现，便于替换前对比。
+测量方法：先按 --min-time 标定每轮循环次数，预热 --warmup 轮，再正式测 --repeats 轮（计时期间关闭 GC），
+每轮得到一个单次耗时，报告中位数、均值、标准差和均值的 95% 置信区间（t 分布）。
+
+    python lock_microbench.py run --output base.json
+    python lock_microbench.py run --filter parse --output new.json
+    python lock_microbench.py compare base.json new.json --threshold 0.05
+
+compare 对两份结果中同名的用例比较中位数：变慢超过阈值且两者置信区间不重叠时判为回归，退出码为 1。
+涉及 Kivy 的用例（Clock.schedule_once、弹窗构造）在未安装 Kivy 或无法创建控件时记为 skipped
+"""
+
+import argparse
+import gc
+import json
+import math
+import os
+import platform
+import statistics
+import sys
+import time
+from collections import deque
+
+import lock_core
+import lock_protocol
+import lock_transport
+
+# 双侧 95% 的 t 分位数（自由度 1~30），更大自由度用正态近似
+T95 = (12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+       2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+       2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042)
+
+CASES = []
+
+
+class Skip(Exception):
+    """用例的依赖不可用"""
+
+
+def bench(group, variant):
+    """登记用例；被装饰的函数做准备工作，返回无参的被测函数"""
+    def register(setup):
+        CASES.append((group, variant, setup))
+        return setup
+    return register
+
+
+def t95(df):
+    return T95[df - 1] if df <= len(T95) else 1.96
+
+
+# ---- add_log：日志字符串处理 ----
+
+LOG_MESSAGE = "响应成功: {'code': 0, 'data': [{'mac': '869701070000001', 'msg_info': 'HD1F0064...W'}]}"
+
+
+@bench('add_log', 'current')
+def add_log_current():
+    """与 main.py LockControlApp.add_log 相同的字符串处理（不含控件赋值）"""
+    state = {'log_text': ''}
+
+    def add_log(message=LOG_MESSAGE):
+        timestamp = time.strftime("%H:%M:%S")
+        state['log_text'] += f"[{timestamp}] {message}\n"
+        lines = state['log_text'].split('\n')
+        if len(lines) > 50:
+            state['log_text'] = '\n'.join(lines[-50:])
+        return state['log_text']
+
+    for _ in range(60):
+        add_log()
+    return add_log
+
+
+@bench('add_log', 'deque')
+def add_log_deque():
+    """固定长度的行队列，只在需要显示时拼接"""
+    lines = deque(maxlen=50)
+
+    def add_log(message=LOG_MESSAGE):
+        lines.append(f"[{time.strftime('%H:%M:%S')}] {message}")
+        return '\n'.join(lines)
+
+    for _ in range(60):
+        add_log()
+    return add_log
+
+
+# ---- parse_lock_command：应答帧解析 ----
+
+UNLOCK_FRAME = "HD2B0454049024910010000000000000000000006EDA1000000007EW"
+
+
+@bench('parse_lock_command', 'current')
+def parse_current():
+    return lambda: lock_core.parse_lock_command(UNLOCK_FRAME)
+
+
+@bench('parse_lock_command', 'protocol')
+def parse_protocol():
+    """按型号的协议解析（lock_protocol.Protocol.parse）"""
+    protocol = lock_protocol.default_registry().default
+    return lambda: protocol.parse(UNLOCK_FRAME)
+
+
+# ---- payload：send_lock_command 中的请求体与请求头构造 ----
+
+def _payload(protocol):
+    command = protocol.command('unlock')
+    return {
+        "type": protocol.type,
+        "mac": "869701070000001",
+        "cmd": command.cmd,
+        "sn": int(time.time()),
+        "info": command.frame(),
+    }
+
+
+@bench('payload', 'current')
+def payload_current():
+    """LockCore.execute 构造请求体 + HttpTransport 经 session.post(json=...) 准备请求"""
+    import requests
+
+    protocol = lock_protocol.default_registry().default
+    session = lock_transport.create_session()
+
+    def build():
+        request = requests.Request('POST', lock_core.DEFAULT_SERVER_URL,
+                                   headers=lock_transport.DEFAULT_HEADERS, json=_payload(protocol))
+        return session.prepare_request(request)
+    return build
+
+
+@bench('payload', 'prebuilt_body')
+def payload_prebuilt():
+    """自行序列化请求体（紧凑分隔符），只在会话合并一次请求头"""
+    import requests
+
+    protocol = lock_protocol.default_registry().default
+    session = lock_transport.create_session()
+    session.headers.update(lock_transport.DEFAULT_HEADERS)
+    dumps = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+
+    def build():
+        body = dumps(_payload(protocol)).encode('utf-8')
+        return session.prepare_request(requests.Request('POST', lock_core.DEFAULT_SERVER_URL, data=body))
+    return build
+
+
+# ---- Clock.schedule_once：每次回调新建 lambda ----
+
+def _kivy():
+    os.environ.setdefault('KIVY_NO_ARGS', '1')
+    os.environ.setdefault('KIVY_NO_CONSOLELOG', '1')
+    try:
+        from kivy.clock import Clock
+    except ImportError as e:
+        raise Skip(f"Kivy 不可用: {e}")
+    return Clock
+
+
+class _Target:
+    value = 0
+
+
+@bench('schedule_once', 'current')
+def schedule_current():
+    """与 main.py 相同：每次进度更新新建 lambda 并 schedule_once，随后由一帧处理"""
+    Clock = _kivy()
+    target = _Target()
+
+    def step(value=30):
+        Clock.schedule_once(lambda dt: setattr(target, 'value', value), 0)
+        Clock.tick()
+    return step
+
+
+@bench('schedule_once', 'trigger')
+def schedule_trigger():
+    """复用一个 create_trigger，待写入的值放在属性上"""
+    Clock = _kivy()
+    target = _Target()
+    pending = [0]
+    trigger = Clock.create_trigger(lambda dt: setattr(target, 'value', pending[0]), 0)
+
+    def step(value=30):
+        pending[0] = value
+        trigger()
+        Clock.tick()
+    return step
+
+
+# ---- show_popup：弹窗控件构造 ----
+
+def _widgets():
+    _kivy()
+    try:
+        from kivy.uix.boxlayout import BoxLayout
+        from kivy.uix.button import Button
+        from kivy.uix.label import Label
+        from kivy.uix.popup import Popup
+    except Exception as e:
+        raise Skip(f"无法导入 Kivy 控件: {e}")
+    return BoxLayout, Button, Label, Popup
+
+
+@bench('show_popup', 'current')
+def popup_current():
+    """与 main.py LockControlApp.show_popup 相同的控件构造（不调用 open，不依赖窗口）"""
+    BoxLayout, Button, Label, Popup = _widgets()
+
+    def show_popup(title="成功", message="门锁操作执行成功！"):
+        popup_layout = BoxLayout(orientation='vertical', padding=10, spacing=10)
+        popup_label = Label(text=message, text_size=(300, None), halign='center')
+        popup_button = Button(text='确定', size_hint_y=None, height='40dp')
+        popup_layout.add_widget(popup_label)
+        popup_layout.add_widget(popup_button)
+        popup = Popup(title=title, content=popup_layout, size_hint=(0.8, 0.6))
+        popup_button.bind(on_press=popup.dismiss)
+        return popup
+
+    try:
+        show_popup()
+    except Exception as e:
+        raise Skip(f"无法创建控件: {e}")
+    return show_popup
+
+
+@bench('show_popup', 'reuse')
+def popup_reuse():
+    """弹窗只构造一次，之后只更新标题和文字"""
+    BoxLayout, Button, Label, Popup = _widgets()
+    try:
+        layout = BoxLayout(orientation='vertical', padding=10, spacing=10)
+        label = Label(text_size=(300, None), halign='center')
+        button = Button(text='确定', size_hint_y=None, height='40dp')
+        layout.add_widget(label)
+        layout.add_widget(button)
+        popup = Popup(content=layout, size_hint=(0.8, 0.6))
+        button.bind(on_press=popup.dismiss)
+    except Exception as e:
+        raise Skip(f"无法创建控件: {e}")
+
+    def show_popup(title="成功", message="门锁操作执行成功！"):
+        popup.title = title
+        label.text = message
+        return popup
+    return show_popup
+
+
+# ---- 测量 ----
+
+def calibrate(func, min_time):
+    """每轮循环次数：使一轮耗时不少于 min_time"""
+    loops = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(loops):
+            func()
+        if time.perf_counter() - started >= min_time:
+            return loops
+        loops *= 2
+
+
+def measure(func, loops, repeats, warmup):
+    """返回每轮的单次耗时（纳秒）"""
+    samples = []
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for index in range(warmup + repeats):
+            started = time.perf_counter_ns()
+            for _ in range(loops):
+                func()
+            if index >= warmup:
+                samples.append((time.perf_counter_ns() - started) / loops)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return samples
+
+
+def summarize(samples, loops):
+    mean = statistics.fmean(samples)
+    stdev = statistics.stdev(samples) if len(samples) > 1 else 0.0
+    half = t95(len(samples) - 1) * stdev / math.sqrt(len(samples)) if len(samples) > 1 else 0.0
+    return {
+        'median_ns': round(statistics.median(samples), 1),
+        'mean_ns': round(mean, 1),
+        'stdev_ns': round(stdev, 1),
+        'ci95_ns': [round(mean - half, 1), round(mean + half, 1)],
+        'min_ns': round(min(samples), 1),
+        'repeats': len(samples),
+        'loops': loops,
+    }
+
+
+def run(args):
+    results = {}
+    for group, variant, setup in CASES:
+        name = f"{group}/{variant}"
+        if args.filter and args.filter not in name:
+            continue
+        try:
+            func = setup()
+        except Skip as e:
+            results.setdefault(group, {})[variant] = {'skipped': str(e)}
+            print(f"{name:32s} skipped（{e}）", file=sys.stderr)
+            continue
+        loops = calibrate(func, args.min_time)
+        stats = summarize(measure(func, loops, args.repeats, args.warmup), loops)
+        results.setdefault(group, {})[variant] = stats
+        print(f"{name:32s} {stats['median_ns']:>12.1f} ns  ±{(stats['ci95_ns'][1] - stats['mean_ns']):.1f}",
+              file=sys.stderr)
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'repeats': args.repeats,
+            'warmup': args.warmup,
+            'min_time': args.min_time,
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+
+
+def compare(base, new, threshold):
+    """逐个用例比较中位数；返回 (比较结果列表, 是否有回归)"""
+    rows = []
+    regressed = False
+    for group, variants in new['results'].items():
+        for variant, stats in variants.items():
+            before = base['results'].get(group, {}).get(variant)
+            if not before or 'skipped' in before or 'skipped' in stats:
+                continue
+            ratio = stats['median_ns'] / before['median_ns']
+            # 变慢超过阈值，且置信区间不重叠（排除测量噪声）
+            regression = ratio > 1 + threshold and stats['ci95_ns'][0] > before['ci95_ns'][1]
+            improvement = ratio < 1 - threshold and stats['ci95_ns'][1] < before['ci95_ns'][0]
+            regressed = regressed or regression
+            rows.append({'case': f"{group}/{variant}", 'base_ns': before['median_ns'],
+                         'new_ns': stats['median_ns'], 'ratio': round(ratio, 3),
+                         'verdict': 'regression' if regression else 'improvement' if improvement else 'same'})
+    return rows, regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='热点路径微基准')
+    sub = parser.add_subparsers(dest='action', required=True)
+    run_parser = sub.add_parser('run', help='运行基准')
+    run_parser.add_argument('--filter', help='只运行名称（group/variant）包含该字符串的用例')
+    run_parser.add_argument('--repeats', type=int, default=20)
+    run_parser.add_argument('--warmup', type=int, default=3)
+    run_parser.add_argument('--min-time', type=float, default=0.05, help='每轮的最短耗时（秒）')
+    run_parser.add_argument('--output', help='写入 JSON 文件（默认打印）')
+    compare_parser = sub.add_parser('compare', help='对比两份结果')
+    compare_parser.add_argument('base')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type=float, default=0.05, help='判为回归的变慢比例')
+    args = parser.parse_args()
+
+    if args.action == 'run':
+        text = json.dumps(run(args), indent=2, ensure_ascii=False)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                f.write(text + '\n')
+        else:
+            print(text)
+    else:
+        with open(args.base, 'r', encoding='utf-8') as f:
+            base = json.load(f)
+        with open(args.new, 'r', encoding='utf-8') as f:
+            new = json.load(f)
+        rows, regressed = compare(base, new, args.threshold)
+        print(json.dumps({'threshold': args.threshold, 'cases': rows, 'regressed': regressed},
+                         indent=2, ensure_ascii=False))
+        sys.exit(1 if regressed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MQTT 直连传输
+绕过 HTTP mqttpost 桥，经一条长连接把与 mqttpost 相同的 JSON 命令（含 HD…W 帧）发布到 broker：
+    命令主题  {prefix}/{type}/{mac}/cmd，QoS 1：等 broker 的 PUBACK（不超过请求超时），
+              幂等命令未确认时以 DUP 标志重发，开锁等非幂等命令不重发（至多执行一次）
+    应答主题  {prefix}/reply/{client_id}；命令中附带 reply_to 和 cid，设备侧按 cid 回复 mqttpost 格式的响应
+只实现所需的 MQTT 3.1.1 子集（CONNECT/PUBLISH/PUBACK/SUBSCRIBE/PINGREQ/DISCONNECT），不依赖第三方库
+"""
+
+import itertools
+import json
+import socket
+import ssl
+import struct
+import threading
+import time
+import uuid
+from urllib.parse import urlsplit
+
+import requests
+
+import lock_deadline
+from lock_transport import CommandNotSent, Transport, TransportResponse, status_for_code
+
+CONNECT = 0x10
+CONNACK = 0x20
+PUBLISH = 0x30
+PUBACK = 0x40
+SUBSCRIBE = 0x80
+SUBACK = 0x90
+PINGREQ = 0xC0
+PINGRESP = 0xD0
+DISCONNECT = 0xE0
+
+# QoS 1 发布未收到 PUBACK 时的重发间隔（秒）
+RETRANSMIT_INTERVAL = 1.0
+
+
+def encode_length(length):
+    """剩余长度：每字节7位，最高位表示后续还有字节"""
+    out = bytearray()
+    while True:
+        byte = length % 128
+        length //= 128
+        out.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(out)
+
+
+def encode_string(value):
+    data = value.encode('utf-8') if isinstance(value, str) else value
+    return struct.pack('>H', len(data)) + data
+
+
+def packet(first_byte, body=b''):
+    return bytes((first_byte,)) + encode_length(len(body)) + body
+
+
+def read_packet(stream):
+    """从缓冲读取器读一个完整报文，返回 (首字节, 报文体)；连接关闭时抛出 ConnectionError"""
+    header = stream.read(1)
+    if not header:
+        raise ConnectionError("连接已关闭")
+    length = 0
+    multiplier = 1
+    while True:
+        byte = stream.read(1)
+        if not byte:
+            raise ConnectionError("连接已关闭")
+        length += (byte[0] & 0x7F) * multiplier
+        if not byte[0] & 0x80:
+            break
+        multiplier *= 128
+    body = stream.read(length) if length else b''
+    if len(body) != length:
+        raise ConnectionError("连接已关闭")
+    return header[0], body
+
+
+def publish_packet(topic, payload, qos=0, packet_id=None, dup=False, retain=False):
+    body = encode_string(topic)
+    if qos:
+        body += struct.pack('>H', packet_id)
+    return packet(PUBLISH | (dup << 3) | (qos << 1) | retain, body + payload)
+
+
+def parse_publish(first_byte, body):
+    """返回 (topic, qos, packet_id, payload)"""
+    qos = (first_byte >> 1) & 0x03
+    topic_len = struct.unpack_from('>H', body)[0]
+    topic = body[2:2 + topic_len].decode('utf-8')
+    pos = 2 + topic_len
+    packet_id = None
+    if qos:
+        packet_id = struct.unpack_from('>H', body, pos)[0]
+        pos += 2
+    return topic, qos, packet_id, body[pos:]
+
+
+class MqttClient:
+    """最小 MQTT 3.1.1 客户端：后台线程接收报文，断线后在下次发布时重连并恢复订阅"""
+
+    def __init__(self, host, port=1883, client_id=None, keepalive=30, username=None, password=None,
+                 use_tls=False, on_message=None, on_disconnect=None):
+        self.host = host
+        self.port = port
+        self.client_id = client_id or f"lockapp-{uuid.uuid4().hex[:12]}"
+        self.keepalive = keepalive
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.on_message = on_message
+        self.on_disconnect = on_disconnect
+        self.subscriptions = {}
+        self._sock = None
+        self._write_lock = threading.Lock()
+        self._connect_lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._acks = {}
+        self._closed = False
+        self._pinger = None
+
+    @property
+    def connected(self):
+        return self._sock is not None
+
+    def _next_id(self):
+        return next(self._ids) % 65535 + 1
+
+    def connect(self, timeout=5.0):
+        """建立连接并恢复订阅（已连接时直接返回）；失败抛出 OSError。
+        订阅全部确认后才视为已连接：订阅超时的连接被关闭，下次调用重新建立，不会留下收不到应答的连接"""
+        with self._connect_lock:
+            if self._sock is not None:
+                return
+            sock = socket.create_connection((self.host, self.port), timeout=timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            if self.use_tls:
+                sock = ssl.create_default_context().wrap_socket(sock, server_hostname=self.host)
+            flags = 0x02                                    # clean session
+            payload = encode_string(self.client_id)
+            if self.username is not None:
+                flags |= 0x80
+                payload += encode_string(self.username)
+                if self.password is not None:
+                    flags |= 0x40
+                    payload += encode_string(self.password)
+            body = encode_string('MQTT') + bytes((4, flags)) + struct.pack('>H', self.keepalive) + payload
+            stream = sock.makefile('rb')
+            try:
+                sock.sendall(packet(CONNECT, body))
+                first, reply = read_packet(stream)
+            except (OSError, ConnectionError):
+                sock.close()
+                raise
+            if first & 0xF0 != CONNACK or len(reply) < 2 or reply[1] != 0:
+                sock.close()
+                raise ConnectionRefusedError(f"broker 拒绝连接: {reply[1] if len(reply) > 1 else '?'}")
+            sock.settimeout(None)
+            # 读线程先启动以接收 SUBACK；它在断线时的 _drop 要等本方法释放 _connect_lock
+            threading.Thread(target=self._read_loop, args=(sock, stream), name='mqtt-reader', daemon=True).start()
+            try:
+                for topic, qos in list(self.subscriptions.items()):
+                    self._send_subscribe(topic, qos, timeout, sock)
+            except BaseException:
+                self._close_socket(sock)
+                raise
+            self._sock = sock
+            if self._pinger is None:
+                self._pinger = threading.Thread(target=self._ping_loop, name='mqtt-ping', daemon=True)
+                self._pinger.start()
+
+    def _send(self, data, sock=None):
+        sock = sock or self._sock
+        if sock is None:
+            raise CommandNotSent("未连接到 broker")
+        with self._write_lock:
+            sock.sendall(data)
+
+    def _send_subscribe(self, topic, qos, timeout, sock=None):
+        packet_id = self._next_id()
+        done = self._acks[packet_id] = threading.Event()
+        self._send(packet(SUBSCRIBE | 0x02, struct.pack('>H', packet_id) + encode_string(topic) + bytes((qos,))), sock)
+        try:
+            acked = done.wait(timeout)
+        finally:
+            self._acks.pop(packet_id, None)
+        if getattr(done, 'dropped', False):
+            raise ConnectionError("与 broker 的连接已断开")
+        if not acked:
+            raise TimeoutError(f"订阅超时: {topic}")
+
+    def subscribe(self, topic, qos=1, timeout=5.0):
+        """订阅主题；未连接时记录下来，连接后自动订阅"""
+        self.subscriptions[topic] = qos
+        if self._sock is not None:
+            self._send_subscribe(topic, qos, timeout)
+
+    def publish(self, topic, payload, qos=1, timeout=10.0, retransmit=True):
+        """发布消息；QoS 1 时等待 PUBACK，返回是否在 timeout 秒内得到确认。
+        retransmit 为真时每 RETRANSMIT_INTERVAL 秒以 DUP 标志重发一次（同一报文ID）；
+        等待期间连接断开抛出 ConnectionError"""
+        if not qos:
+            self._send(publish_packet(topic, payload))
+            return True
+        sock = self._sock
+        packet_id = self._next_id()
+        done = self._acks[packet_id] = threading.Event()
+        try:
+            self._send(publish_packet(topic, payload, qos, packet_id), sock)
+            end = time.monotonic() + timeout
+            while True:
+                remaining = end - time.monotonic()
+                wait = min(remaining, RETRANSMIT_INTERVAL) if retransmit else remaining
+                if done.wait(max(0.0, wait)):
+                    break
+                if remaining <= wait:
+                    return False
+                self._send(publish_packet(topic, payload, qos, packet_id, dup=True), sock)
+        finally:
+            self._acks.pop(packet_id, None)
+        if getattr(done, 'dropped', False):
+            raise ConnectionError("与 broker 的连接已断开")
+        return True
+
+    def _read_loop(self, sock, stream):
+        try:
+            while True:
+                first, body = read_packet(stream)
+                kind = first & 0xF0
+                if kind == PUBLISH:
+                    topic, qos, packet_id, payload = parse_publish(first, body)
+                    if qos:
+                        self._send(packet(PUBACK, struct.pack('>H', packet_id)), sock)
+                    if self.on_message:
+                        self.on_message(topic, payload)
+                elif kind in (PUBACK, SUBACK):
+                    done = self._acks.pop(struct.unpack_from('>H', body)[0], None)
+                    if done is not None:
+                        done.set()
+        except (OSError, ConnectionError, struct.error):
+            pass
+        finally:
+            self._drop(sock)
+
+    def _ping_loop(self):
+        interval = max(1.0, self.keepalive / 2.0)
+        while not self._closed:
+            time.sleep(interval)
+            if self._sock is not None:
+                try:
+                    self._send(packet(PINGREQ))
+                except OSError:
+                    self._drop(self._sock)
+
+    def _drop(self, sock):
+        with self._connect_lock:
+            if self._sock is not sock:
+                return
+            self._sock = None
+        self._close_socket(sock)
+        if self.on_disconnect:
+            self.on_disconnect()
+
+    def _close_socket(self, sock):
+        try:
+            sock.close()
+        except OSError:
+            pass
+        # 唤醒等待确认的调用方，由它们报告连接断开
+        acks, self._acks = self._acks, {}
+        for done in acks.values():
+            done.dropped = True
+            done.set()
+
+    def close(self):
+        self._closed = True
+        sock = self._sock
+        if sock is not None:
+            try:
+                self._send(packet(DISCONNECT))
+            except OSError:
+                pass
+            self._drop(sock)
+
+
+class MqttTransport(Transport):
+    """经 MQTT broker 直接发布命令，按 cid 把应答主题上的响应交还给等待的调用方"""
+
+    name = 'mqtt'
+
+    def __init__(self, url, client_id=None, topic_prefix='yefiot', keepalive=30):
+        parts = urlsplit(url)
+        self.url = url
+        self.topic_prefix = topic_prefix
+        self.client = MqttClient(
+            parts.hostname, parts.port or (8883 if parts.scheme == 'mqtts' else 1883),
+            client_id=client_id, keepalive=keepalive, username=parts.username, password=parts.password,
+            use_tls=parts.scheme == 'mqtts', on_message=self._on_reply, on_disconnect=self._on_disconnect)
+        self.reply_topic = f"{topic_prefix}/reply/{self.client.client_id}"
+        self.client.subscriptions[self.reply_topic] = 1
+        self._cids = itertools.count(1)
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def command_topic(self, payload):
+        return f"{self.topic_prefix}/{payload.get('type', 'yfn03')}/{payload.get('mac') or 'fleet'}/cmd"
+
+    def _on_reply(self, topic, payload):
+        try:
+            body = json.loads(payload)
+            cid = body.get('cid')
+        except (ValueError, AttributeError):
+            return
+        with self._lock:
+            slot = self._pending.pop(cid, None)
+        if slot is not None:
+            # 设备侧以 code 表示错误，映射为与HTTP一致的状态码
+            slot[1] = (status_for_code(body.get('code')), payload)
+            slot[0].set()
+
+    def _on_disconnect(self):
+        # 连接断开：唤醒所有等待中的调用方，由它们报告连接错误
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for slot in pending.values():
+            slot[0].set()
+
+    def post(self, payload, timeout=10, idempotent=False):
+        deadline = lock_deadline.current()
+        # 幂等命令在连接中断后重连再试一次；开锁命令可能已送达，不自动重发
+        attempts = 2 if idempotent else 1
+        for attempt in range(attempts):
+            if deadline is not None:
+                deadline.check()
+            attempt_timeout = timeout if deadline is None else deadline.clamp(timeout)
+            connect_timeout, read_timeout = (attempt_timeout if isinstance(attempt_timeout, tuple)
+                                             else (attempt_timeout, attempt_timeout))
+            try:
+                self.client.connect(connect_timeout)
+            except OSError as e:
+                raise CommandNotSent(e)
+            cid = next(self._cids)
+            slot = [threading.Event(), None]
+            with self._lock:
+                self._pending[cid] = slot
+            message = dict(payload, reply_to=self.reply_topic, cid=cid)
+            started = time.monotonic()
+            try:
+                # 等 broker 确认（计入读取超时）；只有幂等命令在未确认时重发
+                acked = self.client.publish(self.command_topic(payload),
+                                            json.dumps(message, separators=(',', ':')).encode('utf-8'),
+                                            qos=1, timeout=read_timeout, retransmit=idempotent)
+            except CommandNotSent:
+                with self._lock:
+                    self._pending.pop(cid, None)
+                if attempt == attempts - 1:
+                    raise
+                continue
+            except OSError as e:
+                with self._lock:
+                    self._pending.pop(cid, None)
+                if attempt < attempts - 1:
+                    continue
+                raise requests.exceptions.ConnectionError(e)
+            if not acked:
+                with self._lock:
+                    self._pending.pop(cid, None)
+                raise requests.exceptions.ReadTimeout(f"{read_timeout:.3g}秒内 broker 未确认 (cid={cid})")
+            # 取消时唤醒等待，不再等应答
+            with lock_deadline.watch(deadline, slot[0].set):
+                replied = slot[0].wait(max(0.0, read_timeout - (time.monotonic() - started)))
+            if deadline is not None and deadline.cancelled and slot[1] is None:
+                with self._lock:
+                    self._pending.pop(cid, None)
+                deadline.check()
+            if not replied:
+                with self._lock:
+                    self._pending.pop(cid, None)
+                raise requests.exceptions.ReadTimeout(f"{read_timeout:.3g}秒内未收到应答 (cid={cid})")
+            if slot[1] is not None:
+                return TransportResponse(slot[1][0], slot[1][1], self.url)
+        raise requests.exceptions.ConnectionError("与 broker 的连接已断开")
+
+    def close(self):
+        self.client.close()
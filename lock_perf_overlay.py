@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+界面性能浮层
+在 kivy.modules.monitor 的 FPS 曲线下方增加一块文字面板：
+    帧时间分位数（Window.on_flip 打点，环形缓冲）
+    主线程耗时最多的 Clock 回调（后台线程按固定间隔采样主线程调用栈，按回调函数归并，
+    并区分 渲染 / 布局 / 输入 / 回调，卡顿时能看出是哪一类）
+    命令队列深度（LockCore.queue_depths）、在途请求数、状态查询的 etag 命中率、进程内存
+后台采集的开销：每帧一次数组写入，加上每 SAMPLE_INTERVAL 秒一次取主线程栈；
+面板文字只在显示时每 0.5 秒刷新。
+
+    LOCK_PERF_OVERLAY=1    启动时显示浮层
+    F9                     显示/隐藏；Shift+F9 导出快照（JSON，写入用户数据目录，路径记入日志）
+    F10                    开始/停止采样剖析（lock_profiler），停止时写出 collapsed stacks
+    连续点击标题 5 次       显示/隐藏（手机上没有键盘时）
+
+也可作为 Kivy 模块使用（start/stop 与 kivy.modules.monitor 相同），此时不显示 LockCore 相关的指标
+"""
+
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from array import array
+from collections import Counter
+
+import lock_metrics
+import lock_profiler
+import lock_sync
+
+FRAME_CAPACITY = 600
+SAMPLE_INTERVAL = 0.01
+REFRESH_INTERVAL = 0.5
+TOP_CALLBACKS = 8
+KEY_F9 = 290
+KEY_F10 = 291
+
+RENDER = 'render'
+LAYOUT = 'layout'
+INPUT = 'input'
+CALLBACK = 'callback'
+IDLE = 'idle'
+
+
+def enabled():
+    return os.environ.get('LOCK_PERF_OVERLAY', '').strip() not in ('', '0')
+
+
+class FrameRing:
+    """最近 capacity 帧的帧时间（秒）"""
+
+    def __init__(self, capacity=FRAME_CAPACITY):
+        self.times = array('d', bytes(8 * capacity))
+        self.capacity = capacity
+        self.count = 0
+        self.last = None
+
+    def on_flip(self, *args):
+        now = time.perf_counter()
+        if self.last is not None:
+            self.times[self.count % self.capacity] = now - self.last
+            self.count += 1
+        self.last = now
+
+    def recent(self):
+        """按时间顺序"""
+        if self.count <= self.capacity:
+            return list(self.times[:self.count])
+        split = self.count % self.capacity
+        return list(self.times[split:]) + list(self.times[:split])
+
+    def summary(self):
+        frames = sorted(self.recent())
+        if not frames:
+            return {}
+        pick = lambda q: round(frames[min(len(frames) - 1, int(q / 100.0 * len(frames)))] * 1000, 1)
+        return {'frames': len(frames), 'p50_ms': pick(50), 'p95_ms': pick(95), 'p99_ms': pick(99),
+                'max_ms': round(frames[-1] * 1000, 1),
+                'over_budget': sum(1 for frame in frames if frame > 1.5 / 60)}
+
+
+def _is_event_loop(code):
+    return code.co_name == 'idle' and code.co_filename.endswith(os.path.join('kivy', 'base.py'))
+
+
+def attribute(frame):
+    """主线程当前栈 -> (类别, 名称)；不在事件循环中时返回 None
+
+    Clock 的回调由 Cython 代码调用，在 Python 栈上直接挂在 EventLoop.idle 之下，
+    因此 idle 下面的第一帧就是正在执行的回调（或窗口绘制、输入分发）"""
+    top = None
+    while frame is not None and not _is_event_loop(frame.f_code):
+        top = frame
+        frame = frame.f_back
+    if frame is None:
+        return None
+    if top is None:
+        return IDLE, IDLE
+    code = top.f_code
+    name = f"{getattr(code, 'co_qualname', code.co_name)} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    path = code.co_filename.replace('\\', '/')
+    if '/kivy/core/window/' in path:
+        return RENDER, name
+    if code.co_name == 'dispatch_input':
+        return INPUT, name
+    if 'layout' in code.co_name or 'layout' in os.path.basename(path):
+        return LAYOUT, name
+    return CALLBACK, name
+
+
+class CallbackSampler:
+    """按固定间隔采样主线程，累计各回调的耗时（采样数 × 间隔）和单次最长耗时"""
+
+    def __init__(self, interval=SAMPLE_INTERVAL, thread_ident=None):
+        self.interval = interval
+        self.thread_ident = thread_ident or threading.main_thread().ident
+        self.samples = Counter()
+        self.categories = Counter()
+        self.longest = {}
+        self._run = (None, None, 0)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name='perf-sampler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_ident)
+            site = attribute(frame) if frame is not None else None
+            del frame
+            if site is not None:
+                self.add(site)
+
+    def add(self, site):
+        category, name = site
+        with self._lock:
+            self.categories[category] += 1
+            if category != IDLE:
+                self.samples[name] += 1
+            # 连续落在同一回调上的采样视为同一次调用
+            last_name, last_category, run = self._run
+            run = run + 1 if name == last_name else 1
+            self._run = (name, category, run)
+            if category != IDLE and run > self.longest.get(name, 0):
+                self.longest[name] = run
+
+    def top(self, limit=TOP_CALLBACKS):
+        ms = self.interval * 1000
+        with self._lock:
+            return [{'name': name, 'total_ms': round(count * ms), 'longest_ms': round(self.longest[name] * ms)}
+                    for name, count in self.samples.most_common(limit)]
+
+    def busy_share(self):
+        """主线程时间在各类别中的占比"""
+        with self._lock:
+            total = sum(self.categories.values())
+            return {category: round(count / total, 3) for category, count in self.categories.items()} if total else {}
+
+
+def memory_mb():
+    """当前常驻内存（Linux/Android 读 /proc，其他平台用峰值）"""
+    try:
+        with open('/proc/self/statm') as f:
+            return round(int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20, 1)
+    except (OSError, ValueError, AttributeError):
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(rss / (2 ** 20 if sys.platform == 'darwin' else 1024), 1)
+
+
+def status_cache_hit_rate():
+    """条件查询中 not_modified 的比例（etag 命中）"""
+    counts = {result: lock_sync.SYNC_TOTAL.get('conditional', result)
+              for result in (lock_sync.CHANGED, lock_sync.NOT_MODIFIED, lock_sync.FAILED)}
+    total = sum(counts.values())
+    return round(counts[lock_sync.NOT_MODIFIED] / total, 3) if total else None
+
+
+class PerfOverlay:
+    """性能浮层；core 为 LockCore（可选），提供队列深度"""
+
+    def __init__(self, core=None, log=None, export_dir=None):
+        self.core = core
+        self.log = log or (lambda message: None)
+        self.export_dir = export_dir
+        self.frames = FrameRing()
+        self.sampler = CallbackSampler()
+        self.visible = False
+        self._window = None
+        self._monitor = None
+        self._panel = None
+        self._refresh = None
+        self.profile = None
+
+    def install(self, window=None):
+        """开始后台采集，绑定快捷键"""
+        if window is None:
+            from kivy.core.window import Window as window
+        self._window = window
+        window.bind(on_flip=self.frames.on_flip, on_key_down=self._on_key_down)
+        self.sampler.start()
+        if enabled():
+            self.show()
+        return self
+
+    def uninstall(self):
+        self.hide()
+        self.sampler.stop()
+        if self.profile is not None:
+            self.toggle_profile()
+        if self._window is not None:
+            self._window.unbind(on_flip=self.frames.on_flip, on_key_down=self._on_key_down)
+
+    def _on_key_down(self, window, key, scancode=None, codepoint=None, modifiers=None, *args):
+        if key == KEY_F10:
+            self.toggle_profile()
+            return True
+        if key != KEY_F9:
+            return False
+        if 'shift' in (modifiers or ()):
+            self.export()
+        else:
+            self.toggle()
+        return True
+
+    def toggle_profile(self):
+        """开始/停止采样剖析，结果写到导出目录"""
+        if self.profile is None:
+            self.profile = lock_profiler.ProfileSession(self.export_dir or os.getcwd(), log=self.log).start()
+            self.log("采样剖析已开始")
+        else:
+            self.profile.stop()
+            self.profile = None
+
+    # ---- 显示 ----
+
+    def toggle(self):
+        if self.visible:
+            self.hide()
+        else:
+            self.show()
+
+    def show(self):
+        if self.visible or self._window is None:
+            return
+        from kivy.clock import Clock
+        from kivy.core.text import Label as CoreLabel
+        from kivy.graphics import Color, Rectangle
+        from kivy.modules import monitor
+
+        # FPS 曲线沿用 kivy.modules.monitor，文字面板画在它下方
+        self._monitor = type('MonitorContext', (), {})()
+        monitor.start(self._window, self._monitor)
+        self._label = CoreLabel(text='', font_size=12, halign='left')
+        with self._window.canvas.after:
+            self._panel_color = Color(0, 0, 0, 0.6)
+            self._panel = Rectangle(pos=(0, 0), size=(0, 0))
+            self._text_color = Color(1, 1, 1, 1)
+            self._text = Rectangle(pos=(0, 0), size=(0, 0))
+        self._refresh = Clock.schedule_interval(self._update, REFRESH_INTERVAL)
+        self.visible = True
+        self._update()
+
+    def hide(self):
+        if not self.visible:
+            return
+        from kivy.modules import monitor
+
+        self._refresh.cancel()
+        monitor.stop(self._window, self._monitor)
+        for instruction in (self._panel_color, self._panel, self._text_color, self._text):
+            self._window.canvas.after.remove(instruction)
+        self._panel = self._text = None
+        self.visible = False
+
+    def _update(self, *args):
+        self._label.text = self.render_text(self.snapshot(include_metrics=False))
+        self._label.refresh()
+        texture = self._label.texture
+        width, height = texture.size
+        # monitor 的 FPS 条占窗口顶部 25 像素
+        top = self._window.height - 25
+        self._panel.pos = (0, top - height - 8)
+        self._panel.size = (max(width + 12, self._window.width * 0.6), height + 8)
+        self._text.texture = texture
+        self._text.pos = (6, top - height - 4)
+        self._text.size = texture.size
+
+    @staticmethod
+    def render_text(snapshot):
+        frames = snapshot['frames']
+        lines = [f"帧 p50 {frames.get('p50_ms', '-')}  p95 {frames.get('p95_ms', '-')}  "
+                 f"p99 {frames.get('p99_ms', '-')}  max {frames.get('max_ms', '-')} ms  "
+                 f"超预算 {frames.get('over_budget', 0)}/{frames.get('frames', 0)}"]
+        share = snapshot['main_thread']
+        lines.append('主线程 ' + '  '.join(f"{name} {value:.0%}" for name, value in sorted(share.items())))
+        queues = '  '.join(f"{name} {value}" for name, value in snapshot['queues'].items()) or '-'
+        hit_rate = snapshot['status_cache_hit_rate']
+        lines.append(f"队列 {queues}  在途 {snapshot['in_flight']}  "
+                     f"etag命中 {'-' if hit_rate is None else f'{hit_rate:.0%}'}  内存 {snapshot['memory_mb']} MB")
+        if snapshot['profiling']:
+            lines.append("采样剖析中（F10 停止）")
+        for callback in snapshot['slowest_callbacks'][:5]:
+            lines.append(f"  {callback['total_ms']:>6} ms (最长 {callback['longest_ms']} ms)  {callback['name']}")
+        return '\n'.join(lines)
+
+    # ---- 快照 ----
+
+    def snapshot(self, include_metrics=True):
+        snapshot = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'frames': self.frames.summary(),
+            'main_thread': self.sampler.busy_share(),
+            'slowest_callbacks': self.sampler.top(),
+            'queues': self.core.queue_depths() if self.core is not None else {},
+            'in_flight': lock_metrics.REQUESTS_IN_FLIGHT.get(),
+            'status_cache_hit_rate': status_cache_hit_rate(),
+            'memory_mb': memory_mb(),
+            'profiling': self.profile is not None,
+        }
+        if include_metrics:
+            snapshot['frame_times_ms'] = [round(frame * 1000, 2) for frame in self.frames.recent()]
+            snapshot['metrics'] = lock_metrics.REGISTRY.to_dict()
+        return snapshot
+
+    def export(self, directory=None):
+        """写入快照文件，返回路径"""
+        directory = directory or self.export_dir or os.getcwd()
+        path = os.path.join(directory, time.strftime('perf-%Y%m%d-%H%M%S.json'))
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+        self.log(f"性能快照已导出: {path}")
+        return path
+
+
+# ---- 作为 Kivy 模块使用 ----
+
+def start(win, ctx):
+    ctx.overlay = PerfOverlay().install(win)
+    ctx.overlay.show()
+
+
+def stop(win, ctx):
+    ctx.overlay.uninstall()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+服务器健康探测
+只发送不带请求体的 HEAD 请求，不会向门锁下发任何指令；
+分阶段测量 DNS、TCP建连、TLS握手、首字节时间(TTFB)和总往返时间，
+多次采样后给出 最小/中位数/P95 及抖动，并据此建议请求超时
+"""
+
+import socket
+import ssl
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit
+
+PHASES = ('dns', 'tcp', 'tls', 'ttfb', 'total')
+USER_AGENT = 'LockControl-Probe/1.0'
+
+# 每个地址最近一次的探测结果，供超时和选路逻辑参考
+_latest = {}
+_latest_lock = threading.Lock()
+
+
+def _resolve(host, port, timeout):
+    """带超时的DNS解析，返回 (地址列表, 耗时秒)。
+    getaddrinfo 本身不支持超时，放到守护线程中执行，超时后不再等待（线程解析结束后自行退出）"""
+    result = {}
+
+    def run():
+        start = time.perf_counter()
+        try:
+            result['infos'] = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+        except OSError as e:
+            result['error'] = e
+        result['elapsed'] = time.perf_counter() - start
+
+    thread = threading.Thread(target=run, name='probe-dns', daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        raise socket.timeout(f"DNS解析超时（{timeout}秒）: {host}")
+    if 'error' in result:
+        raise result['error']
+    return result['infos'], result['elapsed']
+
+
+def probe_once(url, timeout=5.0, context=None):
+    """单次探测，返回各阶段耗时（秒）及HTTP状态码（没有收到有效状态行时为0）"""
+    parts = urlsplit(url)
+    host = parts.hostname
+    secure = parts.scheme == 'https'
+    port = parts.port or (443 if secure else 80)
+    path = parts.path or '/'
+
+    sample = {'tls': 0.0}
+    start = time.perf_counter()
+    infos, sample['dns'] = _resolve(host, port, timeout)
+    t_dns = time.perf_counter()
+
+    family, socktype, proto, _, address = infos[0]
+    sock = socket.socket(family, socktype, proto)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(address)
+        t_tcp = time.perf_counter()
+        sample['tcp'] = t_tcp - t_dns
+        if secure:
+            context = context or ssl.create_default_context()
+            sock = context.wrap_socket(sock, server_hostname=host)
+            sample['tls'] = time.perf_counter() - t_tcp
+
+        request = (f"HEAD {path} HTTP/1.1\r\nHost: {parts.netloc}\r\n"
+                   f"User-Agent: {USER_AGENT}\r\nConnection: close\r\n\r\n")
+        t_sent = time.perf_counter()
+        sock.sendall(request.encode('ascii'))
+        data = sock.recv(1)
+        sample['ttfb'] = time.perf_counter() - t_sent
+        while b'\r\n\r\n' not in data:
+            chunk = sock.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+        sample['total'] = time.perf_counter() - start
+    finally:
+        sock.close()
+
+    status_line = data.split(b'\r\n', 1)[0].split()
+    sample['status'] = int(status_line[1]) if len(status_line) > 1 and status_line[1].isdigit() else 0
+    return sample
+
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100.0 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+class ProbeReport:
+    """多次探测的汇总结果"""
+
+    def __init__(self, url, samples, errors):
+        self.url = url
+        self.samples = samples
+        self.errors = errors
+        self.finished_at = time.time()
+
+    @property
+    def healthy(self):
+        """收到HTTP状态行的样本；连接被关闭、没有应答的样本（status为0）不算健康"""
+        return [sample for sample in self.samples if sample['status']]
+
+    @property
+    def ok(self):
+        return bool(self.healthy)
+
+    @property
+    def loss(self):
+        """失败次数（含没有HTTP应答的样本）占比"""
+        total = len(self.samples) + len(self.errors)
+        return (total - len(self.healthy)) / total if total else 1.0
+
+    def stats(self, phase):
+        """健康样本某阶段的 min/median/p95/jitter（秒）；jitter为相邻样本差值绝对值的平均"""
+        values = [sample[phase] for sample in self.healthy]
+        if not values:
+            return None
+        diffs = [abs(b - a) for a, b in zip(values, values[1:])]
+        return {
+            'min': min(values),
+            'median': statistics.median(values),
+            'p95': _percentile(values, 95),
+            'jitter': sum(diffs) / len(diffs) if diffs else 0.0,
+        }
+
+    def suggested_timeout(self, default=10.0):
+        """建议的 (连接超时, 读取超时)，可直接传给 requests 的 timeout 参数"""
+        healthy = self.healthy
+        if not healthy:
+            return default
+        setup = [s['dns'] + s['tcp'] + s['tls'] for s in healthy]
+        ttfb = self.stats('ttfb')
+        connect_timeout = min(5.0, max(1.0, _percentile(setup, 95) * 3))
+        read_timeout = min(default, max(2.0, ttfb['p95'] * 4 + ttfb['jitter'] * 4))
+        return (round(connect_timeout, 2), round(read_timeout, 2))
+
+    def to_dict(self):
+        return {
+            'url': self.url,
+            'samples': len(self.samples),
+            'healthy': len(self.healthy),
+            'errors': self.errors,
+            'loss': self.loss,
+            'phases': {phase: self.stats(phase) for phase in PHASES},
+            'suggested_timeout': self.suggested_timeout(),
+        }
+
+    def describe(self):
+        """多行文本摘要（毫秒），用于日志和弹窗"""
+        healthy = len(self.healthy)
+        total = len(self.samples) + len(self.errors)
+        if not healthy:
+            reason = self.errors[-1] if self.errors else ('无HTTP应答' if self.samples else '')
+            return f"{self.url}: 0/{total} OK, {reason}"
+        lines = [f"{self.url}: {healthy}/{total} OK"]
+        for phase in PHASES:
+            st = self.stats(phase)
+            lines.append(f"{phase.upper():5} min {st['min'] * 1000:.1f} / med {st['median'] * 1000:.1f}"
+                         f" / p95 {st['p95'] * 1000:.1f} / jitter {st['jitter'] * 1000:.1f} ms")
+        return '\n'.join(lines)
+
+    def as_response(self):
+        """转换为桌面版 connection_test_complete 使用的响应格式"""
+        return {
+            'status': 'success' if self.ok else 'error',
+            'message': self.describe(),
+            'data': self.to_dict(),
+        }
+
+
+def probe(url, samples=5, interval=0.2, timeout=5.0):
+    """重复探测并汇总；结果同时记为该地址的最新探测"""
+    results = []
+    errors = []
+    context = ssl.create_default_context() if url.startswith('https') else None
+    for i in range(samples):
+        if i:
+            time.sleep(interval)
+        try:
+            results.append(probe_once(url, timeout, context))
+        except (OSError, ssl.SSLError) as e:
+            errors.append(f"{type(e).__name__}: {e}")
+    report = ProbeReport(url, results, errors)
+    with _latest_lock:
+        _latest[url] = report
+    return report
+
+
+def latest_report(url):
+    """某地址最近一次的探测结果（没有则为None）"""
+    return _latest.get(url)
+
+
+if __name__ == '__main__':
+    import json
+    import sys
+
+    target = sys.argv[1] if len(sys.argv) > 1 else "https://svr.yefiot.com/yefiot/v1/mqttpost/"
+    result = probe(target, samples=int(sys.argv[2]) if len(sys.argv) > 2 else 5)
+    print(result.describe())
+    print(json.dumps(result.to_dict(), ensure_ascii=False, indent=2))
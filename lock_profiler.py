@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+内置剖析
+    SamplingProfiler   后台线程按固定间隔读取所有线程的调用栈（sys._current_frames），
+                       停止时写出 collapsed stacks（每行 "线程;外层函数;...;内层函数 次数"），
+                       可直接交给 flamegraph.pl / speedscope / inferno 生成火焰图
+    AllocationTracker  tracemalloc 定期快照，按调用位置记录内存增长（JSON lines），停止时附带
+                       相对起点增长最多的完整调用栈，用于查找只增不减的对象（如日志字符串）
+不依赖 Kivy，界面、lockd、压测中都可用。开关：
+
+    LOCK_PROFILE=sample|alloc|sample,alloc   启动时开启（main.py、lockd.py、lock_loadgen.py）
+    LOCK_PROFILE_DIR                         输出目录（默认为应用数据目录或当前目录）
+    LOCK_PROFILE_INTERVAL_MS=10              采样间隔
+    LOCK_PROFILE_IDLE=1                      保留阻塞等待中的栈（默认丢弃，只看在做事的线程）
+    LOCK_ALLOC_INTERVAL=30                   内存快照间隔（秒）
+    LOCK_ALLOC_FRAMES=10                     每次分配记录的栈深度
+
+界面中 F10（性能浮层的快捷键）随时开始/停止采样剖析，停止时文件路径记入日志
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+DEFAULT_INTERVAL = 0.01
+DEFAULT_ALLOC_INTERVAL = 30.0
+DEFAULT_ALLOC_FRAMES = 10
+TOP_SITES = 20
+
+# 最内层帧落在这些位置时视为线程在阻塞等待（C 层的 sleep/recv 看不到，看到的是调用它们的 Python 帧）
+IDLE_FRAMES = {
+    ('threading.py', 'wait'),
+    ('threading.py', '_wait_for_tstate_lock'),
+    ('queue.py', 'get'),
+    ('selectors.py', 'select'),
+    ('socketserver.py', 'serve_forever'),
+    ('connection.py', '_recv'),
+    ('base.py', 'idle'),
+}
+
+
+def frame_label(code, lineno):
+    return f"{getattr(code, 'co_qualname', code.co_name)} ({os.path.basename(code.co_filename)}:{lineno})"
+
+
+class SamplingProfiler:
+    """所有线程的采样剖析"""
+
+    def __init__(self, interval=DEFAULT_INTERVAL, include_idle=False):
+        self.interval = interval
+        self.include_idle = include_idle
+        self.stacks = Counter()
+        self.samples = 0
+        self.started_at = None
+        self.elapsed = 0.0
+        self._names = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        self._stop.clear()
+        self.started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._loop, name='lock-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.elapsed += time.perf_counter() - self.started_at
+
+    def _thread_name(self, ident):
+        name = self._names.get(ident)
+        if name is None:
+            self._names = {thread.ident: thread.name for thread in threading.enumerate()}
+            name = self._names.get(ident, f"thread-{ident}")
+        return name
+
+    def _loop(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                code = frame.f_code
+                if not self.include_idle and (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                    continue
+                # 栈以 (code, 行号) 记录，写出时才格式化
+                stack = []
+                while frame is not None:
+                    stack.append((frame.f_code, frame.f_lineno))
+                    frame = frame.f_back
+                self.stacks[(self._thread_name(ident), tuple(stack))] += 1
+            # 不持有其他线程的帧
+            frame = None
+            self.samples += 1
+
+    def collapsed(self):
+        """collapsed stacks 文本行（外层在前）"""
+        merged = Counter()
+        for (thread, stack), count in self.stacks.items():
+            names = [thread.replace(';', ':').replace(' ', '_')]
+            names += [frame_label(code, lineno).replace(';', ':') for code, lineno in reversed(stack)]
+            merged[';'.join(names)] += count
+        return [f"{line} {count}" for line, count in sorted(merged.items())]
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for line in self.collapsed():
+                f.write(line + '\n')
+        return path
+
+    def top_functions(self, limit=10):
+        """自身时间最多的函数（最内层帧），按采样数"""
+        own = Counter()
+        for (thread, stack), count in self.stacks.items():
+            own[frame_label(*stack[0])] += count
+        return own.most_common(limit)
+
+
+class AllocationTracker:
+    """tracemalloc 定期快照，按调用位置记录增长"""
+
+    def __init__(self, path, interval=DEFAULT_ALLOC_INTERVAL, frames=DEFAULT_ALLOC_FRAMES, top=TOP_SITES):
+        self.path = path
+        self.interval = interval
+        self.frames = frames
+        self.top = top
+        self.baseline = None
+        self.previous = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._started_tracemalloc = False
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._started_tracemalloc = True
+        self.baseline = self.previous = self._snapshot()
+        self._thread = threading.Thread(target=self._loop, name='lock-alloc-tracker', daemon=True)
+        self._thread.start()
+        return self
+
+    def _snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            # 采样剖析自身的栈记录
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+            tracemalloc.Filter(False, '<unknown>'),
+        ))
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.record()
+
+    def record(self):
+        """与上一次快照比较，追加一行增长记录"""
+        snapshot = self._snapshot()
+        growth = [stat for stat in snapshot.compare_to(self.previous, 'lineno') if stat.size_diff > 0]
+        self.previous = snapshot
+        current, peak = tracemalloc.get_traced_memory()
+        entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'traced_mb': round(current / 2 ** 20, 2),
+            'peak_mb': round(peak / 2 ** 20, 2),
+            'growth': [{'site': f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                        'size_diff_kb': round(stat.size_diff / 1024, 1), 'count_diff': stat.count_diff,
+                        'size_kb': round(stat.size / 1024, 1)} for stat in growth[:self.top]],
+        }
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        return entry
+
+    def stop(self):
+        """最后一次记录，并附上相对起点增长最多的调用栈"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.record()
+        stats = [stat for stat in self._snapshot().compare_to(self.baseline, 'traceback') if stat.size_diff > 0]
+        summary = {'since_start': [{'size_diff_kb': round(stat.size_diff / 1024, 1), 'count_diff': stat.count_diff,
+                                    'traceback': stat.traceback.format()} for stat in stats[:self.top]]}
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(summary, ensure_ascii=False) + '\n')
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+
+
+class ProfileSession:
+    """按开关组合起来的剖析，stop 返回写出的文件"""
+
+    def __init__(self, directory, sample=True, alloc=False, interval=DEFAULT_INTERVAL, include_idle=False,
+                 alloc_interval=DEFAULT_ALLOC_INTERVAL, alloc_frames=DEFAULT_ALLOC_FRAMES, log=None):
+        self.directory = directory
+        self.log = log or (lambda message: None)
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        self.prefix = os.path.join(directory, f"profile-{os.getpid()}-{stamp}")
+        self.profiler = SamplingProfiler(interval, include_idle) if sample else None
+        self.tracker = AllocationTracker(self.prefix + '.alloc.jsonl', alloc_interval, alloc_frames) if alloc else None
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        if self.profiler:
+            self.profiler.start()
+        if self.tracker:
+            self.tracker.start()
+        return self
+
+    def stop(self):
+        paths = []
+        if self.profiler and self.profiler.running:
+            self.profiler.stop()
+            paths.append(self.profiler.write(self.prefix + '.collapsed'))
+        if self.tracker:
+            self.tracker.stop()
+            paths.append(self.tracker.path)
+        for path in paths:
+            self.log(f"剖析结果已写入: {path}")
+        return paths
+
+
+def start_from_env(directory=None, log=None):
+    """按 LOCK_PROFILE 开启剖析，未设置时返回 None"""
+    modes = {mode.strip() for mode in os.environ.get('LOCK_PROFILE', '').split(',') if mode.strip()}
+    if not modes:
+        return None
+    return ProfileSession(
+        os.environ.get('LOCK_PROFILE_DIR') or directory or os.getcwd(),
+        sample='sample' in modes,
+        alloc='alloc' in modes,
+        interval=float(os.environ.get('LOCK_PROFILE_INTERVAL_MS', DEFAULT_INTERVAL * 1000)) / 1000.0,
+        include_idle=os.environ.get('LOCK_PROFILE_IDLE', '') not in ('', '0'),
+        alloc_interval=float(os.environ.get('LOCK_ALLOC_INTERVAL', DEFAULT_ALLOC_INTERVAL)),
+        alloc_frames=int(os.environ.get('LOCK_ALLOC_FRAMES', DEFAULT_ALLOC_FRAMES)),
+        log=log,
+    ).start()
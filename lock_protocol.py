@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+门锁协议注册表
+各型号的命令与应答在 protocols.json 中声明，加载时编译为编码器/解码器，新增型号无需改代码：
+
+    "models": {
+      "<型号>": {
+        "type": 请求体中的 type,  "header": "HD",  "trailer": "W",
+        "commands": {"<命令名>": {"cmd": 请求体中的 cmd, "code": 帧命令码, "data": 数据段模板,
+                                  "params": {"<参数>": {"default": 0, "min": 0, "max": 255}},
+                                  "success": [表示成功的应答码], "idempotent": true/false}},
+        "replies": {"<应答码>": {"name": 名称, "fields": {"<字段>": [偏移, 宽度, "hex"|"str"]}}}
+      }
+    }
+
+success 中的应答码判为 success（界面弹出"执行成功"），其余可解析的应答判为 completed；
+状态查询等只读命令留空。数据段模板可含 str.format 占位符（如 "{seconds:02X}"），按 (型号, 命令, 参数) 渲染一次后缓存；
+无参数的命令在加载时就预先渲染好整帧。LOCK_PROTOCOLS 可指定其他注册表文件
+"""
+
+import json
+import os
+import threading
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'protocols.json')
+CACHE_LIMIT = 4096
+
+
+class ProtocolError(ValueError):
+    """注册表定义错误或参数不合法"""
+
+
+class Command:
+    """一条已编译的命令"""
+
+    __slots__ = ('name', 'cmd', 'code', 'idempotent', 'success', 'params', 'static_frame',
+                 '_prefix', '_template', '_trailer', '_cache')
+
+    def __init__(self, name, spec, header, trailer):
+        self.name = name
+        self.cmd = str(spec['cmd'])
+        self.code = spec['code']
+        self.idempotent = bool(spec.get('idempotent', False))
+        self.success = frozenset(spec.get('success', ()))
+        self.params = spec.get('params', {})
+        self._prefix = header + self.code
+        self._template = spec.get('data', '')
+        self._trailer = trailer
+        self._cache = {}
+        self.static_frame = None
+        if not self.params:
+            self.static_frame = self._prefix + self._template + trailer
+        else:
+            # 用默认值试渲染一次，定义错误在加载时暴露
+            self.frame()
+
+    def frame(self, **params):
+        """渲染命令帧；无参数命令直接返回预渲染的帧"""
+        if self.static_frame is not None:
+            if params:
+                raise ProtocolError(f"命令 {self.name} 不接受参数: {sorted(params)}")
+            return self.static_frame
+        key = tuple(sorted(params.items()))
+        frame = self._cache.get(key)
+        if frame is None:
+            frame = self._render(params)
+            if len(self._cache) >= CACHE_LIMIT:
+                self._cache.clear()
+            self._cache[key] = frame
+        return frame
+
+    def _render(self, params):
+        values = {}
+        for name, spec in self.params.items():
+            value = params.get(name, spec.get('default'))
+            if value is None:
+                raise ProtocolError(f"命令 {self.name} 缺少参数 {name}")
+            if 'min' in spec and value < spec['min'] or 'max' in spec and value > spec['max']:
+                raise ProtocolError(f"参数 {name}={value} 超出范围")
+            values[name] = value
+        unknown = set(params) - set(self.params)
+        if unknown:
+            raise ProtocolError(f"命令 {self.name} 不认识参数: {sorted(unknown)}")
+        try:
+            return self._prefix + self._template.format(**values) + self._trailer
+        except (KeyError, ValueError) as e:
+            raise ProtocolError(f"命令 {self.name} 的模板无法渲染: {e}")
+
+
+class Reply:
+    """一种应答帧的字段布局"""
+
+    __slots__ = ('code', 'name', 'fields')
+
+    def __init__(self, code, spec):
+        self.code = code
+        self.name = spec.get('name', code)
+        self.fields = [(field, offset, offset + width, kind)
+                       for field, (offset, width, kind) in spec.get('fields', {}).items()]
+
+    def decode(self, data):
+        values = {}
+        for field, start, end, kind in self.fields:
+            raw = data[start:end]
+            if len(raw) != end - start:
+                continue
+            if kind == 'hex':
+                try:
+                    values[field] = int(raw, 16)
+                except ValueError:
+                    continue
+            else:
+                values[field] = raw
+        return values
+
+
+class Protocol:
+    """一个型号的协议"""
+
+    def __init__(self, model, spec):
+        self.model = model
+        self.name = spec.get('name', model)
+        self.type = spec.get('type', model)
+        self.header = spec.get('header', 'HD')
+        self.trailer = spec.get('trailer', 'W')
+        try:
+            self.commands = {name: Command(name, command, self.header, self.trailer)
+                             for name, command in spec['commands'].items()}
+        except KeyError as e:
+            raise ProtocolError(f"型号 {model} 的命令定义缺少 {e}")
+        self.by_cmd = {command.cmd: command for command in self.commands.values()}
+        self.replies = {code: Reply(code, reply) for code, reply in spec.get('replies', {}).items()}
+
+    def command(self, name):
+        try:
+            return self.commands[name]
+        except KeyError:
+            raise ProtocolError(f"型号 {self.model} 没有命令 {name}")
+
+    def frame(self, name, **params):
+        return self.command(name).frame(**params)
+
+    def parse(self, frame):
+        """拆分帧头、命令码、数据段和校验位；帧头不符时返回None"""
+        if not frame or not frame.startswith(self.header):
+            return None
+        start = len(self.header)
+        return {
+            'header': frame[:start],
+            'command': frame[start:start + 2],
+            'data': frame[start + 2:-len(self.trailer)],
+            'checksum': frame[-len(self.trailer):],
+        }
+
+    def decode(self, frame):
+        """解析应答帧为 {'code', 'reply', 'fields'}；无法识别时返回None"""
+        parsed = self.parse(frame)
+        if parsed is None:
+            return None
+        reply = self.replies.get(parsed['command'])
+        if reply is None:
+            return {'code': parsed['command'], 'reply': None, 'fields': {}}
+        return {'code': parsed['command'], 'reply': reply.name, 'fields': reply.decode(parsed['data'])}
+
+    def is_success(self, cmd, reply_code):
+        """该命令（请求体中的 cmd）收到 reply_code 是否表示执行成功"""
+        command = self.by_cmd.get(str(cmd))
+        return command is not None and reply_code in command.success
+
+    def is_idempotent(self, cmd):
+        """未登记的命令按非幂等处理（不对冲、可能已发出时不重试）"""
+        command = self.by_cmd.get(str(cmd))
+        return command is not None and command.idempotent
+
+
+class ProtocolRegistry:
+    """型号 -> Protocol"""
+
+    def __init__(self, spec):
+        self.protocols = {model: Protocol(model, model_spec) for model, model_spec in spec['models'].items()}
+        self.default_model = spec.get('default') or next(iter(self.protocols))
+        if self.default_model not in self.protocols:
+            raise ProtocolError(f"默认型号 {self.default_model} 未定义")
+
+    @classmethod
+    def load(cls, path=DEFAULT_PATH):
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def get(self, model=None):
+        """取型号的协议；model 为空或未登记时使用默认型号"""
+        return self.protocols.get(model or self.default_model) or self.protocols[self.default_model]
+
+    @property
+    def default(self):
+        return self.protocols[self.default_model]
+
+    def models(self):
+        return list(self.protocols)
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_registry():
+    """进程内共享的注册表（首次使用时加载）"""
+    global _default
+    if _default is None:
+        with _default_lock:
+            if _default is None:
+                _default = ProtocolRegistry.load(os.environ.get('LOCK_PROTOCOLS') or DEFAULT_PATH)
+    return _default
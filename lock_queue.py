@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+离线命令队列
+网络不可用时把命令持久化到 SQLite（WAL模式），写入按批合并提交（group commit）；
+恢复连接后按设备顺序重放，每条命令带过期时间，过期的开锁命令绝不会延迟执行
+"""
+
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# send 回调的返回值
+DELIVERED = 'delivered'   # 已送达，出队
+RETRY = 'retry'           # 暂时失败，保留并阻塞该设备后续命令
+REJECTED = 'rejected'     # 永久失败（如参数错误），出队
+
+# 默认有效期（秒）：开锁只在短时间内有意义，查询可以等久一些
+DEFAULT_TTL = {'0': 60.0, '1': 300.0}
+
+# flush/close 等待写入线程的默认上限（秒）；数据库被锁或磁盘满时不无限阻塞调用方
+FLUSH_TIMEOUT = 10.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    mac TEXT NOT NULL,
+    cmd TEXT NOT NULL,
+    info TEXT NOT NULL,
+    created REAL NOT NULL,
+    expires REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS outbox_mac ON outbox (mac, id);
+"""
+
+
+class QueuedCommand:
+    """出队待发送的命令"""
+
+    __slots__ = ('id', 'mac', 'cmd', 'info', 'created', 'expires', 'attempts')
+
+    def __init__(self, row):
+        self.id, self.mac, self.cmd, self.info, self.created, self.expires, self.attempts = row
+
+    def payload(self, sn=None, device_type='yfn03'):
+        """与 LockCore.execute 相同的请求体；device_type 取自设备型号的协议"""
+        return {
+            "type": device_type,
+            "mac": self.mac,
+            "cmd": self.cmd,
+            "sn": sn if sn is not None else int(time.time()),
+            "info": self.info,
+        }
+
+
+class CommandQueue:
+    """持久化出站队列"""
+
+    def __init__(self, path, flush_interval=0.005, max_batch=2000):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # WAL + NORMAL：进程崩溃不丢已提交数据，仅断电时可能丢最后几批
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._db_lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._pending = []
+        self._enqueued = 0
+        self._written = 0
+        # 写入失败的序号区间 (首, 末)，只保留最近的若干段
+        self._failed = deque(maxlen=64)
+        self.last_error = None
+        self._closed = False
+        self._writer = threading.Thread(target=self._write_loop, name='outbox-writer', daemon=True)
+        self._writer.start()
+
+    # ---- 写入 ----
+
+    def enqueue(self, mac, cmd, info, ttl=None, wait=False):
+        """加入队列，返回序号；wait=True 时阻塞到已落盘，写入失败时抛出该错误"""
+        now = time.time()
+        if ttl is None:
+            ttl = DEFAULT_TTL.get(str(cmd), 300.0)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("队列已关闭")
+            self._pending.append((mac, str(cmd), info, now, now + ttl))
+            self._enqueued += 1
+            seq = self._enqueued
+            self._cond.notify_all()
+        if wait and not self.wait_durable(seq):
+            raise self.last_error or RuntimeError("命令未能写入离线队列")
+        return seq
+
+    def wait_durable(self, seq, timeout=None):
+        """等待序号 seq 及之前的命令全部写完，返回 seq 是否已提交（超时或写入失败时为 False，原因见 last_error）"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._written >= seq, timeout):
+                return False
+            return not any(first <= seq <= last for first, last in self._failed)
+
+    def flush(self, timeout=FLUSH_TIMEOUT):
+        with self._cond:
+            seq = self._enqueued
+        return self.wait_durable(seq, timeout)
+
+    def _write_loop(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending and self._closed:
+                    return
+                # 稍等片刻，让并发写入合并到同一事务
+                if len(self._pending) < self.max_batch and not self._closed:
+                    self._cond.wait(self.flush_interval)
+                batch = self._pending[:self.max_batch]
+                del self._pending[:len(batch)]
+            error = None
+            with self._db_lock:
+                try:
+                    self._db.execute("BEGIN")
+                    self._db.executemany(
+                        "INSERT INTO outbox (mac, cmd, info, created, expires) VALUES (?, ?, ?, ?, ?)",
+                        batch)
+                    self._db.execute("COMMIT")
+                except Exception as e:
+                    # 磁盘满、数据库被锁等：本批作废并记录，写入线程继续处理后续命令，等待者收到失败
+                    error = e
+                    try:
+                        if self._db.in_transaction:
+                            self._db.execute("ROLLBACK")
+                    except sqlite3.Error:
+                        pass
+            with self._cond:
+                first = self._written + 1
+                self._written += len(batch)
+                if error is not None:
+                    self._failed.append((first, self._written))
+                    self.last_error = error
+                self._cond.notify_all()
+
+    # ---- 读取与重放 ----
+
+    def pending_count(self):
+        with self._db_lock:
+            stored = self._db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+        with self._cond:
+            return stored + len(self._pending)
+
+    def peek(self, limit=100):
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT id, mac, cmd, info, created, expires, attempts FROM outbox ORDER BY id LIMIT ?",
+                (limit,)).fetchall()
+        return [QueuedCommand(row) for row in rows]
+
+    def drain(self, send, workers=1, page=2000, max_items=None):
+        """按设备顺序重放：不同设备可并行，同一设备严格按入队顺序；返回各类计数
+
+        send(command) 返回 DELIVERED / RETRY / REJECTED，抛出异常视为 RETRY；
+        某设备出现 RETRY 后，本轮不再发送该设备后续的命令
+        """
+        self.flush()
+        stats = {DELIVERED: 0, RETRY: 0, REJECTED: 0, 'expired': 0, 'blocked': 0}
+        blocked = set()
+        last_id = 0
+        executor = ThreadPoolExecutor(workers) if workers > 1 else None
+        try:
+            while max_items is None or sum(stats.values()) < max_items:
+                with self._db_lock:
+                    rows = self._db.execute(
+                        "SELECT id, mac, cmd, info, created, expires, attempts FROM outbox"
+                        " WHERE id > ? ORDER BY id LIMIT ?", (last_id, page)).fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                by_device = {}
+                for row in rows:
+                    by_device.setdefault(row[1], []).append(QueuedCommand(row))
+                jobs = [(commands, blocked) for commands in by_device.values()]
+                if executor is None:
+                    results = [self._replay_device(*job, send) for job in jobs]
+                else:
+                    results = list(executor.map(lambda job: self._replay_device(*job, send), jobs))
+                done, retried = [], []
+                for outcome in results:
+                    for command, status in outcome:
+                        stats[status] += 1
+                        if status == RETRY:
+                            retried.append(command.id)
+                        elif status != 'blocked':
+                            done.append((command.id,))
+                with self._db_lock:
+                    self._db.execute("BEGIN")
+                    self._db.executemany("DELETE FROM outbox WHERE id = ?", done)
+                    self._db.executemany("UPDATE outbox SET attempts = attempts + 1 WHERE id = ?",
+                                         [(i,) for i in retried])
+                    self._db.execute("COMMIT")
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        return stats
+
+    @staticmethod
+    def _replay_device(commands, blocked, send):
+        outcome = []
+        for command in commands:
+            if command.mac in blocked:
+                outcome.append((command, 'blocked'))
+                continue
+            # 过期检查放在发送前的最后一刻
+            if command.expires <= time.time():
+                outcome.append((command, 'expired'))
+                continue
+            try:
+                status = send(command)
+            except Exception:
+                status = RETRY
+            if status == RETRY:
+                blocked.add(command.mac)
+            outcome.append((command, status))
+        return outcome
+
+    def purge_expired(self):
+        """删除所有已过期的命令"""
+        with self._db_lock:
+            return self._db.execute("DELETE FROM outbox WHERE expires <= ?", (time.time(),)).rowcount
+
+    def close(self, timeout=FLUSH_TIMEOUT):
+        """关闭队列：最多等 timeout 秒写完已入队的命令；写入线程仍卡住时返回 False（不关闭数据库）"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._writer.join(timeout)
+        if self._writer.is_alive():
+            return False
+        with self._db_lock:
+            self._db.close()
+        return True
+
+
+class Replayer:
+    """后台重放线程：检测到网络恢复后自动清空队列"""
+
+    def __init__(self, queue, send, is_online, interval=5.0, workers=4, on_drained=None):
+        self.queue = queue
+        self.send = send
+        self.is_online = is_online
+        self.interval = interval
+        self.workers = workers
+        self.on_drained = on_drained
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name='outbox-replayer', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def kick(self):
+        """立即检查一次（例如刚有命令成功，说明网络已恢复）"""
+        self._wake.set()
+
+    def stop(self):
+        self._stopped = True
+        self._wake.set()
+
+    def _run(self):
+        while not self._stopped:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stopped:
+                break
+            try:
+                if self.queue.pending_count() and self.is_online():
+                    stats = self.queue.drain(self.send, workers=self.workers)
+                    if self.on_drained:
+                        self.on_drained(stats)
+            except Exception:
+                # 重放失败不影响下次重试
+                pass
@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+定时命令
+按计划对一组设备执行命令（如工作日 08:55 打开会议室门锁、每晚查询整层状态）。
+到期时间放在最小堆中，添加/取消/触发均为 O(log n)，取消的任务在出堆时惰性丢弃；
+任务持久化到 SQLite，重启后从上次的下次触发时间继续；运行中的调度器每 poll_interval 秒检查一次数据库
+（PRAGMA data_version），其他进程（本文件的命令行）添加或删除的任务随即生效。触发在调度线程上回调 on_fire，
+回调应只做交接（如放入离线命令队列），不阻塞调度线程，更不在 Kivy Clock 上执行
+
+计划：
+    {"at": 时间戳}                               一次性
+    {"every": 秒, "start": 时间戳}                固定间隔
+    {"daily": "08:55", "weekdays": [0, 1, 2, 3, 4]}  每天/指定星期几的本地时间（0=周一）
+
+错过的触发（应用未运行、设备休眠）超过 grace 秒即视为错过，按 catch_up 处理：
+    skip  丢弃，等下一次       once  合并为一次补发       all  逐次补发（最多 MAX_CATCH_UP 次）
+开锁默认 skip：迟到的开锁可能已经没有意义甚至不安全
+"""
+
+import argparse
+import heapq
+import itertools
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import lock_metrics
+
+SKIP = 'skip'
+ONCE = 'once'
+ALL = 'all'
+
+DEFAULT_CATCH_UP = {'unlock': SKIP}
+DEFAULT_GRACE = 60.0
+MAX_CATCH_UP = 100
+POLL_INTERVAL = 1.0
+
+FIRINGS_TOTAL = lock_metrics.REGISTRY.counter(
+    'lock_scheduled_firings_total', '定时任务触发（result=fired/missed/error）', ('command', 'result'))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    macs TEXT NOT NULL,
+    command TEXT NOT NULL,
+    spec TEXT NOT NULL,
+    catch_up TEXT NOT NULL,
+    grace REAL NOT NULL,
+    next_due REAL NOT NULL
+);
+"""
+
+
+class Job:
+    """一个定时任务"""
+
+    __slots__ = ('id', 'macs', 'command', 'spec', 'catch_up', 'grace', 'next_due', '_daily', '_weekdays')
+
+    def __init__(self, macs, command, spec, catch_up=None, grace=DEFAULT_GRACE, job_id=None, next_due=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.macs = [macs] if isinstance(macs, str) else list(macs)
+        self.command = command
+        self.spec = spec
+        self.catch_up = catch_up or DEFAULT_CATCH_UP.get(command, ONCE)
+        if self.catch_up not in (SKIP, ONCE, ALL):
+            raise ValueError(f"未知的补发策略: {self.catch_up}")
+        self.grace = grace
+        self._daily = None
+        self._weekdays = None
+        if 'daily' in spec:
+            hour, minute = (int(part) for part in spec['daily'].split(':'))
+            self._daily = (hour, minute)
+            self._weekdays = frozenset(spec.get('weekdays', range(7)))
+        elif 'every' not in spec and 'at' not in spec:
+            raise ValueError(f"无法识别的计划: {spec}")
+        if next_due is None:
+            next_due = spec['at'] if 'at' in spec else self.next_after(time.time() - 1e-6)
+        self.next_due = next_due
+
+    def next_after(self, t):
+        """t 之后（不含）的下一次触发时间；一次性任务已过期时返回 None"""
+        spec = self.spec
+        if 'at' in spec:
+            return spec['at'] if spec['at'] > t else None
+        if 'every' in spec:
+            start = spec.get('start', 0.0)
+            if t < start:
+                return start
+            return start + ((t - start) // spec['every'] + 1) * spec['every']
+        day = datetime.fromtimestamp(t).date()
+        for offset in range(8):
+            candidate = datetime.combine(day + timedelta(days=offset), datetime.min.time()).replace(
+                hour=self._daily[0], minute=self._daily[1])
+            if candidate.weekday() in self._weekdays and candidate.timestamp() > t:
+                return candidate.timestamp()
+        return None
+
+    def occurrences(self, due, now, limit=MAX_CATCH_UP):
+        """[due, now] 内的各次触发时间，最多保留最近 limit 次"""
+        if 'every' in self.spec:
+            # 固定间隔直接算，长时间停机后不用逐次枚举
+            every = self.spec['every']
+            count = int((now - due) // every) + 1
+            return [due + every * i for i in range(max(0, count - limit), count)]
+        result = []
+        t = due
+        while t is not None and t <= now:
+            result.append(t)
+            t = self.next_after(t)
+        return result[-limit:]
+
+    def to_row(self):
+        return (self.id, json.dumps(self.macs), self.command, json.dumps(self.spec),
+                self.catch_up, self.grace, self.next_due)
+
+    @classmethod
+    def from_row(cls, row):
+        job_id, macs, command, spec, catch_up, grace, next_due = row
+        return cls(json.loads(macs), command, json.loads(spec), catch_up, grace, job_id, next_due)
+
+    def to_dict(self):
+        return {'id': self.id, 'macs': self.macs, 'command': self.command, 'spec': self.spec,
+                'catch_up': self.catch_up, 'grace': self.grace, 'next_due': self.next_due}
+
+
+class Scheduler:
+    """到期堆 + 调度线程；path 为 None 时不持久化"""
+
+    def __init__(self, path=None, on_fire=None, poll_interval=POLL_INTERVAL):
+        self.path = path
+        self.on_fire = on_fire
+        self.poll_interval = poll_interval
+        self.jobs = {}
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = None
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._data_version = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(_SCHEMA)
+            self.reload()
+
+    # ---- 任务管理 ----
+
+    def add(self, macs, command, spec, catch_up=None, grace=DEFAULT_GRACE, job_id=None):
+        job = Job(macs, command, spec, catch_up, grace, job_id)
+        self.add_many([job])
+        return job
+
+    def add_many(self, jobs):
+        """批量添加（一个事务）；同 id 的任务被替换"""
+        jobs = [job for job in jobs if job.next_due is not None]
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("BEGIN")
+                self._db.executemany("INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                     [job.to_row() for job in jobs])
+                self._db.execute("COMMIT")
+        with self._cond:
+            for job in jobs:
+                self.jobs[job.id] = job
+                heapq.heappush(self._heap, (job.next_due, next(self._seq), job.id))
+            self._cond.notify()
+
+    def remove(self, job_id):
+        """取消任务；堆中的条目在出堆时丢弃"""
+        with self._cond:
+            job = self.jobs.pop(job_id, None)
+        if job is not None and self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        return job is not None
+
+    def reload(self):
+        """数据库被其他连接修改过时重新载入任务（新增、删除、替换），返回是否有变化；
+        本连接自己的写入不改变 data_version，不会触发重新载入"""
+        with self._db_lock:
+            if self._db is None:
+                return False
+            version = self._db.execute("PRAGMA data_version").fetchone()[0]
+            if version == self._data_version:
+                return False
+            self._data_version = version
+            rows = {row[0]: row for row in self._db.execute("SELECT * FROM jobs")}
+        with self._cond:
+            for job_id in [job_id for job_id in self.jobs if job_id not in rows]:
+                del self.jobs[job_id]
+            for job_id, row in rows.items():
+                job = self.jobs.get(job_id)
+                if job is None or job.to_row() != row:
+                    job = self.jobs[job_id] = Job.from_row(row)
+                    heapq.heappush(self._heap, (job.next_due, next(self._seq), job_id))
+            self._cond.notify()
+        return True
+
+    def next_due(self):
+        with self._cond:
+            self._discard_stale()
+            return self._heap[0][0] if self._heap else None
+
+    def _discard_stale(self):
+        while self._heap:
+            due, _, job_id = self._heap[0]
+            job = self.jobs.get(job_id)
+            if job is not None and job.next_due == due:
+                return
+            heapq.heappop(self._heap)
+
+    # ---- 触发 ----
+
+    def fire_due(self, now=None):
+        """取出所有到期任务并安排下一次，返回 [(job, 触发时间), ...]（按补发策略展开）"""
+        now = time.time() if now is None else now
+        firings = []
+        updated = []
+        finished = []
+        with self._cond:
+            while self._heap and self._heap[0][0] <= now:
+                due, _, job_id = heapq.heappop(self._heap)
+                job = self.jobs.get(job_id)
+                if job is None or job.next_due != due:
+                    continue
+                occurrences = job.occurrences(due, now)
+                on_time = [t for t in occurrences if now - t <= job.grace]
+                if job.catch_up == ALL:
+                    fire = occurrences
+                elif job.catch_up == ONCE:
+                    fire = occurrences[-1:]
+                else:
+                    fire = on_time
+                missed = len(occurrences) - len(fire)
+                if missed:
+                    FIRINGS_TOTAL.inc(job.command, 'missed', amount=missed)
+                firings.extend((job, t) for t in fire)
+                job.next_due = job.next_after(now)
+                if job.next_due is None:
+                    del self.jobs[job_id]
+                    finished.append((job_id,))
+                else:
+                    heapq.heappush(self._heap, (job.next_due, next(self._seq), job_id))
+                    updated.append((job.next_due, job_id))
+        if self._db is not None and (updated or finished):
+            with self._db_lock:
+                self._db.execute("BEGIN")
+                self._db.executemany("UPDATE jobs SET next_due = ? WHERE id = ?", updated)
+                self._db.executemany("DELETE FROM jobs WHERE id = ?", finished)
+                self._db.execute("COMMIT")
+        return firings
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='scheduler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _run(self):
+        while True:
+            # 每次触发前都核对数据库：已被其他进程删除的任务不再触发
+            self.reload()
+            with self._cond:
+                if self._stopped:
+                    return
+                self._discard_stale()
+                now = time.time()
+                if not self._heap or self._heap[0][0] > now:
+                    wait = self._heap[0][0] - now if self._heap else None
+                    if self._db is not None:
+                        wait = self.poll_interval if wait is None else min(wait, self.poll_interval)
+                    self._cond.wait(wait)
+                    continue
+            for job, due in self.fire_due():
+                try:
+                    self.on_fire(job, due)
+                    FIRINGS_TOTAL.inc(job.command, 'fired')
+                except Exception:
+                    # 单个任务交接失败不影响其他任务
+                    FIRINGS_TOTAL.inc(job.command, 'error')
+
+
+def _parse_weekdays(text):
+    """"0-4" 或 "0,2,4" -> [0, 1, 2, 3, 4]"""
+    days = set()
+    for part in text.split(','):
+        if '-' in part:
+            first, last = part.split('-')
+            days.update(range(int(first), int(last) + 1))
+        elif part:
+            days.add(int(part))
+    return sorted(days)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='定时命令管理')
+    parser.add_argument('--db', default='schedule.db', help='任务数据库（应用数据目录下的 schedule.db）')
+    sub = parser.add_subparsers(dest='action', required=True)
+    add = sub.add_parser('add', help='添加任务')
+    add.add_argument('--mac', action='append', required=True, help='可重复指定多台设备')
+    add.add_argument('--command', default='status', help='protocols.json 中的命令名')
+    when = add.add_mutually_exclusive_group(required=True)
+    when.add_argument('--daily', help='本地时间 HH:MM')
+    when.add_argument('--every', type=float, help='间隔秒数')
+    when.add_argument('--at', type=float, help='一次性触发的时间戳')
+    add.add_argument('--weekdays', default='0-6', help='配合 --daily，0=周一，如 0-4')
+    add.add_argument('--catch-up', choices=(SKIP, ONCE, ALL))
+    add.add_argument('--grace', type=float, default=DEFAULT_GRACE)
+    sub.add_parser('list', help='列出任务')
+    remove = sub.add_parser('remove', help='删除任务')
+    remove.add_argument('job_id')
+    args = parser.parse_args()
+
+    scheduler = Scheduler(args.db)
+    try:
+        if args.action == 'add':
+            if args.daily:
+                spec = {'daily': args.daily, 'weekdays': _parse_weekdays(args.weekdays)}
+            elif args.every:
+                spec = {'every': args.every, 'start': time.time()}
+            else:
+                spec = {'at': args.at}
+            job = scheduler.add(args.mac, args.command, spec, args.catch_up, args.grace)
+            print(json.dumps(job.to_dict(), ensure_ascii=False))
+        elif args.action == 'list':
+            for job in sorted(scheduler.jobs.values(), key=lambda job: job.next_due):
+                print(json.dumps(job.to_dict(), ensure_ascii=False))
+        elif not scheduler.remove(args.job_id):
+            parser.exit(1, f"没有任务 {args.job_id}\n")
+    finally:
+        scheduler.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按设备分片路由
+各区域服务器各自负责一部分设备：HashRing 用一致性哈希（虚拟节点）把 MAC 映射到归属节点，
+增删节点时只有约 1/N 的设备改变归属；设备清单中登记的 endpoint 优先于哈希结果。
+ShardedTransport 按归属节点转发命令，每个分片是一个独立分区（Transport.partitions）：
+先分片再批处理，每个分片各有一个 BatchingTransport，信封不会跨分片；
+LockCore.run_bulk 为每个分片开一条并行的发送流水线，变更查询逐个分片发送并各自维护游标
+
+LOCK_SHARDS 以逗号分隔各分片地址，同一分片的多个副本用 | 分隔（分片内按延迟选路、故障切换）
+"""
+
+import bisect
+import hashlib
+import os
+
+from lock_endpoints import EndpointPool
+from lock_transport import HttpTransport, Transport, create_session
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """一致性哈希环；每个节点放置 vnodes 个虚拟节点以均衡负载"""
+
+    def __init__(self, nodes=(), vnodes=160):
+        self.vnodes = vnodes
+        self.nodes = []
+        self._keys = []
+        self._owners = []
+        for node in nodes:
+            self.add(node)
+
+    def _rebuild(self):
+        points = sorted((_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(self.vnodes))
+        self._keys = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+
+    def add(self, node):
+        if node not in self.nodes:
+            self.nodes.append(node)
+            self._rebuild()
+
+    def remove(self, node):
+        if node in self.nodes:
+            self.nodes.remove(node)
+            self._rebuild()
+
+    def lookup(self, key):
+        """顺时针找到第一个虚拟节点"""
+        if not self._keys:
+            raise LookupError("哈希环为空")
+        index = bisect.bisect(self._keys, _hash(key))
+        return self._owners[index % len(self._owners)]
+
+
+class ShardRouter:
+    """MAC -> 分片地址：设备清单中的 endpoint 覆盖优先，其次一致性哈希"""
+
+    def __init__(self, shards, registry=None, vnodes=160):
+        self.ring = HashRing(shards, vnodes)
+        self.registry = registry
+
+    def shard_for(self, mac):
+        if self.registry is not None:
+            override = self.registry.get(mac).get('endpoint')
+            if override:
+                return override
+        return self.ring.lookup(mac)
+
+
+class ShardedTransport(Transport):
+    """按设备归属分片发送；每个分片有独立的传输（连接池、节点选路）"""
+
+    name = 'sharded'
+
+    def __init__(self, shards, registry=None, vnodes=160, pool_maxsize=10, hedging=None, wrap=None):
+        self.router = ShardRouter(list(shards), registry, vnodes)
+        self.transports = {}
+        self.pool_maxsize = pool_maxsize
+        self.hedging = hedging
+        # 包装每个分片的传输，如 BatchingTransport.wrap_from_env
+        self.wrap = wrap or (lambda transport: transport)
+        for shard in shards:
+            self._transport(shard)
+
+    @classmethod
+    def wrap_from_env(cls, transport, registry=None, hedging=None, wrap=None):
+        """设置了 LOCK_SHARDS 时返回分片传输（每个分片的传输经 wrap 包装），否则原样返回 transport"""
+        spec = os.environ.get('LOCK_SHARDS', '').strip()
+        if not spec:
+            return transport
+        transport.close()
+        return cls([shard.strip() for shard in spec.split(',') if shard.strip()], registry,
+                   hedging=hedging, wrap=wrap)
+
+    def _transport(self, shard):
+        transport = self.transports.get(shard)
+        if transport is None:
+            # 设备清单可能指向不在环上的地址，按需建立传输
+            pool = EndpointPool([url for url in shard.split('|') if url])
+            transport = self.transports[shard] = self.wrap(HttpTransport(
+                pool, create_session(pool_maxsize=self.pool_maxsize), hedging=self.hedging))
+        return transport
+
+    def transport_for(self, mac):
+        return self._transport(self.router.shard_for(mac))
+
+    def partition_of(self, mac):
+        return self.router.shard_for(mac)
+
+    def partitions(self):
+        """环上的各分片，以及设备清单中覆盖指定的其他地址"""
+        shards = list(self.router.ring.nodes)
+        if self.router.registry is not None:
+            for info in list(self.router.registry.devices.values()):
+                endpoint = info.get('endpoint')
+                if endpoint and endpoint not in shards:
+                    shards.append(endpoint)
+        return {shard: self._transport(shard) for shard in shards}
+
+    def post(self, payload, timeout=10, idempotent=False):
+        """命令不带 MAC 时发往环上的第一个分片；需要覆盖全部分片的请求应逐个使用 partitions()"""
+        mac = payload.get('mac')
+        transport = self.transport_for(mac) if mac else self._transport(self.router.ring.nodes[0])
+        return transport.post(payload, timeout=timeout, idempotent=idempotent)
+
+    def close(self):
+        for transport in self.transports.values():
+            transport.close()
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+虚拟门锁群
+在进程内模拟大量门锁，作为传输（SimulatorTransport）接入命令核心，批量、状态同步、仪表盘等
+可以在没有网络的情况下做可复现的规模测试。每台锁是一个小状态机：
+    开锁后约 actuation 秒（按设备在 0.5~1.5 倍间浮动）状态才变为开锁，再过 relock_after 秒自动上锁；
+    电量随命令次数和时间下降；
+    按 offline_period 划分时间窗，每个窗口以 offline_rate 的概率离线；
+    开锁以 jam_rate 的概率卡住（应答 2C），应答以 malformed_rate 的概率是损坏的帧
+应答帧与线上格式一致（HD…W）。
+
+随机数不共享状态：每次抽样由 (seed, MAC 的哈希, 该设备的命令序号或时间窗) 经 splitmix64 算出，
+同一种子下各设备的行为与线程调度、设备加入的先后无关，可以逐条复现。每台设备的状态存放在几个 array 中
+（约 34 字节/台，另有 MAC 索引），10 万台以上也只占几 MB
+
+    LOCK_TRANSPORT=sim    命令核心改用虚拟门锁群（LOCK_SIM_SEED、LOCK_SIM_DEVICES、LOCK_SIM_ACTUATION）
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from array import array
+
+import lock_deadline
+from lock_standin_server import UNLOCK_REPLY, status_frame
+from lock_transport import Transport, TransportResponse
+
+# 开锁卡住时的应答：命令码 2C 不在开锁命令的成功码中
+JAM_REPLY = "HD2C" + UNLOCK_REPLY[4:]
+
+_MASK = (1 << 64) - 1
+_SALT_OFFLINE = 0x5F3759DF
+_SALT_JAM = 0x27D4EB2F
+_SALT_MALFORMED = 0x165667B1
+_SALT_LATENCY = 0x61C88647
+_SALT_BATTERY = 0x2545F491
+_SALT_ACTUATION = 0x3C6EF372
+
+
+def _mix(x):
+    """splitmix64 的输出函数"""
+    x = (x + 0x9E3779B97F4A7C15) & _MASK
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK
+    return x ^ (x >> 31)
+
+
+def _mac_key(mac):
+    """设备随机数流的键：只取决于 MAC，不取决于设备加入的先后"""
+    return int.from_bytes(hashlib.blake2b(mac.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class SimulatorOptions:
+    """虚拟门锁群的行为参数"""
+
+    def __init__(self, seed=1, relock_after=5.0, drain_per_command=0.01, drain_per_hour=0.02,
+                 offline_rate=0.01, offline_period=300.0, offline_reply='empty',
+                 jam_rate=0.001, malformed_rate=0.001, latency=0.0, jitter=0.0, actuation=0.0, clock=time.time):
+        self.seed = seed
+        self.relock_after = relock_after
+        # 开锁应答之后电机转动到位的平均耗时（秒），其间状态查询仍为上锁
+        self.actuation = actuation
+        self.drain_per_command = drain_per_command
+        self.drain_per_hour = drain_per_hour
+        self.offline_rate = offline_rate
+        self.offline_period = offline_period
+        # 离线设备的应答：'empty' 返回无数据的应答，'timeout' 抛出读超时（网关等设备应答超时）
+        self.offline_reply = offline_reply
+        self.jam_rate = jam_rate
+        self.malformed_rate = malformed_rate
+        self.latency = latency
+        self.jitter = jitter
+        self.clock = clock
+
+
+class Simulator:
+    """虚拟门锁群；未登记的 MAC 在第一次收到命令时自动加入"""
+
+    def __init__(self, options=None, **kwargs):
+        self.options = options if options is not None else SimulatorOptions(**kwargs)
+        self._seed = _mix(self.options.seed & _MASK)
+        self._index = {}
+        self._macs = []
+        self._key = array('Q')           # MAC 的哈希，决定该设备的随机数流
+        self._battery0 = array('H')      # 初始电量，百分比*100
+        self._unlocked_at = array('d')   # 最近一次开锁时间，0 表示未开过
+        self._commands = array('I')      # 收到的命令数
+        self._version = array('I')       # 状态变化次数，参与 etag
+        self._created = array('d')
+        self._lock = threading.Lock()
+        self.requests = 0
+
+    @classmethod
+    def from_env(cls):
+        simulator = cls(seed=int(os.environ.get('LOCK_SIM_SEED', '1')),
+                        actuation=float(os.environ.get('LOCK_SIM_ACTUATION', '0')))
+        simulator.populate(int(os.environ.get('LOCK_SIM_DEVICES', '0')))
+        return simulator
+
+    def __len__(self):
+        return len(self._macs)
+
+    def _uniform(self, key, counter, salt):
+        return _mix(self._seed ^ _mix(key ^ _mix((counter & 0xFFFFFFFF) ^ salt))) / 2.0 ** 64
+
+    def _add(self, mac, now):
+        index = len(self._macs)
+        self._index[mac] = index
+        self._macs.append(mac)
+        key = _mac_key(mac)
+        self._key.append(key)
+        # 初始电量 30%~100%
+        self._battery0.append(3000 + int(self._uniform(key, 0, _SALT_BATTERY) * 7000))
+        self._unlocked_at.append(0.0)
+        self._commands.append(0)
+        self._version.append(0)
+        self._created.append(now)
+        return index
+
+    def populate(self, count, prefix='86970107'):
+        """预先创建 count 台设备（MAC 为 prefix + 7 位序号），返回它们的 MAC"""
+        now = self.options.clock()
+        macs = [f"{prefix}{i:07d}" for i in range(count)]
+        with self._lock:
+            for mac in macs:
+                if mac not in self._index:
+                    self._add(mac, now)
+        return macs
+
+    def macs(self):
+        return list(self._macs)
+
+    # ---- 状态 ----
+
+    def _battery(self, index, now):
+        drained = (self._commands[index] * self.options.drain_per_command
+                   + (now - self._created[index]) / 3600.0 * self.options.drain_per_hour)
+        return max(0, int(self._battery0[index] / 100.0 - drained))
+
+    def _unlocked(self, index, now):
+        unlocked_at = self._unlocked_at[index]
+        if not unlocked_at:
+            return False
+        since = now - unlocked_at
+        if self.options.actuation:
+            since -= self.options.actuation * (0.5 + self._uniform(self._key[index], self._version[index], _SALT_ACTUATION))
+        return 0 <= since < self.options.relock_after
+
+    def offline(self, index, now):
+        options = self.options
+        if not options.offline_rate:
+            return False
+        window = int(now // options.offline_period)
+        return self._uniform(self._key[index], window, _SALT_OFFLINE) < options.offline_rate
+
+    def state(self, mac):
+        """一台设备的当前状态（不计为命令）"""
+        index = self._index.get(mac)
+        if index is None:
+            return None
+        now = self.options.clock()
+        return {'mac': mac, 'unlocked': self._unlocked(index, now), 'battery': self._battery(index, now),
+                'online': not self.offline(index, now), 'commands': self._commands[index]}
+
+    def summary(self):
+        now = self.options.clock()
+        online = unlocked = low_battery = 0
+        for index in range(len(self._macs)):
+            online += not self.offline(index, now)
+            unlocked += self._unlocked(index, now)
+            low_battery += self._battery(index, now) < 20
+        return {'total': len(self._macs), 'online': online, 'unlocked': unlocked, 'low_battery': low_battery}
+
+    def memory_bytes(self):
+        """状态数组占用的字节数（不含 MAC 字符串和索引）"""
+        arrays = (self._key, self._battery0, self._unlocked_at, self._commands, self._version, self._created)
+        return sum(a.itemsize * len(a) for a in arrays)
+
+    # ---- 命令 ----
+
+    def handle(self, payload):
+        """单条命令 -> 与线上一致的应答结构；离线且 offline_reply='timeout' 时返回 None"""
+        cmd = str(payload.get('cmd'))
+        if cmd == 'batch':
+            results = []
+            for item in (payload.get('items') or [])[:1000]:
+                reply = self.handle(item) if str(item.get('cmd')) != 'batch' else None
+                reply = reply or {'code': 504, 'data': []}
+                results.append({'mac': item.get('mac'), 'sn': item.get('sn'),
+                                'code': reply.get('code', 0), 'data': reply.get('data', [])})
+            return {'code': 0, 'results': results}
+        if cmd == 'sync':
+            # 不支持变更查询（没有 cursor），调用方改用条件查询
+            return {'code': 400, 'msg': 'sync not supported'}
+        mac = payload.get('mac', '')
+        now = self.options.clock()
+        with self._lock:
+            self.requests += 1
+            index = self._index.get(mac)
+            if index is None:
+                index = self._add(mac, now)
+            counter = self._commands[index] = self._commands[index] + 1
+            if self.offline(index, now):
+                return None if self.options.offline_reply == 'timeout' else {
+                    'code': 1, 'msg': 'device offline', 'data': []}
+            if cmd == '0':
+                if self._uniform(self._key[index], counter, _SALT_JAM) < self.options.jam_rate:
+                    frame = JAM_REPLY
+                else:
+                    frame = UNLOCK_REPLY
+                    self._unlocked_at[index] = now
+                    self._version[index] += 1
+            else:
+                frame = status_frame(self._unlocked(index, now), self._battery(index, now))
+            etag = f"{self._version[index]}.{frame[4:8]}"
+        item = {'mac': mac, 'sn': payload.get('sn'), 'etag': etag}
+        if cmd != '0' and payload.get('etag') == etag:
+            item['not_modified'] = True
+            return {'code': 0, 'data': [item]}
+        if self._uniform(self._key[index], counter, _SALT_MALFORMED) < self.options.malformed_rate:
+            # 损坏的帧：丢失帧头或被截断
+            frame = frame[2:] if counter & 1 else frame[:len(frame) // 2]
+        item['msg_info'] = frame
+        return {'code': 0, 'data': [item]}
+
+    def delay(self, payload):
+        """本次请求的模拟网络延迟（秒），同样按设备和命令序号确定"""
+        options = self.options
+        if not options.jitter:
+            return options.latency
+        mac = payload.get('mac', '')
+        index = self._index.get(mac)
+        if index is None:
+            key, counter = _mac_key(mac), 0
+        else:
+            key, counter = self._key[index], self._commands[index]
+        return options.latency + options.jitter * self._uniform(key, counter, _SALT_LATENCY)
+
+
+class SimulatorTransport(Transport):
+    """把命令交给进程内的虚拟门锁群，不经过网络"""
+
+    name = 'sim'
+
+    def __init__(self, simulator=None, **options):
+        self.simulator = simulator if simulator is not None else Simulator(**options)
+
+    def post(self, payload, timeout=10, idempotent=False):
+        import requests
+
+        deadline = lock_deadline.current()
+        if deadline is not None:
+            deadline.check()
+            timeout = deadline.clamp(timeout)
+        delay = self.simulator.delay(payload)
+        if delay:
+            delay = min(delay, timeout if isinstance(timeout, (int, float)) else timeout[-1])
+            if deadline is None:
+                time.sleep(delay)
+            else:
+                # 模拟的网络等待同样可被取消
+                woken = threading.Event()
+                with deadline.watch(woken.set):
+                    woken.wait(delay)
+                if deadline.cancelled:
+                    deadline.check()
+        reply = self.simulator.handle(payload)
+        if reply is None:
+            raise requests.exceptions.ReadTimeout("设备离线，网关等待应答超时")
+        return TransportResponse(200, json.dumps(reply, ensure_ascii=False).encode('utf-8'), 'sim://')
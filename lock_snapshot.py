@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+设备状态快照（冷启动预热）
+暂停/退出时把设备清单、最近状态和界面状态写入紧凑的快照文件；下次启动时通过 mmap 打开，
+直接用文件头中的汇总和界面状态渲染首屏，再在后台载入完整状态并刷新过期设备。
+
+文件：
+    fleet.snap        基础快照：定长记录按MAC排序，附设备清单(JSON)
+    fleet.snap.delta  增量日志：自基础快照以来变更的记录（带CRC），超过阈值时合并进基础快照
+    fleet.snap.ui     界面状态(JSON)
+所有整文件写入都先写临时文件再原子替换
+"""
+
+import json
+import mmap
+import os
+import struct
+import time
+import zlib
+
+from lock_fleet import BATTERY_UNKNOWN, LOW_BATTERY, STATE_UNLOCKED, DeviceStatus
+
+MAGIC = b'LSNP'
+FORMAT_VERSION = 1
+# magic, 格式版本, 记录长度, 代数, 记录数, 创建时间, 总数, 在线, 已开锁, 低电量, 清单偏移, 清单长度
+HEADER = struct.Struct('<4sHHIIdIIIIII')
+RECORD = struct.Struct('<24sBBBxId')            # mac, 状态, 电量, 在线, 版本, 更新时间
+DELTA_HEADER = struct.Struct('<4sI')            # magic, 对应的基础快照代数
+DELTA_MAGIC = b'LSND'
+DELTA_ENTRY = struct.Struct('<%dsI' % RECORD.size)
+MAC_SIZE = 24
+
+
+def _pack(status):
+    mac = status.mac.encode()
+    if len(mac) > MAC_SIZE:
+        raise ValueError(f"MAC过长: {status.mac}")
+    return RECORD.pack(mac, status.state, status.battery, bool(status.online),
+                       status.version, status.updated_at)
+
+
+def _unpack(data, offset=0):
+    mac, state, battery, online, version, updated_at = RECORD.unpack_from(data, offset)
+    return DeviceStatus(mac.rstrip(b'\0').decode(), state, battery, bool(online), version, updated_at)
+
+
+def _atomic_write(path, chunks):
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        for chunk in chunks:
+            f.write(chunk)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _aggregate(statuses):
+    online = unlocked = low = 0
+    for status in statuses:
+        online += bool(status.online)
+        unlocked += status.state == STATE_UNLOCKED
+        low += status.battery < LOW_BATTERY
+    return online, unlocked, low
+
+
+class Snapshot:
+    """只读快照：mmap基础文件，叠加增量日志"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, record_size, self.generation, self.count, self.created,
+         total, online, unlocked, low, self._registry_offset, self._registry_len) = HEADER.unpack_from(self._mm)
+        if magic != MAGIC or version != FORMAT_VERSION or record_size != RECORD.size:
+            self.close()
+            raise ValueError("快照格式不兼容")
+        self._base_summary = {'total': total, 'online': online, 'unlocked': unlocked, 'low_battery': low}
+        self.overlay = self._read_delta()
+        self.ui_state = self._read_ui()
+
+    @classmethod
+    def open(cls, path):
+        """打开快照；不存在或损坏时返回None"""
+        try:
+            return cls(path)
+        except (OSError, ValueError, struct.error):
+            return None
+
+    def _read_delta(self):
+        overlay = {}
+        try:
+            with open(self.path + '.delta', 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return overlay
+        if len(data) < DELTA_HEADER.size:
+            return overlay
+        magic, generation = DELTA_HEADER.unpack_from(data)
+        if magic != DELTA_MAGIC or generation != self.generation:
+            return overlay
+        pos = DELTA_HEADER.size
+        while pos + DELTA_ENTRY.size <= len(data):
+            record, crc = DELTA_ENTRY.unpack_from(data, pos)
+            pos += DELTA_ENTRY.size
+            if zlib.crc32(record) != crc:
+                # 崩溃时写了一半的尾部记录
+                break
+            status = _unpack(record)
+            overlay[status.mac] = status
+        return overlay
+
+    def _read_ui(self):
+        try:
+            with open(self.path + '.ui', 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _base_get(self, mac):
+        key = mac.encode().ljust(MAC_SIZE, b'\0')
+        lo, hi = 0, self.count
+        base = HEADER.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset = base + mid * RECORD.size
+            current = self._mm[offset:offset + MAC_SIZE]
+            if current < key:
+                lo = mid + 1
+            elif current > key:
+                hi = mid
+            else:
+                return _unpack(self._mm, offset)
+        return None
+
+    def get(self, mac):
+        """查询单台设备（二分查找，不载入整表）"""
+        return self.overlay.get(mac) or self._base_get(mac)
+
+    def summary(self):
+        """首屏汇总：基础快照头中的汇总值，再用增量记录修正"""
+        result = dict(self._base_summary)
+        for mac, status in self.overlay.items():
+            old = self._base_get(mac)
+            if old is None:
+                result['total'] += 1
+            else:
+                result['online'] -= bool(old.online)
+                result['unlocked'] -= old.state == STATE_UNLOCKED
+                result['low_battery'] -= old.battery < LOW_BATTERY
+            result['online'] += bool(status.online)
+            result['unlocked'] += status.state == STATE_UNLOCKED
+            result['low_battery'] += status.battery < LOW_BATTERY
+        return result
+
+    def iter_statuses(self):
+        """逐条产出全部设备状态（已叠加增量）"""
+        seen = set()
+        mm = self._mm
+        for i in range(self.count):
+            status = _unpack(mm, HEADER.size + i * RECORD.size)
+            newer = self.overlay.get(status.mac)
+            if newer is not None:
+                seen.add(status.mac)
+                status = newer
+            yield status
+        for mac, status in self.overlay.items():
+            if mac not in seen:
+                yield status
+
+    def registry(self):
+        """设备清单（按需解析）"""
+        if not self._registry_len:
+            return {}
+        start = self._registry_offset
+        return json.loads(self._mm[start:start + self._registry_len].decode('utf-8'))
+
+    def close(self):
+        if getattr(self, '_mm', None) is not None:
+            self._mm.close()
+            self._mm = None
+        self._file.close()
+
+
+class SnapshotWriter:
+    """快照写入：平时追加增量，增量超过基础快照的一定比例时整体重写"""
+
+    def __init__(self, path, compact_ratio=0.25, log=None):
+        self.path = path
+        self.compact_ratio = compact_ratio
+        self.log = log or (lambda message: None)
+        self.generation = 0
+        self.base_count = 0
+        self.delta_count = 0
+        existing = Snapshot.open(path)
+        if existing is not None:
+            self.generation = existing.generation
+            self.base_count = existing.count
+            self.delta_count = len(existing.overlay)
+            existing.close()
+
+    def save(self, store, registry=None, ui_state=None, full=False):
+        """保存快照；返回 'full' 或 'delta'"""
+        if ui_state is not None:
+            _atomic_write(self.path + '.ui', [json.dumps(ui_state, ensure_ascii=False).encode('utf-8')])
+        dirty = store.take_dirty()
+        if (full or registry is not None or not os.path.exists(self.path)
+                or self.delta_count + len(dirty) > self.compact_ratio * max(self.base_count, 1)):
+            self._write_full(store, registry)
+            return 'full'
+        if dirty:
+            self._append_delta(dirty)
+        return 'delta'
+
+    def _write_full(self, store, registry):
+        if registry is None:
+            # 未修改清单时沿用旧快照中的清单
+            old = Snapshot.open(self.path)
+            registry_data = old.registry() if old else {}
+            if old:
+                old.close()
+        else:
+            registry_data = registry.to_dict()
+        statuses = sorted(self._packable(status for _, status in store.items_snapshot()), key=lambda s: s.mac.encode())
+        records = b''.join(_pack(status) for status in statuses)
+        registry_bytes = json.dumps(registry_data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        online, unlocked, low = _aggregate(statuses)
+        self.generation += 1
+        header = HEADER.pack(MAGIC, FORMAT_VERSION, RECORD.size, self.generation, len(statuses),
+                             time.time(), len(statuses), online, unlocked, low,
+                             HEADER.size + len(records), len(registry_bytes))
+        _atomic_write(self.path, [header, records, registry_bytes])
+        # 新一代增量日志（旧增量因代数不符自动失效）
+        _atomic_write(self.path + '.delta', [DELTA_HEADER.pack(DELTA_MAGIC, self.generation)])
+        self.base_count = len(statuses)
+        self.delta_count = 0
+
+    def _append_delta(self, statuses):
+        statuses = self._packable(statuses)
+        with open(self.path + '.delta', 'ab') as f:
+            for status in statuses:
+                record = _pack(status)
+                f.write(DELTA_ENTRY.pack(record, zlib.crc32(record)))
+            f.flush()
+            os.fsync(f.fileno())
+        self.delta_count += len(statuses)
+
+    def _packable(self, statuses):
+        """滤掉放不进定长记录的设备（MAC超过 MAC_SIZE 字节），不让一台设备导致整个快照写不出"""
+        kept = []
+        skipped = []
+        for status in statuses:
+            (kept if len(status.mac.encode()) <= MAC_SIZE else skipped).append(status)
+        if skipped:
+            self.log(f"快照跳过 {len(skipped)} 台MAC过长的设备: {skipped[0].mac[:40]}")
+        return kept
+
+
+def load_into(store, snapshot):
+    """把快照中的全部状态载入 StatusStore（适合在后台线程执行）"""
+    store.load(snapshot.iter_statuses())
+    return len(store)
+
+
+def battery_text(status):
+    return '--' if status.battery == BATTERY_UNKNOWN else f"{status.battery}%"
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地 MQTT 替身 broker
+实现 lock_mqtt.py 用到的 MQTT 3.1.1 子集并按主题转发消息；发布到 {prefix}/+/+/cmd 的命令
+由内置的设备桥（与 HTTP 替身共用 StandinBackend）处理，响应发布到命令中的 reply_to 主题。
+用于 MQTT 直连传输的联调和基准测试，不连接任何真实设备
+"""
+
+import argparse
+import json
+import socket
+import socketserver
+import struct
+import threading
+
+from lock_mqtt import (CONNACK, CONNECT, DISCONNECT, PINGREQ, PINGRESP, PUBACK, PUBLISH, SUBACK,
+                       SUBSCRIBE, packet, parse_publish, publish_packet, read_packet)
+from lock_standin_server import StandinBackend, StandinOptions
+
+
+def topic_matches(pattern, topic):
+    """MQTT 主题过滤：+ 匹配一级，# 匹配其后所有层级"""
+    pattern_parts = pattern.split('/')
+    topic_parts = topic.split('/')
+    for i, part in enumerate(pattern_parts):
+        if part == '#':
+            return True
+        if i >= len(topic_parts) or (part != '+' and part != topic_parts[i]):
+            return False
+    return len(pattern_parts) == len(topic_parts)
+
+
+class BrokerHandler(socketserver.StreamRequestHandler):
+    """一个客户端连接"""
+
+    def setup(self):
+        super().setup()
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.write_lock = threading.Lock()
+        self.packet_ids = 0
+
+    def send(self, data):
+        with self.write_lock:
+            self.request.sendall(data)
+
+    def deliver(self, topic, payload, qos):
+        packet_id = None
+        if qos:
+            self.packet_ids = self.packet_ids % 65535 + 1
+            packet_id = self.packet_ids
+        self.send(publish_packet(topic, payload, qos, packet_id))
+
+    def handle(self):
+        broker = self.server
+        try:
+            first, body = read_packet(self.rfile)
+            if first & 0xF0 != CONNECT:
+                return
+            self.send(packet(CONNACK, b'\x00\x00'))
+            while True:
+                first, body = read_packet(self.rfile)
+                kind = first & 0xF0
+                if kind == PUBLISH:
+                    topic, qos, packet_id, payload = parse_publish(first, body)
+                    if qos:
+                        self.send(packet(PUBACK, struct.pack('>H', packet_id)))
+                    broker.route(topic, payload, qos)
+                elif kind == SUBSCRIBE:
+                    packet_id = struct.unpack_from('>H', body)[0]
+                    pos, granted = 2, bytearray()
+                    while pos < len(body):
+                        length = struct.unpack_from('>H', body, pos)[0]
+                        topic = body[pos + 2:pos + 2 + length].decode('utf-8')
+                        qos = min(body[pos + 2 + length], 1)
+                        pos += 3 + length
+                        broker.add_subscription(topic, self, qos)
+                        granted.append(qos)
+                    self.send(packet(SUBACK, struct.pack('>H', packet_id) + bytes(granted)))
+                elif kind == PINGREQ:
+                    self.send(packet(PINGRESP))
+                elif kind == DISCONNECT:
+                    return
+                # 客户端发来的 PUBACK 无需处理：替身不重发
+        except (OSError, ConnectionError, struct.error):
+            pass
+        finally:
+            broker.remove_client(self)
+
+
+class StandinBroker(StandinBackend, socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, options=None, topic_prefix='yefiot'):
+        socketserver.ThreadingTCPServer.__init__(self, address, BrokerHandler)
+        StandinBackend.__init__(self, options)
+        self.topic_prefix = topic_prefix
+        self.subscriptions = []
+        self._sub_lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"mqtt://{host}:{port}"
+
+    def add_subscription(self, pattern, client, qos):
+        with self._sub_lock:
+            self.subscriptions.append((pattern, client, qos))
+
+    def remove_client(self, client):
+        with self._sub_lock:
+            self.subscriptions = [s for s in self.subscriptions if s[1] is not client]
+
+    def route(self, topic, payload, qos):
+        """转发给所有匹配的订阅者；命令主题交给设备桥"""
+        parts = topic.split('/')
+        if len(parts) == 4 and parts[0] == self.topic_prefix and parts[3] == 'cmd':
+            self.handle_mqtt_command(payload)
+        with self._sub_lock:
+            targets = [(client, min(qos, sub_qos)) for pattern, client, sub_qos in self.subscriptions
+                       if topic_matches(pattern, topic)]
+        for client, granted in targets:
+            try:
+                client.deliver(topic, payload, granted)
+            except OSError:
+                pass
+
+    def handle_mqtt_command(self, raw):
+        try:
+            message = json.loads(raw)
+        except ValueError:
+            return
+        reply_to = message.get('reply_to')
+        if not reply_to:
+            return
+        delay, failed = self.options.draw()
+        self.count_request()
+
+        def reply():
+            if failed:
+                body = {'code': 503, 'msg': 'injected error'}
+            else:
+                body = self.handle_command(message)
+            body['cid'] = message.get('cid')
+            self.route(reply_to, json.dumps(body, ensure_ascii=False).encode('utf-8'), 1)
+
+        if delay:
+            threading.Timer(delay, reply).start()
+        else:
+            reply()
+
+    def shutdown(self):
+        self.close_streams()
+        socketserver.ThreadingTCPServer.shutdown(self)
+
+
+def start_broker(port=0, host='127.0.0.1', **options):
+    """在后台线程启动替身 broker，返回服务器对象（broker.url 为连接地址）"""
+    broker = StandinBroker((host, port), StandinOptions(**options))
+    thread = threading.Thread(target=broker.serve_forever, daemon=True)
+    thread.start()
+    return broker
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地 MQTT 替身 broker')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=1883)
+    parser.add_argument('--latency', type=float, default=0.0, help='设备应答延迟（秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    args = parser.parse_args()
+    broker = StandinBroker((args.host, args.port), StandinOptions(latency=args.latency, error_rate=args.error_rate))
+    print(f"替身 broker 已启动: {broker.url}")
+    try:
+        broker.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地 mqttpost 替身服务器
+按与线上服务器相同的请求/响应格式应答门锁命令，可注入延迟、慢请求和错误，
+用于基准测试和联调，不连接任何真实设备
+
+状态同步约定（见 lock_sync.py）：
+    状态查询带 "etag" 且设备未变化时，应答项为 {"mac", "sn", "etag", "not_modified": true}，不含帧
+    cmd="sync" 带 "cursor"/"limit" 时，返回版本号大于游标的设备 {"cursor", "more", "data": [...]}；
+    游标无效（如服务器重启）时附带 "reset": true，并从头返回
+    cmd="batch" 带 "items" 时逐条执行，返回 {"results": [{"mac", "sn", "code", "data"}, ...]}（见 lock_batching.py）
+
+事件流（见 lock_events.py）：GET .../events/ 以 SSE 推送 status/ack/battery_low 事件，
+支持 Last-Event-ID 续传；续传位置已被淘汰时先发送 reset 事件
+"""
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 应答帧：开锁成功返回命令码2B，状态查询返回1F
+UNLOCK_REPLY = "HD2B0454049024910010000000000000000000006EDA1000000007EW"
+STATUS_REPLY = "HD1F0064" + "0" * 48 + "W"       # 已上锁、电量100%
+
+
+def status_frame(unlocked, battery):
+    """状态应答帧：锁状态(00/01) + 电量(十六进制)"""
+    return f"HD1F{int(unlocked):02X}{battery:02X}" + "0" * 48 + "W"
+
+
+class StandinOptions:
+    """替身服务器的行为参数"""
+
+    def __init__(self, latency=0.0, jitter=0.0, slow_rate=0.0, slow_latency=1.0,
+                 error_rate=0.0, seed=None, capacity=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        # 同时处理的请求数上限（模拟服务器工作线程数），0 表示不限
+        self.slots = threading.BoundedSemaphore(capacity) if capacity else None
+
+    def draw(self):
+        """抽取本次请求的 (延迟秒数, 是否返回错误)"""
+        with self.lock:
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            if self.slow_rate and self.random.random() < self.slow_rate:
+                delay = self.slow_latency
+            failed = bool(self.error_rate) and self.random.random() < self.error_rate
+        return delay, failed
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'LockStandin/1.0'
+    # 长连接下避免 Nagle 与延迟确认叠加造成约40ms的额外延迟
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_HEAD(self):
+        # 健康探测只需要响应头
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        if not self.path.split('?')[0].endswith('/events/'):
+            self._send_json(404, {'code': 404, 'msg': 'not found'})
+            return
+        last_id = self.headers.get('Last-Event-ID')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        self.server.stream_events(self.wfile, int(last_id) if last_id and last_id.isdigit() else None)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length)
+        if len(raw) < length:
+            # 请求体不完整（如落败的对冲请求被客户端中止），不当作空命令执行
+            self.close_connection = True
+            return
+        options = self.server.options
+        delay, failed = options.draw()
+        if options.slots is not None:
+            with options.slots:
+                time.sleep(delay)
+        elif delay:
+            time.sleep(delay)
+        self.server.count_request()
+        if failed:
+            self._send_json(503, {'code': 503, 'msg': 'injected error'})
+            return
+        try:
+            payload = json.loads(raw or b'{}')
+        except ValueError:
+            self._send_json(400, {'code': 400, 'msg': 'bad json'})
+            return
+        self._send_json(200, self.server.handle_command(payload))
+
+
+class StandinBackend:
+    """替身的设备状态、同步和事件日志，HTTP 替身与 MQTT 替身（lock_standin_broker.py）共用"""
+
+    def __init__(self, options=None, event_backlog=10000, heartbeat=15.0):
+        self.options = options or StandinOptions()
+        self.requests = 0
+        self._count_lock = threading.Lock()
+        # mac -> [是否开锁, 电量, 版本号]；版本号取自全局递增序号，兼作同步游标
+        self.devices = {}
+        self.sequence = 0
+        self._device_lock = threading.Lock()
+        # 事件日志（有界），事件ID单调递增
+        self.events = deque(maxlen=event_backlog)
+        self.event_id = 0
+        self.heartbeat = heartbeat
+        self._event_cond = threading.Condition()
+        self.closing = False
+
+    def close_streams(self):
+        """结束所有事件流，否则它们会一直占用处理线程"""
+        with self._event_cond:
+            self.closing = True
+            self._event_cond.notify_all()
+
+    def count_request(self):
+        with self._count_lock:
+            self.requests += 1
+
+    def _device(self, mac):
+        device = self.devices.get(mac)
+        if device is None:
+            self.sequence += 1
+            device = self.devices[mac] = [False, 100, self.sequence]
+        return device
+
+    def mutate(self, mac, unlocked=None, battery=None):
+        """模拟设备侧状态变化（基准测试和联调用）"""
+        with self._device_lock:
+            device = self._device(mac)
+            if unlocked is not None:
+                device[0] = unlocked
+            if battery is not None:
+                device[1] = battery
+            self.sequence += 1
+            device[2] = self.sequence
+            current = list(device)
+        self.publish('status', {'mac': mac, 'etag': str(current[2]), 'msg_info': status_frame(current[0], current[1])})
+        if battery is not None and battery < 20:
+            self.publish('battery_low', {'mac': mac, 'battery': battery})
+
+    def publish(self, event, data):
+        """追加一条事件并唤醒所有事件流"""
+        with self._event_cond:
+            self.event_id += 1
+            self.events.append((self.event_id, event, json.dumps(data, ensure_ascii=False)))
+            self._event_cond.notify_all()
+
+    def stream_events(self, wfile, last_id):
+        """向一个SSE连接持续写出事件，直到客户端断开或服务器关闭"""
+        with self._event_cond:
+            oldest = self.events[0][0] if self.events else self.event_id + 1
+            if last_id is None:
+                position = self.event_id          # 新订阅只接收之后的事件
+            elif last_id + 1 < oldest or last_id > self.event_id:
+                position = None
+            else:
+                position = last_id
+        try:
+            if position is None:
+                with self._event_cond:
+                    position = self.event_id
+                wfile.write(f"id: {position}\nevent: reset\ndata: {{}}\n\n".encode())
+                wfile.flush()
+            while not self.closing:
+                with self._event_cond:
+                    if self.event_id <= position:
+                        self._event_cond.wait(self.heartbeat)
+                    pending = [e for e in self.events if e[0] > position] if self.event_id > position else []
+                if not pending:
+                    wfile.write(b": ping\n\n")
+                else:
+                    wfile.write(''.join(f"id: {eid}\nevent: {name}\ndata: {data}\n\n"
+                                        for eid, name, data in pending).encode('utf-8'))
+                    position = pending[-1][0]
+                wfile.flush()
+        except (ConnectionError, OSError):
+            pass
+
+    def handle_command(self, payload):
+        """单条命令 -> 与线上一致的响应结构"""
+        cmd = str(payload.get('cmd'))
+        if cmd == 'sync':
+            return self.handle_sync(payload)
+        if cmd == 'batch':
+            return self.handle_batch(payload)
+        mac = payload.get('mac', '')
+        item = {'mac': mac, 'sn': payload.get('sn')}
+        if cmd == '0':
+            self.mutate(mac, unlocked=True)
+            with self._device_lock:
+                item['etag'] = str(self.devices[mac][2])
+            item['msg_info'] = UNLOCK_REPLY
+            self.publish('ack', {'mac': mac, 'sn': item['sn'], 'msg_info': UNLOCK_REPLY})
+            return {'code': 0, 'data': [item]}
+        with self._device_lock:
+            unlocked, battery, version = self._device(mac)
+        item['etag'] = str(version)
+        if payload.get('etag') == item['etag']:
+            item['not_modified'] = True
+        else:
+            item['msg_info'] = status_frame(unlocked, battery)
+        return {'code': 0, 'data': [item]}
+
+    def handle_batch(self, payload):
+        """批量信封：逐条执行，按原顺序返回各条的结果"""
+        results = []
+        for item in (payload.get('items') or [])[:1000]:
+            reply = self.handle_command(item) if str(item.get('cmd')) != 'batch' else {'code': 400, 'data': []}
+            results.append({'mac': item.get('mac'), 'sn': item.get('sn'),
+                            'code': reply.get('code', 0), 'data': reply.get('data', [])})
+        return {'code': 0, 'results': results}
+
+    def handle_sync(self, payload):
+        """变更查询：返回版本号大于游标的设备，按版本号排序分页"""
+        cursor = int(payload.get('cursor') or 0)
+        limit = max(1, min(int(payload.get('limit') or 1000), 5000))
+        response = {'code': 0}
+        with self._device_lock:
+            if cursor > self.sequence:
+                response['reset'] = True
+                cursor = 0
+            changed = sorted((version, mac, unlocked, battery)
+                             for mac, (unlocked, battery, version) in self.devices.items()
+                             if version > cursor)
+            current = self.sequence
+        page = changed[:limit]
+        response['more'] = len(changed) > limit
+        response['cursor'] = page[-1][0] if response['more'] else current
+        response['data'] = [{'mac': mac, 'etag': str(version), 'msg_info': status_frame(unlocked, battery)}
+                            for version, mac, unlocked, battery in page]
+        return response
+
+
+class StandinServer(StandinBackend, ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, options=None, event_backlog=10000, heartbeat=15.0):
+        ThreadingHTTPServer.__init__(self, address, StandinHandler)
+        StandinBackend.__init__(self, options, event_backlog, heartbeat)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/yefiot/v1/mqttpost/"
+
+    def handle_error(self, request, client_address):
+        # 客户端中止请求（如对冲落后的一方）属于预期情况，不打印堆栈
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+    def shutdown(self):
+        self.close_streams()
+        ThreadingHTTPServer.shutdown(self)
+
+
+def start_standin(port=0, host='127.0.0.1', **options):
+    """在后台线程启动替身服务器，返回服务器对象（server.url 为接口地址）"""
+    server = StandinServer((host, port), StandinOptions(**options))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地 mqttpost 替身服务器')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.0, help='基础延迟（秒）')
+    parser.add_argument('--jitter', type=float, default=0.0, help='附加均匀抖动上限（秒）')
+    parser.add_argument('--slow-rate', type=float, default=0.0, help='慢请求比例')
+    parser.add_argument('--slow-latency', type=float, default=1.0, help='慢请求延迟（秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='返回503的比例')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--capacity', type=int, default=0, help='同时处理的请求数上限（0为不限）')
+    args = parser.parse_args()
+    server = StandinServer((args.host, args.port), StandinOptions(
+        args.latency, args.jitter, args.slow_rate, args.slow_latency, args.error_rate, args.seed, args.capacity))
+    print(f"替身服务器已启动: {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
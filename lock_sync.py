@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+设备状态同步
+两种方式，均只传输有变化的设备：
+    条件查询  状态查询附带上次应答的 etag，设备未变化时服务器只回 not_modified，不含状态帧
+    变更查询  cmd="sync" 按游标批量拉取自上次同步以来变化的设备，一次请求覆盖整个设备清单
+服务器不支持变更查询时抛出 SyncNotSupported，调用方改用条件查询；
+按设备分片时每个分片各有独立的版本序列，变更查询逐个分片发送、各自维护游标
+状态查询帧和应答布局按设备型号取自协议注册表（lock_protocol）
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import lock_metrics
+from lock_fleet import status_from_frame
+from lock_protocol import default_registry
+
+CHANGED = 'changed'
+NOT_MODIFIED = 'not_modified'
+FAILED = 'failed'
+
+SYNC_TOTAL = lock_metrics.REGISTRY.counter(
+    'lock_status_sync_total', '状态同步结果（mode=conditional/cursor）', ('mode', 'result'))
+
+
+class SyncNotSupported(Exception):
+    """服务器不支持变更查询"""
+
+
+class StatusSync:
+    """维护每台设备的 etag 和变更游标，把同步结果写入 StatusStore"""
+
+    def __init__(self, transport, store, timeout=10, protocol_for=None):
+        self.transport = transport
+        self.store = store
+        self.timeout = timeout
+        # mac -> lock_protocol.Protocol；默认所有设备使用注册表的默认型号
+        self.protocol_for = protocol_for or (lambda mac: default_registry().default)
+        self.etags = {}
+        # 分区（Transport.partitions，未分片时只有 ''）-> 变更游标
+        self.cursors = {}
+        self.bytes_received = 0
+        self._lock = threading.Lock()
+
+    def _post(self, payload, transport=None):
+        response = (transport or self.transport).post(payload, timeout=self.timeout, idempotent=True)
+        with self._lock:
+            self.bytes_received += len(response.content)
+        return response
+
+    def status_fields(self, mac, msg_info):
+        """按设备型号的应答布局解析状态帧"""
+        protocol = self.protocol_for(mac)
+        return status_from_frame(protocol.parse(msg_info), protocol)
+
+    def remember(self, mac, item):
+        """记录应答项中的状态和 etag（也用于普通状态查询的应答）"""
+        fields = self.status_fields(mac, item.get('msg_info', ''))
+        if fields:
+            self.store.update(mac, **fields)
+        if item.get('etag') is not None:
+            with self._lock:
+                self.etags[mac] = item['etag']
+
+    def check(self, mac, sn=None):
+        """条件查询一台设备，返回 CHANGED / NOT_MODIFIED / FAILED"""
+        protocol = self.protocol_for(mac)
+        command = protocol.command('status')
+        payload = {
+            "type": protocol.type,
+            "mac": mac,
+            "cmd": command.cmd,
+            "sn": sn if sn is not None else int(time.time()),
+            "info": command.frame(),
+        }
+        etag = self.etags.get(mac)
+        if etag is not None:
+            payload['etag'] = etag
+        result = FAILED
+        try:
+            response = self._post(payload)
+            if response.status_code == 200:
+                item = (response.json().get('data') or [{}])[0]
+                if item.get('not_modified'):
+                    result = NOT_MODIFIED
+                    # 确认未变化也算一次刷新，避免被再次判为过期
+                    status = self.store.get(mac)
+                    if status is not None:
+                        self.store.update(mac, version=status.version)
+                elif item.get('msg_info'):
+                    self.remember(mac, item)
+                    result = CHANGED
+        except (requests.exceptions.RequestException, ValueError):
+            pass
+        SYNC_TOTAL.inc('conditional', result)
+        return result
+
+    def refresh(self, macs, workers=4):
+        """并发条件查询一组设备，返回各结果的计数"""
+        stats = {CHANGED: 0, NOT_MODIFIED: 0, FAILED: 0}
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for result in pool.map(self.check, macs):
+                stats[result] += 1
+        return stats
+
+    def sync_changes(self, limit=1000):
+        """按游标拉取全部变更，返回变化的设备数；服务器不支持时抛出 SyncNotSupported。
+        分片传输时并行查询各分片，合并结果"""
+        partitions = self.transport.partitions()
+        if len(partitions) == 1:
+            changed = self._sync_partition(*next(iter(partitions.items())), limit)
+        else:
+            with ThreadPoolExecutor(max_workers=len(partitions), thread_name_prefix='sync') as pool:
+                futures = [pool.submit(self._sync_partition, partition, transport, limit)
+                           for partition, transport in partitions.items()]
+                changed = sum(future.result() for future in futures)
+        SYNC_TOTAL.inc('cursor', CHANGED if changed else NOT_MODIFIED)
+        return changed
+
+    def _sync_partition(self, partition, transport, limit):
+        changed = 0
+        while True:
+            payload = {"type": default_registry().default.type, "cmd": "sync",
+                       "cursor": self.cursors.get(partition, 0), "limit": limit}
+            try:
+                response = self._post(payload, transport)
+                body = response.json() if response.status_code == 200 else {}
+            except ValueError:
+                body = {}
+            if 'cursor' not in body:
+                SYNC_TOTAL.inc('cursor', 'unsupported')
+                raise SyncNotSupported(f"{partition or '服务器'}: HTTP {response.status_code}")
+            if body.get('reset'):
+                # 游标失效：服务器从头返回，本地 etag 全部作废
+                with self._lock:
+                    self.etags.clear()
+            for item in body.get('data') or []:
+                self.remember(item['mac'], item)
+                changed += 1
+            with self._lock:
+                self.cursors[partition] = body['cursor']
+            if not body.get('more'):
+                return changed
+
+    def save(self, path):
+        """保存游标和 etag（原子替换）"""
+        with self._lock:
+            state = {'cursors': dict(self.cursors), 'etags': dict(self.etags)}
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(state, f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def load(self, path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return False
+        with self._lock:
+            self.cursors.update(state.get('cursors', {}))
+            if 'cursor' in state:
+                # 旧版本只有一个游标
+                self.cursors.setdefault('', state['cursor'])
+            self.etags.update(state.get('etags', {}))
+        return True
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+门锁命令链路追踪
+按命令记录各阶段span（线程启动、DNS、TCP、TLS、服务器等待、JSON解码、指令解析、UI回调），
+写入环形缓冲区，可导出为Chrome trace-event JSON（Perfetto UI可直接打开）
+"""
+
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+
+_now_ns = time.perf_counter_ns
+_trace_ids = itertools.count(1)
+_local = threading.local()
+
+
+def current_trace():
+    """当前线程正在执行的追踪（没有则返回None）"""
+    return getattr(_local, 'trace', None)
+
+
+class Trace:
+    """单条命令的追踪记录"""
+
+    def __init__(self, tracer, name, sampled, tags):
+        self.tracer = tracer
+        self.name = name
+        self.sampled = sampled
+        self.tags = tags
+        self.trace_id = next(_trace_ids)
+        self.start_ns = _now_ns()
+        self.end_ns = None
+        self.spans = []
+        # 尚未执行的跨线程回调数；finish() 等它们执行完才结束追踪
+        self._lock = threading.Lock()
+        self._pending_hops = 0
+        self._finishing = False
+
+    def mark(self):
+        """返回当前时间戳（ns），供 add_span 使用"""
+        return _now_ns()
+
+    def add_span(self, name, start_ns, end_ns=None, **args):
+        """记录一个已测量的阶段"""
+        if end_ns is None:
+            end_ns = _now_ns()
+        thread = threading.current_thread()
+        self.spans.append((name, start_ns, end_ns, thread.ident, thread.name, args))
+
+    def span(self, name, **args):
+        """上下文管理器形式的阶段记录"""
+        return _SpanContext(self, name, args)
+
+    def wrap_hop(self, name, callback):
+        """包装跨线程回调（如 Clock.schedule_once），记录从调度到执行的间隔；
+        回调执行完之前追踪不会结束，UI回调阶段计入命令耗时"""
+        scheduled = _now_ns()
+        with self._lock:
+            self._pending_hops += 1
+
+        def hop(*args):
+            self.add_span(name, scheduled)
+            try:
+                return callback(*args)
+            finally:
+                with self._lock:
+                    self._pending_hops -= 1
+                    ready = self._finishing and not self._pending_hops
+                if ready:
+                    self._close()
+        return hop
+
+    def activate(self):
+        """设为当前线程的活动追踪，以便连接层记录DNS/TCP/TLS"""
+        _local.trace = self
+        return self
+
+    def deactivate(self):
+        if getattr(_local, 'trace', None) is self:
+            _local.trace = None
+
+    def finish(self):
+        """结束追踪，按采样规则决定是否写入环形缓冲区；
+        仍有 wrap_hop 包装的回调未执行时，推迟到最后一个回调执行完毕"""
+        self.deactivate()
+        with self._lock:
+            if self._finishing:
+                return
+            self._finishing = True
+            ready = not self._pending_hops
+        if ready:
+            self._close()
+
+    def _close(self):
+        self.end_ns = _now_ns()
+        self.tracer._finish(self)
+
+    @property
+    def duration(self):
+        end = self.end_ns if self.end_ns is not None else _now_ns()
+        return (end - self.start_ns) / 1e9
+
+
+class _SpanContext:
+    __slots__ = ('trace', 'name', 'args', 'start')
+
+    def __init__(self, trace, name, args):
+        self.trace = trace
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = _now_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        self.trace.add_span(self.name, self.start, **self.args)
+        return False
+
+
+class _NullTrace:
+    """未采样时使用的空追踪，所有操作均为空操作"""
+
+    sampled = False
+    tags = {}
+    spans = ()
+
+    def mark(self):
+        return 0
+
+    def add_span(self, name, start_ns, end_ns=None, **args):
+        pass
+
+    def span(self, name, **args):
+        return _NULL_SPAN
+
+    def wrap_hop(self, name, callback):
+        return callback
+
+    def activate(self):
+        return self
+
+    def deactivate(self):
+        pass
+
+    def finish(self):
+        pass
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NULL_TRACE = _NullTrace()
+_NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """追踪器：头部按比例采样，尾部保留慢命令，结果存入环形缓冲区"""
+
+    def __init__(self, sample_rate=0.0, slow_threshold=2.0, capacity=256):
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+        self.buffer = deque(maxlen=capacity)
+        self.pid = os.getpid()
+
+    @classmethod
+    def from_env(cls):
+        """LOCK_TRACE_SAMPLE（0~1）、LOCK_TRACE_SLOW_MS、LOCK_TRACE_CAPACITY"""
+        slow_ms = os.environ.get('LOCK_TRACE_SLOW_MS', '2000')
+        return cls(
+            sample_rate=float(os.environ.get('LOCK_TRACE_SAMPLE', '0')),
+            slow_threshold=float(slow_ms) / 1000.0 if slow_ms else None,
+            capacity=int(os.environ.get('LOCK_TRACE_CAPACITY', '256')),
+        )
+
+    @property
+    def enabled(self):
+        return self.sample_rate > 0 or self.slow_threshold is not None
+
+    def start_trace(self, name, **tags):
+        """开始一条命令追踪；完全关闭时返回 NULL_TRACE"""
+        if not self.enabled:
+            return NULL_TRACE
+        sampled = self.sample_rate >= 1.0 or random.random() < self.sample_rate
+        return Trace(self, name, sampled, tags)
+
+    def _finish(self, trace):
+        if trace.sampled or (self.slow_threshold is not None
+                             and trace.duration >= self.slow_threshold):
+            self.buffer.append(trace)
+
+    def clear(self):
+        self.buffer.clear()
+
+    def to_chrome(self, min_duration=0.0):
+        """转换为Chrome trace-event格式（dict）"""
+        events = []
+        threads = {}
+        for trace in list(self.buffer):
+            if trace.duration < min_duration:
+                continue
+            args = dict(trace.tags, trace_id=trace.trace_id)
+            root_tid = trace.spans[0][3] if trace.spans else 0
+            events.append({
+                'name': trace.name, 'cat': 'command', 'ph': 'X',
+                'ts': trace.start_ns / 1000.0,
+                'dur': (trace.end_ns - trace.start_ns) / 1000.0,
+                'pid': self.pid, 'tid': root_tid, 'args': args,
+            })
+            previous_tid = None
+            for name, start, end, tid, thread_name, span_args in list(trace.spans):
+                threads[tid] = thread_name
+                events.append({
+                    'name': name, 'cat': 'span', 'ph': 'X',
+                    'ts': start / 1000.0, 'dur': (end - start) / 1000.0,
+                    'pid': self.pid, 'tid': tid,
+                    'args': dict(span_args, trace_id=trace.trace_id),
+                })
+                # 跨线程跳转用flow事件连接，便于在查看器中追踪关键路径
+                if previous_tid is not None and previous_tid != tid:
+                    events.append({'name': 'hop', 'cat': 'flow', 'ph': 's', 'id': trace.trace_id,
+                                   'ts': start / 1000.0, 'pid': self.pid, 'tid': previous_tid})
+                    events.append({'name': 'hop', 'cat': 'flow', 'ph': 'f', 'bp': 'e',
+                                   'id': trace.trace_id, 'ts': start / 1000.0,
+                                   'pid': self.pid, 'tid': tid})
+                previous_tid = tid
+        for tid, thread_name in threads.items():
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': tid,
+                           'args': {'name': thread_name}})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def export_chrome_json(self, min_duration=0.0):
+        return json.dumps(self.to_chrome(min_duration), ensure_ascii=False)
+
+    def dump(self, path, min_duration=0.0):
+        """写出追踪文件，可在 chrome://tracing 或 ui.perfetto.dev 打开"""
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.export_chrome_json(min_duration))
+        return path
+
+
+TRACER = Tracer.from_env()
@@ -0,0 +1,454 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+门锁命令传输层
+Transport 定义命令核心（lock_core）使用的传输接口，有两种实现：
+    HttpTransport  通过 EndpointPool 选路发送 mqttpost 请求，连接失败时自动切换到其他节点；
+                   幂等的状态查询可启用对冲请求，以压低尾延迟
+    MqttTransport  （lock_mqtt.py）经一条长连接直接向 MQTT broker 发布命令帧
+    SimulatorTransport （lock_simulator.py）进程内的虚拟门锁群，用于无网络的规模测试
+用 LOCK_TRANSPORT=http|mqtt|sim 选择，见 transport_from_env
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import NewConnectionError
+
+import lock_deadline
+import lock_metrics
+from lock_tracing import NULL_TRACE, current_trace
+
+DEFAULT_HEADERS = {
+    'Content-Type': 'application/json',
+    'User-Agent': 'Mozilla/5.0 (Linux; Android 10) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Mobile Safari/537.36'
+}
+
+HEDGES_TOTAL = lock_metrics.REGISTRY.counter(
+    'lock_hedged_requests_total', '对冲请求（issued/hedge_won/primary_won/budget_exhausted）', ('outcome',))
+HEDGES_ISSUED = HEDGES_TOTAL.labels('issued')
+HEDGES_BUDGET_EXHAUSTED = HEDGES_TOTAL.labels('budget_exhausted')
+HEDGES_PRIMARY_WON = HEDGES_TOTAL.labels('primary_won')
+HEDGES_HEDGE_WON = HEDGES_TOTAL.labels('hedge_won')
+
+_now_ns = time.perf_counter_ns
+_local = threading.local()
+
+
+class AbortScope:
+    """可中止的请求范围：范围内发出的HTTP请求在 abort() 时立即断开套接字"""
+
+    def __init__(self):
+        self.aborted = False
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self._previous = getattr(_local, 'scope', None)
+        _local.scope = self
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _local.scope = self._previous
+        with self._lock:
+            self._connections.clear()
+        return False
+
+    def register(self, connection):
+        with self._lock:
+            self._connections.append(connection)
+            aborted = self.aborted
+        if aborted:
+            _shutdown(connection)
+
+    def abort(self):
+        """中止范围内所有在途请求；阻塞在读取上的线程会立即收到连接错误"""
+        with self._lock:
+            self.aborted = True
+            connections = list(self._connections)
+        for connection in connections:
+            _shutdown(connection)
+
+
+def _shutdown(connection):
+    sock = getattr(connection, 'sock', None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class _InstrumentedMixin:
+    """为DNS/TCP/TLS阶段打点，并把连接登记到当前的 AbortScope"""
+
+    def _new_conn(self):
+        trace = current_trace()
+        if trace is None:
+            return super()._new_conn()
+        dns_host = getattr(self, '_dns_host', self.host)
+        start = _now_ns()
+        try:
+            infos = socket.getaddrinfo(dns_host, self.port, 0, socket.SOCK_STREAM)
+        finally:
+            trace.add_span('dns', start, host=dns_host)
+        # 用已解析的地址建立TCP连接，避免重复解析；TLS仍使用原主机名校验
+        resolved = infos[0][4][0] if infos else dns_host
+        self._dns_host = resolved
+        start = _now_ns()
+        try:
+            return super()._new_conn()
+        finally:
+            self._dns_host = dns_host
+            self._tcp_done = _now_ns()
+            trace.add_span('tcp_connect', start, self._tcp_done, addr=resolved)
+
+    def connect(self):
+        self._tcp_done = None
+        super().connect()
+        scope = getattr(_local, 'scope', None)
+        if scope is not None and scope.aborted:
+            _shutdown(self)
+
+    def request(self, *args, **kwargs):
+        scope = getattr(_local, 'scope', None)
+        if scope is not None:
+            scope.register(self)
+        return super().request(*args, **kwargs)
+
+
+class _InstrumentedHTTPConnection(_InstrumentedMixin, HTTPConnection):
+    pass
+
+
+class _InstrumentedHTTPSConnection(_InstrumentedMixin, HTTPSConnection):
+    def connect(self):
+        super().connect()
+        trace = current_trace()
+        if trace is not None and self._tcp_done is not None:
+            trace.add_span('tls_handshake', self._tcp_done)
+
+
+class _InstrumentedHTTPPool(HTTPConnectionPool):
+    ConnectionCls = _InstrumentedHTTPConnection
+
+
+class _InstrumentedHTTPSPool(HTTPSConnectionPool):
+    ConnectionCls = _InstrumentedHTTPSConnection
+
+
+class _InstrumentedAdapter(HTTPAdapter):
+    def send(self, request, *args, **kwargs):
+        trace = current_trace()
+        if trace is None:
+            return super().send(request, *args, **kwargs)
+        start = _now_ns()
+        response = super().send(request, *args, **kwargs)
+        # 建连之后到收到响应头为止，记为等待服务器（首字节）阶段
+        for name, _, end, _, _, _ in trace.spans:
+            if name in ('tcp_connect', 'tls_handshake') and end > start:
+                start = end
+        trace.add_span('server_wait', start, status=response.status_code)
+        return response
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _InstrumentedHTTPPool, 'https': _InstrumentedHTTPSPool,
+        }
+
+
+def create_session(pool_maxsize=10):
+    """创建带连接阶段打点和中止支持的 requests.Session"""
+    session = requests.Session()
+    adapter = _InstrumentedAdapter(pool_maxsize=pool_maxsize)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class CommandNotSent(requests.exceptions.ConnectionError):
+    """非HTTP传输在命令发出前失败（如与 broker 的连接不可用）"""
+
+
+class TransportResponse:
+    """非HTTP传输的响应，提供 send_lock_command 用到的 requests.Response 接口子集"""
+
+    def __init__(self, status_code, content, endpoint=None):
+        self.status_code = status_code
+        self.content = content
+        self.endpoint = endpoint
+
+    def json(self):
+        return json.loads(self.content)
+
+
+def status_for_code(code):
+    """批量信封/MQTT应答中的 code -> 与HTTP一致的状态码：0 为成功(200)，HTTP状态码原样透传"""
+    if isinstance(code, int) and 100 <= code <= 599:
+        return code
+    return 200
+
+
+class Transport:
+    """命令传输接口
+
+    post(payload, timeout, idempotent) 发送一条 mqttpost 格式的命令，返回带 status_code、json()、
+    endpoint 的响应对象；网络错误以 requests.exceptions 中的异常抛出，命令未发出时
+    request_not_sent(exc) 为真，调用方据此决定能否安全重试或加入离线队列。
+    按设备分片的传输（lock_sharding）由多个独立分区组成，未分片的传输只有一个分区 ''
+    """
+
+    name = 'base'
+
+    def post(self, payload, timeout=10, idempotent=False):
+        raise NotImplementedError
+
+    def partition_of(self, mac):
+        """设备所在的分区；批量任务按分区各开一条发送流水线"""
+        return ''
+
+    def partitions(self):
+        """{分区: 该分区的传输}；不带MAC的请求（如变更查询）需逐个分区发送"""
+        return {'': self}
+
+    def close(self):
+        pass
+
+
+def transport_from_env(pool, session=None, hedging=None):
+    """LOCK_TRANSPORT=mqtt 时使用 LOCK_MQTT_URL 指向的 broker，=sim 时使用虚拟门锁群，否则使用 HTTP"""
+    kind = os.environ.get('LOCK_TRANSPORT', 'http')
+    if kind == 'mqtt':
+        import lock_mqtt
+        return lock_mqtt.MqttTransport(os.environ.get('LOCK_MQTT_URL', 'mqtt://127.0.0.1:1883'))
+    if kind == 'sim':
+        import lock_simulator
+        return lock_simulator.SimulatorTransport(lock_simulator.Simulator.from_env())
+    return HttpTransport(pool, session, hedging=hedging)
+
+
+def request_not_sent(exc):
+    """判断异常是否发生在请求发出之前（此时即使是开锁命令也可以安全换节点重试）"""
+    if isinstance(exc, (requests.exceptions.ConnectTimeout, CommandNotSent)):
+        return True
+    reason = getattr(exc.args[0], 'reason', None) if exc.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+# 对冲线程池大小：每个并发调用方最多同时占用两个线程（主请求+对冲），按批量默认并发32计
+HEDGE_WORKERS = 64
+
+
+class HedgingPolicy:
+    """对冲策略：超过已观测的P95仍无响应时补发一次，额外负载受预算限制"""
+
+    def __init__(self, budget_percent=5.0, quantile=95, initial_delay=1.0,
+                 min_delay=0.02, min_samples=20, burst=10.0):
+        self.ratio = budget_percent / 100.0
+        self.quantile = quantile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.burst = burst
+        self.tokens = burst
+        self.latency = lock_metrics.Histogram()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """LOCK_HEDGE_BUDGET：对冲额外负载上限（百分比，默认5，设为0关闭）"""
+        budget = float(os.environ.get('LOCK_HEDGE_BUDGET', '5'))
+        return cls(budget_percent=budget) if budget > 0 else None
+
+    def on_request(self):
+        """每个主请求为预算积累 ratio 个令牌"""
+        with self._lock:
+            self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def try_acquire(self):
+        with self._lock:
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return True
+            return False
+
+    def observe(self, seconds):
+        self.latency.observe(seconds)
+
+    def delay(self):
+        """发出对冲请求前的等待时间"""
+        if self.latency.count < self.min_samples:
+            return self.initial_delay
+        return max(self.min_delay, self.latency.percentile(self.quantile))
+
+
+class HttpTransport(Transport):
+    """基于 requests.Session 的 HTTP 传输，支持多节点故障切换与对冲请求"""
+
+    name = 'http'
+
+    def __init__(self, pool, session=None, headers=None, max_attempts=3, hedging=None,
+                 hedge_workers=HEDGE_WORKERS):
+        self.pool = pool
+        self.session = session or create_session()
+        self.headers = headers or DEFAULT_HEADERS
+        self.max_attempts = max_attempts
+        self.hedging = hedging
+        self.hedge_workers = hedge_workers
+        self._executor = None
+
+    def post(self, payload, timeout=10, idempotent=False):
+        """发送一条命令，返回 requests.Response（response.endpoint 为实际使用的地址）
+
+        连接失败时总是换节点重试；幂等命令（状态查询）在读取超时或5xx时也会重试，
+        配置了 hedging 时幂等命令改走对冲路径；开锁等非幂等命令从不对冲。
+        当前命令带 Deadline（lock_deadline）时，重试前检查截止时间，取消时立即断开在途请求
+        """
+        deadline = lock_deadline.current()
+        if idempotent and self.hedging is not None:
+            return self._post_hedged(payload, timeout, deadline)
+        tried = []
+        attempts = min(self.max_attempts, len(self.pool.endpoints))
+        for attempt in range(attempts):
+            last_attempt = attempt == attempts - 1
+            # 每次（重）试前检查截止时间和取消，超时按剩余时间收紧
+            attempt_timeout = timeout
+            if deadline is not None:
+                deadline.check()
+                attempt_timeout = deadline.clamp(timeout)
+            endpoint = self.pool.choose(exclude=tried)
+            tried.append(endpoint)
+            start = time.perf_counter()
+            scope = AbortScope()
+            try:
+                with scope, lock_deadline.watch(deadline, scope.abort):
+                    response = self.session.post(endpoint.url, headers=self.headers,
+                                                 json=payload, timeout=attempt_timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if deadline is not None and deadline.done:
+                    # 被取消或截止时间到：不计为节点故障
+                    self.pool.release(endpoint, time.perf_counter() - start)
+                    if deadline.cancelled:
+                        raise lock_deadline.Cancelled(deadline.reason or "命令已取消") from e
+                    raise
+                self.pool.record(endpoint, time.perf_counter() - start, False)
+                if last_attempt or not (idempotent or request_not_sent(e)):
+                    raise
+                continue
+            ok = response.status_code < 500
+            self.pool.record(endpoint, time.perf_counter() - start, ok)
+            response.endpoint = endpoint.url
+            if ok or not idempotent or last_attempt:
+                return response
+        raise RuntimeError("没有可用的服务器地址")
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        self.session.close()
+
+    def _attempt(self, endpoint, payload, timeout, scope, trace, started):
+        """在线程池中执行单次请求；被中止的请求不计为节点故障"""
+        started.set()
+        trace.activate()
+        start = time.perf_counter()
+        try:
+            with scope:
+                response = self.session.post(endpoint.url, headers=self.headers,
+                                             json=payload, timeout=timeout)
+        except Exception:
+            if scope.aborted:
+                self.pool.release(endpoint, time.perf_counter() - start)
+            else:
+                self.pool.record(endpoint, time.perf_counter() - start, False)
+            raise
+        finally:
+            trace.deactivate()
+        elapsed = time.perf_counter() - start
+        ok = response.status_code < 500
+        self.pool.record(endpoint, elapsed, ok)
+        if ok:
+            self.hedging.observe(elapsed)
+        response.endpoint = endpoint.url
+        return response
+
+    def _post_hedged(self, payload, timeout, deadline=None):
+        if deadline is not None:
+            deadline.check()
+            timeout = deadline.clamp(timeout)
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.hedge_workers, thread_name_prefix='hedge')
+        trace = current_trace() or NULL_TRACE
+        self.hedging.on_request()
+        attempts = {}
+        tried = []
+
+        def launch():
+            endpoint = self.pool.choose(exclude=tried)
+            tried.append(endpoint)
+            scope = AbortScope()
+            if deadline is not None:
+                deadline.register(scope.abort)
+            started = threading.Event()
+            future = self._executor.submit(self._attempt, endpoint, payload, timeout, scope, trace, started)
+            future.started = started
+            attempts[future] = scope
+            return future
+
+        try:
+            return self._race(launch, attempts, tried, trace, deadline)
+        finally:
+            if deadline is not None:
+                for scope in attempts.values():
+                    deadline.unregister(scope.abort)
+
+    def _race(self, launch, attempts, tried, trace, deadline):
+        primary = launch()
+        # 对冲计时从主请求真正开始执行时算起，线程池中排队的时间不计入（否则排队会直接触发对冲）；
+        # 排队期间被取消或到期的命令撤出线程池，不再发出
+        with lock_deadline.watch(deadline, primary.started.set):
+            primary.started.wait(None if deadline is None else deadline.remaining())
+        if deadline is not None and deadline.done and primary.cancel():
+            deadline.check()
+        done, _ = wait([primary], timeout=self.hedging.delay())
+        if not done and not (deadline is not None and deadline.done):
+            if self.hedging.try_acquire():
+                HEDGES_ISSUED.inc()
+                trace.add_span('hedge', trace.mark())
+                launch()
+            else:
+                HEDGES_BUDGET_EXHAUSTED.inc()
+
+        pending = set(attempts)
+        failures = []
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None and future.result().status_code < 500:
+                    # 取得首个成功响应后立即中止其余请求
+                    for other in pending:
+                        attempts[other].abort()
+                    if len(attempts) > 1:
+                        (HEDGES_PRIMARY_WON if future is primary else HEDGES_HEDGE_WON).inc()
+                    return future.result()
+                failures.append(future)
+            # 主请求快速失败时立即补发一次（属于重试，不占对冲预算）
+            if not pending and len(attempts) < 2 and len(self.pool.endpoints) > 1:
+                if deadline is not None and deadline.done:
+                    break
+                pending.add(launch())
+        if deadline is not None and deadline.cancelled:
+            deadline.check()
+        last = failures[-1]
+        if last.exception() is not None:
+            raise last.exception()
+        return last.result()
@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+开锁并确认
+开锁应答（2B）只说明网关收到了命令，不说明门已经打开。UnlockVerifier 发出开锁后按自适应的间隔
+查询状态，一旦查到"已开锁"就结束，给出一个合并的结果和总耗时：
+    confirmed     状态查询确认已开锁
+    unconfirmed   确认窗口内状态一直不是开锁（卡住、应答丢失、已自动上锁等）
+    queued / cancelled / expired   开锁没有发出（与 lock_core 的结果相同），不查询
+开锁应答超时或出错时照样查询：命令可能已经执行，确认能消除这种不确定。
+
+查询时间表（PollSchedule）从已确认的设备学习"开锁应答 → 门打开"耗时的均值和离散程度（EWMA）：
+第一次查询安排在均值减一个离散度处，之后以离散度的一半为起步间隔、按 factor 递增（不超过 max_interval），
+门通常打开的时段内查询较密，迟迟不开的设备查询逐渐变疏；整个确认窗口不超过 window（应小于门锁自动上锁的时间）。
+批量（run_bulk）时所有设备的开锁和查询在一个线程池（按设备分片时每个分片一个）中流水线执行：等待下一次查询的设备不占线程，
+到期的查询优先于新的开锁。开锁到确认的耗时计入 lock_unlock_confirm_seconds 直方图：
+
+    python lock_verify.py --file macs.txt --workers 64 --output verify.json
+    LOCK_TRANSPORT=sim LOCK_SIM_ACTUATION=0.8 python lock_verify.py --devices 5000
+"""
+
+import argparse
+import heapq
+import json
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import lock_core
+import lock_deadline
+import lock_fleet
+import lock_metrics
+
+CONFIRMED = 'confirmed'
+UNCONFIRMED = 'unconfirmed'
+
+# 开锁未发出，不需要确认
+NOT_SENT = (lock_core.QUEUED, lock_core.CANCELLED, lock_core.EXPIRED)
+
+VERIFIED_TOTAL = lock_metrics.REGISTRY.counter(
+    'lock_verified_unlocks_total', '开锁并确认（confirmed/unconfirmed/未发出）', ('result',))
+CONFIRM_SECONDS = lock_metrics.REGISTRY.histogram(
+    'lock_unlock_confirm_seconds', '从发出开锁到查询确认已开锁的耗时', ()).labels()
+
+# 报告中直方图的桶边界（秒）
+REPORT_BOUNDS = (0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0)
+
+
+class PollSchedule:
+    """确认查询的时间表，首次等待时间从已确认的设备学习；可在多个设备、多次调用间共享"""
+
+    def __init__(self, initial=0.3, spread=0.2, factor=1.5, min_interval=0.05, max_interval=1.0, window=4.0,
+                 alpha=0.1):
+        self.expected = initial
+        self.spread = spread
+        self.factor = factor
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.window = window
+        self.alpha = alpha
+        self._lock = threading.Lock()
+
+    def _clamp(self, delay):
+        return max(self.min_interval, min(self.max_interval, delay))
+
+    def first_delay(self):
+        return self._clamp(self.expected - self.spread)
+
+    def next_delay(self, attempt):
+        """第 attempt 次（从1起）未确认之后的等待时间"""
+        return self._clamp(self.spread / 2 * self.factor ** (attempt - 1))
+
+    def learn(self, actuation):
+        """actuation：开锁应答之后到门打开的估计耗时（秒）"""
+        with self._lock:
+            error = actuation - self.expected
+            self.expected += self.alpha * error
+            self.spread += self.alpha * (abs(error) - self.spread)
+
+
+class VerifiedUnlock:
+    """一次开锁并确认的合并结果"""
+
+    __slots__ = ('mac', 'result', 'unlock', 'status', 'polls', 'confirmed_after', 'elapsed', 'error')
+
+    def __init__(self, mac):
+        self.mac = mac
+        self.result = UNCONFIRMED
+        self.unlock = None           # 开锁的 CommandResult
+        self.status = None           # 最后一次查询的 CommandResult
+        self.polls = 0
+        self.confirmed_after = None  # 发出开锁到确认的秒数
+        self.elapsed = 0.0
+        self.error = None
+
+    @property
+    def ok(self):
+        return self.result == CONFIRMED
+
+    @classmethod
+    def from_dict(cls, data):
+        """to_dict 的逆过程（如来自引擎进程的结果）"""
+        outcome = cls(data.get('mac'))
+        outcome.result = data.get('result', UNCONFIRMED)
+        outcome.polls = data.get('polls', 0)
+        if data.get('confirm_ms') is not None:
+            outcome.confirmed_after = data['confirm_ms'] / 1000.0
+        outcome.elapsed = data.get('elapsed_ms', 0) / 1000.0
+        outcome.error = data.get('error')
+        return outcome
+
+    def to_dict(self):
+        result = {'mac': self.mac, 'result': self.result,
+                  'unlock': self.unlock.result if self.unlock else None,
+                  'polls': self.polls,
+                  'confirm_ms': None if self.confirmed_after is None else round(self.confirmed_after * 1000, 2),
+                  'elapsed_ms': round(self.elapsed * 1000, 2)}
+        if self.error:
+            result['error'] = self.error
+        return result
+
+
+class _Verification:
+    """一台设备的确认过程；on_* 返回下一次查询的时刻（perf_counter），None 表示已结束"""
+
+    def __init__(self, mac, schedule, protocol):
+        self.outcome = VerifiedUnlock(mac)
+        self.schedule = schedule
+        self.protocol = protocol
+        self.started = time.perf_counter()
+        self.replied = None
+        self.last_locked = None      # 最近一次查到"未开锁"的时刻
+        self.delay = None
+
+    def unlock(self, core, deadline, **kwargs):
+        self.started = time.perf_counter()
+        return self.on_unlock(core.command(self.outcome.mac, 'unlock', deadline=deadline, **kwargs))
+
+    def poll(self, core, deadline):
+        sent_at = time.perf_counter()
+        return self.on_status(core.command(self.outcome.mac, 'status', deadline=deadline), sent_at)
+
+    def on_unlock(self, result):
+        self.outcome.unlock = result
+        if result.result in NOT_SENT:
+            return self.finish(result.result)
+        self.replied = self.last_locked = time.perf_counter()
+        self.delay = self.schedule.first_delay()
+        return self._next(self.replied)
+
+    def on_status(self, result, sent_at):
+        outcome = self.outcome
+        outcome.status = result
+        outcome.polls += 1
+        if result.result == lock_core.CANCELLED:
+            return self.finish(lock_core.CANCELLED)
+        if result.result == lock_core.EXPIRED:
+            # 截止时间已到，查询没有发出
+            return self.finish(UNCONFIRMED)
+        # 设备状态约在请求往返的中点被读取
+        observed = sent_at + result.elapsed / 2
+        state = lock_fleet.status_from_frame(result.parsed, self.protocol).get('state')
+        if state == lock_fleet.STATE_UNLOCKED:
+            outcome.confirmed_after = time.perf_counter() - self.started
+            # 门在上一次"未开锁"与本次之间打开，取中点
+            self.schedule.learn((self.last_locked + observed) / 2 - self.replied)
+            CONFIRM_SECONDS.observe(outcome.confirmed_after)
+            return self.finish(CONFIRMED)
+        if state == lock_fleet.STATE_LOCKED:
+            self.last_locked = observed
+        self.delay = self.schedule.next_delay(outcome.polls)
+        return self._next(time.perf_counter())
+
+    def _next(self, now):
+        due = now + self.delay
+        if due > self.replied + self.schedule.window:
+            return self.finish(UNCONFIRMED)
+        return due
+
+    def fail(self, error):
+        self.outcome.error = str(error)
+        return self.finish(UNCONFIRMED if self.outcome.unlock else lock_core.ERROR)
+
+    def finish(self, result):
+        self.outcome.result = result
+        self.outcome.elapsed = time.perf_counter() - self.started
+        VERIFIED_TOTAL.inc(result)
+        return None
+
+
+class UnlockVerifier:
+    """开锁并确认；单台用 verify，多台用 run_bulk。查询时间表在各次调用间共享学习"""
+
+    def __init__(self, core, schedule=None):
+        self.core = core
+        self.schedule = schedule if schedule is not None else PollSchedule()
+
+    def _verification(self, mac):
+        return _Verification(mac, self.schedule, self.core.protocol_for(mac))
+
+    def verify(self, mac, deadline=None, **kwargs):
+        """在调用线程上完成一台设备的开锁和确认；deadline 同时限制开锁和查询，
+        其余参数（enqueued_at、trace、on_progress）交给开锁命令的 LockCore.execute"""
+        job = self._verification(mac)
+        due = job.unlock(self.core, deadline, **kwargs)
+        woken = threading.Event()
+        while due is not None:
+            wait = due - time.perf_counter()
+            if wait > 0:
+                with lock_deadline.watch(deadline, woken.set):
+                    woken.wait(wait)
+            due = job.poll(self.core, deadline)
+        return job.outcome
+
+    def run_bulk(self, macs, workers=32, on_result=None, deadline=None):
+        """对一组设备开锁并确认，返回与 macs 同序的 VerifiedUnlock 列表；
+        workers 为同时在途的请求数（开锁和查询合计；按设备分片时为每个分片的数量），
+        deadline.cancel() 取消整个任务"""
+        if deadline is None:
+            deadline = lock_deadline.Deadline()
+        jobs = [self._verification(mac) for mac in macs]
+        groups = self.core.partition_indexes(macs)
+        if len(groups) <= 1:
+            self._dispatch(jobs, workers, on_result, deadline)
+            return [job.outcome for job in jobs]
+        # 每个分片一条独立的流水线
+        threads = [threading.Thread(target=self._dispatch, name='verify-shard', daemon=True,
+                                    args=([jobs[index] for index in indexes], workers, on_result, deadline))
+                   for indexes in groups]
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        except BaseException:
+            deadline.cancel("批量确认已中断")
+            raise
+        return [job.outcome for job in jobs]
+
+    def _dispatch(self, jobs, workers, on_result, deadline):
+        """在一个线程池中流水线执行 jobs 的开锁和查询"""
+        cond = threading.Condition()
+        due = []                 # (查询时刻, 序号)
+        state = {'inflight': 0, 'finished': 0}
+
+        def done(index, next_due):
+            with cond:
+                state['inflight'] -= 1
+                if next_due is None:
+                    state['finished'] += 1
+                else:
+                    heapq.heappush(due, (next_due, index))
+                cond.notify()
+            if next_due is None and on_result:
+                on_result(jobs[index].outcome)
+
+        def step(index, first):
+            job = jobs[index]
+            try:
+                next_due = job.unlock(self.core, deadline) if first else job.poll(self.core, deadline)
+            except Exception as e:
+                next_due = job.fail(e)
+            done(index, next_due)
+
+        def wake():
+            with cond:
+                cond.notify()
+
+        started = 0
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='verify') as executor, \
+                deadline.watch(wake):
+            try:
+                with cond:
+                    while state['finished'] < len(jobs):
+                        if state['inflight'] < workers:
+                            now = time.perf_counter()
+                            # 到期的查询优先；取消后立即派发，由命令核心以 cancelled 结束
+                            if due and (due[0][0] <= now or deadline.done):
+                                state['inflight'] += 1
+                                executor.submit(step, heapq.heappop(due)[1], False)
+                                continue
+                            if started < len(jobs):
+                                state['inflight'] += 1
+                                executor.submit(step, started, True)
+                                started += 1
+                                continue
+                            cond.wait(due[0][0] - now if due else None)
+                        else:
+                            cond.wait()
+            except BaseException:
+                deadline.cancel("批量确认已中断")
+                raise
+
+
+def summarize(results, bounds=REPORT_BOUNDS):
+    """各结果计数、确认耗时分位数和直方图（每个桶：不超过 le 秒的确认数，非累计）"""
+    histogram = lock_metrics.Histogram()
+    for outcome in results:
+        if outcome.confirmed_after is not None:
+            histogram.observe(outcome.confirmed_after)
+    snap = histogram.snapshot()
+    buckets, previous = [], 0
+    for bound, seen in histogram.cumulative(bounds, snapshot=snap):
+        buckets.append({'le': 'inf' if bound == float('inf') else bound, 'count': seen - previous})
+        previous = seen
+    summary = {
+        'devices': len(results),
+        'results': dict(Counter(outcome.result for outcome in results)),
+        'polls': sum(outcome.polls for outcome in results),
+        'time_to_confirmed': {},
+        'histogram': buckets,
+    }
+    if snap[1]:
+        summary['time_to_confirmed'] = {
+            f"p{q}_ms": round(histogram.percentile(q, snap) * 1000, 1) for q in (50, 90, 99)}
+        summary['time_to_confirmed']['max_ms'] = round(snap[3] / 1000, 1)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='批量开锁并确认')
+    parser.add_argument('macs', nargs='*')
+    parser.add_argument('--file', help='每行一个 MAC')
+    parser.add_argument('--devices', type=int, default=0, help='不给 MAC 时生成该数量的设备（配合 LOCK_TRANSPORT=sim）')
+    parser.add_argument('--server', default=lock_core.DEFAULT_SERVER_URL)
+    parser.add_argument('--workers', type=int, default=32)
+    parser.add_argument('--timeout', type=float, default=10)
+    parser.add_argument('--deadline', type=float, help='整个任务的截止时间（秒）')
+    parser.add_argument('--window', type=float, default=4.0, help='开锁应答后最多确认多久（秒）')
+    parser.add_argument('--results', action='store_true', help='逐台输出结果（JSON lines，写到标准错误）')
+    parser.add_argument('--output', help='汇总写入 JSON 文件（默认打印）')
+    args = parser.parse_args()
+    macs = list(args.macs)
+    if args.file:
+        with open(args.file, 'r', encoding='utf-8') as f:
+            macs += [line.strip() for line in f if line.strip()]
+    if not macs:
+        macs = [f"86970107{i:07d}" for i in range(args.devices)]
+    if not macs:
+        parser.error('需要 MAC、--file 或 --devices')
+
+    core = lock_core.LockCore(args.server, timeout=args.timeout)
+    verifier = UnlockVerifier(core, PollSchedule(window=args.window))
+    on_result = None
+    if args.results:
+        on_result = lambda outcome: print(json.dumps(outcome.to_dict(), ensure_ascii=False), file=sys.stderr)
+    wall = time.perf_counter()
+    try:
+        results = verifier.run_bulk(macs, workers=args.workers, on_result=on_result,
+                                    deadline=lock_deadline.Deadline(args.deadline))
+    finally:
+        core.close()
+    wall = time.perf_counter() - wall
+    report = summarize(results)
+    report['workers'] = args.workers
+    report['duration_s'] = round(wall, 3)
+    report['learned_actuation_ms'] = round(verifier.schedule.expected * 1000, 1)
+    report['learned_spread_ms'] = round(verifier.schedule.spread * 1000, 1)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    print(text)
+    sys.exit(0 if report['results'].get(CONFIRMED, 0) == len(results) else 1)
+
+
+if __name__ == '__main__':
+    main()
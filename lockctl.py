@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+门锁命令行
+    lockctl.py unlock <MAC>
+    lockctl.py status <MAC> [<MAC> ...]
+    lockctl.py bulk --command status --file macs.txt
+    lockctl.py verify --file macs.txt                  开锁并查询确认，汇总（含确认耗时直方图）写到标准错误
+    lockctl.py stream --command status < macs.txt     每行一个 MAC 或 {"mac": ..., "command": ...}
+    lockctl.py get <MAC>                               （仅 --daemon）状态表中的该设备
+结果逐行输出为 JSON；有命令失败时退出码为 1。--deadline 秒数限定整个任务的截止时间，本进程执行时 Ctrl-C 取消任务。
+默认在本进程内运行命令核心（lock_core）；--daemon http://127.0.0.1:8765/ 或 --daemon unix:/path/lockd.sock
+时交给 lockd.py 执行（共用它的离线队列、审计日志和状态表）
+"""
+
+import argparse
+import http.client
+import json
+import socket
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import lock_core
+import lock_deadline
+import lock_verify
+
+STREAM_CHUNK = 500
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """经 Unix 套接字的 HTTP 连接"""
+
+    def __init__(self, path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.unix_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_path)
+
+
+class DaemonClient:
+    """lockd 的接口客户端（单连接，非线程安全）"""
+
+    def __init__(self, address, timeout=600):
+        if address.startswith('unix:'):
+            self.conn = UnixHTTPConnection(address[len('unix:'):], timeout=timeout)
+            self.prefix = ''
+        else:
+            parts = urlsplit(address)
+            self.conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=timeout)
+            self.prefix = parts.path.rstrip('/')
+
+    def request(self, method, path, body=None):
+        data = None if body is None else json.dumps(body, ensure_ascii=False).encode('utf-8')
+        headers = {'Content-Type': 'application/json'} if data is not None else {}
+        self.conn.request(method, self.prefix + path, data, headers)
+        response = self.conn.getresponse()
+        payload = json.loads(response.read() or b'{}')
+        if response.status != 200:
+            raise RuntimeError(f"lockd HTTP {response.status}: {payload.get('error', payload)}")
+        return payload
+
+    def command(self, mac, name, deadline=None):
+        return self.request('POST', '/command', {'mac': mac, 'command': name, 'deadline': deadline})
+
+    def bulk(self, macs, name, workers, deadline=None):
+        return self.request('POST', '/bulk', {'macs': macs, 'command': name, 'workers': workers,
+                                              'deadline': deadline})['results']
+
+    def verify(self, macs, workers, deadline=None):
+        return self.request('POST', '/verify', {'macs': macs, 'workers': workers, 'deadline': deadline})
+
+    def close(self):
+        self.conn.close()
+
+
+class Output:
+    """逐行输出 JSON，统计失败数"""
+
+    def __init__(self, stream=sys.stdout):
+        self.stream = stream
+        self.failed = 0
+        self._lock = threading.Lock()
+
+    def write(self, result):
+        with self._lock:
+            if result.get('result') not in (lock_core.SUCCESS, lock_core.COMPLETED, lock_verify.CONFIRMED):
+                self.failed += 1
+            self.stream.write(json.dumps(result, ensure_ascii=False) + '\n')
+            self.stream.flush()
+
+
+def read_macs(args):
+    macs = list(args.macs)
+    if args.file:
+        with open(args.file, 'r', encoding='utf-8') as f:
+            macs += [line.strip() for line in f if line.strip()]
+    return macs
+
+
+def parse_line(line, default_command):
+    line = line.strip()
+    if not line:
+        return None
+    if line.startswith('{'):
+        item = json.loads(line)
+        return item['mac'], item.get('command', default_command)
+    return line, default_command
+
+
+def stream_local(core, lines, default_command, workers, output, deadline=None):
+    """边读边发：在途命令不超过 2*workers，读入速度随发送速度调节；deadline 为整个任务的截止时间"""
+    slots = threading.BoundedSemaphore(workers * 2)
+
+    def one(mac, name):
+        try:
+            output.write(core.command(mac, name, deadline=deadline).to_dict())
+        except Exception as e:
+            output.write({'mac': mac, 'result': lock_core.ERROR, 'error': str(e)})
+        finally:
+            slots.release()
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='stream') as executor:
+        try:
+            for line in lines:
+                item = parse_line(line, default_command)
+                if item is None:
+                    continue
+                slots.acquire()
+                executor.submit(one, *item)
+        except BaseException:
+            if deadline is not None:
+                deadline.cancel("任务已中断")
+            raise
+
+
+def stream_daemon(client, lines, default_command, workers, output, deadline=None):
+    """按命令名分组，每 STREAM_CHUNK 条交给 lockd 批量执行；各批带上整个任务的剩余时间"""
+    chunks = {}
+
+    def remaining():
+        return None if deadline is None else deadline.remaining()
+
+    for line in lines:
+        item = parse_line(line, default_command)
+        if item is None:
+            continue
+        mac, name = item
+        chunk = chunks.setdefault(name, [])
+        chunk.append(mac)
+        if len(chunk) >= STREAM_CHUNK:
+            for result in client.bulk(chunk, name, workers, remaining()):
+                output.write(result)
+            chunk.clear()
+    for name, chunk in chunks.items():
+        if chunk:
+            for result in client.bulk(chunk, name, workers, remaining()):
+                output.write(result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='门锁命令行')
+    parser.add_argument('--daemon', help='lockd 地址（http://host:port/ 或 unix:/path），不指定时在本进程执行')
+    parser.add_argument('--server', default=lock_core.DEFAULT_SERVER_URL, help='门锁服务器地址（本进程执行时）')
+    parser.add_argument('--data-dir', help='本进程执行时打开该目录下的离线队列和审计日志')
+    parser.add_argument('--workers', type=int, default=32)
+    parser.add_argument('--timeout', type=float, default=10)
+    parser.add_argument('--deadline', type=float, help='整个任务的截止时间（秒），到期未发出的命令不再发送')
+    parser.add_argument('--verbose', action='store_true', help='把每条命令的日志打印到标准错误')
+    sub = parser.add_subparsers(dest='action', required=True)
+    unlock = sub.add_parser('unlock', help='开锁')
+    unlock.add_argument('macs', nargs=1)
+    status = sub.add_parser('status', help='查询状态')
+    status.add_argument('macs', nargs='+')
+    bulk = sub.add_parser('bulk', help='对一组设备执行同一命令')
+    bulk.add_argument('macs', nargs='*')
+    bulk.add_argument('--file', help='每行一个 MAC')
+    bulk.add_argument('--command', default='status')
+    verify = sub.add_parser('verify', help='开锁并查询确认门已打开')
+    verify.add_argument('macs', nargs='*')
+    verify.add_argument('--file', help='每行一个 MAC')
+    stream = sub.add_parser('stream', help='从标准输入逐行读取命令')
+    stream.add_argument('--command', default='status', help='行中未指定命令时使用')
+    get = sub.add_parser('get', help='读取 lockd 状态表中的设备')
+    get.add_argument('mac')
+    args = parser.parse_args()
+
+    output = Output()
+    if args.daemon:
+        client = DaemonClient(args.daemon)
+        try:
+            if args.action == 'get':
+                print(json.dumps(client.request('GET', f"/status/{args.mac}"), ensure_ascii=False))
+            elif args.action == 'stream':
+                stream_daemon(client, sys.stdin, args.command, args.workers, output,
+                              lock_deadline.Deadline(args.deadline))
+            elif args.action == 'verify':
+                reply = client.verify(read_macs(args), args.workers, args.deadline)
+                for result in reply['results']:
+                    output.write(result)
+                print(json.dumps(reply['summary'], ensure_ascii=False), file=sys.stderr)
+            else:
+                name = args.command if args.action == 'bulk' else args.action
+                macs = read_macs(args) if args.action == 'bulk' else args.macs
+                for result in client.bulk(macs, name, args.workers, args.deadline):
+                    output.write(result)
+        except (OSError, RuntimeError) as e:
+            parser.exit(2, f"{e}\n")
+        finally:
+            client.close()
+    else:
+        if args.action == 'get':
+            parser.error('get 需要 --daemon')
+        log = (lambda message: print(message, file=sys.stderr)) if args.verbose else None
+        core = lock_core.LockCore(args.server, timeout=args.timeout, log=log)
+        if args.data_dir:
+            core.open(args.data_dir)
+        try:
+            if args.action == 'stream':
+                stream_local(core, sys.stdin, args.command, args.workers, output,
+                             lock_deadline.Deadline(args.deadline))
+            elif args.action == 'verify':
+                results = lock_verify.UnlockVerifier(core).run_bulk(
+                    read_macs(args), workers=args.workers, on_result=lambda r: output.write(r.to_dict()),
+                    deadline=lock_deadline.Deadline(args.deadline))
+                print(json.dumps(lock_verify.summarize(results), ensure_ascii=False), file=sys.stderr)
+            else:
+                name = args.command if args.action == 'bulk' else args.action
+                macs = read_macs(args) if args.action == 'bulk' else args.macs
+                # Ctrl-C 取消整个任务：在途请求立即中止，未发出的命令不再发送
+                core.run_bulk(macs, name, workers=args.workers, on_result=lambda r: output.write(r.to_dict()),
+                              deadline=lock_deadline.Deadline(args.deadline))
+        finally:
+            core.close()
+    sys.exit(1 if output.failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+门锁后台服务
+无界面运行命令核心（lock_core），不导入 Kivy，适合服务器/定时任务；经本地 HTTP（默认 127.0.0.1:8765）
+或 Unix 套接字（--socket）提供接口：
+    POST /command        {"mac": "...", "command": "unlock"|"status"}          -> 命令结果
+    POST /bulk           {"macs": [...], "command": "status", "workers": 32}  -> {"results": [...], "summary": {...}}
+    POST /verify         {"macs": [...], "workers": 32}  开锁并查询确认 -> {"results": [...], "summary": {...}}
+                         以上都可带 "deadline": 秒数，到期未发出的命令以 expired 结束，不再发送或重试；
+                         参数不合法时返回 400 {"error": ...}
+    GET  /status/<mac>   状态表中的该设备
+    GET  /health
+    GET  /metrics        Prometheus 文本格式
+离线命令队列、审计日志、定时任务和状态快照保存在 --data-dir；命令行客户端见 lockctl.py
+"""
+
+import argparse
+import json
+import math
+import os
+import signal
+import socketserver
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import lock_core
+import lock_deadline
+import lock_metrics
+import lock_profiler
+import lock_protocol
+import lock_snapshot
+import lock_verify
+
+DEFAULT_PORT = 8765
+DEFAULT_DATA_DIR = os.path.join(os.path.expanduser('~'), '.lockd')
+MAX_BULK = 100000
+MAX_WORKERS = 1024
+SNAPSHOT_INTERVAL = 60.0
+
+
+class BadRequest(ValueError):
+    """请求参数不合法，返回 400"""
+
+
+def request_deadline(body):
+    """请求体中的 deadline（秒），从收到请求时算起"""
+    deadline = body.get('deadline')
+    if deadline is None:
+        return None
+    try:
+        seconds = float(deadline)
+    except (TypeError, ValueError):
+        raise BadRequest(f"deadline 应为秒数: {deadline!r}")
+    if not math.isfinite(seconds) or seconds < 0:
+        raise BadRequest(f"deadline 应为非负秒数: {deadline!r}")
+    return lock_deadline.Deadline(seconds)
+
+
+def request_workers(body, default):
+    workers = body.get('workers', default)
+    try:
+        value = int(workers)
+    except (TypeError, ValueError):
+        raise BadRequest(f"workers 应为整数: {workers!r}")
+    if not 1 <= value <= MAX_WORKERS:
+        raise BadRequest(f"workers 应在 1~{MAX_WORKERS} 之间: {workers!r}")
+    return value
+
+
+def request_macs(body):
+    macs = body.get('macs') or []
+    if not isinstance(macs, list) or not all(isinstance(mac, str) and mac for mac in macs):
+        raise BadRequest("macs 应为 MAC 字符串列表")
+    return macs
+
+
+class LockdHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'lockd/1.0'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type='application/json; charset=utf-8'):
+        data = body if isinstance(body, bytes) else json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        core = self.server.core
+        path = self.path.split('?', 1)[0]
+        if path == '/health':
+            self._send(200, {'ok': True, 'devices': len(core.fleet),
+                             'pending': core.outbox.pending_count() if core.outbox else 0})
+        elif path == '/metrics':
+            self._send(200, lock_metrics.REGISTRY.render_prometheus().encode('utf-8'),
+                       'text/plain; version=0.0.4; charset=utf-8')
+        elif path.startswith('/status/'):
+            status = core.fleet.get(path[len('/status/'):])
+            if status is None:
+                self._send(404, {'error': '没有该设备的状态'})
+            else:
+                self._send(200, status.to_dict())
+        else:
+            self._send(404, {'error': 'not found'})
+
+    def do_POST(self):
+        core = self.server.core
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'{}')
+        except ValueError:
+            self._send(400, {'error': 'bad json'})
+            return
+        if not isinstance(body, dict):
+            self._send(400, {'error': '请求体应为 JSON 对象'})
+            return
+        path = self.path.split('?', 1)[0]
+        try:
+            if path == '/command':
+                if not body.get('mac') or not isinstance(body['mac'], str):
+                    self._send(400, {'error': '缺少 mac'})
+                    return
+                result = core.command(body['mac'], body.get('command', 'status'), deadline=request_deadline(body))
+                self._send(200, result.to_dict())
+            elif path == '/bulk':
+                macs = request_macs(body)
+                if len(macs) > MAX_BULK:
+                    self._send(413, {'error': f"单次最多 {MAX_BULK} 台设备"})
+                    return
+                results = core.run_bulk(macs, body.get('command', 'status'),
+                                        workers=request_workers(body, self.server.workers),
+                                        deadline=request_deadline(body))
+                self._send(200, {'results': [result.to_dict() for result in results],
+                                 'summary': dict(Counter(result.result for result in results))})
+            elif path == '/verify':
+                macs = request_macs(body)
+                if len(macs) > MAX_BULK:
+                    self._send(413, {'error': f"单次最多 {MAX_BULK} 台设备"})
+                    return
+                results = self.server.verifier.run_bulk(macs, workers=request_workers(body, self.server.workers),
+                                                        deadline=request_deadline(body))
+                self._send(200, {'results': [result.to_dict() for result in results],
+                                 'summary': lock_verify.summarize(results)})
+            else:
+                self._send(404, {'error': 'not found'})
+        except (BadRequest, lock_protocol.ProtocolError) as e:
+            self._send(400, {'error': str(e)})
+        except Exception as e:
+            # 意外错误也要给出应答，不让客户端收到空响应
+            self._send(500, {'error': f"{type(e).__name__}: {e}"})
+
+
+class UnixLockdHandler(LockdHandler):
+    # Unix 套接字没有 TCP 选项，也没有客户端地址
+    disable_nagle_algorithm = False
+
+    def address_string(self):
+        return 'unix'
+
+
+class LockdServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, core, workers=32):
+        self.core = core
+        self.workers = workers
+        self.verifier = lock_verify.UnlockVerifier(core)
+        super().__init__(address, LockdHandler)
+
+
+class LockdUnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, core, workers=32):
+        self.core = core
+        self.workers = workers
+        self.verifier = lock_verify.UnlockVerifier(core)
+        if os.path.exists(path):
+            os.unlink(path)
+        super().__init__(path, UnixLockdHandler)
+        os.chmod(path, 0o600)
+
+
+class Lockd:
+    """核心 + 接口服务器 + 定期保存快照"""
+
+    def __init__(self, data_dir, server_url=lock_core.DEFAULT_SERVER_URL, host='127.0.0.1', port=DEFAULT_PORT,
+                 socket_path=None, workers=32, verbose=False):
+        self.data_dir = data_dir
+        self.socket_path = socket_path
+        self.core = lock_core.LockCore(server_url, log=print if verbose else None)
+        self.core.open(data_dir)
+        self.snapshot_path = os.path.join(data_dir, 'fleet.snap')
+        snapshot = lock_snapshot.Snapshot.open(self.snapshot_path)
+        if snapshot is not None:
+            try:
+                lock_snapshot.load_into(self.core.fleet, snapshot)
+                for mac, info in snapshot.registry().items():
+                    self.core.registry.add(mac, **info)
+            finally:
+                snapshot.close()
+        self.snapshot_writer = lock_snapshot.SnapshotWriter(self.snapshot_path, log=self.core.log)
+        if socket_path:
+            self.server = LockdUnixServer(socket_path, self.core, workers)
+            self.address = socket_path
+        else:
+            self.server = LockdServer((host, port), self.core, workers)
+            self.address = f"http://{host}:{self.server.server_address[1]}/"
+        self._stopped = threading.Event()
+
+    def save_snapshot(self):
+        registry = self.core.registry if self.core.registry_changed else None
+        self.snapshot_writer.save(self.core.fleet, registry)
+        self.core.registry_changed = False
+        self.core.sync.save(os.path.join(self.data_dir, 'sync.json'))
+
+    def _snapshot_loop(self):
+        while not self._stopped.wait(SNAPSHOT_INTERVAL):
+            self.save_snapshot()
+
+    def serve_forever(self):
+        threading.Thread(target=self._snapshot_loop, name='lockd-snapshot', daemon=True).start()
+        try:
+            self.server.serve_forever()
+        finally:
+            self._stopped.set()
+            self.server.server_close()
+            if self.socket_path and os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+            try:
+                self.save_snapshot()
+            finally:
+                self.core.close()
+
+    def shutdown(self):
+        # serve_forever 所在线程之外调用
+        threading.Thread(target=self.server.shutdown, daemon=True).start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='门锁后台服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--socket', help='改用 Unix 套接字（路径）')
+    parser.add_argument('--server', default=lock_core.DEFAULT_SERVER_URL, help='门锁服务器地址')
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR)
+    parser.add_argument('--workers', type=int, default=32, help='批量命令的默认并发数')
+    parser.add_argument('--verbose', action='store_true', help='打印每条命令的日志')
+    args = parser.parse_args()
+
+    daemon = Lockd(args.data_dir, args.server, args.host, args.port, args.socket, args.workers, args.verbose)
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: daemon.shutdown())
+    print(f"lockd 已启动: {daemon.address}（数据目录 {args.data_dir}）", flush=True)
+    profile = lock_profiler.start_from_env(args.data_dir, log=print)
+    try:
+        daemon.serve_forever()
+    finally:
+        if profile:
+            profile.stop()
+
+
+if __name__ == '__main__':
+    main()
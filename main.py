@@ -1,5 +1,6 @@
 import requests
 import json
+import os
 import time
 from threading import Thread
 
@@ -14,13 +15,74 @@ from kivy.uix.progressbar import ProgressBar
 from kivy.uix.gridlayout import GridLayout
 from kivy.uix.scrollview import ScrollView
 
+import lock_core
+import lock_deadline
+import lock_engine_process
+import lock_events
+import lock_metrics
+import lock_perf_overlay
+import lock_probe
+import lock_profiler
+import lock_queue
+import lock_snapshot
+import lock_sync
+import lock_tracing
+import lock_verify
+
+# 连续点击标题该次数（间隔不超过 TITLE_TAP_WINDOW 秒）切换性能浮层
+TITLE_TAPS = 5
+TITLE_TAP_WINDOW = 2.0
+# 超过该时间未更新的设备在启动后于后台刷新，每次启动最多刷新 STALE_REFRESH_LIMIT 台
+STALE_STATUS_SECONDS = 600
+STALE_REFRESH_LIMIT = 20
+SNAPSHOT_LOG_LINES = 20
+# 点击后该时间内未完成的命令不再发出/重试（含等待线程和离线前的重试）；切到后台或退出时取消未完成的命令
+COMMAND_DEADLINE = 15.0
+# 退出时等待仍在启动的引擎进程的最长时间（秒）
+ENGINE_START_WAIT = 3.0
+
 class LockControlApp(App):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.lock_mac = "869701070802882"  # 默认MAC地址
-        self.server_url = "https://svr.yefiot.com/yefiot/v1/mqttpost/"
+        self.server_url = lock_core.DEFAULT_SERVER_URL
         self.status_label = None
         self.log_text = ""
+        # 设置 LOCK_METRICS_PORT 时开启本地指标抓取端点
+        self.metrics_server = lock_metrics.start_from_env()
+        lock_metrics.register_route('/trace.json', lock_tracing.TRACER.export_chrome_json)
+        # 命令流水线、设备清单、状态表、传输和状态同步都在不依赖 Kivy 的核心中（lock_core），
+        # 界面只负责显示；离线命令队列、审计日志和定时任务在 on_start 中打开
+        self.core = lock_core.LockCore(self.server_url, log=self.add_log)
+        self.registry = self.core.registry
+        self.fleet = self.core.fleet
+        self.endpoints = self.core.endpoints
+        self.sync = self.core.sync
+        # 开锁后查询状态确认门已打开（查询时间表在各次开锁间学习）
+        self.verifier = lock_verify.UnlockVerifier(self.core)
+        self.fleet_loaded = False
+        self.snapshot_writer = None
+        # LOCK_ENGINE=process（桌面）：网络和命令引擎在独立进程中运行，本进程只渲染、读共享状态表
+        self.engine = None
+        self.engine_ready = False
+        self.engine_thread = None
+        self.engine_summary = None
+        self.stopping = False
+        if lock_engine_process.enabled():
+            self.engine = lock_engine_process.EngineProcess(
+                self.server_url, on_log=lambda message: Clock.schedule_once(lambda dt: self.add_log(message), 0))
+        # 事件推送：按MAC分发到状态表和界面，续传位置不在服务器保留范围时做一次全量同步
+        self.event_demux = lock_events.EventDemux(self.fleet, self.sync, on_reset=self.start_fleet_sync)
+        self.event_demux.subscribe(None, self.on_device_event)
+        self.events = None
+        self.fleet_label = None
+        # 性能浮层（F9 或连续点击标题），在 on_start 中安装
+        self.perf_overlay = None
+        self.title_taps = []
+        # LOCK_PROFILE=sample/alloc 时启动即开始剖析，退出时写出结果
+        self.profile = None
+        # 未完成的命令：命令名 -> 取消句柄（本进程为 Deadline，引擎进程为请求号）
+        self.active_commands = {}
         
     def build(self):
         # 主布局
@@ -34,8 +96,20 @@ class LockControlApp(App):
             height='60dp',
             color=(0.2, 0.6, 1, 1)
         )
+        title.bind(on_touch_down=self.on_title_touch)
         main_layout.add_widget(title)
         
+        # 设备汇总
+        self.fleet_label = Label(
+            text='设备: --',
+            size_hint_y=None,
+            height='30dp',
+            color=(0.7, 0.7, 0.7, 1)
+        )
+        main_layout.add_widget(self.fleet_label)
+        self.fleet_label_trigger = Clock.create_trigger(lambda dt: self.render_fleet_summary(self.fleet.summary()), 0.5)
+        self.fleet.subscribe(lambda status: self.fleet_label_trigger())
+        
         # MAC地址输入区域
         mac_layout = BoxLayout(orientation='horizontal', size_hint_y=None, height='50dp')
         mac_label = Label(text='设备MAC:', size_hint_x=0.3)
@@ -129,6 +203,17 @@ class LockControlApp(App):
         
         return main_layout
     
+    def on_title_touch(self, widget, touch):
+        """连续点击标题切换性能浮层（没有键盘的设备上使用）"""
+        if not widget.collide_point(*touch.pos) or self.perf_overlay is None:
+            return False
+        now = time.monotonic()
+        self.title_taps = [t for t in self.title_taps if now - t < TITLE_TAP_WINDOW] + [now]
+        if len(self.title_taps) >= TITLE_TAPS:
+            self.title_taps = []
+            self.perf_overlay.toggle()
+        return False
+    
     def update_status(self, message, color=(1, 1, 1, 1)):
         """更新状态显示"""
         if self.status_label:
@@ -167,85 +252,129 @@ class LockControlApp(App):
         popup_button.bind(on_press=popup.dismiss)
         popup.open()
     
-    def parse_lock_command(self, hex_string):
-        """解析门锁指令"""
-        if not hex_string.startswith('HD'):
-            return None
-        
-        return {
-            'header': hex_string[:2],
-            'command': hex_string[2:4],
-            'data': hex_string[4:-1],
-            'checksum': hex_string[-1]
-        }
-    
-    def send_lock_command(self, cmd_type, info_data):
+    def begin_command(self, name, handle):
+        """登记新命令；同类命令仍未完成时先取消（重复点击以最后一次为准）"""
+        previous = self.active_commands.get(name)
+        if previous is not None:
+            self.cancel_command(previous, "已被新的点击取代")
+        self.active_commands[name] = handle
+        return handle
+
+    def finish_command(self, handle):
+        for name, active in list(self.active_commands.items()):
+            if active is handle:
+                del self.active_commands[name]
+
+    def cancel_command(self, handle, reason):
+        if isinstance(handle, lock_deadline.Deadline):
+            handle.cancel(reason)
+        elif self.engine:
+            self.engine.cancel(handle)
+
+    def cancel_commands(self, reason):
+        """取消所有未完成的命令，释放发送线程和连接"""
+        for handle in list(self.active_commands.values()):
+            self.cancel_command(handle, reason)
+        self.active_commands.clear()
+
+    def send_lock_command(self, cmd_type, info_data, enqueued_at=None, trace=lock_tracing.NULL_TRACE,
+                          deadline=None):
         """发送门锁命令"""
-        try:
-            self.update_status("发送命令中...", (1, 1, 0, 1))
-            Clock.schedule_once(lambda dt: setattr(self.progress_bar, 'value', 30), 0)
-            
-            headers = {
-                'Content-Type': 'application/json',
-                'User-Agent': 'Mozilla/5.0 (Linux; Android 10) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Mobile Safari/537.36'
-            }
-            
-            payload = {
-                "type": "yfn03",
-                "mac": self.mac_input.text.strip(),
-                "cmd": cmd_type,
-                "sn": int(time.time()),
-                "info": info_data
-            }
-            
-            self.add_log(f"发送命令: {cmd_type}, MAC: {payload['mac']}")
-            Clock.schedule_once(lambda dt: setattr(self.progress_bar, 'value', 60), 0)
-            
-            response = requests.post(
-                self.server_url,
-                headers=headers,
-                json=payload,
-                timeout=10
-            )
-            
-            Clock.schedule_once(lambda dt: setattr(self.progress_bar, 'value', 90), 0)
-            
-            if response.status_code == 200:
-                response_data = response.json()
-                self.add_log(f"响应成功: {response_data}")
-                
-                if 'data' in response_data and response_data['data']:
-                    msg_info = response_data['data'][0].get('msg_info', '')
-                    parsed = self.parse_lock_command(msg_info)
-                    
-                    if parsed:
-                        self.add_log(f"指令解析: 命令码={parsed['command']}, 数据={parsed['data']}")
-                        
-                        # 根据响应判断操作结果
-                        if parsed['command'] == '2B':
-                            self.update_status("操作成功", (0.2, 0.8, 0.2, 1))
-                            Clock.schedule_once(lambda dt: self.show_popup("成功", "门锁操作执行成功！"), 0.1)
-                        else:
-                            self.update_status("操作完成", (0.2, 0.6, 1, 1))
-                    else:
-                        self.update_status("响应格式异常", (1, 0.6, 0.2, 1))
+        self.update_status("发送命令中...", (1, 1, 0, 1))
+
+        def progress(value):
+            callback = lambda dt: setattr(self.progress_bar, 'value', value)
+            Clock.schedule_once(trace.wrap_hop('ui_hop', callback) if value == 90 else callback, 0)
+
+        outcome = self.core.execute(self.mac_input.text.strip(), cmd_type, info_data,
+                                    enqueued_at=enqueued_at, trace=trace, on_progress=progress,
+                                    deadline=deadline)
+        self.finish_command(deadline)
+        self.show_result(outcome)
+        Clock.schedule_once(lambda dt: setattr(self.progress_bar, 'value', 0), 1)
+    
+    def send_verified_unlock(self, enqueued_at=None, trace=lock_tracing.NULL_TRACE, deadline=None):
+        """开锁并查询确认门已打开"""
+        self.update_status("发送命令中...", (1, 1, 0, 1))
+
+        def progress(value):
+            callback = lambda dt: setattr(self.progress_bar, 'value', value)
+            Clock.schedule_once(trace.wrap_hop('ui_hop', callback) if value == 90 else callback, 0)
+            if value == 90:
+                Clock.schedule_once(lambda dt: self.update_status("正在确认门锁状态...", (1, 1, 0, 1)), 0)
+
+        outcome = self.verifier.verify(self.mac_input.text.strip(), deadline=deadline, enqueued_at=enqueued_at,
+                                       trace=trace, on_progress=progress)
+        self.finish_command(deadline)
+        self.show_verified(outcome)
+        Clock.schedule_once(lambda dt: setattr(self.progress_bar, 'value', 0), 1)
+
+    def send_via_engine(self, name):
+        """交给引擎进程执行，结果回到界面线程显示；开锁同样在引擎进程中确认"""
+        if not self.engine_ready:
+            self.update_status("引擎进程启动中，请稍候", (1, 0.6, 0.2, 1))
+            return
+        self.update_status("发送命令中...", (1, 1, 0, 1))
+        self.progress_bar.value = 30
+
+        def on_result(result):
+            def show(dt):
+                self.finish_command(request_id)
+                if name == 'unlock':
+                    self.show_verified(lock_verify.VerifiedUnlock.from_dict(result))
                 else:
-                    self.update_status("无响应数据", (1, 0.6, 0.2, 1))
-            else:
-                self.add_log(f"请求失败: HTTP {response.status_code}")
-                self.update_status("请求失败", (0.8, 0.2, 0.2, 1))
-                Clock.schedule_once(lambda dt: self.show_popup("错误", f"请求失败: {response.status_code}"), 0.1)
-                
-        except requests.exceptions.Timeout:
-            self.add_log("请求超时")
+                    self.show_result(lock_core.CommandResult.from_dict(result))
+                self.progress_bar.value = 0
+            Clock.schedule_once(show, 0)
+
+        mac = self.mac_input.text.strip()
+        if name == 'unlock':
+            request_id = self.engine.verify(mac, on_result, timeout=COMMAND_DEADLINE)
+        else:
+            request_id = self.engine.command(mac, name, on_result, timeout=COMMAND_DEADLINE)
+        self.begin_command(name, request_id)
+
+    def show_verified(self, outcome):
+        """开锁并确认的结果；开锁未发出时按命令结果显示"""
+        if outcome.result == lock_verify.CONFIRMED:
+            self.update_status(f"已开锁（{outcome.confirmed_after:.1f}秒确认）", (0.2, 0.8, 0.2, 1))
+            Clock.schedule_once(lambda dt: self.show_popup("成功", "门已打开（状态已确认）"), 0.1)
+        elif outcome.result == lock_verify.UNCONFIRMED:
+            self.update_status("开锁未确认", (1, 0.6, 0.2, 1))
+            Clock.schedule_once(lambda dt: self.show_popup(
+                "未确认", f"已发送开锁命令，但 {outcome.polls} 次查询均未确认门已打开"), 0.1)
+        else:
+            self.show_result(outcome.unlock or lock_core.CommandResult.from_dict(
+                {'mac': outcome.mac, 'result': outcome.result, 'error': outcome.error}))
+    
+    def show_result(self, outcome):
+        """按命令结果更新状态栏，失败时弹窗"""
+        result = outcome.result
+        if result == lock_core.SUCCESS:
+            self.update_status("操作成功", (0.2, 0.8, 0.2, 1))
+            Clock.schedule_once(lambda dt: self.show_popup("成功", "门锁操作执行成功！"), 0.1)
+        elif result == lock_core.COMPLETED:
+            self.update_status("操作完成", (0.2, 0.6, 1, 1))
+        elif result == lock_core.BAD_FORMAT:
+            self.update_status("响应格式异常", (1, 0.6, 0.2, 1))
+        elif result == lock_core.NO_DATA:
+            self.update_status("无响应数据", (1, 0.6, 0.2, 1))
+        elif result == lock_core.HTTP_ERROR:
+            self.update_status("请求失败", (0.8, 0.2, 0.2, 1))
+            Clock.schedule_once(lambda dt: self.show_popup("错误", f"请求失败: {outcome.http_status}"), 0.1)
+        elif result == lock_core.QUEUED:
+            self.update_status("已加入离线队列", (1, 0.6, 0.2, 1))
+        elif result == lock_core.TIMEOUT:
             self.update_status("连接超时", (0.8, 0.2, 0.2, 1))
             Clock.schedule_once(lambda dt: self.show_popup("错误", "连接超时，请检查网络"), 0.1)
-        except Exception as e:
-            self.add_log(f"错误: {str(e)}")
+        elif result == lock_core.CANCELLED:
+            self.update_status("已取消", (0.7, 0.7, 0.7, 1))
+        elif result == lock_core.EXPIRED:
+            self.update_status("已超时，命令未发出", (0.8, 0.2, 0.2, 1))
+            Clock.schedule_once(lambda dt: self.show_popup("错误", "命令未能及时发出，请检查网络后重试"), 0.1)
+        else:
             self.update_status("操作失败", (0.8, 0.2, 0.2, 1))
-            Clock.schedule_once(lambda dt: self.show_popup("错误", f"操作失败: {str(e)}"), 0.1)
-        finally:
-            Clock.schedule_once(lambda dt: setattr(self.progress_bar, 'value', 0), 1)
+            Clock.schedule_once(lambda dt: self.show_popup("错误", f"操作失败: {outcome.error}"), 0.1)
     
     def unlock_door(self, instance):
         """开锁操作"""
@@ -253,8 +382,14 @@ class LockControlApp(App):
             self.show_popup("错误", "请输入设备MAC地址")
             return
         
-        # 在后台线程执行网络请求
-        thread = Thread(target=self.send_lock_command, args=("0", "HD2F0454049024910010000000000000000000006EDA1000000007EW"))
+        if self.engine:
+            self.send_via_engine('unlock')
+            return
+        # 在后台线程开锁并查询确认
+        command = self.core.protocol_for(self.mac_input.text.strip()).command('unlock')
+        trace = lock_tracing.TRACER.start_trace('unlock', cmd=command.cmd)
+        deadline = self.begin_command('unlock', lock_deadline.Deadline(COMMAND_DEADLINE))
+        thread = Thread(target=self.send_verified_unlock, args=(time.perf_counter(), trace, deadline))
         thread.daemon = True
         thread.start()
     
@@ -264,28 +399,257 @@ class LockControlApp(App):
             self.show_popup("错误", "请输入设备MAC地址")
             return
         
+        if self.engine:
+            self.send_via_engine('status')
+            return
         # 使用不同的命令码查询状态
-        thread = Thread(target=self.send_lock_command, args=("1", "HD1F0000000000000000000000000000000000000000000000000000W"))
+        command = self.core.protocol_for(self.mac_input.text.strip()).command('status')
+        trace = lock_tracing.TRACER.start_trace('query_status', cmd=command.cmd)
+        deadline = self.begin_command('status', lock_deadline.Deadline(COMMAND_DEADLINE))
+        thread = Thread(target=self.send_lock_command,
+                        args=(command.cmd, command.frame(), time.perf_counter(), trace, deadline))
         thread.daemon = True
         thread.start()
     
     def test_connection(self, instance):
         """测试连接"""
-        if not self.mac_input.text.strip():
-            self.show_popup("错误", "请输入设备MAC地址")
-            return
-        
         self.add_log("测试连接...")
-        thread = Thread(target=self.send_lock_command, args=("0", "HD2F0454049024910010000000000000000000006EDA1000000007EW"))
+        thread = Thread(target=self.run_health_probe)
         thread.daemon = True
         thread.start()
     
+    def run_health_probe(self):
+        """健康探测：仅发送HEAD请求，不会触发门锁动作"""
+        self.update_status("测试连接中...", (1, 1, 0, 1))
+        Clock.schedule_once(lambda dt: setattr(self.progress_bar, 'value', 30), 0)
+        reports = []
+        for url in self.endpoints.urls:
+            report = lock_probe.probe(url, samples=5)
+            self.endpoints.seed_from_probe(report)
+            reports.append(report)
+        Clock.schedule_once(lambda dt: self.health_probe_complete(reports), 0)
+    
+    def health_probe_complete(self, reports):
+        """显示探测结果并更新请求超时"""
+        for report in reports:
+            for line in report.describe().split('\n'):
+                self.add_log(line)
+        healthy = [report for report in reports if report.ok]
+        summary = '\n\n'.join(report.describe() for report in reports)
+        if healthy:
+            # 以最慢的健康节点为准，保证故障切换后超时仍然够用
+            timeouts = [report.suggested_timeout() for report in healthy]
+            self.core.set_timeout((max(t[0] for t in timeouts), max(t[1] for t in timeouts)))
+            self.add_log(f"请求超时调整为: {self.core.timeout}")
+            best = min(report.stats('total')['median'] for report in healthy)
+            self.update_status(f"连接正常 {best * 1000:.0f}ms ({len(healthy)}/{len(reports)})", (0.2, 0.8, 0.2, 1))
+            self.show_popup("连接测试", summary)
+        else:
+            self.update_status("连接失败", (0.8, 0.2, 0.2, 1))
+            self.show_popup("错误", summary)
+        self.progress_bar.value = 0
+    
     def clear_log(self, instance):
         """清除日志"""
         self.log_text = "日志已清除\n"
         if self.log_display:
             self.log_display.text = self.log_text
         self.update_status("就绪", (0.2, 0.8, 0.2, 1))
+    
+    def render_fleet_summary(self, summary):
+        """显示设备汇总"""
+        if self.fleet_label:
+            self.fleet_label.text = (f"设备: {summary['total']}  在线: {summary['online']}  "
+                                     f"已开锁: {summary['unlocked']}  低电量: {summary['low_battery']}")
+    
+    def warm_start(self):
+        """从快照恢复上次的界面和汇总，完整状态表在后台载入"""
+        path = os.path.join(self.user_data_dir, 'fleet.snap')
+        snapshot = lock_snapshot.Snapshot.open(path)
+        self.snapshot_writer = lock_snapshot.SnapshotWriter(path, log=self.add_log)
+        if snapshot is None:
+            self.fleet_loaded = True
+            return
+        ui_state = snapshot.ui_state
+        if ui_state.get('mac'):
+            self.mac_input.text = ui_state['mac']
+        if ui_state.get('log'):
+            self.log_text = ui_state['log'] + '应用启动完成\n'
+            self.log_display.text = self.log_text
+        self.render_fleet_summary(snapshot.summary())
+        if self.engine:
+            # 状态表由引擎进程载入和保存
+            snapshot.close()
+            return
+        thread = Thread(target=self.load_fleet, args=(snapshot,))
+        thread.daemon = True
+        thread.start()
+    
+    def load_fleet(self, snapshot):
+        """后台载入快照中的状态表，并刷新过期设备"""
+        try:
+            lock_snapshot.load_into(self.fleet, snapshot)
+            for mac, info in snapshot.registry().items():
+                self.registry.add(mac, **info)
+            self.sync.load(os.path.join(self.user_data_dir, 'sync.json'))
+        finally:
+            snapshot.close()
+            self.fleet_loaded = True
+        self.sync_fleet()
+    
+    def start_fleet_sync(self):
+        thread = Thread(target=self.sync_fleet)
+        thread.daemon = True
+        thread.start()
+    
+    def on_device_event(self, event):
+        """当前设备的推送事件写入日志（在事件线程中调用）"""
+        if event.data.get('mac') != self.mac_input.text.strip():
+            return
+        names = {'status': '状态变化', 'ack': '命令已执行', 'battery_low': '电量低'}
+        message = f"设备事件: {names.get(event.event, event.event)}"
+        Clock.schedule_once(lambda dt: self.add_log(message), 0)
+    
+    def on_events_state(self, connected):
+        message = "事件推送已连接" if connected else "事件推送已断开，正在重连"
+        Clock.schedule_once(lambda dt: self.add_log(message), 0)
+    
+    def sync_fleet(self):
+        """拉取自上次同步以来变化的设备；服务器不支持时对过期设备做条件查询"""
+        try:
+            changed = self.sync.sync_changes()
+            Clock.schedule_once(lambda dt: self.add_log(f"状态同步完成: {changed} 台设备有变化"), 0)
+            return
+        except lock_sync.SyncNotSupported:
+            pass
+        except requests.exceptions.RequestException:
+            return
+        stale = set(self.fleet.stale(STALE_STATUS_SECONDS))
+        current = self.mac_input.text.strip()
+        # 当前设备优先，其余过期设备限量刷新，避免启动时集中请求
+        targets = [current] if current in stale else []
+        targets += [mac for mac in stale if mac != current][:STALE_REFRESH_LIMIT - len(targets)]
+        if targets:
+            self.sync.refresh(targets)
+    
+    def save_snapshot(self):
+        """写入快照：状态变更追加到增量日志，清单变化或增量过多时整体重写"""
+        if self.snapshot_writer is None or not self.fleet_loaded or self.engine:
+            # 引擎进程模式下快照由引擎进程在退出时写入
+            return
+        registry = self.registry if self.core.registry_changed else None
+        self.snapshot_writer.save(self.fleet, registry, self.ui_state())
+        self.core.registry_changed = False
+        self.sync.save(os.path.join(self.user_data_dir, 'sync.json'))
+        if self.events:
+            lock_events.save_offset(os.path.join(self.user_data_dir, 'events.offset'), self.events.last_event_id)
+    
+    def ui_state(self):
+        lines = self.log_text.split('\n')
+        return {
+            'mac': self.mac_input.text.strip(),
+            'log': '\n'.join(lines[-SNAPSHOT_LOG_LINES:]),
+        }
+    
+    def on_pause(self):
+        """切到后台时取消未完成的命令并保存快照"""
+        self.cancel_commands("应用已切到后台")
+        try:
+            self.save_snapshot()
+        except Exception as e:
+            self.add_log(f"保存快照失败: {e}")
+        return True
+    
+    def on_start(self):
+        """恢复快照，打开审计日志和离线命令队列，并启动后台重放"""
+        self.profile = lock_profiler.start_from_env(self.user_data_dir, log=self.add_log)
+        self.perf_overlay = lock_perf_overlay.PerfOverlay(
+            self.core, log=self.add_log, export_dir=self.user_data_dir).install()
+        self.warm_start()
+        if self.engine:
+            # 离线队列、定时任务、快照都在引擎进程中；界面定时读共享状态表的汇总（O(1)）
+            # 启动最长等待30秒，放到后台线程，不阻塞界面线程
+            self.engine.data_dir = self.user_data_dir
+            self.engine_thread = Thread(target=self.start_engine, name='engine-start')
+            self.engine_thread.daemon = True
+            self.engine_thread.start()
+            return
+        self.events = lock_events.EventSubscriber(
+            lock_events.events_url(self.server_url), self.event_demux.dispatch,
+            last_event_id=lock_events.load_offset(os.path.join(self.user_data_dir, 'events.offset')),
+            on_state=self.on_events_state,
+            on_unsupported=lambda status: Clock.schedule_once(
+                lambda dt: self.add_log(f"服务器不提供事件推送（HTTP {status}），仅在启动时同步状态"), 0),
+            log=lambda message: Clock.schedule_once(lambda dt: self.add_log(message), 0)
+        ).start()
+        pending = self.core.open(
+            self.user_data_dir,
+            on_drained=lambda stats: Clock.schedule_once(lambda dt: self.outbox_drained(stats), 0),
+            on_scheduled=self.on_scheduled)
+        if pending:
+            self.add_log(f"离线队列中有 {pending} 条待发送命令")
+    
+    def start_engine(self):
+        """在后台线程中启动引擎进程，就绪后回到界面线程"""
+        try:
+            self.engine.start()
+        except Exception as e:
+            message = f"引擎进程启动失败: {e}"
+            Clock.schedule_once(lambda dt: self.add_log(message), 0)
+            return
+        Clock.schedule_once(lambda dt: self.engine_started(), 0)
+
+    def engine_started(self):
+        if self.stopping:
+            return
+        self.engine_ready = True
+        self.add_log("引擎进程已就绪")
+        self.engine_summary = Clock.schedule_interval(
+            lambda dt: self.render_fleet_summary(self.engine.table.summary()), 0.5)
+
+    def on_scheduled(self, job, due):
+        """定时任务已交给离线队列（在调度线程中调用）"""
+        late = time.time() - due
+        Clock.schedule_once(lambda dt: self.add_log(
+            f"定时任务 {job.command}: {len(job.macs)} 台设备" + (f"（补发，迟到 {late:.0f} 秒）" if late > job.grace else "")), 0)
+
+    def outbox_drained(self, stats):
+        """离线队列重放完成"""
+        self.add_log(f"离线队列重放: 送达 {stats[lock_queue.DELIVERED]}, 过期 {stats['expired']}, "
+                     f"待重试 {stats[lock_queue.RETRY] + stats['blocked']}")
+    
+    def on_stop(self):
+        """退出时保存快照、关闭离线队列，并按需导出追踪（LOCK_TRACE_FILE）"""
+        if self.perf_overlay:
+            self.perf_overlay.uninstall()
+        if self.profile:
+            self.profile.stop()
+        self.stopping = True
+        self.cancel_commands("应用已退出")
+        if self.engine:
+            # 先停止读共享状态表的定时汇总，表在 engine.stop 中关闭
+            if self.engine_summary is not None:
+                self.engine_summary.cancel()
+                self.engine_summary = None
+            if self.engine_thread is not None:
+                # 仍在启动中时最多等一会儿，不让界面线程卡在退出上
+                self.engine_thread.join(ENGINE_START_WAIT)
+            if self.engine_thread is None or not self.engine_thread.is_alive():
+                self.engine.stop(self.ui_state())
+            elif self.engine.process is not None:
+                # 启动仍未完成：直接结束子进程（accept 随看门狗超时返回）
+                self.engine.process.kill()
+        try:
+            self.save_snapshot()
+        except Exception as e:
+            # 快照写不出也要继续关闭离线队列和审计日志
+            self.add_log(f"保存快照失败: {e}")
+        if self.events:
+            self.events.stop()
+        self.core.close()
+        trace_file = os.environ.get('LOCK_TRACE_FILE')
+        if trace_file and lock_tracing.TRACER.buffer:
+            lock_tracing.TRACER.dump(trace_file)
 
 if __name__ == '__main__':
     LockControlApp().run()
\ No newline at end of file
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""测试共用：把仓库根目录加入导入路径，提供替身服务器"""
+
+import os
+import socket
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lock_standin_server import start_standin  # noqa: E402
+
+# 影响 LockCore 传输组装的环境变量，测试中一律从干净状态开始
+TRANSPORT_ENV = ('LOCK_SERVER_URLS', 'LOCK_TRANSPORT', 'LOCK_SHARDS', 'LOCK_BATCH', 'LOCK_HEDGE_BUDGET')
+
+
+@pytest.fixture(autouse=True)
+def clean_env(monkeypatch):
+    for name in TRANSPORT_ENV:
+        monkeypatch.delenv(name, raising=False)
+
+
+@pytest.fixture
+def standin():
+    """standin(**options) 启动一个替身服务器，测试结束时关闭"""
+    servers = []
+
+    def start(**options):
+        server = start_standin(**options)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def dead_url():
+    """没有服务在监听的地址（连接被拒绝）"""
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return f"http://127.0.0.1:{port}/yefiot/v1/mqttpost/"
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""审计日志：写入、封存后按MAC查询、超长字段"""
+
+import lock_audit
+import lock_core
+
+
+def test_query_after_seal(tmp_path):
+    directory = str(tmp_path / 'audit')
+    audit = lock_audit.AuditLog(directory, block_size=256)
+    for i in range(200):
+        audit.record_command(f"86970107000{i % 7:04d}", '2B', 1000 + i, 'HD2B00W', ts=1000.0 + i)
+    audit.close()
+    for name in sorted(p.name for p in (tmp_path / 'audit').iterdir() if p.suffix == '.log'):
+        lock_audit.seal_segment(str(tmp_path / 'audit' / name), block_size=256, run_size=1024)
+
+    records = list(lock_audit.AuditReader(directory).query(mac='869701070000003'))
+    assert [record['sn'] for record in records] == [1000 + i for i in range(200) if i % 7 == 3]
+    assert all(record['kind'] == 'command' and record['frame'] == 'HD2B00W' for record in records)
+
+
+def test_oversized_fields_are_truncated(tmp_path):
+    directory = str(tmp_path / 'audit')
+    audit = lock_audit.AuditLog(directory)
+    mac = 'M' * 300
+    audit.record_response(mac, 'x' * 300, 1, 'F' * 70000, 'r' * 300)
+    audit.close()
+
+    (record,) = lock_audit.AuditReader(directory).query(mac=mac)
+    assert record['mac'] == mac[:lock_audit.FIELD_MAX]
+    assert len(record['cmd']) == len(record['result']) == lock_audit.FIELD_MAX
+    assert len(record['frame']) == lock_audit.FRAME_MAX
+
+
+class BrokenAudit:
+    def record_command(self, *args):
+        raise ValueError("audit broken")
+
+    record_response = record_command
+
+
+def test_audit_failure_does_not_fail_command(standin):
+    server = standin()
+    logs = []
+    core = lock_core.LockCore(server.url, log=logs.append)
+    core.audit = BrokenAudit()
+    try:
+        result = core.command('869701070000001', 'unlock')
+        assert result.result == lock_core.SUCCESS
+        assert server.requests == 1
+        assert any('audit broken' in line for line in logs)
+    finally:
+        core.audit = None
+        core.close()
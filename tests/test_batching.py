@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""批量信封：并发命令合并发送、按 (mac, sn) 分发，服务器不支持或暂时故障时逐条发送"""
+
+import json
+import threading
+import time
+
+import pytest
+
+import lock_deadline
+from lock_batching import BatchingTransport
+from lock_transport import Transport, TransportResponse
+
+
+class FakeServer(Transport):
+    """记录收到的信封和单条命令；batch_status 不为200时信封返回该状态"""
+
+    def __init__(self, batch_status=200, delay=0.02):
+        self.batch_status = batch_status
+        self.delay = delay
+        self.envelopes = []
+        self.singles = []
+        self._lock = threading.Lock()
+
+    def post(self, payload, timeout=10, idempotent=False):
+        time.sleep(self.delay)
+        if payload.get('cmd') == 'batch':
+            with self._lock:
+                self.envelopes.append(payload['items'])
+            if self.batch_status != 200:
+                return TransportResponse(self.batch_status, b'{}')
+            results = [{'mac': item['mac'], 'sn': item['sn'], 'code': 0,
+                        'data': [{'mac': item['mac'], 'msg_info': 'batched'}]} for item in payload['items']]
+            return TransportResponse(200, json.dumps({'code': 0, 'results': results}).encode('utf-8'))
+        with self._lock:
+            self.singles.append(payload)
+        return TransportResponse(200, json.dumps({'code': 0, 'data': [{'mac': payload['mac'], 'msg_info': 'single'}]})
+                                 .encode('utf-8'))
+
+
+def command(i, cmd='1'):
+    return {'type': 'yfn03', 'mac': f"8697010700{i:05d}", 'cmd': cmd, 'sn': i, 'info': 'HD1F0000W'}
+
+
+def post_all(transport, payloads, idempotent=True):
+    """并发发送，返回与 payloads 同序的 (响应数据, 异常)"""
+    results = [None] * len(payloads)
+    barrier = threading.Barrier(len(payloads))
+
+    def send(index):
+        barrier.wait()
+        try:
+            results[index] = (transport.post(payloads[index], timeout=5, idempotent=idempotent).json(), None)
+        except Exception as e:
+            results[index] = (None, e)
+
+    threads = [threading.Thread(target=send, args=(i,)) for i in range(len(payloads))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+@pytest.fixture
+def batching():
+    transports = []
+
+    def make(server, **options):
+        transport = BatchingTransport(server, **options)
+        transports.append(transport)
+        return transport
+
+    yield make
+    for transport in transports:
+        transport.close()
+
+
+def test_concurrent_commands_share_envelopes(batching):
+    server = FakeServer()
+    transport = batching(server, max_batch=50)
+    payloads = [command(i) for i in range(60)]
+    results = post_all(transport, payloads)
+    # 每个调用方拿到的是自己那条命令的结果
+    assert [body['data'][0]['mac'] for body, error in results] == [p['mac'] for p in payloads]
+    assert transport.supported is True
+    assert server.envelopes
+    assert sum(len(items) for items in server.envelopes) + len(server.singles) == len(payloads)
+    assert len(server.envelopes) + len(server.singles) < len(payloads)
+
+
+def test_unsupported_server_falls_back_to_singles(batching):
+    server = FakeServer(batch_status=404)
+    transport = batching(server)
+    results = post_all(transport, [command(i) for i in range(20)])
+    assert all(error is None and body['data'][0]['msg_info'] == 'single' for body, error in results)
+    assert transport.supported is False
+    # 此后不再装批
+    envelopes = len(server.envelopes)
+    transport.post(command(99), timeout=5, idempotent=True)
+    assert len(server.envelopes) == envelopes
+
+
+def test_transient_failure_resends_idempotent_singly(batching):
+    server = FakeServer(batch_status=503)
+    transport = batching(server)
+    results = post_all(transport, [command(i) for i in range(20)])
+    assert all(error is None for _, error in results)
+    assert transport.supported is None
+
+
+def test_non_idempotent_not_batched_until_supported(batching):
+    server = FakeServer()
+    transport = batching(server)
+    post_all(transport, [command(i, cmd='0') for i in range(10)], idempotent=False)
+    assert not server.envelopes
+    assert len(server.singles) == 10
+
+
+def test_cancelled_command_leaves_queue(batching):
+    server = FakeServer(delay=0.3)
+    transport = batching(server)
+    deadline = lock_deadline.Deadline()
+    errors = []
+
+    def send():
+        try:
+            with lock_deadline.activate(deadline):
+                transport.post(command(1), timeout=5, idempotent=True)
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=send)
+    start = time.perf_counter()
+    thread.start()
+    time.sleep(0.05)
+    deadline.cancel("测试取消")
+    thread.join(2)
+    assert time.perf_counter() - start < 0.3
+    assert len(errors) == 1 and isinstance(errors[0], lock_deadline.Cancelled)
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""LockCore.execute 的结果判定"""
+
+import json
+
+import pytest
+import requests
+
+import lock_core
+from lock_transport import Transport, TransportResponse
+
+MAC = '869701070000001'
+
+
+class ReplyTransport(Transport):
+    """固定应答或固定异常的传输"""
+
+    def __init__(self, body=None, status=200, error=None):
+        self.body = body
+        self.status = status
+        self.error = error
+
+    def post(self, payload, timeout=10, idempotent=False):
+        if self.error is not None:
+            raise self.error
+        return TransportResponse(self.status, json.dumps(self.body).encode('utf-8'))
+
+
+@pytest.fixture
+def core():
+    core = lock_core.LockCore('http://127.0.0.1:9/')
+    yield core
+    core.close()
+
+
+def with_transport(core, transport):
+    core.transport.close()
+    core.transport = transport
+    return core
+
+
+def test_unlock_reply_is_success_and_updates_fleet(standin):
+    server = standin()
+    core = lock_core.LockCore(server.url)
+    try:
+        result = core.command(MAC, 'unlock')
+        assert result.result == lock_core.SUCCESS
+        assert result.parsed['command'] == '2B'
+        assert core.fleet.get(MAC).state == lock_core.lock_fleet.STATE_UNLOCKED
+    finally:
+        core.close()
+
+
+def test_status_reply_is_completed(standin):
+    server = standin()
+    core = lock_core.LockCore(server.url)
+    try:
+        result = core.command(MAC, 'status')
+        assert result.result == lock_core.COMPLETED
+        assert result.http_status == '200'
+    finally:
+        core.close()
+
+
+def test_http_error(standin):
+    server = standin(error_rate=1.0)
+    core = lock_core.LockCore(server.url)
+    try:
+        result = core.command(MAC, 'status')
+        assert result.result == lock_core.HTTP_ERROR
+        assert result.http_status == '503'
+    finally:
+        core.close()
+
+
+def test_read_timeout(standin):
+    server = standin(latency=1.0)
+    core = lock_core.LockCore(server.url, timeout=0.2)
+    try:
+        assert core.command(MAC, 'unlock').result == lock_core.TIMEOUT
+    finally:
+        core.close()
+
+
+def test_bad_format(core):
+    with_transport(core, ReplyTransport({'code': 0, 'data': [{'msg_info': 'XX2B00W'}]}))
+    assert core.command(MAC, 'status').result == lock_core.BAD_FORMAT
+
+
+def test_no_data(core):
+    with_transport(core, ReplyTransport({'code': 0, 'data': []}))
+    assert core.command(MAC, 'status').result == lock_core.NO_DATA
+
+
+def test_connect_timeout_is_timeout_not_error(core):
+    # ConnectTimeout 同时是 ConnectionError 和 Timeout 的子类
+    with_transport(core, ReplyTransport(error=requests.exceptions.ConnectTimeout("connect timed out")))
+    assert core.command(MAC, 'status').result == lock_core.TIMEOUT
+
+
+def test_connection_error_without_outbox(core):
+    with_transport(core, ReplyTransport(error=requests.exceptions.ConnectionError("reset")))
+    result = core.command(MAC, 'status')
+    assert result.result == lock_core.ERROR
+    assert result.error
+
+
+def test_protocol_with_other_header_is_parsed(core):
+    # 解析按设备型号的协议进行，不再写死 HD 帧头
+    protocol = core.protocols.default
+    protocol.header, original = 'HX', protocol.header
+    try:
+        with_transport(core, ReplyTransport({'code': 0, 'data': [{'msg_info': 'HX2B00W'}]}))
+        result = core.command(MAC, 'unlock')
+        assert result.result == lock_core.SUCCESS
+    finally:
+        protocol.header = original
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""截止时间与取消"""
+
+import threading
+import time
+
+import pytest
+
+import lock_core
+import lock_deadline
+
+MAC = '869701070000001'
+
+
+def test_expired_deadline_is_not_sent(standin):
+    server = standin()
+    core = lock_core.LockCore(server.url)
+    try:
+        result = core.command(MAC, 'unlock', deadline=lock_deadline.Deadline(0))
+        assert result.result == lock_core.EXPIRED
+        assert server.requests == 0
+    finally:
+        core.close()
+
+
+def test_deadline_bounds_a_slow_request(standin):
+    server = standin(latency=1.0)
+    core = lock_core.LockCore(server.url)
+    try:
+        started = time.monotonic()
+        result = core.command(MAC, 'status', deadline=lock_deadline.Deadline(0.3))
+        assert result.result in (lock_core.TIMEOUT, lock_core.EXPIRED)
+        assert time.monotonic() - started < 0.8
+    finally:
+        core.close()
+
+
+def test_cancel_aborts_request_in_flight(standin):
+    server = standin(latency=2.0)
+    core = lock_core.LockCore(server.url)
+    deadline = lock_deadline.Deadline()
+    timer = threading.Timer(0.2, deadline.cancel)
+    try:
+        timer.start()
+        started = time.monotonic()
+        result = core.command(MAC, 'status', deadline=deadline)
+        assert result.result == lock_core.CANCELLED
+        assert time.monotonic() - started < 1.0
+    finally:
+        timer.cancel()
+        core.close()
+
+
+def test_cancel_stops_bulk_run(standin):
+    server = standin(latency=0.5)
+    core = lock_core.LockCore(server.url)
+    deadline = lock_deadline.Deadline()
+    timer = threading.Timer(0.2, deadline.cancel)
+    macs = [f"8697010700{i:05d}" for i in range(200)]
+    try:
+        timer.start()
+        started = time.monotonic()
+        results = core.run_bulk(macs, 'status', workers=4, deadline=deadline)
+        assert time.monotonic() - started < 2.0
+        assert len(results) == len(macs)
+        assert sum(result.result == lock_core.CANCELLED for result in results) > len(macs) // 2
+    finally:
+        timer.cancel()
+        core.close()
+
+
+def test_clamp_raises_when_nothing_is_left():
+    assert lock_deadline.Deadline().clamp((3, 10)) == (3, 10)
+    assert lock_deadline.Deadline(5).clamp(1) == 1
+    with pytest.raises(lock_deadline.DeadlineExceeded):
+        lock_deadline.Deadline(0).clamp((3, 10))
+
+
+class LapsedAfterCheck(lock_deadline.Deadline):
+    """check 时尚未到期、clamp 时已到期"""
+
+    def check(self):
+        pass
+
+
+def test_deadline_lapsing_after_check_is_expired(standin):
+    server = standin()
+    core = lock_core.LockCore(server.url)
+    try:
+        result = core.command(MAC, 'status', deadline=LapsedAfterCheck(0))
+        assert result.result == lock_core.EXPIRED
+        assert server.requests == 0
+    finally:
+        core.close()
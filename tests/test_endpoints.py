@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""多服务器选路：偏向低延迟节点，连续失败摘除、冷却后恢复，连接失败时切换到其他节点"""
+
+import time
+from collections import Counter
+
+import lock_core
+import lock_probe
+from lock_endpoints import EndpointPool
+
+MAC = '869701070000001'
+
+
+def test_prefers_faster_endpoint():
+    pool = EndpointPool(['http://fast/', 'http://slow/'], seed=1)
+    chosen = Counter()
+    for _ in range(200):
+        endpoint = pool.choose()
+        chosen[endpoint.url] += 1
+        pool.record(endpoint, 0.01 if endpoint.url == 'http://fast/' else 0.5, True)
+    assert chosen['http://fast/'] > chosen['http://slow/'] * 3
+
+
+def test_eject_after_failures_then_recover():
+    pool = EndpointPool(['http://a/', 'http://b/'], max_failures=2, cooldown=0.1, seed=1)
+    a, b = pool.endpoints
+    for _ in range(2):
+        pool.choose()
+        pool.record(a, 1.0, False)
+    assert not a.healthy(time.monotonic())
+    assert {pool.choose().url for _ in range(20)} == {'http://b/'}
+
+    time.sleep(0.15)
+    assert a.healthy(time.monotonic())
+    pool.record(a, 0.01, True)
+    assert a.failures == 0 and a.ejections == 0
+
+
+def test_all_ejected_still_returns_endpoint():
+    pool = EndpointPool(['http://a/'], max_failures=1, cooldown=30)
+    endpoint = pool.choose()
+    pool.record(endpoint, 1.0, False)
+    assert pool.choose() is endpoint
+
+
+def test_seed_from_failed_probe_ejects():
+    pool = EndpointPool(['http://a/', 'http://b/'])
+    closed = {'dns': 0.0, 'tcp': 0.0, 'tls': 0.0, 'ttfb': 0.0, 'total': 0.0, 'status': 0}
+    pool.seed_from_probe(lock_probe.ProbeReport('http://a/', [closed], []))
+    a, b = pool.endpoints
+    assert a.error_rate == 1.0 and not a.healthy(time.monotonic())
+    assert b.healthy(time.monotonic())
+
+
+def test_core_fails_over_to_live_server(standin, dead_url, monkeypatch):
+    server = standin()
+    monkeypatch.setenv('LOCK_SERVER_URLS', f"{dead_url},{server.url}")
+    core = lock_core.LockCore(server.url)
+    try:
+        results = [core.command(MAC, 'status').result for _ in range(5)]
+        assert results == [lock_core.COMPLETED] * 5
+        dead, live = core.endpoints.endpoints
+        assert dead.error_rate > 0
+        assert live.requests >= 5
+    finally:
+        core.close()
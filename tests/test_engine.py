@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""命令引擎子进程：命令、批量（含失败的批量）、共享状态表"""
+
+import threading
+
+import pytest
+
+import lock_core
+import lock_engine_process
+
+MACS = [f"8697010700{i:05d}" for i in range(50)]
+
+
+@pytest.fixture
+def engine(standin, tmp_path):
+    server = standin()
+    engine = lock_engine_process.EngineProcess(server.url, data_dir=str(tmp_path)).start()
+    yield engine
+    engine.stop()
+
+
+def wait_result(start):
+    """start(callback) 发起请求，返回回调收到的结果"""
+    done = threading.Event()
+    box = []
+
+    def callback(result):
+        box.append(result)
+        done.set()
+
+    start(callback)
+    assert done.wait(15)
+    return box[0]
+
+
+def test_command_and_shared_table(engine):
+    result = wait_result(lambda callback: engine.command(MACS[0], 'unlock', callback, timeout=10))
+    assert result['result'] == lock_core.SUCCESS
+    assert engine.table.summary()['unlocked'] == 1
+
+
+def test_bulk_done(engine):
+    counts = wait_result(lambda callback: engine.bulk(MACS, 'status', workers=8, on_done=callback, timeout=10))
+    assert counts == {lock_core.COMPLETED: len(MACS)}
+    assert engine.table.summary()['total'] == len(MACS)
+
+
+def test_failed_bulk_still_reports_done(engine):
+    counts = wait_result(lambda callback: engine.bulk(MACS, 'explode', on_done=callback, timeout=10))
+    assert counts == {lock_core.ERROR: len(MACS)}
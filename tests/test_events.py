@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""事件订阅：续传位置、格式意外的事件"""
+
+import time
+
+import lock_events
+import lock_fleet
+
+MAC = '869701070000001'
+
+
+def wait_until(predicate, timeout=5.0):
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return predicate()
+
+
+def test_malformed_events_are_skipped(standin):
+    server = standin()
+    server.publish('battery_low', {'mac': MAC, 'battery': 'lots'})
+    server.publish('status', [MAC])
+    server.publish('ack', 42)
+    server.mutate(MAC, unlocked=True, battery=55)
+    last_id = str(server.event_id)
+
+    store = lock_fleet.StatusStore()
+    logs = []
+    subscriber = lock_events.EventSubscriber(
+        lock_events.events_url(server.url), lock_events.EventDemux(store).dispatch,
+        last_event_id=0, min_backoff=0.05, log=logs.append).start()
+    try:
+        assert wait_until(lambda: subscriber.last_event_id == last_id)
+        status = store.get(MAC)
+        assert status.state == lock_fleet.STATE_UNLOCKED
+        assert status.battery == 55
+        assert len(logs) == 1 and 'battery_low' in logs[0]
+
+        # 订阅线程仍在工作
+        server.mutate(MAC, unlocked=False)
+        assert wait_until(lambda: store.get(MAC).state == lock_fleet.STATE_LOCKED)
+        assert subscriber.connected
+    finally:
+        subscriber.stop()
+
+
+def test_resume_from_last_event_id(standin):
+    server = standin()
+    server.mutate(MAC, battery=80)
+    skipped = server.event_id
+    server.mutate('869701070000002', battery=70)
+
+    store = lock_fleet.StatusStore()
+    subscriber = lock_events.EventSubscriber(
+        lock_events.events_url(server.url), lock_events.EventDemux(store).dispatch,
+        last_event_id=skipped, min_backoff=0.05).start()
+    try:
+        assert wait_until(lambda: store.get('869701070000002') is not None)
+        assert store.get(MAC) is None
+    finally:
+        subscriber.stop()
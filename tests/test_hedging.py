@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""对冲请求：慢节点由对冲补上；排队中的主请求可被取消或到期"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import lock_deadline
+import lock_endpoints
+import lock_transport
+
+PAYLOAD = {'type': 'yfn03', 'mac': '869701070000001', 'cmd': '1', 'sn': 1, 'info': ''}
+
+
+def test_hedge_covers_a_slow_endpoint(standin):
+    slow, fast = standin(latency=1.0), standin()
+    pool = lock_endpoints.EndpointPool([slow.url, fast.url])
+    transport = lock_transport.HttpTransport(pool, hedging=lock_transport.HedgingPolicy(initial_delay=0.05))
+    try:
+        for _ in range(3):
+            started = time.monotonic()
+            response = transport.post(PAYLOAD, timeout=5, idempotent=True)
+            assert response.status_code == 200
+            assert time.monotonic() - started < 0.6
+    finally:
+        transport.close()
+
+
+@pytest.fixture
+def busy_transport(standin):
+    """对冲线程池唯一的线程被占用，新请求只能排队"""
+    server = standin()
+    transport = lock_transport.HttpTransport(
+        lock_endpoints.EndpointPool([server.url]), hedging=lock_transport.HedgingPolicy(), hedge_workers=1)
+    release = threading.Event()
+    transport._executor = ThreadPoolExecutor(max_workers=1)
+    transport._executor.submit(release.wait, 10)
+    yield server, transport
+    release.set()
+    transport.close()
+
+
+def test_cancel_while_primary_is_queued(busy_transport):
+    server, transport = busy_transport
+    deadline = lock_deadline.Deadline()
+    timer = threading.Timer(0.1, deadline.cancel)
+    timer.start()
+    started = time.monotonic()
+    with pytest.raises(lock_deadline.Cancelled), deadline.activate():
+        transport.post(PAYLOAD, timeout=5, idempotent=True)
+    assert time.monotonic() - started < 1.0
+    assert server.requests == 0
+
+
+def test_deadline_expires_while_primary_is_queued(busy_transport):
+    server, transport = busy_transport
+    started = time.monotonic()
+    with pytest.raises(lock_deadline.DeadlineExceeded), lock_deadline.Deadline(0.1).activate():
+        transport.post(PAYLOAD, timeout=5, idempotent=True)
+    assert time.monotonic() - started < 1.0
+    assert server.requests == 0
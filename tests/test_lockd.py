@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""lockd 请求参数校验"""
+
+import json
+import threading
+
+import pytest
+import requests
+
+import lock_core
+import lockd
+from conftest import TRANSPORT_ENV
+from lock_standin_server import start_standin
+
+
+@pytest.fixture(scope='module')
+def daemon():
+    server = start_standin()
+    with pytest.MonkeyPatch.context() as patch:
+        for name in TRANSPORT_ENV:
+            patch.delenv(name, raising=False)
+        core = lock_core.LockCore(server.url)
+    httpd = lockd.LockdServer(('127.0.0.1', 0), core)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+    core.close()
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.parametrize('path, body', [
+    ('/bulk', {'macs': ['869701070000001'], 'deadline': 'soon'}),
+    ('/bulk', {'macs': ['869701070000001'], 'deadline': -1}),
+    ('/bulk', {'macs': ['869701070000001'], 'deadline': 'nan'}),
+    ('/bulk', {'macs': ['869701070000001'], 'workers': 0}),
+    ('/bulk', {'macs': ['869701070000001'], 'workers': 'many'}),
+    ('/bulk', {'macs': ['869701070000001'], 'workers': lockd.MAX_WORKERS + 1}),
+    ('/bulk', {'macs': '869701070000001'}),
+    ('/bulk', {'macs': [123]}),
+    ('/verify', {'macs': [None]}),
+    ('/command', {'mac': ['869701070000001']}),
+    ('/command', {}),
+    ('/command', {'mac': '869701070000001', 'command': 'explode'}),
+    ('/command', ['869701070000001']),
+])
+def test_bad_request(daemon, path, body):
+    response = requests.post(daemon + path, data=json.dumps(body), timeout=5)
+    assert response.status_code == 400
+    assert response.json()['error']
+
+
+def test_bad_json(daemon):
+    response = requests.post(daemon + '/bulk', data=b'{not json', timeout=5)
+    assert response.status_code == 400
+
+
+def test_valid_bulk(daemon):
+    macs = ['869701070000001', '869701070000002']
+    response = requests.post(daemon + '/bulk', json={'macs': macs, 'command': 'status',
+                                                      'workers': 2, 'deadline': 5}, timeout=5)
+    assert response.status_code == 200
+    body = response.json()
+    assert [result['mac'] for result in body['results']] == macs
+    assert body['summary'] == {lock_core.COMPLETED: 2}
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""lock_metrics：直方图/计数器的正确性、负值拒绝与记录开销预算"""
+
+import sys
+import threading
+import time
+
+import pytest
+
+import lock_metrics
+from lock_metrics import Counter, Histogram, MetricsRegistry
+
+# 单次记录开销预算（纳秒）
+BUDGET_NS = 1000
+
+
+def best_ns(call, n=20000, rounds=5):
+    """多轮取最快一轮的单次开销，扣除空循环开销"""
+    def timed(fn):
+        best = None
+        for _ in range(rounds):
+            start = time.perf_counter_ns()
+            for _ in range(n):
+                fn()
+            cost = (time.perf_counter_ns() - start) / n
+            best = cost if best is None else min(best, cost)
+        return best
+    return timed(call) - timed(lambda: None)
+
+
+def test_histogram_percentiles_and_summary():
+    hist = Histogram()
+    for ms in range(1, 101):
+        hist.observe(ms / 1000.0)
+    summary = hist.summary()
+    assert summary['count'] == 100
+    assert summary['max'] == pytest.approx(0.1)
+    assert summary['sum'] == pytest.approx(5.05, rel=1e-3)
+    # 对数-线性桶相对误差约6%
+    assert summary['p50'] == pytest.approx(0.050, rel=0.07)
+    assert summary['p99'] == pytest.approx(0.099, rel=0.07)
+
+
+def test_histogram_large_values_and_cumulative():
+    hist = Histogram()
+    hist.observe_us(0)
+    hist.observe_us(2 ** 62)
+    assert hist.count == 2
+    cumulative = hist.cumulative()
+    assert cumulative[0] == (0.001, 1)
+    assert cumulative[-1] == (float('inf'), 2)
+
+
+def test_negative_values_rejected():
+    hist = Histogram()
+    with pytest.raises(ValueError):
+        hist.observe(-0.5)
+    with pytest.raises(ValueError):
+        hist.observe_us(-1)
+    counter = Counter('test_negative_total', '测试')
+    with pytest.raises(ValueError):
+        counter.inc(amount=-1)
+    assert hist.count == 0
+    assert counter.values == {(): 0}
+
+
+def test_counts_merged_across_threads():
+    hist = Histogram()
+    counter = Counter('test_threads_total', '测试', ('kind',))
+    bound = counter.labels('bound')
+
+    def work():
+        for _ in range(1000):
+            hist.observe_us(5)
+            counter.inc('free')
+            bound.inc()
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # 已退出线程的分片并入 retired 后仍计入
+    assert hist.count == 4000
+    assert counter.values == {('free',): 4000, ('bound',): 4000}
+    assert counter.labels('bound') is bound
+
+
+def test_prometheus_render():
+    registry = MetricsRegistry()
+    counter = registry.counter('test_render_total', '测试', ('cmd',))
+    histogram = registry.histogram('test_render_seconds', '测试', ('stage',))
+    counter.inc('1', amount=3)
+    histogram.observe(0.002, 'network')
+    text = registry.render_prometheus()
+    assert 'test_render_total{cmd="1"} 3' in text
+    assert 'test_render_seconds_bucket{stage="network",le="+Inf"} 1' in text
+    assert 'test_render_seconds_count{stage="network"} 1' in text
+
+
+@pytest.mark.skipif(sys.gettrace() is not None, reason="覆盖率/调试跟踪下计时无意义")
+def test_hot_path_budget():
+    hist = Histogram()
+    counter = Counter('test_budget_total', '测试', ('cmd', 'result'))
+    bound = counter.labels('1', 'success')
+    costs = {
+        'observe': best_ns(lambda: hist.observe(0.0123)),
+        'observe_us': best_ns(lambda: hist.observe_us(12300)),
+        'inc': best_ns(lambda: counter.inc('1', 'success')),
+        'bound_inc': best_ns(bound.inc),
+        'stage_observe': best_ns(lambda: lock_metrics.NETWORK.observe(0.0123)),
+    }
+    over = {name: round(cost) for name, cost in costs.items() if cost >= BUDGET_NS}
+    assert not over, f"记录开销超出 {BUDGET_NS}ns 预算: {over}"
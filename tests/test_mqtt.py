@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""MQTT 直连传输：经替身 broker 收发、订阅确认超时、PUBACK 丢失时的重发"""
+
+import socket
+import struct
+import threading
+
+import pytest
+
+import lock_mqtt
+from lock_mqtt import CONNACK, PUBACK, PUBLISH, SUBACK, SUBSCRIBE, packet, read_packet
+from lock_standin_broker import start_broker
+
+MAC = '869701070000001'
+
+
+class ScriptedBroker:
+    """只回应 CONNACK 的假 broker；ignore_subscribes/ignore_publishes 条报文不确认，之后的正常确认"""
+
+    def __init__(self, ignore_subscribes=0, ignore_publishes=0):
+        self.ignore_subscribes = ignore_subscribes
+        self.ignore_publishes = ignore_publishes
+        self.received = []
+        self.listener = socket.socket()
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen()
+        self.port = self.listener.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        stream = conn.makefile('rb')
+        try:
+            read_packet(stream)
+            conn.sendall(packet(CONNACK, b'\x00\x00'))
+            while True:
+                first, body = read_packet(stream)
+                self.received.append(first)
+                kind = first & 0xF0
+                if kind == SUBSCRIBE:
+                    if self.ignore_subscribes:
+                        self.ignore_subscribes -= 1
+                        continue
+                    conn.sendall(packet(SUBACK, body[:2] + b'\x01'))
+                elif kind == PUBLISH:
+                    _, _, packet_id, _ = lock_mqtt.parse_publish(first, body)
+                    if self.ignore_publishes:
+                        self.ignore_publishes -= 1
+                        continue
+                    conn.sendall(packet(PUBACK, struct.pack('>H', packet_id)))
+        except (OSError, ConnectionError):
+            pass
+        finally:
+            conn.close()
+
+    def close(self):
+        self.listener.close()
+
+
+@pytest.fixture
+def broker():
+    brokers = []
+
+    def start(**options):
+        fake = ScriptedBroker(**options)
+        brokers.append(fake)
+        return fake
+
+    yield start
+    for fake in brokers:
+        fake.close()
+
+
+def test_command_round_trip():
+    standin = start_broker()
+    transport = lock_mqtt.MqttTransport(standin.url)
+    try:
+        response = transport.post({'type': 'yfn03', 'mac': MAC, 'cmd': '0', 'sn': 1, 'info': ''}, timeout=5)
+        assert response.status_code == 200
+        assert response.json()['data'][0]['msg_info'].startswith('HD2B')
+        assert standin.devices[MAC][0]
+    finally:
+        transport.close()
+        standin.shutdown()
+        standin.server_close()
+
+
+def test_subscribe_timeout_does_not_leave_a_half_open_connection(broker):
+    fake = broker(ignore_subscribes=1)
+    client = lock_mqtt.MqttClient('127.0.0.1', fake.port)
+    client.subscriptions['replies'] = 1
+    with pytest.raises(TimeoutError):
+        client.connect(timeout=0.2)
+    assert not client.connected
+
+    # 下一次连接重新订阅
+    client.connect(timeout=2)
+    try:
+        assert client.connected
+        assert [first & 0xF0 for first in fake.received].count(SUBSCRIBE) == 2
+    finally:
+        client.close()
+
+
+def test_unacknowledged_publish_is_retransmitted_with_dup(broker, monkeypatch):
+    monkeypatch.setattr(lock_mqtt, 'RETRANSMIT_INTERVAL', 0.05)
+    fake = broker(ignore_publishes=1)
+    client = lock_mqtt.MqttClient('127.0.0.1', fake.port)
+    client.connect(timeout=2)
+    try:
+        assert client.publish('t', b'x', qos=1, timeout=2)
+        publishes = [first for first in fake.received if first & 0xF0 == PUBLISH]
+        assert len(publishes) == 2
+        assert not publishes[0] & 0x08 and publishes[1] & 0x08
+    finally:
+        client.close()
+
+
+def test_unacknowledged_publish_without_retransmit_times_out(broker):
+    fake = broker(ignore_publishes=1)
+    client = lock_mqtt.MqttClient('127.0.0.1', fake.port)
+    client.connect(timeout=2)
+    try:
+        assert not client.publish('t', b'x', qos=1, timeout=0.2, retransmit=False)
+        assert len([first for first in fake.received if first & 0xF0 == PUBLISH]) == 1
+    finally:
+        client.close()
+
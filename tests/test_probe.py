@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""健康探测：只有收到HTTP状态行的样本算健康，DNS解析有超时"""
+
+import socket
+import threading
+import time
+
+import pytest
+
+import lock_probe
+
+
+@pytest.fixture
+def closing_url():
+    """接受连接后立即关闭、不返回任何应答的地址"""
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(8)
+    stopped = threading.Event()
+
+    def serve():
+        while not stopped.is_set():
+            try:
+                conn, _ = listener.accept()
+            except OSError:
+                return
+            conn.close()
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{listener.getsockname()[1]}/"
+    stopped.set()
+    listener.close()
+
+
+def test_http_status_counts_as_healthy(standin):
+    server = standin()
+    report = lock_probe.probe(server.url, samples=2, interval=0)
+    assert [sample['status'] for sample in report.samples] == [200, 200]
+    assert report.ok
+    assert report.loss == 0.0
+    assert report.stats('total')['min'] > 0
+    assert isinstance(report.suggested_timeout(), tuple)
+    assert lock_probe.latest_report(server.url) is report
+
+
+def test_no_status_is_not_healthy(closing_url):
+    report = lock_probe.probe(closing_url, samples=3, interval=0)
+    assert len(report.samples) + len(report.errors) == 3
+    assert all(sample['status'] == 0 for sample in report.samples)
+    assert not report.ok
+    assert report.loss == 1.0
+    assert report.stats('total') is None
+    assert report.suggested_timeout(default=7.0) == 7.0
+    assert report.as_response()['status'] == 'error'
+    assert '0/3 OK' in report.describe()
+
+
+def test_loss_counts_samples_without_status():
+    healthy = {'dns': 0.001, 'tcp': 0.001, 'tls': 0.0, 'ttfb': 0.01, 'total': 0.02, 'status': 200}
+    closed = dict(healthy, status=0)
+    report = lock_probe.ProbeReport('http://example.invalid/', [healthy, closed], ['timeout: timed out'])
+    assert report.ok
+    assert report.healthy == [healthy]
+    assert report.loss == pytest.approx(2 / 3)
+    assert report.to_dict()['healthy'] == 1
+
+
+def test_dns_hang_times_out(monkeypatch):
+    release = threading.Event()
+
+    def hanging_getaddrinfo(*args, **kwargs):
+        release.wait(5)
+        raise socket.gaierror("released")
+
+    monkeypatch.setattr(socket, 'getaddrinfo', hanging_getaddrinfo)
+    try:
+        start = time.perf_counter()
+        with pytest.raises(socket.timeout):
+            lock_probe.probe_once('http://lock.example.invalid/', timeout=0.2)
+        assert time.perf_counter() - start < 1.0
+
+        report = lock_probe.probe('http://lock.example.invalid/', samples=1, timeout=0.2)
+        assert not report.ok
+        assert 'DNS' in report.errors[0]
+    finally:
+        release.set()
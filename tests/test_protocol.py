@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""协议注册表：默认型号的帧与原先写死的帧一致，带参数模板按参数缓存，定义错误在加载时暴露"""
+
+import pytest
+
+import lock_core
+from lock_protocol import ProtocolError, ProtocolRegistry, default_registry
+from lock_standin_server import STATUS_REPLY, UNLOCK_REPLY
+
+UNLOCK_FRAME = "HD2F0454049024910010000000000000000000006EDA1000000007EW"
+STATUS_FRAME = "HD1F0000000000000000000000000000000000000000000000000000W"
+
+SPEC = {
+    'default': 'yfn03',
+    'models': {
+        'yfn03': {
+            'type': 'yfn03',
+            'commands': {'status': {'cmd': '1', 'code': '1F', 'data': '00', 'idempotent': True}},
+            'replies': {'1F': {'name': 'status', 'fields': {'lock': [0, 2, 'hex'], 'battery': [2, 2, 'hex']}}},
+        },
+        'k9': {
+            'type': 'k9', 'header': 'KX', 'trailer': 'Z',
+            'commands': {
+                'unlock': {'cmd': '7', 'code': 'A1', 'data': '{seconds:02X}',
+                           'params': {'seconds': {'default': 5, 'min': 1, 'max': 60}}, 'success': ['A2']},
+            },
+            'replies': {'A2': {'name': 'unlock_ok', 'fields': {'tag': [0, 3, 'str']}}},
+        },
+    },
+}
+
+
+def test_default_frames_match_legacy():
+    protocol = default_registry().default
+    assert protocol.frame('unlock') == UNLOCK_FRAME
+    assert protocol.frame('status') == STATUS_FRAME
+    assert protocol.command('status').static_frame is not None
+    assert protocol.is_idempotent('1') and not protocol.is_idempotent('0')
+    assert not protocol.is_idempotent('99')
+
+
+def test_decode_replies():
+    protocol = default_registry().default
+    assert protocol.is_success('0', protocol.parse(UNLOCK_REPLY)['command'])
+    decoded = protocol.decode(STATUS_REPLY)
+    assert decoded['reply'] == 'status'
+    assert decoded['fields'] == {'lock': 0, 'battery': 100}
+    assert protocol.decode('XX1F00W') is None
+    assert protocol.decode('HD99W')['reply'] is None
+
+
+def test_parameterised_template_cached_and_checked():
+    protocol = ProtocolRegistry(SPEC).get('k9')
+    command = protocol.command('unlock')
+    assert command.static_frame is None
+    assert command.frame() == 'KXA105Z'
+    assert command.frame(seconds=30) == 'KXA11EZ'
+    assert command.frame(seconds=30) is command.frame(seconds=30)
+    with pytest.raises(ProtocolError):
+        command.frame(seconds=61)
+    with pytest.raises(ProtocolError):
+        command.frame(volume=3)
+    with pytest.raises(ProtocolError):
+        protocol.command('status')
+    assert protocol.decode('KXA2abcZ')['fields'] == {'tag': 'abc'}
+
+
+def test_bad_definitions_fail_at_load():
+    with pytest.raises(ProtocolError):
+        ProtocolRegistry({'default': 'missing', 'models': SPEC['models']})
+    with pytest.raises(ProtocolError):
+        ProtocolRegistry({'models': {'bad': {'commands': {'status': {'code': '1F'}}}}})
+    with pytest.raises(ProtocolError):
+        ProtocolRegistry({'models': {'bad': {'commands': {
+            'x': {'cmd': '1', 'code': '1F', 'data': '{missing:02X}', 'params': {'seconds': {'default': 1}}}}}}})
+
+
+def test_unknown_model_uses_default():
+    registry = ProtocolRegistry(SPEC)
+    assert registry.get('nope') is registry.default
+    assert registry.get(None).model == 'yfn03'
+    assert registry.models() == ['yfn03', 'k9']
+
+
+def test_core_selects_protocol_by_model():
+    core = lock_core.LockCore('http://127.0.0.1:9/')
+    try:
+        core.protocols = ProtocolRegistry(SPEC)
+        core.registry.add('869701070000001', model='k9')
+        assert core.protocol_for('869701070000001').type == 'k9'
+        assert core.protocol_for('869701070000002').type == 'yfn03'
+    finally:
+        core.close()
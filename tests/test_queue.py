@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""离线命令队列：连接失败入队，恢复后按序重放，过期命令丢弃，写入失败不阻塞调用方"""
+
+import sqlite3
+import time
+
+import pytest
+
+import lock_core
+import lock_queue
+
+MAC = '869701070000001'
+
+
+def test_unsent_command_is_queued_and_replayed(standin, dead_url, tmp_path):
+    path = str(tmp_path / 'outbox.db')
+    offline = lock_core.LockCore(dead_url, timeout=1)
+    offline.outbox = lock_queue.CommandQueue(path)
+    try:
+        assert offline.command(MAC, 'unlock').result == lock_core.QUEUED
+        offline.outbox.enqueue('869701070000002', '2B', 'stale', ttl=0.01)
+        assert offline.outbox.pending_count() == 2
+    finally:
+        offline.close()
+    time.sleep(0.05)
+
+    server = standin()
+    online = lock_core.LockCore(server.url)
+    queue = lock_queue.CommandQueue(path)
+    try:
+        stats = queue.drain(online.send_queued)
+        assert stats[lock_queue.DELIVERED] == 1
+        assert stats['expired'] == 1
+        assert queue.pending_count() == 0
+        assert server.devices[MAC][0]
+        assert '869701070000002' not in server.devices
+    finally:
+        queue.close()
+        online.close()
+
+
+def test_server_error_keeps_command_for_retry(standin, tmp_path):
+    server = standin(error_rate=1.0)
+    core = lock_core.LockCore(server.url)
+    queue = lock_queue.CommandQueue(str(tmp_path / 'outbox.db'))
+    try:
+        queue.enqueue(MAC, '2B', 'payload')
+        queue.enqueue(MAC, '2B', 'payload')
+        stats = queue.drain(core.send_queued)
+        # 同一设备第一条失败后，后续命令本轮不再发送
+        assert stats[lock_queue.RETRY] == 1
+        assert stats['blocked'] == 1
+        assert queue.pending_count() == 2
+    finally:
+        queue.close()
+        core.close()
+
+
+def test_write_failure_wakes_waiters(tmp_path):
+    path = str(tmp_path / 'outbox.db')
+    queue = lock_queue.CommandQueue(path)
+    other = sqlite3.connect(path, isolation_level=None)
+    other.execute("CREATE TRIGGER fail BEFORE INSERT ON outbox BEGIN SELECT RAISE(ABORT, 'disk full'); END")
+    try:
+        seq = queue.enqueue(MAC, '2B', 'payload')
+        assert queue.wait_durable(seq, timeout=5) is False
+        assert 'disk full' in str(queue.last_error)
+        with pytest.raises(sqlite3.Error):
+            queue.enqueue(MAC, '2B', 'payload', wait=True)
+
+        # 写入线程仍在工作
+        other.execute("DROP TRIGGER fail")
+        queue.enqueue(MAC, '2B', 'payload', wait=True)
+        assert queue.flush() is True
+        assert queue.pending_count() == 1
+    finally:
+        other.close()
+        assert queue.close() is True
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""运行中的调度器感知其他连接（命令行）添加和删除的任务"""
+
+import threading
+import time
+
+import lock_scheduler
+
+
+def wait_until(predicate, timeout=5.0):
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return predicate()
+
+
+def test_jobs_added_and_removed_by_another_connection(tmp_path):
+    path = str(tmp_path / 'schedule.db')
+    fired = []
+    lock = threading.Lock()
+
+    def on_fire(job, due):
+        with lock:
+            fired.append(job.id)
+
+    running = lock_scheduler.Scheduler(path, on_fire=on_fire, poll_interval=0.05).start()
+    cli = lock_scheduler.Scheduler(path)
+    try:
+        job = cli.add(['869701070000001'], 'status', {'every': 0.1, 'start': time.time()})
+        assert wait_until(lambda: len(fired) >= 2)
+        assert set(fired) == {job.id}
+
+        assert cli.remove(job.id)
+        assert wait_until(lambda: job.id not in running.jobs)
+        with lock:
+            count = len(fired)
+        time.sleep(0.4)
+        assert len(fired) == count
+    finally:
+        cli.stop()
+        running.stop()
+
+
+def test_jobs_survive_restart(tmp_path):
+    path = str(tmp_path / 'schedule.db')
+    scheduler = lock_scheduler.Scheduler(path)
+    job = scheduler.add(['869701070000001'], 'unlock', {'daily': '08:55', 'weekdays': [0, 1, 2, 3, 4]})
+    scheduler.stop()
+
+    reopened = lock_scheduler.Scheduler(path)
+    try:
+        assert reopened.jobs[job.id].to_row() == job.to_row()
+        assert reopened.jobs[job.id].catch_up == lock_scheduler.SKIP
+    finally:
+        reopened.stop()
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""分片路由 + 批量信封"""
+
+from collections import Counter
+
+import lock_core
+
+MACS = [f"8697010700{i:05d}" for i in range(400)]
+
+
+def test_bulk_routes_each_device_to_its_shard(standin, monkeypatch):
+    servers = [standin(), standin()]
+    monkeypatch.setenv('LOCK_SHARDS', ','.join(server.url for server in servers))
+    monkeypatch.setenv('LOCK_BATCH', '50')
+    core = lock_core.LockCore(servers[0].url)
+    try:
+        results = core.run_bulk(MACS, 'status', workers=16)
+        assert Counter(result.result for result in results) == {lock_core.COMPLETED: len(MACS)}
+        assert [result.mac for result in results] == MACS
+
+        expected = Counter(core.transport.partition_of(mac) for mac in MACS)
+        assert len(expected) == 2
+        for server in servers:
+            assert len(server.devices) == expected[server.url] > 0
+            # 批量信封生效：请求数远少于设备数
+            assert server.requests < len(server.devices)
+    finally:
+        core.close()
+
+
+def test_sync_changes_covers_every_shard(standin, monkeypatch):
+    servers = [standin(), standin()]
+    monkeypatch.setenv('LOCK_SHARDS', ','.join(server.url for server in servers))
+    monkeypatch.setenv('LOCK_BATCH', '50')
+    core = lock_core.LockCore(servers[0].url)
+    try:
+        core.run_bulk(MACS, 'status', workers=16)
+        assert core.sync.sync_changes() == len(MACS)
+        assert set(core.sync.cursors) == {server.url for server in servers}
+        assert core.sync.sync_changes() == 0
+
+        mac = MACS[7]
+        owner = next(server for server in servers if server.url == core.transport.partition_of(mac))
+        owner.mutate(mac, unlocked=True)
+        assert core.sync.sync_changes() == 1
+    finally:
+        core.close()
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""虚拟门锁群：同一种子可复现，开锁/自动上锁状态机，离线、卡住、损坏帧按比例注入"""
+
+from collections import Counter
+
+import pytest
+
+import lock_core
+import lock_simulator
+from lock_simulator import Simulator, SimulatorTransport
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def sim_core():
+    cores = []
+
+    def make(**options):
+        core = lock_core.LockCore('http://127.0.0.1:9/')
+        core.transport.close()
+        core.transport = SimulatorTransport(**options)
+        cores.append(core)
+        return core
+
+    yield make
+    for core in cores:
+        core.close()
+
+
+def outcomes(core, macs, name, workers):
+    return {result.mac: (result.result, result.msg_info) for result in core.run_bulk(macs, name, workers=workers)}
+
+
+def test_same_seed_reproducible_across_schedules(sim_core):
+    options = dict(seed=7, offline_rate=0.2, jam_rate=0.2, malformed_rate=0.1, clock=FakeClock())
+    macs = [f"86970107{i:07d}" for i in range(300)]
+    first = sim_core(**options)
+    second = sim_core(**options)
+    # 自动加入的设备按到达顺序编号，随机数流不能依赖编号
+    unlocks = outcomes(first, macs, 'unlock', 1)
+    assert unlocks == outcomes(second, macs, 'unlock', 16)
+    # 注入的各类结果都出现了：卡住、离线、损坏帧
+    counts = Counter(result for result, _ in unlocks.values())
+    assert counts[lock_core.SUCCESS] and counts[lock_core.COMPLETED]
+    assert counts[lock_core.NO_DATA] and counts[lock_core.BAD_FORMAT]
+    assert outcomes(first, macs, 'status', 8) == outcomes(second, macs, 'status', 1)
+
+
+def test_behaviour_independent_of_arrival_order():
+    options = dict(seed=3, offline_rate=0.3, jam_rate=0.3, malformed_rate=0.2, clock=FakeClock())
+    macs = [f"86970107{i:07d}" for i in range(200)]
+    forward, backward = Simulator(**options), Simulator(**options)
+    replies = {mac: forward.handle({'mac': mac, 'cmd': '0', 'sn': 1}) for mac in macs}
+    assert replies == {mac: backward.handle({'mac': mac, 'cmd': '0', 'sn': 1}) for mac in reversed(macs)}
+    assert [forward.state(mac) for mac in macs] == [backward.state(mac) for mac in macs]
+
+
+def test_unlock_actuation_and_relock():
+    clock = FakeClock()
+    simulator = Simulator(seed=1, offline_rate=0, jam_rate=0, malformed_rate=0, relock_after=5.0,
+                          actuation=1.0, clock=clock)
+    mac = simulator.populate(1)[0]
+    reply = simulator.handle({'mac': mac, 'cmd': '0', 'sn': 1})
+    assert reply['data'][0]['msg_info'] == lock_simulator.UNLOCK_REPLY
+    # 电机转动到位之前仍为上锁
+    assert not simulator.state(mac)['unlocked']
+    clock.now += 1.6
+    assert simulator.state(mac)['unlocked']
+    clock.now += 5.0
+    assert not simulator.state(mac)['unlocked']
+    assert simulator.state(mac)['commands'] == 1
+
+
+def test_etag_not_modified_until_state_changes():
+    simulator = Simulator(seed=1, offline_rate=0, jam_rate=0, malformed_rate=0, clock=FakeClock())
+    first = simulator.handle({'mac': 'm1', 'cmd': '1', 'sn': 1})['data'][0]
+    again = simulator.handle({'mac': 'm1', 'cmd': '1', 'sn': 2, 'etag': first['etag']})['data'][0]
+    assert again.get('not_modified')
+    simulator.handle({'mac': 'm1', 'cmd': '0', 'sn': 3})
+    changed = simulator.handle({'mac': 'm1', 'cmd': '1', 'sn': 4, 'etag': first['etag']})['data'][0]
+    assert 'msg_info' in changed
+
+
+def test_failure_modes(sim_core):
+    mac = '869701070000001'
+    assert sim_core(offline_rate=1.0).command(mac, 'status').result == lock_core.NO_DATA
+    assert sim_core(offline_rate=1.0, offline_reply='timeout').command(mac, 'status').result == lock_core.TIMEOUT
+    assert sim_core(offline_rate=0, jam_rate=1.0).command(mac, 'unlock').result == lock_core.COMPLETED
+    assert sim_core(offline_rate=0, jam_rate=0, malformed_rate=0).command(mac, 'unlock').result == lock_core.SUCCESS
+
+
+def test_batch_envelope_and_sync_unsupported():
+    simulator = Simulator(seed=1, offline_rate=0, malformed_rate=0)
+    reply = simulator.handle({'cmd': 'batch', 'items': [{'mac': 'a', 'cmd': '1', 'sn': 1},
+                                                        {'mac': 'b', 'cmd': '1', 'sn': 2}]})
+    assert [result['mac'] for result in reply['results']] == ['a', 'b']
+    assert simulator.handle({'cmd': 'sync', 'cursor': 0})['code'] == 400
+
+
+def test_from_env_and_memory(monkeypatch):
+    monkeypatch.setenv('LOCK_TRANSPORT', 'sim')
+    monkeypatch.setenv('LOCK_SIM_DEVICES', '1000')
+    core = lock_core.LockCore('http://127.0.0.1:9/')
+    try:
+        simulator = core.transport.simulator
+        assert len(simulator) == 1000
+        assert simulator.memory_bytes() / len(simulator) <= 40
+        assert simulator.summary()['total'] == 1000
+    finally:
+        core.close()
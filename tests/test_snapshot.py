@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""设备状态快照：整体重写、增量日志、放不进定长记录的设备"""
+
+import lock_fleet
+import lock_snapshot
+
+LONG_MAC = 'M' * (lock_snapshot.MAC_SIZE + 1)
+
+
+def make_store(macs):
+    store = lock_fleet.StatusStore()
+    for i, mac in enumerate(macs):
+        store.update(mac, state=lock_fleet.STATE_UNLOCKED if i % 2 else lock_fleet.STATE_LOCKED,
+                     battery=10 + i, online=True)
+    return store
+
+
+def test_full_then_delta_round_trip(tmp_path):
+    path = str(tmp_path / 'fleet.snap')
+    macs = [f"8697010700{i:05d}" for i in range(20)]
+    store = make_store(macs)
+    writer = lock_snapshot.SnapshotWriter(path)
+    assert writer.save(store, ui_state={'mac': macs[0]}) == 'full'
+
+    store.update(macs[3], battery=99)
+    assert writer.save(store) == 'delta'
+
+    snapshot = lock_snapshot.Snapshot.open(path)
+    try:
+        assert snapshot.get(macs[3]).battery == 99
+        assert snapshot.get(macs[4]).battery == 14
+        assert snapshot.get('missing') is None
+        assert snapshot.summary() == store.summary()
+        assert sorted(status.mac for status in snapshot.iter_statuses()) == macs
+        assert snapshot.ui_state == {'mac': macs[0]}
+    finally:
+        snapshot.close()
+
+
+def test_long_mac_is_skipped_and_logged(tmp_path):
+    path = str(tmp_path / 'fleet.snap')
+    logs = []
+    macs = [f"8697010700{i:05d}" for i in range(20)]
+    store = make_store(macs + [LONG_MAC])
+    writer = lock_snapshot.SnapshotWriter(path, log=logs.append)
+    assert writer.save(store) == 'full'
+    assert len(logs) == 1
+
+    # 增量日志同样跳过
+    store.update(LONG_MAC, battery=5)
+    store.update(macs[1], battery=6)
+    assert writer.save(store) == 'delta'
+    assert len(logs) == 2
+
+    snapshot = lock_snapshot.Snapshot.open(path)
+    try:
+        assert sorted(status.mac for status in snapshot.iter_statuses()) == macs
+        assert snapshot.get(macs[1]).battery == 6
+    finally:
+        snapshot.close()
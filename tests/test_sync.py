@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""状态同步：条件查询只在变化时带回状态帧，变更查询按游标分页，游标失效时从头同步"""
+
+import json
+
+import pytest
+
+import lock_core
+import lock_fleet
+import lock_sync
+from lock_transport import Transport, TransportResponse
+
+MACS = [f"8697010700{i:05d}" for i in range(5)]
+
+
+@pytest.fixture
+def core_for(standin):
+    cores = []
+
+    def make():
+        server = standin()
+        core = lock_core.LockCore(server.url)
+        cores.append(core)
+        return server, core
+
+    yield make
+    for core in cores:
+        core.close()
+
+
+def test_conditional_check(core_for):
+    server, core = core_for()
+    sync = core.sync
+    mac = MACS[0]
+    assert sync.check(mac) == lock_sync.CHANGED
+    assert sync.etags[mac] == str(server.devices[mac][2])
+    assert core.fleet.get(mac).battery == 100
+    assert sync.check(mac) == lock_sync.NOT_MODIFIED
+
+    server.mutate(mac, unlocked=True, battery=40)
+    assert sync.check(mac) == lock_sync.CHANGED
+    status = core.fleet.get(mac)
+    assert status.state == lock_fleet.STATE_UNLOCKED
+    assert status.battery == 40
+    assert sync.refresh(MACS) == {lock_sync.CHANGED: 4, lock_sync.NOT_MODIFIED: 1, lock_sync.FAILED: 0}
+
+
+def test_cursor_sync_pages_and_resets(core_for):
+    server, core = core_for()
+    for mac in MACS:
+        server.mutate(mac, battery=90)
+    sync = core.sync
+    assert sync.sync_changes(limit=2) == len(MACS)
+    assert sync.cursors[''] == server.sequence
+    assert sync.sync_changes(limit=2) == 0
+
+    server.mutate(MACS[3], unlocked=True)
+    assert sync.sync_changes() == 1
+    assert core.fleet.get(MACS[3]).state == lock_fleet.STATE_UNLOCKED
+
+    # 游标超出服务器序号（如服务器重启）：etag 作废，从头同步
+    sync.cursors[''] = server.sequence + 100
+    assert sync.sync_changes() == len(MACS)
+    assert set(sync.etags) == set(MACS)
+
+
+class NotFoundTransport(Transport):
+    def post(self, payload, timeout=10, idempotent=False):
+        return TransportResponse(404, b'not found')
+
+
+def test_cursor_sync_not_supported():
+    sync = lock_sync.StatusSync(NotFoundTransport(), lock_fleet.StatusStore())
+    with pytest.raises(lock_sync.SyncNotSupported):
+        sync.sync_changes()
+    assert sync.check(MACS[0]) == lock_sync.FAILED
+
+
+def test_save_and_load(tmp_path):
+    path = str(tmp_path / 'sync.json')
+    sync = lock_sync.StatusSync(NotFoundTransport(), lock_fleet.StatusStore())
+    sync.cursors['shard-a'] = 42
+    sync.etags[MACS[0]] = '7'
+    sync.save(path)
+
+    restored = lock_sync.StatusSync(NotFoundTransport(), lock_fleet.StatusStore())
+    assert restored.load(path)
+    assert restored.cursors == {'shard-a': 42}
+    assert restored.etags == {MACS[0]: '7'}
+
+    # 旧版本只保存一个游标
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'cursor': 9, 'etags': {}}, f)
+    legacy = lock_sync.StatusSync(NotFoundTransport(), lock_fleet.StatusStore())
+    assert legacy.load(path)
+    assert legacy.cursors == {'': 9}
+    assert not legacy.load(str(tmp_path / 'missing.json'))
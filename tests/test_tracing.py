@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""命令链路追踪：UI回调（ui_hop）执行完毕后才结束追踪，回调阶段计入命令耗时"""
+
+import queue
+import threading
+
+import lock_core
+import lock_tracing
+
+MAC = '869701070000001'
+
+
+def test_finish_without_hops_records_immediately():
+    tracer = lock_tracing.Tracer(sample_rate=1.0)
+    trace = tracer.start_trace('query_status')
+    with trace.span('http_post'):
+        pass
+    trace.finish()
+    trace.finish()
+    assert list(tracer.buffer) == [trace]
+    assert trace.end_ns >= trace.spans[0][2]
+
+
+def test_finish_waits_for_pending_hop():
+    tracer = lock_tracing.Tracer(sample_rate=1.0)
+    trace = tracer.start_trace('unlock')
+    ran = []
+    hop = trace.wrap_hop('ui_hop', lambda dt: ran.append(dt))
+    trace.finish()
+    # 回调还在UI线程排队：追踪尚未结束
+    assert not tracer.buffer
+    assert trace.end_ns is None
+
+    thread = threading.Thread(target=hop, args=(0,))
+    thread.start()
+    thread.join()
+    assert ran == [0]
+    assert list(tracer.buffer) == [trace]
+    (name, start_ns, end_ns, *_), = trace.spans
+    assert name == 'ui_hop'
+    assert trace.start_ns <= start_ns <= end_ns <= trace.end_ns
+
+
+def test_slow_threshold_includes_ui_hop():
+    # 只保留慢命令时，UI回调的排队时间同样计入耗时判断
+    tracer = lock_tracing.Tracer(sample_rate=0.0, slow_threshold=0.05)
+    trace = tracer.start_trace('unlock')
+    hop = trace.wrap_hop('ui_hop', lambda dt: None)
+    trace.finish()
+    threading.Event().wait(0.06)
+    hop(0)
+    assert list(tracer.buffer) == [trace]
+
+
+def test_execute_trace_ends_after_ui_hop(standin):
+    server = standin()
+    core = lock_core.LockCore(server.url)
+    tracer = lock_tracing.Tracer(sample_rate=1.0)
+    trace = tracer.start_trace('query_status')
+    ui_queue = queue.Queue()
+
+    def progress(value):
+        # 模拟 main.py：进度90%的回调经 Clock 调度到UI线程
+        if value == 90:
+            ui_queue.put(trace.wrap_hop('ui_hop', lambda dt: None))
+
+    try:
+        outcome = core.command(MAC, 'status', enqueued_at=None, trace=trace, on_progress=progress)
+    finally:
+        core.close()
+    assert outcome.result == lock_core.COMPLETED
+    assert not tracer.buffer
+
+    ui_queue.get_nowait()(0)
+    names = [span[0] for span in trace.spans]
+    assert 'http_post' in names and names[-1] == 'ui_hop'
+    assert list(tracer.buffer) == [trace]
+    assert trace.spans[-1][2] <= trace.end_ns
+    assert trace.tags['result'] == lock_core.COMPLETED
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""开锁并确认：查询到开锁即确认，卡住的设备在窗口结束时判为未确认，批量流水线与取消"""
+
+import threading
+import time
+from collections import Counter
+
+import pytest
+
+import lock_core
+import lock_deadline
+import lock_verify
+from lock_simulator import SimulatorTransport
+from lock_verify import PollSchedule, UnlockVerifier, VerifiedUnlock
+
+MACS = [f"86970107{i:07d}" for i in range(120)]
+
+
+@pytest.fixture
+def sim_core():
+    cores = []
+
+    def make(**options):
+        options = dict(dict(offline_rate=0, malformed_rate=0, jam_rate=0, actuation=0.2), **options)
+        core = lock_core.LockCore('http://127.0.0.1:9/')
+        core.transport.close()
+        core.transport = SimulatorTransport(**options)
+        cores.append(core)
+        return core
+
+    yield make
+    for core in cores:
+        core.close()
+
+
+def fast_schedule():
+    return PollSchedule(initial=0.2, spread=0.1, min_interval=0.02, max_interval=0.2, window=1.0)
+
+
+def test_poll_schedule_learns_and_backs_off():
+    schedule = PollSchedule(initial=0.3, spread=0.2, factor=2.0, min_interval=0.05, max_interval=1.0)
+    assert schedule.first_delay() == pytest.approx(0.1)
+    delays = [schedule.next_delay(attempt) for attempt in range(1, 8)]
+    assert delays == sorted(delays) and delays[-1] == 1.0
+    for _ in range(100):
+        schedule.learn(0.8)
+    assert schedule.expected == pytest.approx(0.8, abs=0.01)
+    assert schedule.spread < 0.05
+
+
+def test_verify_confirms_unlock(sim_core):
+    verifier = UnlockVerifier(sim_core(), fast_schedule())
+    outcome = verifier.verify(MACS[0])
+    assert outcome.result == lock_verify.CONFIRMED
+    assert outcome.unlock.result == lock_core.SUCCESS
+    assert outcome.polls >= 1
+    # 执行时间为 actuation 的 0.5~1.5 倍
+    assert 0.1 <= outcome.confirmed_after < 1.0
+
+
+def test_jammed_lock_unconfirmed_after_window(sim_core):
+    verifier = UnlockVerifier(sim_core(jam_rate=1.0), fast_schedule())
+    start = time.perf_counter()
+    outcome = verifier.verify(MACS[0])
+    assert outcome.result == lock_verify.UNCONFIRMED
+    assert outcome.unlock.result == lock_core.COMPLETED
+    assert outcome.polls > 1
+    assert time.perf_counter() - start < 2.0
+
+
+def test_cancelled_unlock_not_polled(sim_core):
+    deadline = lock_deadline.Deadline()
+    deadline.cancel("测试取消")
+    outcome = UnlockVerifier(sim_core(), fast_schedule()).verify(MACS[0], deadline=deadline)
+    assert outcome.result == lock_core.CANCELLED
+    assert outcome.polls == 0
+
+
+def test_bulk_pipeline_confirms_all(sim_core):
+    schedule = fast_schedule()
+    verifier = UnlockVerifier(sim_core(latency=0.005), schedule)
+    streamed = []
+    results = verifier.run_bulk(MACS, workers=8, on_result=streamed.append)
+    assert [outcome.mac for outcome in results] == MACS
+    assert Counter(outcome.result for outcome in results) == {lock_verify.CONFIRMED: len(MACS)}
+    assert len(streamed) == len(MACS)
+    # 时间表从确认结果中学到了执行时间
+    assert 0.1 < schedule.expected < 0.35
+
+    summary = lock_verify.summarize(results)
+    assert summary['results'] == {lock_verify.CONFIRMED: len(MACS)}
+    assert sum(bucket['count'] for bucket in summary['histogram']) == len(MACS)
+    assert summary['time_to_confirmed']['p50_ms'] > 0
+
+
+def test_bulk_cancel_stops_promptly(sim_core):
+    verifier = UnlockVerifier(sim_core(latency=0.05), fast_schedule())
+    deadline = lock_deadline.Deadline()
+    threading.Timer(0.2, deadline.cancel, args=("测试取消",)).start()
+    start = time.perf_counter()
+    results = verifier.run_bulk(MACS, workers=4, deadline=deadline)
+    assert time.perf_counter() - start < 1.5
+    counts = Counter(outcome.result for outcome in results)
+    assert counts[lock_core.CANCELLED] > len(MACS) / 2
+
+
+def test_outcome_round_trip():
+    outcome = VerifiedUnlock(MACS[0])
+    outcome.result = lock_verify.CONFIRMED
+    outcome.polls = 3
+    outcome.confirmed_after = 0.4567
+    outcome.elapsed = 0.5
+    restored = VerifiedUnlock.from_dict(outcome.to_dict())
+    assert restored.to_dict() == outcome.to_dict()
+    assert restored.ok